@@ -31,7 +31,10 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 import database_extended as db
 import ml_precio_optimo
 import rag_historico
+import pool_ml
+import sketches_precios
 import auth_service
+from canonizacion import normalizar_termino
 from gemini_prompts import (
     ContextoUsuario, ContextoLicitacion, PerfilExperiencia,
     clasificar_perfil, get_system_prompt_principiante,
@@ -41,7 +44,10 @@ from prompt_generator import generar_prompt_dinamico, generar_user_prompt_analis
 
 # Redis (opcional)
 try:
-    from redis_cache import cache_response, CACHE_TTL, rate_limiters, REDIS_AVAILABLE
+    from redis_cache import (
+        cache_response, cache_get_many, cache_set_many, get_cache_key,
+        CACHE_TTL, rate_limiters, REDIS_AVAILABLE
+    )
 except ImportError:
     REDIS_AVAILABLE = False
     rate_limiters = {}
@@ -306,6 +312,36 @@ class PrecioOptimoRequest(BaseModel):
         }
     }
 
+class PrecioItemRequest(BaseModel):
+    """Ítem de una solicitud de precios en lote"""
+    producto: str = Field(min_length=2, description="Nombre del producto", examples=["resma papel carta"])
+    cantidad: int = Field(default=1, ge=1, description="Cantidad de unidades", examples=[50])
+    region: Optional[str] = Field(default=None, description="Filtrar por región", examples=["Metropolitana"])
+
+class PrecioOptimoLoteRequest(BaseModel):
+    """Request para calcular precios óptimos de varios productos (ej. todas las líneas de una licitación)"""
+    items: List[PrecioItemRequest] = Field(
+        min_length=1,
+        max_length=100,
+        description="Productos a cotizar (máximo 100)"
+    )
+    solo_ganadores: bool = Field(
+        default=True,
+        description="Solo considerar ofertas ganadoras para el cálculo"
+    )
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "items": [
+                    {"producto": "resma papel carta", "cantidad": 50, "region": "Metropolitana"},
+                    {"producto": "toner hp 85a", "cantidad": 4}
+                ],
+                "solo_ganadores": True
+            }
+        }
+    }
+
 # ==================== APP ====================
 
 # Tags para organizar la documentación
@@ -406,8 +442,37 @@ app.add_middleware(
 # Rate limiting middleware (debe ir despues de CORS)
 app.add_middleware(RateLimitMiddleware)
 
+@app.on_event("shutdown")
+async def cerrar_pool_ml():
+    """Detiene los workers del pool ML."""
+    pool_ml.cerrar()
+
+@app.on_event("shutdown")
+async def cerrar_proveedores_ia():
+    """Cierra los clientes HTTP async de los proveedores de IA (si se usaron)."""
+    modulo = sys.modules.get('ai_providers')
+    if modulo is not None:
+        await modulo.close_providers()
+
 # ==================== UTILIDADES ====================
 
+async def ejecutar_ml(funcion, *args, tipo: str, **kwargs):
+    """
+    Ejecuta cómputo ML CPU-bound en pool_ml, sin bloquear el event loop.
+
+    Cola llena -> 503; resultado fuera de plazo -> 504.
+    """
+    try:
+        return await pool_ml.ejecutar(funcion, *args, tipo=tipo, **kwargs)
+    except pool_ml.PoolSaturado as e:
+        raise_safe_error(503, e, f"pool ML ({tipo})")
+    except TimeoutError as e:
+        logger.warning(f"Timeout en pool ML ({tipo}): {e}")
+        raise HTTPException(
+            status_code=504,
+            detail="El análisis tardó demasiado. Intente más tarde."
+        )
+
 def paginate_query(query: str, page: int, limit: int, count_query: Optional[str] = None, params: tuple = ()):
     """Ejecuta query con paginación usando parámetros seguros"""
     conn = db.get_connection()
@@ -774,9 +839,22 @@ async def listar_historico(
     params = []
     
     if producto:
-        # Usar ILIKE para PostgreSQL (aprovecha índices GIN trigram)
-        where_clauses.append(f"producto_cotizado ILIKE {placeholder}")
-        params.append(f"%{producto}%")
+        # Cada token del término canónico contra producto_normalizado
+        # (índice GIN trigram idx_hist_producto_norm_trgm)
+        tokens = normalizar_termino(producto).split()
+        if tokens:
+            # Filas aún sin canonizar (canonizacion.py --rellenar pendiente):
+            # se comparan por el nombre original
+            por_tokens = " AND ".join([f"producto_normalizado LIKE {placeholder}"] * len(tokens))
+            where_clauses.append(
+                f"(({por_tokens}) OR "
+                f"(producto_normalizado IS NULL AND producto_cotizado ILIKE {placeholder}))"
+            )
+            params.extend(f"%{token}%" for token in tokens)
+            params.append(f"%{producto}%")
+        else:
+            where_clauses.append(f"producto_cotizado ILIKE {placeholder}")
+            params.append(f"%{producto}%")
     if region:
         where_clauses.append(f"UPPER(region) = UPPER({placeholder})")
         params.append(region)
@@ -928,7 +1006,9 @@ async def calcular_precio_optimo(
     ```
     """
     try:
-        resultado = ml_precio_optimo.calcular_precio_optimo(
+        resultado = await ejecutar_ml(
+            ml_precio_optimo.calcular_precio_optimo,
+            tipo='precio',
             producto=request.producto,
             cantidad=request.cantidad,
             region=request.region,
@@ -936,9 +1016,124 @@ async def calcular_precio_optimo(
         )
         # Sanitize numpy values for JSON serialization
         return sanitize_for_json(resultado)
+    except HTTPException:
+        raise
     except Exception as e:
         raise_safe_error(500, e, "calcular precio óptimo")
 
+@app.post(
+    "/api/v3/ml/precio/batch",
+    tags=["ML - Machine Learning"],
+    summary="Calcular precios óptimos en lote",
+    response_description="Recomendaciones de precio por ítem, en el orden recibido"
+)
+async def calcular_precio_optimo_lote(
+    request: PrecioOptimoLoteRequest,
+    user_id: Optional[int] = Depends(auth_service.optional_api_key),
+    _rate_limit: bool = Depends(check_ml_rate_limit)
+):
+    """
+    Calcula el precio óptimo de hasta 100 productos en una sola llamada.
+    
+    Pensado para cotizar todas las líneas de una licitación a la vez: los
+    candidatos históricos se buscan una sola vez para todo el lote y la
+    similitud se calcula en una sola pasada.
+    
+    ## Response
+    
+    - `resultados`: un elemento por ítem, en el mismo orden del request, con
+      el mismo formato de `/api/v3/ml/precio` más `indice`, `producto`,
+      `cantidad`, `region` y `cache_hit`
+    - Un ítem sin datos o con error trae `success: false` y `error`, sin
+      afectar al resto del lote
+    
+    ## Rate Limit
+    
+    Cuenta como un request ML (50 requests/minuto por IP)
+    """
+    try:
+        items = [item.model_dump() for item in request.items]
+        claves = [
+            get_cache_key(
+                'ml_precio', producto=item['producto'].strip().lower(), cantidad=item['cantidad'],
+                region=(item['region'] or '').strip().upper() or None,
+                solo_ganadores=request.solo_ganadores
+            )
+            for item in items
+        ] if REDIS_AVAILABLE else [None] * len(items)
+
+        cacheados = cache_get_many(claves) if REDIS_AVAILABLE else [None] * len(items)
+        pendientes = [i for i, r in enumerate(cacheados) if r is None]
+
+        calculados = await ejecutar_ml(
+            ml_precio_optimo.calcular_precios_lote,
+            [items[i] for i in pendientes], tipo='precio_lote',
+            solo_ganadores=request.solo_ganadores
+        ) if pendientes else []
+
+        resultados = list(cacheados)
+        nuevos = {}
+        for i, resultado in zip(pendientes, calculados):
+            resultados[i] = sanitize_for_json(resultado)
+            if REDIS_AVAILABLE and resultado.get('success'):
+                nuevos[claves[i]] = resultados[i]
+        if nuevos:
+            cache_set_many(nuevos, CACHE_TTL['ml_precio'])
+
+        respuesta = [
+            {'indice': i, **items[i], 'cache_hit': cacheados[i] is not None, **resultado}
+            for i, resultado in enumerate(resultados)
+        ]
+        return {
+            "success": True,
+            "total": len(respuesta),
+            "exitosos": sum(1 for r in respuesta if r.get('success')),
+            "errores": sum(1 for r in respuesta if not r.get('success')),
+            "cache_hits": sum(1 for r in respuesta if r['cache_hit']),
+            "resultados": respuesta,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise_safe_error(500, e, "calcular precios en lote")
+
+@app.get(
+    "/api/v3/ml/precio/rango",
+    tags=["ML - Machine Learning"],
+    summary="Rango de precios de un producto",
+    response_description="Percentiles aproximados de precios ganadores"
+)
+async def rango_precios(
+    producto: str = Query(..., min_length=2, description="Nombre del producto"),
+    region: Optional[str] = Query(None, description="Región (opcional)"),
+    meses: int = Query(24, ge=1, le=120, description="Meses hacia atrás desde el mes actual"),
+    user_id: Optional[int] = Depends(auth_service.optional_api_key),
+    _rate_limit: bool = Depends(check_ml_rate_limit)
+):
+    """
+    Distribución de precios unitarios ganadores de un producto en los últimos meses.
+    
+    Se calcula fusionando los sketches mensuales precalculados (t-digest), por
+    lo que el costo no depende de cuántas ofertas hay en el rango. Los
+    percentiles son aproximados (error típico bajo 1%) y descartan outliers
+    con la misma regla que el cálculo en vivo (mediana ± 3 MAD).
+    """
+    try:
+        distribucion = await ejecutar_ml(
+            sketches_precios.consultar,
+            producto, region,
+            tipo='rango',
+            meses=sketches_precios.ultimos_meses(meses)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise_safe_error(500, e, "calcular rango de precios")
+    
+    if not distribucion:
+        raise HTTPException(status_code=404, detail="No hay datos de precios para el producto")
+    return {"success": True, **sanitize_for_json(distribucion)}
+
 @app.post(
     "/api/v3/historico/buscar",
     tags=["Histórico"],
@@ -968,11 +1163,15 @@ async def buscar_historico(
     200 requests/minuto por IP
     """
     try:
-        casos = rag_historico.buscar_casos_similares(
+        casos = await ejecutar_ml(
+            rag_historico.buscar_casos_similares,
+            tipo='rag',
             nombre_licitacion=query,
             limite=limite
         )
         return {"success": True, "total": len(casos), "casos": casos}
+    except HTTPException:
+        raise
     except Exception as e:
         raise_safe_error(500, e, "buscar histórico RAG")
 
@@ -5,7 +5,7 @@ echo ========================================
 echo.
 
 echo [1/4] Instalando dependencias ML...
-pip install xgboost lightgbm shap fuzzywuzzy python-Levenshtein
+pip install xgboost lightgbm shap "rapidfuzz>=3.0.0" "pyarrow>=15.0.0"
 
 echo.
 echo [2/4] Instalando dependencias Dashboard...
@@ -17,7 +17,7 @@ pip install stripe passlib[bcrypt] python-multipart email-validator alembic
 
 echo.
 echo [4/4] Verificando instalacion...
-python -c "import pandas, xgboost, fuzzywuzzy; print('✅ Todas las dependencias ML instaladas correctamente')"
+python -c "import pandas, xgboost, rapidfuzz, pyarrow; print('✅ Todas las dependencias ML instaladas correctamente')"
 
 echo.
 echo ========================================
@@ -8,6 +8,73 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 import database_extended as db
 
+# Índices GiST de la búsqueda KNN: tabla y columna que cada uno ordena
+# (tabla plana o, tras normalize_historico.py, las tablas normalizadas)
+INDICES_KNN = {
+    'idx_hist_producto_norm_gist': ('historico_licitaciones', 'producto_normalizado'),
+    'idx_hist_nombre_norm_gist': ('historico_licitaciones', 'nombre_normalizado'),
+    'idx_hofe_producto_norm_gist': ('historico_ofertas', 'producto_normalizado'),
+    'idx_hcot_nombre_norm_gist': ('hist_cotizaciones', 'nombre_normalizado'),
+}
+
+
+def validar_indices_knn(conn, termino='papel carta'):
+    """
+    Verifica los índices GiST de la búsqueda KNN.
+
+    Un CREATE INDEX interrumpido deja el índice inválido (indisvalid = false)
+    y el planner lo ignora: se elimina para recrearlo en la siguiente ejecución.
+    Además se revisa con EXPLAIN que ORDER BY <-> LIMIT use el índice.
+
+    Returns:
+        True si todos los índices existen, son válidos y el planner los usa
+    """
+    cursor = conn.cursor()
+    print("\nVALIDANDO ÍNDICES KNN (GiST)...")
+    validos = True
+
+    for nombre, (tabla, columna) in INDICES_KNN.items():
+        # Solo tablas reales: con el esquema normalizado historico_licitaciones es una vista
+        cursor.execute("""
+            SELECT relkind IN ('r', 'p') FROM pg_class WHERE oid = to_regclass(%s)
+        """, (tabla,))
+        fila = cursor.fetchone()
+        if not fila or not fila[0]:
+            continue
+
+        cursor.execute("""
+            SELECT i.indisvalid, i.indisready
+            FROM pg_index i
+            WHERE i.indexrelid = to_regclass(%s)
+        """, (nombre,))
+        fila = cursor.fetchone()
+        if fila is None:
+            validos = False
+            print(f"  ❌ {nombre}: no existe")
+            continue
+        if not (fila[0] and fila[1]):
+            validos = False
+            cursor.execute(f"DROP INDEX IF EXISTS {nombre}")
+            conn.commit()
+            print(f"  ❌ {nombre}: inválido, eliminado (vuelva a ejecutar el script)")
+            continue
+
+        cursor.execute(f"""
+            EXPLAIN SELECT {columna}
+            FROM {tabla}
+            ORDER BY {columna} <-> %s
+            LIMIT 10
+        """, (termino,))
+        plan = '\n'.join(fila[0] for fila in cursor.fetchall())
+        if nombre in plan:
+            print(f"  ✅ {nombre}: válido, usado por ORDER BY {columna} <-> ... LIMIT")
+        else:
+            validos = False
+            print(f"  ⚠️  {nombre}: válido pero el planner no lo usa (¿falta ANALYZE?)")
+
+    return validos
+
+
 def crear_indices_optimizados():
     """Crea índices optimizados para queries del ML y API REST"""
     conn = db.get_connection()
@@ -43,6 +110,33 @@ def crear_indices_optimizados():
             USING gin(nombre_cotizacion gin_trgm_ops)
         """, "GIN Trigram: nombre (fuzzy matching para búsquedas)"),
 
+        # Columnas canónicas (canonizacion.py): agrupación exacta y fuzzy matching
+        ("idx_hist_producto_norm_trgm", """
+            CREATE INDEX IF NOT EXISTS idx_hist_producto_norm_trgm
+            ON historico_licitaciones
+            USING gin(producto_normalizado gin_trgm_ops)
+        """, "GIN Trigram: producto canónico (precio óptimo)"),
+
+        ("idx_hist_nombre_norm_trgm", """
+            CREATE INDEX IF NOT EXISTS idx_hist_nombre_norm_trgm
+            ON historico_licitaciones
+            USING gin(nombre_normalizado gin_trgm_ops)
+        """, "GIN Trigram: nombre canónico (RAG)"),
+
+        # Índices GiST para búsqueda KNN (ORDER BY col <-> término LIMIT k):
+        # devuelven los k más similares sin ordenar todas las coincidencias
+        ("idx_hist_producto_norm_gist", """
+            CREATE INDEX IF NOT EXISTS idx_hist_producto_norm_gist
+            ON historico_licitaciones
+            USING gist(producto_normalizado gist_trgm_ops)
+        """, "GiST Trigram: producto canónico (KNN precio óptimo/RAG)"),
+
+        ("idx_hist_nombre_norm_gist", """
+            CREATE INDEX IF NOT EXISTS idx_hist_nombre_norm_gist
+            ON historico_licitaciones
+            USING gist(nombre_normalizado gist_trgm_ops)
+        """, "GiST Trigram: nombre canónico (KNN RAG)"),
+
         # Índices para búsquedas de texto (case-insensitive - legacy)
         ("idx_hist_nombre_lower", """
             CREATE INDEX IF NOT EXISTS idx_hist_nombre_lower
@@ -213,6 +307,8 @@ def crear_indices_optimizados():
     print(f"  • Errores: {errores}")
     print("=" * 80)
     
+    validar_indices_knn(conn)
+
     # Analizar tamaño de índices
     print("\nANALIZANDO TAMAÑO DE ÍNDICES...")
     cursor.execute("""
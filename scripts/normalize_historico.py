@@ -0,0 +1,293 @@
+"""
+Script para normalizar historico_licitaciones en dimensiones + tabla de hechos
+Reduce el tamaño de tabla e índices para que más datos quepan en shared_buffers
+
+Crea hist_cotizaciones, hist_proveedores, hist_regiones e historico_ofertas
+(con claves enteras), copia los datos y reemplaza historico_licitaciones por
+una vista de compatibilidad con las mismas columnas. Las consultas existentes
+(ml_precio_optimo, rag_historico, api_backend_v3) siguen funcionando sin cambios.
+
+Si historico_licitaciones está particionada, historico_ofertas se crea con
+las mismas particiones mensuales (historico_ofertas_YYYY_MM).
+
+ADVERTENCIA: Este script realiza cambios estructurales en la BD.
+Ejecutar en horario de baja actividad y con backup previo.
+
+El script es IDEMPOTENTE - puede ejecutarse múltiples veces sin problemas.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import database_extended as db
+import dimensiones_historico as dim
+import particiones_historico as ph
+import time
+
+TABLA_ANTIGUA = 'historico_licitaciones_old'
+
+INDICES = [
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_cotizacion ON historico_ofertas(cotizacion_id)", "Cotización (joins)"),
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_proveedor ON historico_ofertas(proveedor_id)", "Proveedor (joins)"),
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_region_ganador ON historico_ofertas(region_id, es_ganador)", "Región + ganador"),
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_fecha ON historico_ofertas(fecha_cierre DESC)", "Fecha cierre"),
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_ganador_monto ON historico_ofertas(es_ganador, fecha_cierre DESC, monto_total) WHERE monto_total > 0", "Ganador + fecha + monto"),
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_producto_trgm ON historico_ofertas USING gin(producto_cotizado gin_trgm_ops)", "GIN Trigram producto"),
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_producto_norm ON historico_ofertas(producto_normalizado)", "Producto canónico"),
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_producto_norm_trgm ON historico_ofertas USING gin(producto_normalizado gin_trgm_ops)", "GIN Trigram producto canónico"),
+    ("CREATE INDEX IF NOT EXISTS idx_hcot_nombre_norm_trgm ON hist_cotizaciones USING gin(nombre_normalizado gin_trgm_ops)", "GIN Trigram nombre canónico"),
+    ("CREATE INDEX IF NOT EXISTS idx_hofe_producto_norm_gist ON historico_ofertas USING gist(producto_normalizado gist_trgm_ops)", "GiST Trigram producto canónico (KNN)"),
+    ("CREATE INDEX IF NOT EXISTS idx_hcot_nombre_norm_gist ON hist_cotizaciones USING gist(nombre_normalizado gist_trgm_ops)", "GiST Trigram nombre canónico (KNN)"),
+    ("CREATE INDEX IF NOT EXISTS idx_hcot_nombre_trgm ON hist_cotizaciones USING gin(nombre gin_trgm_ops)", "GIN Trigram nombre cotización"),
+    ("CREATE INDEX IF NOT EXISTS idx_hprov_nombre ON hist_proveedores(nombre)", "Nombre proveedor"),
+    ("CREATE INDEX IF NOT EXISTS idx_hreg_nombre_upper ON hist_regiones(UPPER(nombre))", "Región uppercase"),
+]
+
+
+def tamano_total(cursor, tabla):
+    """Tamaño de tabla + índices (incluye particiones)"""
+    cursor.execute("""
+        SELECT COALESCE(SUM(pg_total_relation_size(c.oid)), 0)
+        FROM pg_class c
+        WHERE c.oid = to_regclass(%s)
+        OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))
+    """, (tabla, tabla))
+    return cursor.fetchone()[0]
+
+
+def crear_tabla_hechos(cursor, particionada):
+    """Crea historico_ofertas (sin datos aún)"""
+    print("\n📋 Creando tabla de hechos historico_ofertas...")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {dim.TABLA_HECHOS} (
+            id SERIAL,
+            cotizacion_id INTEGER,
+            region_id SMALLINT,
+            proveedor_id INTEGER,
+            producto_cotizado TEXT,
+            cantidad INTEGER,
+            monto_total INTEGER,
+            detalle_oferta TEXT,
+            es_ganador BOOLEAN,
+            fecha_cierre DATE,
+            fecha_importacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            producto_normalizado TEXT,
+            cantidad_medida REAL,
+            unidad_medida TEXT
+            {', PRIMARY KEY (id, fecha_cierre)' if particionada else ', PRIMARY KEY (id)'}
+        ) {'PARTITION BY RANGE (fecha_cierre)' if particionada else ''}
+    """)
+
+
+def meses_particionados(cursor):
+    """Meses de las particiones existentes de historico_licitaciones"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname
+    """, (ph.TABLA_HISTORICO,))
+    meses = []
+    for (nombre,) in cursor.fetchall():
+        anio, mes = nombre.rsplit('_', 2)[-2:]
+        meses.append(f"{anio}-{mes}")
+    return meses
+
+
+def copiar_datos(conn, particionada):
+    """Puebla dimensiones y copia las filas traducidas a claves"""
+    cursor = conn.cursor()
+
+    print("\n📇 Poblando dimensiones (cotizaciones, proveedores, regiones)...")
+    start_time = time.time()
+    dim.actualizar_dimensiones(cursor, ph.TABLA_HISTORICO)
+    conn.commit()
+    for tabla in ('hist_cotizaciones', 'hist_proveedores', 'hist_regiones'):
+        cursor.execute(f"SELECT COUNT(*) FROM {tabla}")
+        print(f"  • {tabla:20} {cursor.fetchone()[0]:>12,} filas")
+    print(f"  ✅ Dimensiones pobladas en {time.time() - start_time:.1f} segundos")
+
+    print("\n📦 Copiando filas a historico_ofertas...")
+    print("  (Esto puede tomar varios minutos para 10M+ registros)")
+    start_time = time.time()
+    total = 0
+
+    if particionada:
+        for mes in meses_particionados(cursor):
+            inicio, fin = ph.rango_mes(mes)
+            origen = ph.nombre_particion(mes)
+            destino = ph.nombre_particion(mes, dim.TABLA_HECHOS)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {destino}
+                PARTITION OF {dim.TABLA_HECHOS}
+                FOR VALUES FROM (%s) TO (%s)
+            """, (inicio, fin))
+            cursor.execute(f"TRUNCATE {destino}")
+            filas = dim.insertar_hechos(cursor, origen, destino, conservar_ids=True)
+            conn.commit()
+            total += filas
+            print(f"  ✓ {mes}: {filas:,} filas")
+    else:
+        cursor.execute(f"TRUNCATE {dim.TABLA_HECHOS}")
+        total = dim.insertar_hechos(cursor, ph.TABLA_HISTORICO, dim.TABLA_HECHOS, conservar_ids=True)
+        conn.commit()
+
+    # Continuar la secuencia desde el id más alto copiado
+    cursor.execute(f"""
+        SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 1))
+        FROM {dim.TABLA_HECHOS}
+    """, (dim.TABLA_HECHOS,))
+    conn.commit()
+
+    print(f"  ✅ {total:,} filas copiadas en {time.time() - start_time:.1f} segundos")
+    return total
+
+
+def crear_indices(conn):
+    """Crea índices en hechos y dimensiones"""
+    cursor = conn.cursor()
+    print("\n📇 Creando índices...")
+    for sql, desc in INDICES:
+        try:
+            print(f"  • {desc}...")
+            cursor.execute(sql)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"    ⚠️  Error: {e}")
+    cursor.execute(f"ANALYZE {dim.TABLA_HECHOS}")
+    for tabla in ('hist_cotizaciones', 'hist_proveedores', 'hist_regiones'):
+        cursor.execute(f"ANALYZE {tabla}")
+    conn.commit()
+    print("  ✅ Índices creados")
+
+
+def reemplazar_por_vista(conn):
+    """Renombra la tabla original y crea la vista de compatibilidad (una transacción)"""
+    cursor = conn.cursor()
+    print("\n🔁 Reemplazando historico_licitaciones por la vista de compatibilidad...")
+    try:
+        cursor.execute(f"ALTER TABLE {ph.TABLA_HISTORICO} RENAME TO {TABLA_ANTIGUA}")
+        cursor.execute(dim.SQL_VISTA)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"  ✅ Vista creada; la tabla original quedó como {TABLA_ANTIGUA}")
+
+
+def limpiar_tabla_antigua(conn):
+    """
+    Elimina la tabla antigua SOLO si el usuario confirma
+    ADVERTENCIA: Esta operación es irreversible
+    """
+    print("\n🗑️  LIMPIEZA DE TABLA ANTIGUA")
+    print("=" * 80)
+    print(f"La tabla '{TABLA_ANTIGUA}' contiene los datos originales (con textos repetidos).")
+    print()
+    print("⚠️  ADVERTENCIA: Esta operación es IRREVERSIBLE")
+    print()
+
+    respuesta = input("¿Deseas eliminar la tabla antigua? (escribe 'SI' en mayúsculas): ")
+
+    if respuesta != "SI":
+        print("❌ Operación cancelada. La tabla antigua permanece como backup.")
+        print("   Puedes eliminarla manualmente más tarde con:")
+        print(f"   DROP TABLE {TABLA_ANTIGUA} CASCADE;")
+        return
+
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLA_ANTIGUA} CASCADE")
+    conn.commit()
+    print("✅ Tabla antigua eliminada")
+
+
+def main():
+    """Función principal de normalización"""
+    print("=" * 80)
+    print("NORMALIZACIÓN DE HISTORICO_LICITACIONES")
+    print("=" * 80)
+    print()
+
+    if not db.USE_POSTGRES:
+        print("⚠️  La normalización solo está disponible en PostgreSQL.")
+        return
+
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    # Paso 0: Verificar si ya está normalizada
+    if dim.esta_normalizada(conn):
+        print("✅ historico_licitaciones ya es una vista sobre historico_ofertas.")
+        conn.close()
+        return
+
+    particionada = ph.esta_particionada(conn)
+    tamano_antes = tamano_total(cursor, ph.TABLA_HISTORICO)
+
+    print(f"  • Tabla particionada: {'sí' if particionada else 'no'}")
+    print(f"  • Tamaño actual (tabla + índices): {tamano_antes / (1024**3):.2f} GB")
+    print()
+    print("⚠️  ADVERTENCIA:")
+    print("  Este proceso va a:")
+    print("  1. Crear tablas de dimensiones y la tabla historico_ofertas")
+    print("  2. Copiar todos los registros traduciendo textos a claves enteras")
+    print(f"  3. Renombrar la tabla actual a '{TABLA_ANTIGUA}'")
+    print("  4. Crear la vista historico_licitaciones con las columnas originales")
+    print()
+    print("  💾 ASEGÚRATE DE TENER UN BACKUP antes de continuar")
+    print()
+
+    respuesta = input("¿Continuar con la normalización? (escribe 'SI' en mayúsculas): ")
+
+    if respuesta != "SI":
+        print("❌ Operación cancelada por el usuario")
+        conn.close()
+        return
+
+    # Paso 1: Dimensiones y tabla de hechos
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️  pg_trgm no disponible, se omitirán los índices trigram: {e}")
+    # La tabla actual debe tener las columnas canónicas que se copian
+    db.agregar_columnas_normalizadas(cursor)
+    dim.crear_dimensiones(cursor)
+    crear_tabla_hechos(cursor, particionada)
+    conn.commit()
+
+    # Paso 2: Copiar datos
+    copiar_datos(conn, particionada)
+
+    # Paso 3: Índices
+    crear_indices(conn)
+
+    # Paso 4: Vista de compatibilidad
+    reemplazar_por_vista(conn)
+
+    tamano_despues = (
+        tamano_total(cursor, dim.TABLA_HECHOS)
+        + sum(tamano_total(cursor, t) for t in ('hist_cotizaciones', 'hist_proveedores', 'hist_regiones'))
+    )
+    print("\n📊 Tamaño (tabla + índices):")
+    print(f"  • Antes:   {tamano_antes / (1024**3):.2f} GB")
+    print(f"  • Después: {tamano_despues / (1024**3):.2f} GB")
+
+    # Paso 5: Limpiar tabla antigua (opcional)
+    limpiar_tabla_antigua(conn)
+    conn.close()
+
+    print("\n" + "=" * 80)
+    print("✅ NORMALIZACIÓN COMPLETADA EXITOSAMENTE")
+    print("=" * 80)
+    print("\n🔧 Próximos pasos:")
+    print("  1. Las importaciones (run_monthly_import, backfill_historico) cargan")
+    print("     automáticamente en historico_ofertas a través de las dimensiones")
+    print("  2. Monitorear el plan de las consultas más frecuentes (EXPLAIN)")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,12 +11,18 @@ Usage:
     # Use specific provider
     provider = get_ai_provider("groq")
     response = provider.generate("Tu prompt aquí")
+
+    # Async (doesn't block the bot's event loop) and streaming
+    response = await agenerate_completion("Analiza esta licitación...")
+    async for token in astream_completion("Analiza esta licitación..."):
+        print(token, end="")
 """
 import os
 import json
+import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator
 from dataclasses import dataclass
 from dotenv import load_dotenv
 
@@ -85,6 +91,136 @@ class AIProvider(ABC):
         """Generate and parse as JSON."""
         response = self.generate(prompt, **kwargs)
         return response.to_json()
+    
+    def _ensure_configured(self):
+        if not self._configured:
+            self.configure()
+        
+        if not self._configured:
+            raise RuntimeError(f"{self.name} provider not configured")
+    
+    async def agenerate(self, prompt: str, **kwargs) -> AIResponse:
+        """
+        Async version of generate().
+        
+        Providers with a native async client override this; the default runs
+        generate() in a worker thread so the event loop is never blocked.
+        """
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+    
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Stream the completion as text chunks, in order.
+        
+        The default yields the whole agenerate() text as a single chunk.
+        """
+        response = await self.agenerate(prompt, **kwargs)
+        yield response.text
+    
+    async def agenerate_json(self, prompt: str, **kwargs) -> Optional[dict]:
+        """Async generate and parse as JSON."""
+        response = await self.agenerate(prompt, **kwargs)
+        return response.to_json()
+    
+    async def aclose(self):
+        """Release async connections (call on shutdown)."""
+        pass
+
+
+def _usage_dict(completion) -> Optional[Dict[str, int]]:
+    """Token usage of an OpenAI-compatible completion, if reported."""
+    usage = getattr(completion, 'usage', None)
+    if not usage:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens
+    }
+
+
+class ChatCompletionsProvider(AIProvider):
+    """
+    Base for providers with an OpenAI-compatible chat completions API
+    (Groq, Cerebras, OpenAI).
+    
+    The async client is created once per event loop and reused, so
+    concurrent requests share its HTTP connection pool.
+    """
+    
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+        super().__init__(api_key=api_key, model=model)
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+    
+    @abstractmethod
+    def _create_async_client(self):
+        """Build the SDK's async client."""
+        pass
+    
+    def _completion_params(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """Arguments for chat.completions.create()."""
+        return {
+            "messages": [{"role": "user", "content": prompt}],
+            "model": self.model,
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 4096),
+        }
+    
+    async def _get_async_client(self):
+        # The SDK clients hold connections bound to the loop that opened them:
+        # on a new loop the previous client is closed and replaced
+        loop = asyncio.get_running_loop()
+        if self._async_client is not None and self._async_loop is not loop:
+            previous, self._async_client = self._async_client, None
+            try:
+                await previous.close()
+            except Exception as e:
+                logger.debug(f"{self.name}: error closing previous async client: {e}")
+        if self._async_client is None:
+            self._async_client = self._create_async_client()
+            self._async_loop = loop
+        return self._async_client
+    
+    async def agenerate(self, prompt: str, **kwargs) -> AIResponse:
+        self._ensure_configured()
+        
+        try:
+            chat_completion = await (await self._get_async_client()).chat.completions.create(
+                **self._completion_params(prompt, **kwargs)
+            )
+            
+            return AIResponse(
+                text=chat_completion.choices[0].message.content,
+                provider=self.name,
+                model=self.model,
+                usage=_usage_dict(chat_completion),
+                raw_response=chat_completion
+            )
+        except Exception as e:
+            logger.error(f"{self.name} async generation error: {e}")
+            raise
+    
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        self._ensure_configured()
+        
+        try:
+            stream = await (await self._get_async_client()).chat.completions.create(
+                stream=True, **self._completion_params(prompt, **kwargs)
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"{self.name} streaming error: {e}")
+            raise
+    
+    async def aclose(self):
+        client, self._async_client = self._async_client, None
+        self._async_loop = None
+        if client is not None:
+            await client.close()
 
 
 # ==================== GEMINI PROVIDER ====================
@@ -141,11 +277,42 @@ class GeminiProvider(AIProvider):
         except Exception as e:
             logger.error(f"Gemini generation error: {e}")
             raise
+    
+    async def agenerate(self, prompt: str, **kwargs) -> AIResponse:
+        self._ensure_configured()
+        
+        try:
+            model = self._genai.GenerativeModel(self.model)
+            response = await model.generate_content_async(prompt)
+            
+            return AIResponse(
+                text=response.text,
+                provider=self.name,
+                model=self.model,
+                raw_response=response
+            )
+        except Exception as e:
+            logger.error(f"Gemini async generation error: {e}")
+            raise
+    
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        self._ensure_configured()
+        
+        try:
+            model = self._genai.GenerativeModel(self.model)
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                # Chunks without text parts (e.g. final safety metadata) are skipped
+                if chunk.parts:
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Gemini streaming error: {e}")
+            raise
 
 
 # ==================== GROQ PROVIDER ====================
 
-class GroqProvider(AIProvider):
+class GroqProvider(ChatCompletionsProvider):
     """Groq AI provider (fast inference)."""
     
     name = "groq"
@@ -164,7 +331,6 @@ class GroqProvider(AIProvider):
             api_key=api_key or os.getenv('GROQ_API_KEY'),
             model=model or os.getenv('GROQ_MODEL', self.default_model)
         )
-        self._client = None
     
     def configure(self) -> bool:
         if not self.api_key:
@@ -184,6 +350,10 @@ class GroqProvider(AIProvider):
             logger.error(f"Groq configuration error: {e}")
             return False
     
+    def _create_async_client(self):
+        from groq import AsyncGroq
+        return AsyncGroq(api_key=self.api_key)
+    
     def generate(self, prompt: str, **kwargs) -> AIResponse:
         if not self._configured:
             self.configure()
@@ -226,7 +396,7 @@ class GroqProvider(AIProvider):
 
 # ==================== CEREBRAS PROVIDER ====================
 
-class CerebrasProvider(AIProvider):
+class CerebrasProvider(ChatCompletionsProvider):
     """Cerebras AI provider (ultra-fast inference)."""
     
     name = "cerebras"
@@ -243,7 +413,6 @@ class CerebrasProvider(AIProvider):
             api_key=api_key or os.getenv('CEREBRAS_API_KEY'),
             model=model or os.getenv('CEREBRAS_MODEL', self.default_model)
         )
-        self._client = None
     
     def configure(self) -> bool:
         if not self.api_key:
@@ -263,6 +432,10 @@ class CerebrasProvider(AIProvider):
             logger.error(f"Cerebras configuration error: {e}")
             return False
     
+    def _create_async_client(self):
+        from cerebras.cloud.sdk import AsyncCerebras
+        return AsyncCerebras(api_key=self.api_key)
+    
     def generate(self, prompt: str, **kwargs) -> AIResponse:
         if not self._configured:
             self.configure()
@@ -305,7 +478,7 @@ class CerebrasProvider(AIProvider):
 
 # ==================== OPENAI PROVIDER ====================
 
-class OpenAIProvider(AIProvider):
+class OpenAIProvider(ChatCompletionsProvider):
     """OpenAI ChatGPT provider."""
     
     name = "openai"
@@ -326,7 +499,6 @@ class OpenAIProvider(AIProvider):
             api_key=api_key or os.getenv('OPENAI_API_KEY'),
             model=model or os.getenv('OPENAI_MODEL', self.default_model)
         )
-        self._client = None
     
     def configure(self) -> bool:
         if not self.api_key:
@@ -346,6 +518,17 @@ class OpenAIProvider(AIProvider):
             logger.error(f"OpenAI configuration error: {e}")
             return False
     
+    def _create_async_client(self):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=self.api_key)
+    
+    def _completion_params(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        params = super()._completion_params(prompt, **kwargs)
+        # o1 models don't support temperature parameter
+        if self.model.startswith('o1'):
+            del params["temperature"]
+        return params
+    
     def generate(self, prompt: str, **kwargs) -> AIResponse:
         if not self._configured:
             self.configure()
@@ -354,36 +537,15 @@ class OpenAIProvider(AIProvider):
             raise RuntimeError("OpenAI provider not configured")
         
         try:
-            # Check if using o1 models (they don't support temperature)
-            is_o1_model = self.model.startswith('o1')
-            
-            create_params = {
-                "messages": [{"role": "user", "content": prompt}],
-                "model": self.model,
-                "max_tokens": kwargs.get('max_tokens', 4096),
-            }
-            
-            # o1 models don't support temperature parameter
-            if not is_o1_model:
-                create_params["temperature"] = kwargs.get('temperature', 0.7)
-            
-            chat_completion = self._client.chat.completions.create(**create_params)
-            
-            response_text = chat_completion.choices[0].message.content
-            
-            usage = None
-            if chat_completion.usage:
-                usage = {
-                    "prompt_tokens": chat_completion.usage.prompt_tokens,
-                    "completion_tokens": chat_completion.usage.completion_tokens,
-                    "total_tokens": chat_completion.usage.total_tokens
-                }
+            chat_completion = self._client.chat.completions.create(
+                **self._completion_params(prompt, **kwargs)
+            )
             
             return AIResponse(
-                text=response_text,
+                text=chat_completion.choices[0].message.content,
                 provider=self.name,
                 model=self.model,
-                usage=usage,
+                usage=_usage_dict(chat_completion),
                 raw_response=chat_completion
             )
         except Exception as e:
@@ -490,6 +652,44 @@ def generate_json(
     return response.to_json()
 
 
+async def agenerate_completion(
+    prompt: str,
+    provider: Optional[str] = None,
+    **kwargs
+) -> AIResponse:
+    """
+    Async version of generate_completion(): the event loop keeps serving
+    other requests while the provider answers.
+    """
+    ai_provider = get_ai_provider(provider)
+    return await ai_provider.agenerate(prompt, **kwargs)
+
+
+async def astream_completion(
+    prompt: str,
+    provider: Optional[str] = None,
+    **kwargs
+) -> AsyncIterator[str]:
+    """
+    Stream a completion as text chunks from the specified or default provider.
+    
+    Yields:
+        Text chunks in order; joined they form the full completion.
+    """
+    ai_provider = get_ai_provider(provider)
+    async for chunk in ai_provider.astream(prompt, **kwargs):
+        yield chunk
+
+
+async def close_providers():
+    """Close the async clients of the cached providers."""
+    for provider in _provider_instances.values():
+        try:
+            await provider.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing {provider.name}: {e}")
+
+
 # ==================== FALLBACK CHAIN ====================
 
 class FallbackChain:
@@ -530,6 +730,44 @@ class FallbackChain:
                 last_error = e
         
         raise RuntimeError(f"All providers failed. Last error: {last_error}")
+    
+    async def agenerate(self, prompt: str, **kwargs) -> AIResponse:
+        """Async version of generate()."""
+        last_error = None
+        
+        for provider in self._providers:
+            try:
+                return await provider.agenerate(prompt, **kwargs)
+            except Exception as e:
+                logger.warning(f"{provider.name} failed: {e}, trying next...")
+                last_error = e
+        
+        raise RuntimeError(f"All providers failed. Last error: {last_error}")
+    
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Stream from the first provider that succeeds.
+        
+        A provider that fails before its first chunk is skipped; once chunks
+        have been yielded an error is raised instead of switching providers,
+        so the caller never receives text from two different completions.
+        """
+        last_error = None
+        
+        for provider in self._providers:
+            started = False
+            try:
+                async for chunk in provider.astream(prompt, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                logger.warning(f"{provider.name} failed: {e}, trying next...")
+                last_error = e
+        
+        raise RuntimeError(f"All providers failed. Last error: {last_error}")
 
 
 # ==================== MAIN ====================
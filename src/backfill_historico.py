@@ -0,0 +1,363 @@
+"""
+Backfill del histórico de Mercado Público para un rango de meses.
+
+Determina qué meses faltan o están obsoletos, y ejecuta descarga, carga y
+finalización (intercambio de partición) en paralelo con concurrencia
+configurable. El estado de cada mes se registra en historico_importaciones,
+por lo que una ejecución interrumpida se retoma desde donde quedó.
+
+Uso:
+    python src/backfill_historico.py --desde 2023-01 --hasta 2025-06 --descargas 3 --paralelo 2
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+import database_extended as db
+import descarga_historico as dh
+import importar_historico as ih
+import particiones_historico as ph
+from run_monthly_import import actualizar_derivados, build_month_str, build_url
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+# Estados de un mes en historico_importaciones
+ESTADO_DESCARGANDO = 'descargando'
+ESTADO_CARGANDO = 'cargando'
+ESTADO_FINALIZANDO = 'finalizando'
+ESTADO_COMPLETADO = 'completado'
+ESTADO_ERROR = 'error'
+
+# Campos actualizables del checkpoint
+_CAMPOS_CHECKPOINT = (
+    'url', 'estado', 'etag', 'registros', 'descartados', 'bytes_descargados',
+    'segundos_descarga', 'segundos_carga', 'segundos_finalizacion', 'error'
+)
+
+
+def meses_en_rango(desde, hasta):
+    """Lista de meses 'YYYY-MM' entre desde y hasta (inclusive)."""
+    inicio, _ = ph.rango_mes(desde)
+    fin, _ = ph.rango_mes(hasta)
+    if inicio > fin:
+        raise ValueError(f"Rango inválido: {desde} > {hasta}")
+
+    meses = []
+    anio, mes = inicio.year, inicio.month
+    while (anio, mes) <= (fin.year, fin.month):
+        meses.append(f"{anio}-{mes:02d}")
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return meses
+
+
+# ==================== CHECKPOINTS ====================
+
+def leer_checkpoints(meses):
+    """Retorna {mes: dict} con el estado registrado de cada mes."""
+    if not meses:
+        return {}
+    p = db.get_placeholder()
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT mes, {', '.join(_CAMPOS_CHECKPOINT)}
+            FROM historico_importaciones
+            WHERE mes IN ({', '.join([p] * len(meses))})
+        """, tuple(meses))
+        return {
+            row[0]: dict(zip(_CAMPOS_CHECKPOINT, row[1:]))
+            for row in cursor.fetchall()
+        }
+    finally:
+        conn.close()
+
+
+def guardar_checkpoint(mes, **campos):
+    """Inserta o actualiza el estado de un mes (upsert compatible PostgreSQL/SQLite)."""
+    columnas = [c for c in _CAMPOS_CHECKPOINT if c in campos]
+    p = db.get_placeholder()
+    actualizaciones = ', '.join(f"{c} = EXCLUDED.{c}" for c in columnas)
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO historico_importaciones (mes, {', '.join(columnas)}, actualizado)
+            VALUES ({p}, {', '.join([p] * len(columnas))}, CURRENT_TIMESTAMP)
+            ON CONFLICT (mes) DO UPDATE SET {actualizaciones}, actualizado = CURRENT_TIMESTAMP
+        """, (mes, *[campos[c] for c in columnas]))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ==================== PLANIFICACIÓN ====================
+
+def clasificar_meses(meses, checkpoints, con_datos, etags_remotos=None, force=False):
+    """
+    Decide qué meses importar y por qué.
+
+    Args:
+        meses: Meses del rango solicitado
+        checkpoints: {mes: dict} leído de historico_importaciones
+        con_datos: Conjunto de meses con datos presentes en la tabla
+        etags_remotos: {mes: etag} actual del servidor (opcional, para detectar cambios)
+        force: Reimportar todo el rango
+
+    Returns:
+        {mes: motivo} solo para los meses que deben importarse
+    """
+    etags_remotos = etags_remotos or {}
+    plan = {}
+    for mes in meses:
+        checkpoint = checkpoints.get(mes)
+        if force:
+            plan[mes] = 'forzado'
+        elif checkpoint is None:
+            if mes not in con_datos:
+                plan[mes] = 'faltante'
+        elif checkpoint['estado'] != ESTADO_COMPLETADO:
+            plan[mes] = f"incompleto ({checkpoint['estado']})"
+        elif mes not in con_datos:
+            plan[mes] = 'sin datos (restauración o borrado)'
+        elif etags_remotos.get(mes) and etags_remotos[mes] != checkpoint.get('etag'):
+            plan[mes] = 'archivo remoto actualizado'
+    return plan
+
+
+def _etag_remoto(url):
+    try:
+        r = requests.head(url, allow_redirects=True, timeout=dh.TIMEOUT)
+        return r.headers.get('ETag') if r.ok else None
+    except requests.exceptions.RequestException:
+        return None
+
+
+# ==================== ETAPAS ====================
+
+class Backfill:
+    """Ejecuta el pipeline descarga -> carga -> finalización para varios meses."""
+
+    def __init__(self, descargas=2, paralelo=1, workers=1, usar_cache=True):
+        self.descargas = descargas
+        self.paralelo = paralelo
+        self.workers = workers
+        self.usar_cache = usar_cache
+        self.cache = dh.CacheHistorico()
+        self.resultados = {}
+        # Los intercambios de partición toman locks exclusivos sobre el padre: uno a la vez
+        self._lock_finalizacion = threading.Lock()
+
+        conn = db.get_connection()
+        try:
+            self.particionada = ph.esta_particionada(conn)
+        finally:
+            conn.close()
+
+    def descargar(self, mes):
+        url = build_url(mes)
+        guardar_checkpoint(mes, url=url, estado=ESTADO_DESCARGANDO, error=None)
+        inicio = time.time()
+
+        ruta = self.cache.buscar(url) if self.usar_cache else None
+        if ruta is None:
+            descarga = self.cache.abrir_descarga(url)
+            try:
+                ruta = self.cache.registrar(url, descarga)
+            finally:
+                descarga.close()
+
+        segundos = time.time() - inicio
+        ref = self.cache.referencia(url) or {}
+        tamano = os.path.getsize(ruta)
+        guardar_checkpoint(mes, etag=ref.get('etag'), bytes_descargados=tamano, segundos_descarga=segundos)
+        self.resultados[mes] = {'bytes': tamano, 'descarga': segundos}
+        return mes
+
+    def cargar(self, mes):
+        url = build_url(mes)
+        resultado = self.resultados[mes]
+        guardar_checkpoint(mes, estado=ESTADO_CARGANDO)
+
+        inicio = time.time()
+        if self.particionada:
+            conn = db.get_connection()
+            try:
+                staging = ph.crear_staging(conn, mes)
+            finally:
+                conn.close()
+            registros = ih.descargar_y_procesar(url, workers=self.workers, tabla=staging)
+        else:
+            registros = ih.descargar_y_procesar(url, workers=self.workers)
+        resultado['carga'] = time.time() - inicio
+        resultado['registros'] = registros
+        guardar_checkpoint(mes, estado=ESTADO_FINALIZANDO, registros=registros,
+                           segundos_carga=resultado['carga'])
+
+        inicio = time.time()
+        descartadas = 0
+        if self.particionada:
+            with self._lock_finalizacion:
+                conn = db.get_connection()
+                try:
+                    descartadas = ph.preparar_staging(conn, mes)
+                    ph.intercambiar_particion(conn, mes)
+                finally:
+                    conn.close()
+        resultado['finalizacion'] = time.time() - inicio
+        resultado['registros'] = registros - descartadas
+
+        guardar_checkpoint(
+            mes, estado=ESTADO_COMPLETADO, registros=resultado['registros'],
+            descartados=descartadas, segundos_finalizacion=resultado['finalizacion']
+        )
+        return mes
+
+    def _fallo(self, mes, etapa, error):
+        logger.error(f"[{mes}] Error en {etapa}: {error}")
+        self.resultados.setdefault(mes, {})['error'] = f"{etapa}: {error}"
+        guardar_checkpoint(mes, estado=ESTADO_ERROR, error=f"{etapa}: {error}"[:1000])
+
+    def ejecutar(self, meses):
+        """Descarga con `descargas` hilos y carga con `paralelo` hilos a medida que llegan."""
+        with ThreadPoolExecutor(self.descargas, thread_name_prefix='descarga') as pool_descargas, \
+             ThreadPoolExecutor(self.paralelo, thread_name_prefix='carga') as pool_cargas:
+            descargas = {pool_descargas.submit(self.descargar, mes): mes for mes in meses}
+            cargas = {}
+
+            for futuro in as_completed(descargas):
+                mes = descargas[futuro]
+                try:
+                    futuro.result()
+                except Exception as e:
+                    self._fallo(mes, 'descarga', e)
+                    continue
+                logger.info(f"[{mes}] Descargado, en cola para carga")
+                cargas[pool_cargas.submit(self.cargar, mes)] = mes
+
+            for futuro in as_completed(cargas):
+                mes = cargas[futuro]
+                try:
+                    futuro.result()
+                    logger.info(f"[{mes}] ✓ Completado")
+                except Exception as e:
+                    self._fallo(mes, 'carga', e)
+
+        return self.resultados
+
+
+def imprimir_resumen(resultados, duracion_total):
+    """Resumen por mes y throughput agregado por etapa."""
+    logger.info("=" * 78)
+    logger.info("RESUMEN DEL BACKFILL")
+    logger.info("=" * 78)
+    logger.info(f"{'Mes':<8} {'Registros':>11} {'Descarga':>12} {'Carga':>14} {'Finalización':>14}  Estado")
+
+    totales = {'registros': 0, 'bytes': 0, 'descarga': 0.0, 'carga': 0.0, 'finalizacion': 0.0}
+    for mes in sorted(resultados):
+        r = resultados[mes]
+        registros = r.get('registros', 0)
+        for clave in totales:
+            totales[clave] += r.get(clave, 0) if 'error' not in r else 0
+
+        descarga = f"{r['bytes'] / (1024*1024) / r['descarga']:.1f} MB/s" if r.get('descarga') else '-'
+        carga = f"{registros / r['carga']:,.0f} reg/s" if r.get('carga') else '-'
+        final = f"{registros / r['finalizacion']:,.0f} reg/s" if r.get('finalizacion') else '-'
+        estado = r.get('error', 'OK')
+        logger.info(f"{mes:<8} {registros:>11,} {descarga:>12} {carga:>14} {final:>14}  {estado}")
+
+    logger.info("-" * 78)
+    if totales['descarga']:
+        logger.info(f"Descarga:     {totales['bytes'] / (1024*1024) / totales['descarga']:.1f} MB/s "
+                    f"({totales['registros'] / totales['descarga']:,.0f} reg/s)")
+    if totales['carga']:
+        logger.info(f"Carga:        {totales['registros'] / totales['carga']:,.0f} reg/s")
+    if totales['finalizacion']:
+        logger.info(f"Finalización: {totales['registros'] / totales['finalizacion']:,.0f} reg/s")
+    logger.info(f"Total: {totales['registros']:,} registros en {duracion_total:.1f}s "
+                f"({totales['registros'] / duracion_total if duracion_total else 0:,.0f} reg/s de punta a punta)")
+    logger.info("=" * 78)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Backfill de histórico para un rango de meses")
+    parser.add_argument("--desde", required=True, help="Primer mes (YYYY-MM)")
+    parser.add_argument("--hasta", help="Último mes (YYYY-MM, por defecto el mes anterior)")
+    parser.add_argument("--db-url", help="URL de conexión a la base de datos")
+    parser.add_argument("--descargas", type=int, default=2, help="Descargas simultáneas")
+    parser.add_argument("--paralelo", type=int, default=1, help="Meses cargándose simultáneamente")
+    parser.add_argument("--workers", type=int, default=ih.IMPORT_WORKERS,
+                        help="Procesos de parseo/carga por mes")
+    parser.add_argument("--verificar-remoto", action="store_true",
+                        help="Reimportar meses cuyo archivo remoto cambió (ETag)")
+    parser.add_argument("--force", action="store_true", help="Reimportar todo el rango")
+    parser.add_argument("--no-cache", action="store_true", help="Ignorar la caché local de ZIPs")
+    parser.add_argument("--parquet", action="store_true",
+                        help="Actualizar el espejo Parquet de los meses importados")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar el plan")
+    args = parser.parse_args()
+
+    if args.db_url:
+        os.environ["DATABASE_URL"] = args.db_url
+        import importlib
+        importlib.reload(db)
+
+    db.iniciar_db_extendida()
+
+    meses = meses_en_rango(args.desde, build_month_str(args.hasta))
+    checkpoints = leer_checkpoints(meses)
+
+    conn = db.get_connection()
+    try:
+        con_datos = {mes for mes in meses if ph.mes_tiene_datos(conn, mes)}
+        particionada = ph.esta_particionada(conn)
+    finally:
+        conn.close()
+
+    etags = {}
+    if args.verificar_remoto:
+        etags = {mes: _etag_remoto(build_url(mes)) for mes in meses if mes in con_datos}
+
+    plan = clasificar_meses(meses, checkpoints, con_datos, etags, force=args.force)
+
+    if not particionada:
+        # Sin particiones no hay reemplazo atómico: nunca recargar meses con datos
+        for mes in [m for m in plan if m in con_datos]:
+            logger.warning(f"[{mes}] Tiene datos y la tabla no está particionada; se omite ({plan[mes]})")
+            del plan[mes]
+
+    logger.info(f"Meses en rango: {len(meses)} | A importar: {len(plan)}")
+    for mes, motivo in sorted(plan.items()):
+        logger.info(f"  • {mes}: {motivo}")
+
+    if args.dry_run or not plan:
+        return
+
+    inicio = time.time()
+    backfill = Backfill(descargas=args.descargas, paralelo=args.paralelo,
+                        workers=args.workers, usar_cache=not args.no_cache)
+    resultados = backfill.ejecutar(sorted(plan))
+    imprimir_resumen(resultados, time.time() - inicio)
+
+    importados = [mes for mes, r in resultados.items() if 'error' not in r]
+    if args.parquet:
+        import parquet_historico
+        parquet_historico.sincronizar(importados, force=True)
+    if importados:
+        actualizar_derivados(importados)
+
+    if any('error' in r for r in resultados.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -78,6 +78,17 @@ async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await bot_ui.menu_principal(update, context)
 
 
+async def cerrar_recursos(application):
+    """Al apagar: cierra los clientes HTTP de los proveedores de IA y el pool ML"""
+    try:
+        import ai_providers
+        await ai_providers.close_providers()
+    except ImportError:
+        pass
+    import pool_ml
+    pool_ml.cerrar()
+
+
 def main():
     """Función principal del bot"""
     
@@ -99,7 +110,7 @@ def main():
     db_bot.iniciar_db_bot()
     
     # Crear aplicación
-    application = ApplicationBuilder().token(TOKEN).build()
+    application = ApplicationBuilder().token(TOKEN).post_shutdown(cerrar_recursos).build()
     
     # ==================== HANDLERS ====================
     
@@ -7,6 +7,8 @@ import database_bot as db_bot
 import database_extended as db
 import filtros
 import gemini_ai
+import cache_analisis
+from mensaje_progresivo import MensajeProgresivo, texto_legible_json
 import api_client
 import io
 import pandas as pd
@@ -322,10 +324,11 @@ async def analizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    await update.effective_message.reply_text(
-        f"🤖 Analizando licitación {codigo}...\n"
-        "Esto puede tomar unos segundos.",
-        parse_mode='HTML'
+    # Mensaje que muestra el análisis a medida que llega
+    progreso = await MensajeProgresivo.enviar(
+        update.effective_message,
+        f"🤖 Analizando licitación {codigo}...",
+        vista_previa=texto_legible_json
     )
     
     # Buscar licitación en BD
@@ -343,7 +346,8 @@ async def analizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if not row:
         conn.close()
-        await update.effective_message.reply_text(
+        # El aviso reemplaza al mensaje de progreso
+        await progreso.finalizar(
             f"❌ No encontré la licitación {codigo}\n"
             "Verifica el código e intenta de nuevo.",
             parse_mode='HTML'
@@ -362,14 +366,16 @@ async def analizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     productos = [dict(zip(['nombre', 'cantidad', 'unidad_medida'], p)) for p in cursor.fetchall()]
     conn.close()
     
-    # Verificar caché
-    analisis = db_bot.obtener_analisis_cache(codigo)
+    # Verificar caché (por licitación y perfil)
+    analisis = cache_analisis.obtener(codigo, perfil)
     
     if not analisis:
         # Analizar con IA
-        analisis = gemini_ai.analizar_licitacion_completo(licitacion, perfil, productos)
-        # Guardar en caché
-        db_bot.guardar_analisis_cache(codigo, analisis)
+        analisis = await gemini_ai.analizar_licitacion_completo_async(
+            licitacion, perfil, productos, al_avanzar=progreso.actualizar
+        )
+        # Guardar en caché hasta el cierre de la licitación
+        cache_analisis.guardar(codigo, perfil, analisis, licitacion['fecha_cierre'])
     
     # Formatear respuesta
     mensaje = f"🤖 <b>Análisis de Licitación</b>\n\n"
@@ -421,7 +427,7 @@ async def analizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await update.effective_message.reply_text(mensaje, reply_markup=reply_markup, parse_mode='HTML')
+    await progreso.finalizar(mensaje, reply_markup=reply_markup, parse_mode='HTML')
     
     # NUEVO: Trackear uso exitoso
     subs.track_usage(user_id, 'ai_analysis', codigo)
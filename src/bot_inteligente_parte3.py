@@ -6,6 +6,8 @@ from telegram.ext import ContextTypes
 import database_bot as db_bot
 import database_extended as db
 import gemini_ai
+import cache_analisis
+from mensaje_progresivo import MensajeProgresivo, texto_legible_json
 
 
 # ==================== LICITACIONES GUARDADAS ====================
@@ -124,9 +126,10 @@ async def ayuda_cotizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    await update.effective_message.reply_text(
+    progreso = await MensajeProgresivo.enviar(
+        update.effective_message,
         f"📝 Generando guía para cotizar {codigo}...",
-        parse_mode='HTML'
+        vista_previa=texto_legible_json
     )
     
     # Obtener licitación
@@ -142,7 +145,8 @@ async def ayuda_cotizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     conn.close()
     
     if not row:
-        await update.effective_message.reply_text(
+        # El aviso reemplaza al mensaje de progreso
+        await progreso.finalizar(
             f"❌ No encontré la licitación {codigo}",
             parse_mode='HTML'
         )
@@ -151,16 +155,18 @@ async def ayuda_cotizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     licitacion = dict(zip(['id', 'codigo', 'nombre', 'monto_disponible', 'moneda', 'fecha_cierre'], row))
     
     # Obtener análisis previo
-    analisis = db_bot.obtener_analisis_cache(codigo)
+    analisis = cache_analisis.obtener(codigo, perfil)
     if not analisis:
-        await update.effective_message.reply_text(
+        await progreso.finalizar(
             f"⚠️ Primero analiza la licitación con /analizar {codigo}",
             parse_mode='HTML'
         )
         return
     
     # Generar guía con IA
-    guia = gemini_ai.generar_ayuda_cotizacion(licitacion, perfil, analisis)
+    guia = await gemini_ai.generar_ayuda_cotizacion_async(
+        licitacion, perfil, analisis, al_avanzar=progreso.actualizar
+    )
     
     # Formatear respuesta
     mensaje = f"📝 <b>Guía para Cotizar</b>\n\n"
@@ -193,7 +199,7 @@ async def ayuda_cotizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     mensaje += f"🔗 Ver análisis completo: /analizar {codigo}\n"
     mensaje += f"⭐ Guardar: /guardar {codigo}"
     
-    await update.effective_message.reply_text(mensaje, parse_mode='HTML')
+    await progreso.finalizar(mensaje, parse_mode='HTML')
     db_bot.registrar_interaccion(user_id, 'ayuda_cotizar', codigo)
 
 
@@ -439,7 +445,10 @@ async def ejecutar_redaccion(update: Update, context: ContextTypes.DEFAULT_TYPE,
     user_id = update.effective_user.id
     perfil = db_bot.obtener_perfil(user_id)
     
-    await update.effective_message.reply_text(f"🤖 Generando borrador en formato <b>{formato.upper()}</b>...", parse_mode='HTML')
+    progreso = await MensajeProgresivo.enviar(
+        update.effective_message,
+        f"🤖 Generando borrador en formato <b>{formato.upper()}</b>..."
+    )
     
     # Obtener datos completos de la licitación
     conn = db.get_connection()
@@ -455,7 +464,7 @@ async def ejecutar_redaccion(update: Update, context: ContextTypes.DEFAULT_TYPE,
     conn.close()
     
     if not row:
-        await update.effective_message.reply_text("❌ Error al obtener datos de la licitación.")
+        await progreso.finalizar("❌ Error al obtener datos de la licitación.")
         return
         
     licitacion = {
@@ -468,17 +477,15 @@ async def ejecutar_redaccion(update: Update, context: ContextTypes.DEFAULT_TYPE,
     }
     
     # Generar con IA
-    borrador = gemini_ai.generar_borrador_oferta(licitacion, perfil, formato)
+    borrador = await gemini_ai.generar_borrador_oferta_async(
+        licitacion, perfil, formato, al_avanzar=progreso.actualizar
+    )
     
-    # Enviar resultado
+    # Enviar resultado: el borrador reemplaza al avance
+    await progreso.finalizar(borrador[:4000])
     if len(borrador) > 4000:
-        # Si es muy largo, enviar en partes o archivo
-        # Por simplicidad, enviamos los primeros 4000 caracteres
-        await update.effective_message.reply_text(borrador[:4000])
-        if len(borrador) > 4000:
-            await update.effective_message.reply_text(borrador[4000:])
-    else:
-        await update.effective_message.reply_text(borrador)
+        # Si es muy largo, el resto va en un segundo mensaje
+        await update.effective_message.reply_text(borrador[4000:])
         
     # Sugerencia final
     await update.effective_message.reply_text(
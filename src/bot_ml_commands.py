@@ -7,12 +7,22 @@ from telegram.ext import ContextTypes
 import logging
 
 # Importar módulos ML
+import pool_ml
 from ml_precio_optimo import obtener_recomendacion_rapida, analizar_competencia_precios
 from rag_historico import buscar_casos_similares, construir_contexto_historico
 
 logger = logging.getLogger(__name__)
 
 
+def _texto_error(e: Exception, accion: str) -> str:
+    """Mensaje para el usuario cuando falla un análisis del pool ML."""
+    if isinstance(e, pool_ml.PoolSaturado):
+        return "⏳ Hay muchos análisis en curso. Intenta de nuevo en unos segundos."
+    if isinstance(e, TimeoutError):
+        return "⏳ El análisis tardó demasiado. Intenta de nuevo más tarde."
+    return f"❌ Error al {accion}: {str(e)}"
+
+
 async def comando_precio_optimo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Comando /precio_optimo <producto> [cantidad]
@@ -50,7 +60,9 @@ async def comando_precio_optimo(update: Update, context: ContextTypes.DEFAULT_TY
     
     try:
         # Obtener recomendación
-        resultado = obtener_recomendacion_rapida(producto, cantidad)
+        resultado = await pool_ml.ejecutar(
+            obtener_recomendacion_rapida, producto, cantidad, tipo='precio'
+        )
         
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
@@ -63,7 +75,7 @@ async def comando_precio_optimo(update: Update, context: ContextTypes.DEFAULT_TY
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
             message_id=mensaje_loading.message_id,
-            text=f"❌ Error al calcular precio óptimo: {str(e)}"
+            text=_texto_error(e, "calcular precio óptimo")
         )
 
 
@@ -91,7 +103,7 @@ async def comando_historico(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # Buscar casos similares
-        casos = buscar_casos_similares(busqueda, limite=10)
+        casos = await pool_ml.ejecutar(buscar_casos_similares, busqueda, limite=10, tipo='rag')
         
         if not casos:
             await context.bot.edit_message_text(
@@ -131,7 +143,7 @@ async def comando_historico(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
             message_id=mensaje_loading.message_id,
-            text=f"❌ Error al buscar en histórico: {str(e)}"
+            text=_texto_error(e, "buscar en histórico")
         )
 
 
@@ -198,8 +210,8 @@ async def comando_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             
             try:
-                from ml_precio_optimo import buscar_productos_similares
-                df = buscar_productos_similares(producto, limite=1000)
+                from ml_precio_optimo import resumen_mercado
+                df = await pool_ml.ejecutar(resumen_mercado, producto, tipo='stats')
                 
                 if df.empty:
                     await context.bot.edit_message_text(
@@ -255,7 +267,7 @@ async def comando_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await context.bot.edit_message_text(
                     chat_id=update.effective_chat.id,
                     message_id=mensaje_loading.message_id,
-                    text=f"❌ Error al calcular estadísticas: {str(e)}"
+                    text=_texto_error(e, "calcular estadísticas")
                 )
                 conn.close()
                 return
@@ -291,7 +303,9 @@ async def comando_competidores(update: Update, context: ContextTypes.DEFAULT_TYP
     )
     
     try:
-        resultado = analizar_competencia_precios(producto)
+        resultado = await pool_ml.ejecutar(
+            analizar_competencia_precios, producto, tipo='competencia'
+        )
         
         if not resultado.get('success'):
             await context.bot.edit_message_text(
@@ -328,7 +342,7 @@ async def comando_competidores(update: Update, context: ContextTypes.DEFAULT_TYP
         await context.bot.edit_message_text(
             chat_id=update.effective_chat.id,
             message_id=mensaje_loading.message_id,
-            text=f"❌ Error al analizar competencia: {str(e)}"
+            text=_texto_error(e, "analizar competencia")
         )
 
 
@@ -0,0 +1,220 @@
+"""
+Caché de análisis de IA por licitación y perfil de empresa.
+
+Un análisis depende de la licitación, del perfil que se envía en el prompt,
+de la versión del prompt y del modelo que lo responde; la clave usa los
+cuatro, así que perfiles equivalentes comparten análisis y perfiles
+distintos nunca ven el de otro:
+
+- Huella del perfil: hash de los campos que entran al prompt, normalizados
+  (mayúsculas, espacios y orden de las palabras clave no cambian la huella).
+- Vencimiento: el cierre de la licitación (después no sirve), acotado a
+  ANALISIS_CACHE_MAX_HORAS para que el análisis recoja datos nuevos. Un
+  análisis parcial (sin RAG o sin precios por un timeout) dura solo
+  ANALISIS_CACHE_PARCIAL_MINUTOS: evita repetir la llamada al LLM mientras
+  la BD está lenta sin ocultar los datos faltantes por días.
+- Dos niveles: Redis (o un LRU del proceso si no hay Redis) delante de la
+  tabla analisis_cache_perfil de database_bot.
+
+Métricas: consultas por resultado y tokens de LLM ahorrados (metrics_server).
+"""
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time
+from typing import Dict, Optional
+
+import database_bot as db_bot
+
+logger = logging.getLogger(__name__)
+
+# Vigencia máxima de un análisis, aunque la licitación cierre más tarde
+ANALISIS_CACHE_MAX_HORAS = float(os.getenv('ANALISIS_CACHE_MAX_HORAS', '72'))
+
+# Vigencia de un análisis parcial (0 = no se guarda)
+ANALISIS_CACHE_PARCIAL_MINUTOS = float(os.getenv('ANALISIS_CACHE_PARCIAL_MINUTOS', '10'))
+
+# Entradas del nivel en memoria cuando no hay Redis
+ANALISIS_CACHE_LOCAL_MAX = int(os.getenv('ANALISIS_CACHE_LOCAL_MAX', '256'))
+
+# Campos del perfil que entran al prompt del análisis
+CAMPOS_PERFIL = (
+    'nombre_empresa', 'tipo_negocio', 'productos_servicios', 'palabras_clave',
+    'capacidad_entrega_dias', 'ubicacion', 'experiencia_anos', 'certificaciones',
+)
+
+PREFIJO_REDIS = 'analisis_ia:'
+
+_locales: "OrderedDict[str, tuple]" = OrderedDict()
+_locales_lock = threading.Lock()
+
+
+def _normalizar(valor) -> str:
+    return ' '.join(str(valor).lower().split()) if valor is not None else ''
+
+
+def huella_perfil(perfil: Dict) -> str:
+    """Hash de los campos del perfil que usa el prompt."""
+    campos = {campo: _normalizar(perfil.get(campo)) for campo in CAMPOS_PERFIL}
+    campos['palabras_clave'] = ','.join(sorted({
+        palabra.strip() for palabra in campos['palabras_clave'].split(',') if palabra.strip()
+    }))
+    return hashlib.sha1(json.dumps(campos, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+
+
+def clave_analisis(codigo: str, huella: str, version_prompt: str, modelo: str) -> str:
+    return f"{version_prompt}:{modelo}:{codigo}:{huella}"
+
+
+def expiracion(fecha_cierre, ahora: Optional[float] = None) -> Optional[float]:
+    """
+    Timestamp de vencimiento: el cierre de la licitación, como máximo
+    ANALISIS_CACHE_MAX_HORAS desde ahora. None si la licitación ya cerró.
+    """
+    ahora = time.time() if ahora is None else ahora
+    vence = ahora + ANALISIS_CACHE_MAX_HORAS * 3600
+
+    cierre = fecha_cierre
+    if isinstance(cierre, str):
+        try:
+            cierre = datetime.fromisoformat(cierre.strip())
+        except ValueError:
+            cierre = None
+    if isinstance(cierre, date) and not isinstance(cierre, datetime):
+        cierre = datetime.combine(cierre, dt_time.max)
+    if isinstance(cierre, datetime):
+        vence = min(vence, cierre.timestamp())
+
+    return vence if vence > ahora else None
+
+
+def _contexto():
+    """Versión del prompt y modelo activos."""
+    import gemini_ai
+    return gemini_ai.VERSION_PROMPT_ANALISIS, gemini_ai.modelo_activo()
+
+
+def _redis():
+    """Cliente Redis compartido, o None si no está disponible."""
+    try:
+        import redis_cache
+    except Exception:
+        return None
+    return redis_cache.redis_client if redis_cache.REDIS_AVAILABLE else None
+
+
+def _contar(resultado: str, tokens: int = 0):
+    try:
+        from metrics_server import analisis_cache_consultas, analisis_cache_tokens_ahorrados
+    except Exception:
+        return
+    analisis_cache_consultas.labels(result=resultado).inc()
+    if tokens:
+        analisis_cache_tokens_ahorrados.inc(tokens)
+
+
+def _leer_memoria(cliente, clave: str) -> Optional[tuple]:
+    """(analisis, tokens) desde Redis o el LRU local."""
+    if cliente is not None:
+        try:
+            valor = cliente.get(PREFIJO_REDIS + clave)
+            if valor:
+                entrada = json.loads(valor)
+                return entrada['analisis'], entrada.get('tokens', 0)
+        except Exception as e:
+            logger.warning(f"Error leyendo caché de análisis en Redis: {e}")
+        return None
+    with _locales_lock:
+        entrada = _locales.get(clave)
+        if entrada and entrada[0] > time.time():
+            _locales.move_to_end(clave)
+            return copy.deepcopy(entrada[1]), entrada[2]
+    return None
+
+
+def _guardar_memoria(cliente, clave: str, analisis: Dict, tokens: int, expira_en: float):
+    if cliente is not None:
+        try:
+            ttl = max(int(expira_en - time.time()), 1)
+            cliente.setex(
+                PREFIJO_REDIS + clave, ttl,
+                json.dumps({'analisis': analisis, 'tokens': tokens}, ensure_ascii=False, default=str)
+            )
+        except Exception as e:
+            logger.warning(f"Error guardando caché de análisis en Redis: {e}")
+        return
+    with _locales_lock:
+        _locales[clave] = (expira_en, copy.deepcopy(analisis), tokens)
+        _locales.move_to_end(clave)
+        while len(_locales) > ANALISIS_CACHE_LOCAL_MAX:
+            _locales.popitem(last=False)
+
+
+def obtener(codigo: str, perfil: Dict) -> Optional[Dict]:
+    """
+    Análisis vigente de la licitación para este perfil, o None.
+
+    Busca primero en memoria/Redis y luego en la BD (promoviendo el acierto
+    al nivel en memoria).
+    """
+    version_prompt, modelo = _contexto()
+    clave = clave_analisis(codigo, huella_perfil(perfil), version_prompt, modelo)
+    cliente = _redis()
+
+    encontrado = _leer_memoria(cliente, clave)
+    if encontrado is not None:
+        _contar('hit_memoria', encontrado[1])
+        return encontrado[0]
+
+    try:
+        fila = db_bot.obtener_analisis_cache(clave)
+    except Exception as e:
+        logger.warning(f"Error leyendo caché de análisis en BD: {e}")
+        fila = None
+    if fila is None:
+        _contar('miss')
+        return None
+
+    analisis, tokens, expira_en = fila
+    _guardar_memoria(cliente, clave, analisis, tokens, expira_en)
+    _contar('hit_bd', tokens)
+    return analisis
+
+
+def guardar(codigo: str, perfil: Dict, analisis: Dict, fecha_cierre=None) -> bool:
+    """
+    Guarda el análisis hasta el cierre de la licitación (ver expiracion).
+
+    No guarda análisis con error ni de licitaciones ya cerradas; los
+    parciales vencen a los ANALISIS_CACHE_PARCIAL_MINUTOS.
+    """
+    if not analisis or 'error' in analisis:
+        return False
+    expira_en = expiracion(fecha_cierre)
+    if expira_en is None:
+        return False
+    if (analisis.get('_metadata') or {}).get('parcial'):
+        if ANALISIS_CACHE_PARCIAL_MINUTOS <= 0:
+            return False
+        expira_en = min(expira_en, time.time() + ANALISIS_CACHE_PARCIAL_MINUTOS * 60)
+
+    version_prompt, modelo = _contexto()
+    huella = huella_perfil(perfil)
+    clave = clave_analisis(codigo, huella, version_prompt, modelo)
+    tokens = (analisis.get('_metadata') or {}).get('tokens_estimados', 0)
+
+    _guardar_memoria(_redis(), clave, analisis, tokens, expira_en)
+    return db_bot.guardar_analisis_cache(
+        clave, codigo, huella, version_prompt, modelo, analisis, expira_en, tokens
+    )
+
+
+def limpiar_cache_local():
+    """Descarta el nivel en memoria de este proceso."""
+    with _locales_lock:
+        _locales.clear()
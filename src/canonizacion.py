@@ -0,0 +1,251 @@
+"""
+Canonización de nombres de producto y de cotización.
+
+El fuzzy matching, las búsquedas y las agrupaciones por producto volvían a
+pasar a minúsculas, quitar tildes y tokenizar producto_cotizado y
+nombre_cotizacion en cada request. Esta etapa se ejecuta una vez al importar
+(importar_historico) y guarda el resultado en columnas indexadas del histórico:
+
+    producto_normalizado   término canónico de producto_cotizado
+    nombre_normalizado     término canónico de nombre_cotizacion
+    cantidad_medida        cantidad extraída del producto ("500 ml" -> 500)
+    unidad_medida          unidad canónica extraída ("500 ml" -> 'ml')
+
+El término canónico no tiene tildes y va en minúsculas. Quita stop words,
+unidades de medida y cantidades, y deja los tokens únicos ordenados:
+"Resma papel carta 75 gr" y "PAPEL, resma de carta 75g" dan 'carta papel resma'.
+
+Las filas importadas antes de estas columnas se completan tras la importación
+mensual (run_monthly_import.actualizar_derivados) o a mano con:
+    python src/canonizacion.py --rellenar
+"""
+import re
+import logging
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import pandas as pd
+import database_extended as db
+from ml_utils import STOP_WORDS
+
+logger = logging.getLogger(__name__)
+
+# Variantes de escritura -> unidad canónica
+UNIDADES = {
+    'kg': ('kg', 'kgs', 'kilo', 'kilos', 'kilogramo', 'kilogramos'),
+    'g': ('g', 'gr', 'grs', 'gramo', 'gramos'),
+    'mg': ('mg',),
+    'l': ('l', 'lt', 'lts', 'litro', 'litros'),
+    'ml': ('ml', 'cc'),
+    'm': ('m', 'mt', 'mts', 'metro', 'metros'),
+    'cm': ('cm', 'cms'),
+    'mm': ('mm',),
+    'm2': ('m2',),
+    'un': ('u', 'un', 'und', 'unid', 'unids', 'unidad', 'unidades'),
+}
+_UNIDAD_CANONICA = {variante: unidad for unidad, variantes in UNIDADES.items() for variante in variantes}
+
+_CANTIDAD_RE = re.compile(
+    r'(?<![a-z0-9])(\d+(?:[.,]\d+)?)\s*('
+    + '|'.join(sorted(_UNIDAD_CANONICA, key=len, reverse=True))
+    + r')(?![a-z0-9])'
+)
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Columna original -> columna canónica en historico_licitaciones
+COLUMNAS_NORMALIZADAS = {
+    'producto_cotizado': 'producto_normalizado',
+    'nombre_cotizacion': 'nombre_normalizado',
+}
+
+
+class Canonico(NamedTuple):
+    termino: str
+    cantidad: Optional[float]
+    unidad: Optional[str]
+
+
+def quitar_tildes(texto) -> str:
+    """Texto en minúsculas sin tildes ni diacríticos ('Ñandú' -> 'nandu')."""
+    if not texto:
+        return ""
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+@lru_cache(maxsize=200000)
+def _canonizar(texto: str) -> Canonico:
+    texto = quitar_tildes(texto)
+    cantidad = unidad = None
+    medida = _CANTIDAD_RE.search(texto)
+    if medida:
+        cantidad = float(medida.group(1).replace(',', '.'))
+        unidad = _UNIDAD_CANONICA[medida.group(2)]
+        texto = _CANTIDAD_RE.sub(' ', texto)
+
+    tokens = {
+        t for t in _TOKEN_RE.findall(texto)
+        if len(t) > 1 and t not in STOP_WORDS and t not in _UNIDAD_CANONICA
+    }
+    return Canonico(' '.join(sorted(tokens)), cantidad, unidad)
+
+
+def canonizar(texto) -> Canonico:
+    """Término canónico, cantidad y unidad de un nombre de producto."""
+    if not texto:
+        return Canonico('', None, None)
+    return _canonizar(str(texto))
+
+
+def normalizar_termino(texto) -> str:
+    """
+    Clave canónica de un producto ("Resma papel carta" == "papel, resma de carta").
+    """
+    return canonizar(texto).termino
+
+
+def columnas_fila(producto, nombre):
+    """Valores (producto_normalizado, nombre_normalizado, cantidad_medida, unidad_medida)."""
+    canonico = canonizar(producto)
+    return canonico.termino, normalizar_termino(nombre), canonico.cantidad, canonico.unidad
+
+
+def columna_normalizada(df: pd.DataFrame, origen: str) -> pd.Series:
+    """
+    Columna canónica de origen ('producto_cotizado' o 'nombre_cotizacion').
+
+    Usa la columna precalculada cuando viene en el DataFrame y solo canoniza
+    las filas donde falta (importadas antes de la migración, espejo Parquet).
+    """
+    destino = COLUMNAS_NORMALIZADAS[origen]
+    if destino in df.columns:
+        serie = df[destino]
+        faltan = serie.isna()
+        if not faltan.any():
+            return serie
+        serie = serie.copy()
+    else:
+        serie = pd.Series(None, index=df.index, dtype=object)
+        faltan = pd.Series(True, index=df.index)
+
+    codigos, unicos = pd.factorize(df.loc[faltan, origen], use_na_sentinel=True)
+    terminos = [normalizar_termino(texto) for texto in unicos]
+    serie[faltan] = [terminos[c] if c >= 0 else '' for c in codigos]
+    return serie
+
+
+# ==================== RELLENO DE FILAS EXISTENTES ====================
+
+FILAS_POR_LOTE = 20000
+
+
+def _rellenar_tabla(conn, tabla, origenes, destinos, pendientes, calcular, lote):
+    """
+    Completa por lotes (orden de id) las filas de tabla con alguna de las
+    columnas `pendientes` en NULL; cada fila se lee y actualiza una vez.
+
+    calcular recibe los textos de `origenes` y devuelve los valores de `destinos`.
+    """
+    p = db.get_placeholder()
+    cursor = conn.cursor()
+    ultimo = 0
+    total = 0
+    while True:
+        cursor.execute(f"""
+            SELECT id, {', '.join(origenes)} FROM {tabla}
+            WHERE id > {p} AND ({' OR '.join(f'{c} IS NULL' for c in pendientes)})
+            ORDER BY id
+            LIMIT {p}
+        """, (ultimo, lote))
+        filas = cursor.fetchall()
+        if not filas:
+            break
+
+        valores = [(fila[0],) + tuple(calcular(*fila[1:])) for fila in filas]
+        asignaciones = ', '.join(f"{columna} = v.{columna}" for columna in destinos)
+        if db.USE_POSTGRES:
+            from psycopg2.extras import execute_values
+            plantilla = '(%s, ' + ', '.join('%s::real' if c == 'cantidad_medida' else '%s' for c in destinos) + ')'
+            execute_values(cursor, f"""
+                UPDATE {tabla} t SET {asignaciones}
+                FROM (VALUES %s) AS v(id, {', '.join(destinos)})
+                WHERE t.id = v.id
+            """, valores, template=plantilla, page_size=lote)
+        else:
+            cursor.executemany(
+                f"UPDATE {tabla} SET {', '.join(f'{c} = ?' for c in destinos)} WHERE id = ?",
+                [fila[1:] + fila[:1] for fila in valores]
+            )
+        conn.commit()
+        ultimo = filas[-1][0]
+        total += len(filas)
+        logger.info(f"{tabla}: {total:,} filas canonizadas")
+    return total
+
+
+def rellenar(lote: int = FILAS_POR_LOTE) -> int:
+    """
+    Calcula las columnas canónicas de las filas del histórico que no las tienen.
+
+    Con el esquema normalizado (dimensiones_historico) el producto vive en
+    historico_ofertas y el nombre en hist_cotizaciones.
+
+    Returns:
+        Cantidad de filas actualizadas (cada fila cuenta una vez; en el
+        esquema normalizado, ofertas más cotizaciones)
+    """
+    import dimensiones_historico as dim
+
+    def producto(texto):
+        canonico = canonizar(texto)
+        return canonico.termino, canonico.cantidad, canonico.unidad
+
+    def nombre(texto):
+        return (normalizar_termino(texto),)
+
+    def producto_y_nombre(texto_producto, texto_nombre):
+        return producto(texto_producto) + nombre(texto_nombre)
+
+    columnas_producto = ['producto_normalizado', 'cantidad_medida', 'unidad_medida']
+    conn = db.get_connection()
+    try:
+        if dim.esta_normalizada(conn):
+            total = _rellenar_tabla(
+                conn, dim.TABLA_HECHOS, ['producto_cotizado'], columnas_producto,
+                ['producto_normalizado'], producto, lote
+            )
+            total += _rellenar_tabla(
+                conn, 'hist_cotizaciones', ['nombre'], ['nombre_normalizado'],
+                ['nombre_normalizado'], nombre, lote
+            )
+        else:
+            total = _rellenar_tabla(
+                conn, 'historico_licitaciones', ['producto_cotizado', 'nombre_cotizacion'],
+                columnas_producto + ['nombre_normalizado'],
+                ['producto_normalizado', 'nombre_normalizado'], producto_y_nombre, lote
+            )
+    finally:
+        conn.close()
+    logger.info(f"Canonización completada: {total:,} filas")
+    return total
+
+
+def main():
+    import argparse
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Columnas canónicas del histórico")
+    parser.add_argument("--rellenar", action="store_true", required=True,
+                        help="Canonizar las filas sin columnas normalizadas")
+    parser.add_argument("--lote", type=int, default=FILAS_POR_LOTE, help="Filas por lote")
+    args = parser.parse_args()
+
+    db.iniciar_db_extendida()
+    rellenar(args.lote)
+
+
+if __name__ == "__main__":
+    main()
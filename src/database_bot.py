@@ -82,13 +82,22 @@ def iniciar_db_bot():
         )
     ''')
     
-    # Tabla de caché de análisis de IA
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS analisis_cache (
-            codigo_licitacion TEXT PRIMARY KEY,
+    # Tabla de caché de análisis de IA (clave: código + perfil + prompt + modelo,
+    # ver cache_analisis.py); reemplaza a analisis_cache, que era solo por código
+    # y quedaba huérfana: es solo caché, así que se elimina sin migrar filas
+    cursor.execute('DROP TABLE IF EXISTS analisis_cache')
+    real_type = "DOUBLE PRECISION" if USE_POSTGRES else "REAL"
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS analisis_cache_perfil (
+            clave TEXT PRIMARY KEY,
+            codigo_licitacion TEXT,
+            huella_perfil TEXT,
+            version_prompt TEXT,
+            modelo TEXT,
             analisis_json TEXT,
-            fecha_analisis TEXT,
-            version_prompt TEXT
+            tokens_estimados INTEGER DEFAULT 0,
+            creado_en {real_type},
+            expira_en {real_type}
         )
     ''')
     
@@ -141,12 +150,14 @@ def iniciar_db_bot():
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_guardadas_codigo ON licitaciones_guardadas(codigo_licitacion)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_historial_user ON historial_interacciones(telegram_user_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedback_codigo ON feedback_analisis(codigo_licitacion)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_analisis_cache_expira ON analisis_cache_perfil(expira_en)')
     else:
         try:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_guardadas_user ON licitaciones_guardadas(telegram_user_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_guardadas_codigo ON licitaciones_guardadas(codigo_licitacion)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_historial_user ON historial_interacciones(telegram_user_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedback_codigo ON feedback_analisis(codigo_licitacion)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_analisis_cache_expira ON analisis_cache_perfil(expira_en)')
         except Exception as e:
             # Índices ya existen o error de SQLite
             logger.debug(f"Índices ya existen o no se pudieron crear: {e}")
@@ -381,52 +392,77 @@ def eliminar_licitacion_guardada(user_id, codigo):
 
 # ==================== CACHÉ DE ANÁLISIS ====================
 
-def guardar_analisis_cache(codigo, analisis, version_prompt="v1"):
-    """Guarda el análisis de IA en caché."""
+def guardar_analisis_cache(clave, codigo, huella_perfil, version_prompt, modelo,
+                           analisis, expira_en, tokens_estimados=0):
+    """
+    Guarda un análisis de IA en caché.
+
+    Args:
+        clave: Clave completa (cache_analisis.clave_analisis)
+        expira_en: Vencimiento como timestamp Unix
+        tokens_estimados: Tokens que costó generarlo (métrica de ahorro)
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
     placeholder = get_placeholder()
+    valores = ', '.join([placeholder] * 9)
+    params = (
+        clave, codigo, huella_perfil, version_prompt, modelo,
+        json.dumps(analisis, ensure_ascii=False), tokens_estimados,
+        datetime.now().timestamp(), expira_en
+    )
     
     try:
         if USE_POSTGRES:
             cursor.execute(f'''
-                INSERT INTO analisis_cache 
-                (codigo_licitacion, analisis_json, fecha_analisis, version_prompt)
-                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
-                ON CONFLICT (codigo_licitacion) DO UPDATE SET
+                INSERT INTO analisis_cache_perfil 
+                (clave, codigo_licitacion, huella_perfil, version_prompt, modelo,
+                 analisis_json, tokens_estimados, creado_en, expira_en)
+                VALUES ({valores})
+                ON CONFLICT (clave) DO UPDATE SET
                     analisis_json = EXCLUDED.analisis_json,
-                    fecha_analisis = EXCLUDED.fecha_analisis
-            ''', (codigo, json.dumps(analisis, ensure_ascii=False), datetime.now().isoformat(), version_prompt))
+                    tokens_estimados = EXCLUDED.tokens_estimados,
+                    creado_en = EXCLUDED.creado_en,
+                    expira_en = EXCLUDED.expira_en
+            ''', params)
         else:
             cursor.execute(f'''
-                INSERT OR REPLACE INTO analisis_cache 
-                (codigo_licitacion, analisis_json, fecha_analisis, version_prompt)
-                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
-            ''', (codigo, json.dumps(analisis, ensure_ascii=False), datetime.now().isoformat(), version_prompt))
+                INSERT OR REPLACE INTO analisis_cache_perfil 
+                (clave, codigo_licitacion, huella_perfil, version_prompt, modelo,
+                 analisis_json, tokens_estimados, creado_en, expira_en)
+                VALUES ({valores})
+            ''', params)
         
         conn.commit()
         return True
     except Exception as e:
-        print(f"Error al guardar análisis en caché: {e}")
+        logger.error(f"Error al guardar análisis en caché: {e}")
         conn.rollback()
         return False
     finally:
         conn.close()
 
 
-def obtener_analisis_cache(codigo, max_edad_horas=24):
-    """Obtiene el análisis de IA desde caché si existe y no está muy antiguo."""
+def obtener_analisis_cache(clave):
+    """
+    Obtiene un análisis de IA vigente desde caché.
+
+    El vencimiento se guarda como timestamp y se filtra en la consulta.
+
+    Returns:
+        (analisis, tokens_estimados, expira_en) o None si no hay uno vigente
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
     placeholder = get_placeholder()
     
     cursor.execute(f'''
-        SELECT analisis_json, fecha_analisis 
-        FROM analisis_cache 
-        WHERE codigo_licitacion = {placeholder}
-    ''', (codigo,))
+        SELECT analisis_json, tokens_estimados, expira_en
+        FROM analisis_cache_perfil 
+        WHERE clave = {placeholder} AND expira_en > {placeholder}
+    ''', (clave, datetime.now().timestamp()))
     
     row = cursor.fetchone()
     conn.close()
@@ -434,14 +470,26 @@ def obtener_analisis_cache(codigo, max_edad_horas=24):
     if not row:
         return None
     
-    # Verificar edad del análisis
-    fecha_analisis = datetime.fromisoformat(row[1])
-    edad_horas = (datetime.now() - fecha_analisis).total_seconds() / 3600
+    return json.loads(row[0]), row[1] or 0, row[2]
+
+
+def purgar_analisis_cache():
+    """Elimina los análisis vencidos. Retorna cuántos se borraron."""
+    conn = get_connection()
+    cursor = conn.cursor()
     
-    if edad_horas > max_edad_horas:
-        return None  # Muy antiguo
+    placeholder = get_placeholder()
     
-    return json.loads(row[0])
+    try:
+        cursor.execute(
+            f"DELETE FROM analisis_cache_perfil WHERE expira_en <= {placeholder}",
+            (datetime.now().timestamp(),)
+        )
+        borrados = cursor.rowcount
+        conn.commit()
+        return borrados
+    finally:
+        conn.close()
 
 
 # ==================== HISTORIAL ====================
@@ -230,6 +230,85 @@ def get_placeholder():
     return '%s' if USE_POSTGRES else '?'
 
 
+# Columnas canónicas del histórico (canonizacion.py)
+COLUMNAS_PRODUCTO_NORMALIZADO = (
+    ('producto_normalizado', 'TEXT'),
+    ('cantidad_medida', 'REAL'),
+    ('unidad_medida', 'TEXT'),
+)
+COLUMNAS_NOMBRE_NORMALIZADO = (('nombre_normalizado', 'TEXT'),)
+
+
+def _columnas_tabla(cursor, tabla):
+    if USE_POSTGRES:
+        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s", (tabla,))
+        return {row[0] for row in cursor.fetchall()}
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def _agregar_columnas(cursor, tabla, columnas):
+    """ALTER TABLE solo para las columnas que faltan (evita el lock si ya existen)."""
+    existentes = _columnas_tabla(cursor, tabla)
+    faltantes = [(nombre, tipo) for nombre, tipo in columnas if nombre not in existentes]
+    for nombre, tipo in faltantes:
+        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {nombre} {tipo}")
+    return bool(faltantes)
+
+
+def agregar_columnas_normalizadas(cursor, historico_es_vista=False):
+    """
+    Agrega las columnas canónicas al histórico existente. Con el esquema
+    normalizado van en historico_ofertas y hist_cotizaciones, y la vista de
+    compatibilidad se recrea para exponerlas.
+    """
+    if not historico_es_vista:
+        _agregar_columnas(cursor, 'historico_licitaciones', COLUMNAS_PRODUCTO_NORMALIZADO + COLUMNAS_NOMBRE_NORMALIZADO)
+        return
+
+    import dimensiones_historico as dim
+    nuevas = _agregar_columnas(cursor, dim.TABLA_HECHOS, COLUMNAS_PRODUCTO_NORMALIZADO)
+    nuevas = _agregar_columnas(cursor, 'hist_cotizaciones', COLUMNAS_NOMBRE_NORMALIZADO) or nuevas
+    if nuevas:
+        cursor.execute(dim.SQL_VISTA)
+
+
+_normalizadas_verificadas = False
+
+
+def advertir_normalizadas_pendientes():
+    """
+    Advierte si quedan filas del histórico sin columnas canónicas. Las
+    búsquedas pg_trgm filtran por producto_normalizado y no ven esas filas.
+
+    No las rellena: sobre el histórico completo es una migración larga que
+    se corre aparte (python src/canonizacion.py --rellenar) o tras la
+    importación mensual (run_monthly_import.actualizar_derivados). Se
+    verifica una vez por proceso con una consulta sobre idx_hist_producto_norm.
+
+    Returns:
+        True si hay filas pendientes
+    """
+    global _normalizadas_verificadas
+    if _normalizadas_verificadas:
+        return False
+    _normalizadas_verificadas = True
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM historico_licitaciones WHERE producto_normalizado IS NULL LIMIT 1")
+        pendientes = cursor.fetchone() is not None
+    finally:
+        conn.close()
+    if pendientes:
+        logger.warning(
+            "Hay filas del histórico sin columnas canónicas; las búsquedas por similitud "
+            "no las verán hasta ejecutar: python src/canonizacion.py --rellenar"
+        )
+    return pendientes
+
+
 def iniciar_db_extendida():
     """
     Crea todas las tablas necesarias para almacenar información completa
@@ -422,14 +501,90 @@ def iniciar_db_extendida():
             detalle_oferta TEXT,
             es_ganador BOOLEAN,
             fecha_cierre DATE,
-            fecha_importacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            fecha_importacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            producto_normalizado TEXT,
+            nombre_normalizado TEXT,
+            cantidad_medida REAL,
+            unidad_medida TEXT
+        )
+    ''')
+
+    # Estado de importación por mes del histórico (checkpoints del backfill)
+    safe_create_table('''
+        CREATE TABLE IF NOT EXISTS historico_importaciones (
+            mes TEXT PRIMARY KEY,
+            url TEXT,
+            estado TEXT,
+            etag TEXT,
+            registros INTEGER DEFAULT 0,
+            descartados INTEGER DEFAULT 0,
+            bytes_descargados BIGINT DEFAULT 0,
+            segundos_descarga REAL,
+            segundos_carga REAL,
+            segundos_finalizacion REAL,
+            error TEXT,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Estadísticas de precio precalculadas por término de producto (estadisticas_precios.py).
+    # region = '' agrupa todas las regiones.
+    safe_create_table('''
+        CREATE TABLE IF NOT EXISTS estadisticas_precios (
+            termino TEXT NOT NULL,
+            region TEXT NOT NULL DEFAULT '',
+            n_ofertas INTEGER DEFAULT 0,
+            n_ganadores INTEGER DEFAULT 0,
+            n_registros INTEGER DEFAULT 0,
+            tasa_ganadores REAL,
+            p25 REAL,
+            p42 REAL,
+            p50 REAL,
+            p75 REAL,
+            p90 REAL,
+            promedio REAL,
+            desviacion REAL,
+            precio_min REAL,
+            precio_max REAL,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (termino, region)
+        )
+    ''')
+
+    # Sketches t-digest de precios ganadores por término, región y mes (sketches_precios.py)
+    safe_create_table(f'''
+        CREATE TABLE IF NOT EXISTS sketches_precios (
+            termino TEXT NOT NULL,
+            region TEXT NOT NULL DEFAULT '',
+            mes TEXT NOT NULL,
+            n_ofertas INTEGER DEFAULT 0,
+            n_ganadores INTEGER DEFAULT 0,
+            n INTEGER DEFAULT 0,
+            suma DOUBLE PRECISION,
+            suma_cuadrados DOUBLE PRECISION,
+            precio_min REAL,
+            precio_max REAL,
+            centroides {'BYTEA' if USE_POSTGRES else 'BLOB'},
+            PRIMARY KEY (termino, region, mes)
         )
     ''')
 
+    # Con el esquema normalizado (scripts/normalize_historico.py) historico_licitaciones
+    # es una vista de compatibilidad y los índices viven en historico_ofertas
+    historico_es_vista = False
+    if USE_POSTGRES:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_views WHERE viewname = 'historico_licitaciones')")
+        historico_es_vista = cursor.fetchone()[0]
+
+    # Columnas canónicas (canonizacion.py) en tablas creadas antes de que existieran
+    agregar_columnas_normalizadas(cursor, historico_es_vista)
+
     # Índices para búsquedas rápidas en histórico
-    safe_create_table('CREATE INDEX IF NOT EXISTS idx_hist_codigo ON historico_licitaciones(codigo_cotizacion)')
-    safe_create_table('CREATE INDEX IF NOT EXISTS idx_hist_producto ON historico_licitaciones(producto_cotizado)')
-    safe_create_table('CREATE INDEX IF NOT EXISTS idx_hist_ganador ON historico_licitaciones(es_ganador)')
+    if not historico_es_vista:
+        safe_create_table('CREATE INDEX IF NOT EXISTS idx_hist_codigo ON historico_licitaciones(codigo_cotizacion)')
+        safe_create_table('CREATE INDEX IF NOT EXISTS idx_hist_producto ON historico_licitaciones(producto_cotizado)')
+        safe_create_table('CREATE INDEX IF NOT EXISTS idx_hist_ganador ON historico_licitaciones(es_ganador)')
+        safe_create_table('CREATE INDEX IF NOT EXISTS idx_hist_producto_norm ON historico_licitaciones(producto_normalizado)')
 
     try:
         conn.commit()
@@ -454,6 +609,11 @@ def iniciar_db_extendida():
             conn.close()
             print("[OK] Tablas ya existen (ignorando errores de secuencias duplicadas)")
 
+    try:
+        advertir_normalizadas_pendientes()
+    except Exception as e:
+        logger.warning(f"No se pudieron verificar las columnas canónicas del histórico: {e}")
+
 
 def guardar_licitacion_basica(datos):
     """
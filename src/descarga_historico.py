@@ -0,0 +1,538 @@
+"""
+Capa de descarga para los ZIP del histórico de Mercado Público (COT_YYYY-MM.zip).
+
+Features:
+- Descargas reanudables con HTTP Range (If-Range con ETag) ante cortes de conexión
+- Caché local direccionada por contenido (sha256) para re-importaciones y --force
+- Lectura en streaming de las entradas del ZIP mientras se descarga, usando los
+  encabezados locales (no requiere el directorio central al final del archivo)
+"""
+import os
+import io
+import json
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import zipfile
+import requests
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+CACHE_DIR = os.getenv('HISTORICO_CACHE_DIR', os.path.join('.cache', 'historico'))
+CACHE_MAX_ARCHIVOS = int(os.getenv('HISTORICO_CACHE_MAX_ARCHIVOS', '36'))
+MAX_REINTENTOS = int(os.getenv('HISTORICO_MAX_REINTENTOS', '10'))
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+TIMEOUT = (15, 120)  # (conexión, lectura) en segundos
+
+# Firmas ZIP
+_FIRMA_LOCAL = b'PK\x03\x04'
+_FIRMA_DESCRIPTOR = b'PK\x07\x08'
+_ZIP64_EXTRA_ID = 0x0001
+_ZIP64_MARCA = 0xFFFFFFFF
+
+_ERRORES_RED = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+
+class ZipNoStreamable(Exception):
+    """La entrada del ZIP no se puede leer en streaming (requiere el archivo completo)."""
+
+
+class ArchivoRemotoCambiado(Exception):
+    """El archivo remoto cambió mientras se reanudaba la descarga."""
+
+
+# ==================== DESCARGA REANUDABLE ====================
+
+class DescargaReanudable(io.RawIOBase):
+    """
+    Stream de solo lectura sobre una URL que se reanuda con HTTP Range.
+
+    Todo lo leído se persiste en `ruta_parcial` y se acumula en un sha256,
+    de modo que un corte de conexión (o de proceso) continúa desde el último
+    byte recibido. Si existe un parcial de una ejecución anterior, sus bytes
+    se entregan primero desde disco.
+    """
+
+    def __init__(self, url, ruta_parcial, session=None):
+        self.url = url
+        self.ruta_parcial = ruta_parcial
+        self.session = session or requests.Session()
+        self.sha256 = hashlib.sha256()
+        self.descargados = 0
+        self.total = None
+        self.etag = None
+        self.completo = False
+
+        self._respuesta = None
+        self._iter = None
+        self._pendiente = b''
+        self._lectura = memoryview(b'')
+        self._reintentos = 0
+        self._local = None
+
+        self._retomar_parcial()
+        self._archivo = open(self.ruta_parcial, 'ab')
+
+    # ---------- Estado persistido del parcial ----------
+
+    @property
+    def _ruta_meta(self):
+        return self.ruta_parcial + '.json'
+
+    def _retomar_parcial(self):
+        """Valida un parcial previo contra el ETag remoto y prepara su relectura."""
+        if not os.path.exists(self.ruta_parcial):
+            return
+
+        meta = {}
+        try:
+            with open(self._ruta_meta, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        etag_remoto = None
+        try:
+            r = self.session.head(self.url, allow_redirects=True, timeout=TIMEOUT)
+            etag_remoto = r.headers.get('ETag')
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"No se pudo validar el parcial existente: {e}")
+
+        if not meta.get('etag') or meta.get('etag') != etag_remoto:
+            logger.info("Parcial previo descartado (sin ETag o archivo remoto distinto)")
+            self._descartar_parcial()
+            return
+
+        self.etag = meta['etag']
+        self.total = meta.get('total')
+        with open(self.ruta_parcial, 'rb') as f:
+            for bloque in iter(lambda: f.read(CHUNK_SIZE), b''):
+                self.sha256.update(bloque)
+                self.descargados += len(bloque)
+        self._local = open(self.ruta_parcial, 'rb')
+        logger.info(f"Reanudando descarga desde {self.descargados / (1024*1024):.2f} MB")
+
+    def _descartar_parcial(self):
+        for ruta in (self.ruta_parcial, self._ruta_meta):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+    def _guardar_meta(self):
+        with open(self._ruta_meta, 'w', encoding='utf-8') as f:
+            json.dump({'url': self.url, 'etag': self.etag, 'total': self.total}, f)
+
+    # ---------- Red ----------
+
+    def _conectar(self):
+        headers = {}
+        if self.descargados:
+            headers['Range'] = f'bytes={self.descargados}-'
+            if self.etag:
+                headers['If-Range'] = self.etag
+
+        r = self.session.get(self.url, stream=True, headers=headers, timeout=TIMEOUT)
+        r.raise_for_status()
+
+        etag = r.headers.get('ETag')
+        if self.etag and etag and etag != self.etag:
+            r.close()
+            raise ArchivoRemotoCambiado(f"ETag cambió durante la descarga: {self.etag} -> {etag}")
+        self.etag = etag or self.etag
+
+        saltar = 0
+        if r.status_code == 206:
+            rango = r.headers.get('Content-Range', '')
+            if '/' in rango and not rango.endswith('/*'):
+                self.total = int(rango.rsplit('/', 1)[1])
+        else:
+            # El servidor ignoró el Range: descartar lo que ya tenemos
+            saltar = self.descargados
+            if r.headers.get('content-length'):
+                self.total = int(r.headers['content-length'])
+
+        self._respuesta = r
+        self._iter = r.iter_content(chunk_size=CHUNK_SIZE)
+        self._guardar_meta()
+
+        while saltar > 0:
+            bloque = next(self._iter, b'')
+            if not bloque:
+                raise ArchivoRemotoCambiado("Respuesta más corta que el parcial ya descargado")
+            if len(bloque) > saltar:
+                self._pendiente = bloque[saltar:]
+            saltar -= len(bloque)
+
+    def _cerrar_respuesta(self):
+        if self._respuesta is not None:
+            self._respuesta.close()
+        self._respuesta = None
+        self._iter = None
+
+    def _reintentar(self, motivo):
+        self._cerrar_respuesta()
+        self._reintentos += 1
+        if self._reintentos > MAX_REINTENTOS:
+            raise requests.exceptions.ConnectionError(
+                f"Descarga abortada tras {MAX_REINTENTOS} reintentos: {motivo}"
+            )
+        espera = min(2 ** self._reintentos, 60)
+        logger.warning(
+            f"Conexión interrumpida en {self.descargados / (1024*1024):.2f} MB ({motivo}). "
+            f"Reintento {self._reintentos}/{MAX_REINTENTOS} en {espera}s..."
+        )
+        time.sleep(espera)
+
+    def _siguiente_bloque(self):
+        while not self._pendiente:
+            if self.completo:
+                return b''
+            if self._iter is None:
+                if self.total is not None and self.descargados >= self.total:
+                    self.completo = True
+                    return b''
+                try:
+                    self._conectar()
+                except _ERRORES_RED as e:
+                    self._reintentar(e)
+                continue
+            try:
+                self._pendiente = next(self._iter)
+            except StopIteration:
+                self._cerrar_respuesta()
+                if self.total is None or self.descargados >= self.total:
+                    self.completo = True
+                    return b''
+                self._reintentar("respuesta incompleta")
+            except _ERRORES_RED as e:
+                self._reintentar(e)
+
+        bloque, self._pendiente = self._pendiente, b''
+        self._archivo.write(bloque)
+        self.sha256.update(bloque)
+        self.descargados += len(bloque)
+        self._reintentos = 0
+        return bloque
+
+    # ---------- io.RawIOBase ----------
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._local is not None:
+            n = self._local.readinto(buffer)
+            if n:
+                return n
+            self._local.close()
+            self._local = None
+
+        if not self._lectura:
+            bloque = self._siguiente_bloque()
+            if not bloque:
+                return 0
+            self._lectura = memoryview(bloque)
+
+        n = min(len(buffer), len(self._lectura))
+        buffer[:n] = self._lectura[:n]
+        self._lectura = self._lectura[n:]
+        return n
+
+    def completar(self):
+        """Descarga lo que falte (sin entregarlo al consumidor) y cierra el parcial."""
+        restante = (self.total - self.descargados) if self.total else None
+        if not self.completo:
+            with tqdm(total=restante, unit='B', unit_scale=True,
+                      desc="Descargando", ncols=100) as pbar:
+                while True:
+                    bloque = self._siguiente_bloque()
+                    if not bloque:
+                        break
+                    pbar.update(len(bloque))
+        self._archivo.flush()
+        self.close()
+
+        if self.total is not None and self.descargados != self.total:
+            raise zipfile.BadZipFile(
+                f"Tamaño descargado ({self.descargados}) distinto del esperado ({self.total})"
+            )
+        return self.sha256.hexdigest()
+
+    def close(self):
+        self._cerrar_respuesta()
+        if self._local is not None:
+            self._local.close()
+            self._local = None
+        if not self._archivo.closed:
+            self._archivo.close()
+        super().close()
+
+
+# ==================== CACHÉ DIRECCIONADA POR CONTENIDO ====================
+
+class CacheHistorico:
+    """
+    Caché local de ZIPs del histórico.
+
+    Estructura:
+        objetos/<sha256>.zip   Archivos verificados (direccionados por contenido)
+        refs/<clave>.json      URL -> sha256, tamaño y ETag
+        parciales/<clave>.part Descargas en curso (reanudables)
+    """
+
+    def __init__(self, directorio=None):
+        self.directorio = directorio or CACHE_DIR
+        for sub in ('objetos', 'refs', 'parciales'):
+            os.makedirs(os.path.join(self.directorio, sub), exist_ok=True)
+
+    @staticmethod
+    def _clave(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+    def _ruta_ref(self, url):
+        return os.path.join(self.directorio, 'refs', f'{self._clave(url)}.json')
+
+    def _ruta_objeto(self, sha256):
+        return os.path.join(self.directorio, 'objetos', f'{sha256}.zip')
+
+    def ruta_parcial(self, url):
+        return os.path.join(self.directorio, 'parciales', f'{self._clave(url)}.part')
+
+    def referencia(self, url):
+        """Retorna la referencia registrada para la URL (sha256, tamaño, ETag) o None."""
+        try:
+            with open(self._ruta_ref(url), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def buscar(self, url, verificar_hash=True):
+        """
+        Retorna la ruta del ZIP en caché para la URL, o None si no está o no es válido.
+
+        Con verificar_hash=True se recalcula el sha256 del archivo (mucho más barato
+        que volver a descargarlo) para detectar corrupción en disco.
+        """
+        ref = self.referencia(url)
+        if ref is None:
+            return None
+
+        ruta = self._ruta_objeto(ref['sha256'])
+        if not os.path.exists(ruta) or os.path.getsize(ruta) != ref.get('tamano'):
+            return None
+
+        if verificar_hash:
+            sha = hashlib.sha256()
+            with open(ruta, 'rb') as f:
+                for bloque in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    sha.update(bloque)
+            if sha.hexdigest() != ref['sha256']:
+                logger.warning(f"Archivo en caché corrupto, se descartará: {ruta}")
+                os.remove(ruta)
+                return None
+
+        os.utime(ruta)  # Marcar como usado recientemente (para purgar)
+        return ruta
+
+    def abrir_descarga(self, url, session=None):
+        """Abre un stream reanudable para la URL sobre el parcial de la caché."""
+        return DescargaReanudable(url, self.ruta_parcial(url), session=session)
+
+    def registrar(self, url, descarga):
+        """Mueve una descarga completa a objetos/ y registra la referencia de la URL."""
+        sha256 = descarga.completar()
+        ruta = self._ruta_objeto(sha256)
+
+        if os.path.exists(ruta):
+            os.remove(descarga.ruta_parcial)
+        else:
+            os.replace(descarga.ruta_parcial, ruta)
+        if os.path.exists(descarga.ruta_parcial + '.json'):
+            os.remove(descarga.ruta_parcial + '.json')
+
+        with open(self._ruta_ref(url), 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': url,
+                'sha256': sha256,
+                'tamano': os.path.getsize(ruta),
+                'etag': descarga.etag,
+            }, f)
+
+        logger.info(f"Archivo verificado y guardado en caché: {sha256[:12]}...")
+        self.purgar()
+        return ruta
+
+    def purgar(self, mantener=None):
+        """Elimina los objetos menos usados recientemente por sobre `mantener`."""
+        mantener = CACHE_MAX_ARCHIVOS if mantener is None else mantener
+        directorio = os.path.join(self.directorio, 'objetos')
+        objetos = sorted(
+            (os.path.join(directorio, n) for n in os.listdir(directorio)),
+            key=os.path.getmtime,
+            reverse=True
+        )
+        for ruta in objetos[mantener:]:
+            os.remove(ruta)
+            logger.info(f"Caché: eliminado {os.path.basename(ruta)}")
+
+
+# ==================== LECTURA DE ZIP EN STREAMING ====================
+
+class _Fuente:
+    """Lector secuencial con capacidad de devolver bytes sobrantes."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = b''
+
+    def leer(self, n):
+        if self._buffer:
+            datos, self._buffer = self._buffer[:n], self._buffer[n:]
+            return datos
+        return self._stream.read(n)
+
+    def leer_exacto(self, n):
+        partes = []
+        while n > 0:
+            datos = self.leer(n)
+            if not datos:
+                raise zipfile.BadZipFile("ZIP truncado")
+            partes.append(datos)
+            n -= len(datos)
+        return b''.join(partes)
+
+    def devolver(self, datos):
+        if datos:
+            self._buffer = datos + self._buffer
+
+
+class _LectorEntrada(io.RawIOBase):
+    """Stream descomprimido de una entrada del ZIP, con verificación de CRC al final."""
+
+    def __init__(self, fuente, metodo, tamano_comprimido, crc, usa_descriptor, zip64):
+        self._fuente = fuente
+        self._restante = None if usa_descriptor else tamano_comprimido
+        self._decomp = zlib.decompressobj(-15) if metodo == zipfile.ZIP_DEFLATED else None
+        self._crc_esperado = crc
+        self._usa_descriptor = usa_descriptor
+        self._zip64 = zip64
+        self._crc = 0
+        self._salida = b''
+        self._fin = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._salida and not self._fin:
+            self._rellenar()
+        n = min(len(buffer), len(self._salida))
+        buffer[:n] = self._salida[:n]
+        self._salida = self._salida[n:]
+        return n
+
+    def _emitir(self, datos):
+        if datos:
+            self._crc = zlib.crc32(datos, self._crc)
+            self._salida = datos
+
+    def _rellenar(self):
+        if self._decomp is None:
+            if self._restante == 0:
+                return self._terminar()
+            datos = self._fuente.leer(min(CHUNK_SIZE, self._restante))
+            if not datos:
+                raise zipfile.BadZipFile("Entrada del ZIP truncada")
+            self._restante -= len(datos)
+            return self._emitir(datos)
+
+        if self._decomp.eof:
+            self._fuente.devolver(self._decomp.unused_data)
+            if self._restante:
+                self._fuente.leer_exacto(self._restante)
+            return self._terminar()
+
+        tam = CHUNK_SIZE if self._restante is None else min(CHUNK_SIZE, self._restante)
+        datos = self._fuente.leer(tam) if tam else b''
+        if not datos:
+            raise zipfile.BadZipFile("Entrada del ZIP truncada")
+        if self._restante is not None:
+            self._restante -= len(datos)
+        self._emitir(self._decomp.decompress(datos))
+
+    def _terminar(self):
+        self._fin = True
+        if self._usa_descriptor:
+            inicio = self._fuente.leer_exacto(4)
+            if inicio == _FIRMA_DESCRIPTOR:
+                inicio = self._fuente.leer_exacto(4)
+            self._crc_esperado = struct.unpack('<I', inicio)[0]
+            self._fuente.leer_exacto(16 if self._zip64 else 8)
+        if self._crc != self._crc_esperado:
+            raise zipfile.BadZipFile("CRC inválido en entrada del ZIP")
+
+    def descartar(self):
+        """Consume lo que quede de la entrada para posicionarse en la siguiente."""
+        buffer = bytearray(CHUNK_SIZE)
+        while self.readinto(buffer):
+            pass
+
+
+def iterar_entradas_zip(stream):
+    """
+    Recorre las entradas de un ZIP leyendo sus encabezados locales en orden.
+
+    Genera tuplas (nombre, tamano_descomprimido, lector). El tamaño es None
+    cuando la entrada usa data descriptor. El lector debe consumirse antes de
+    pedir la siguiente entrada; lo que no se lea se descarta.
+
+    Raises:
+        ZipNoStreamable: si una entrada está cifrada, usa un método distinto de
+            stored/deflate, o es stored con data descriptor (sin tamaño conocido)
+    """
+    fuente = _Fuente(stream)
+    while True:
+        primero = fuente.leer(1)
+        if not primero:
+            return
+        if primero + fuente.leer_exacto(3) != _FIRMA_LOCAL:
+            return  # Directorio central u otro registro: no hay más entradas
+
+        (_version, flags, metodo, _hora, _fecha, crc, tamano_comprimido,
+         tamano, largo_nombre, largo_extra) = struct.unpack('<HHHHHIIIHH', fuente.leer_exacto(26))
+        nombre = fuente.leer_exacto(largo_nombre).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = fuente.leer_exacto(largo_extra)
+
+        if flags & 0x1:
+            raise ZipNoStreamable(f"{nombre}: entrada cifrada")
+        if metodo not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ZipNoStreamable(f"{nombre}: método de compresión {metodo} no soportado")
+        usa_descriptor = bool(flags & 0x08)
+        if usa_descriptor and metodo == zipfile.ZIP_STORED:
+            raise ZipNoStreamable(f"{nombre}: entrada sin comprimir con data descriptor")
+
+        zip64 = False
+        i = 0
+        while i + 4 <= len(extra):
+            tipo, largo = struct.unpack('<HH', extra[i:i + 4])
+            if tipo == _ZIP64_EXTRA_ID:
+                zip64 = True
+                valores = extra[i + 4:i + 4 + largo]
+                j = 0
+                if tamano == _ZIP64_MARCA and j + 8 <= len(valores):
+                    tamano = struct.unpack('<Q', valores[j:j + 8])[0]
+                    j += 8
+                if tamano_comprimido == _ZIP64_MARCA and j + 8 <= len(valores):
+                    tamano_comprimido = struct.unpack('<Q', valores[j:j + 8])[0]
+            i += 4 + largo
+
+        lector = _LectorEntrada(fuente, metodo, tamano_comprimido, crc, usa_descriptor, zip64)
+        yield nombre, (None if usa_descriptor else tamano), lector
+        lector.descartar()
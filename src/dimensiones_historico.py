@@ -0,0 +1,227 @@
+"""
+Esquema normalizado del histórico: tablas de dimensiones + tabla de hechos.
+
+historico_licitaciones repite en cada una de sus ~10M filas el proveedor, la
+región y el nombre de la cotización. Con scripts/normalize_historico.py esos
+textos pasan a tablas de dimensiones y la tabla de hechos guarda solo claves
+enteras:
+
+    hist_cotizaciones (id, codigo, nombre, nombre_normalizado)
+    hist_proveedores  (id, rut, nombre)         -- proveedores por RUT
+    hist_regiones     (id, nombre)
+    historico_ofertas (id, cotizacion_id, region_id, proveedor_id,
+                       producto_cotizado, cantidad, monto_total,
+                       detalle_oferta, es_ganador, fecha_cierre, ...)
+
+historico_licitaciones queda como vista de compatibilidad con las mismas
+columnas de antes, por lo que las consultas existentes no cambian. Las
+uniones son LEFT JOIN sobre claves únicas: PostgreSQL las elimina del plan
+cuando la consulta no usa columnas de esa dimensión.
+
+Las cargas siguen escribiendo filas "crudas" (con textos) en una tabla de
+carga; cargar_hechos() actualiza las dimensiones y traduce a claves.
+Solo aplica a PostgreSQL.
+"""
+import logging
+import database_extended as db
+
+logger = logging.getLogger(__name__)
+
+VISTA_HISTORICO = 'historico_licitaciones'
+TABLA_HECHOS = 'historico_ofertas'
+
+# Tabla de carga usada por importaciones sin particiones sobre el esquema normalizado
+TABLA_CARGA = 'historico_licitaciones_carga'
+
+SQL_DIMENSIONES = [
+    """
+    CREATE TABLE IF NOT EXISTS hist_cotizaciones (
+        id SERIAL PRIMARY KEY,
+        codigo TEXT NOT NULL UNIQUE,
+        nombre TEXT,
+        nombre_normalizado TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hist_proveedores (
+        id SERIAL PRIMARY KEY,
+        rut TEXT NOT NULL UNIQUE,
+        nombre TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hist_regiones (
+        id SMALLSERIAL PRIMARY KEY,
+        nombre TEXT NOT NULL UNIQUE
+    )
+    """,
+]
+
+SQL_VISTA = f"""
+    CREATE OR REPLACE VIEW {VISTA_HISTORICO} AS
+    SELECT
+        o.id,
+        c.codigo AS codigo_cotizacion,
+        c.nombre AS nombre_cotizacion,
+        r.nombre AS region,
+        p.rut AS rut_proveedor,
+        p.nombre AS nombre_proveedor,
+        o.producto_cotizado,
+        o.cantidad,
+        o.monto_total,
+        o.detalle_oferta,
+        o.es_ganador,
+        o.fecha_cierre,
+        o.fecha_importacion,
+        o.producto_normalizado,
+        c.nombre_normalizado,
+        o.cantidad_medida,
+        o.unidad_medida
+    FROM {TABLA_HECHOS} o
+    LEFT JOIN hist_cotizaciones c ON c.id = o.cotizacion_id
+    LEFT JOIN hist_regiones r ON r.id = o.region_id
+    LEFT JOIN hist_proveedores p ON p.id = o.proveedor_id
+"""
+
+# Columnas de la tabla de hechos que se copian tal cual desde las filas crudas
+_COLUMNAS_DIRECTAS = (
+    'producto_cotizado', 'cantidad', 'monto_total', 'detalle_oferta',
+    'es_ganador', 'fecha_cierre', 'producto_normalizado', 'cantidad_medida',
+    'unidad_medida'
+)
+
+
+def esta_normalizada(conn):
+    """True si historico_licitaciones es la vista sobre historico_ofertas."""
+    if not db.USE_POSTGRES:
+        return False
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT EXISTS (SELECT 1 FROM pg_views WHERE viewname = %s)
+        AND to_regclass(%s) IS NOT NULL
+    """, (VISTA_HISTORICO, TABLA_HECHOS))
+    return cursor.fetchone()[0]
+
+
+def tabla_fisica(conn):
+    """Tabla donde se guardan (y particionan) las filas del histórico."""
+    return TABLA_HECHOS if esta_normalizada(conn) else VISTA_HISTORICO
+
+
+def crear_dimensiones(cursor):
+    for sql in SQL_DIMENSIONES:
+        cursor.execute(sql)
+
+
+def actualizar_dimensiones(cursor, origen):
+    """
+    Agrega a las dimensiones los valores nuevos presentes en la tabla cruda origen.
+
+    Un RUT o código ya registrado conserva su nombre; solo se completa si estaba vacío.
+    """
+    cursor.execute(f"""
+        INSERT INTO hist_regiones (nombre)
+        SELECT DISTINCT region FROM {origen}
+        WHERE region IS NOT NULL
+        ON CONFLICT (nombre) DO NOTHING
+    """)
+    cursor.execute(f"""
+        INSERT INTO hist_proveedores (rut, nombre)
+        SELECT DISTINCT ON (rut_proveedor) rut_proveedor, nombre_proveedor
+        FROM {origen}
+        WHERE rut_proveedor IS NOT NULL
+        ORDER BY rut_proveedor, fecha_cierre DESC NULLS LAST
+        ON CONFLICT (rut) DO UPDATE
+        SET nombre = EXCLUDED.nombre
+        WHERE hist_proveedores.nombre IS NULL
+    """)
+    cursor.execute(f"""
+        INSERT INTO hist_cotizaciones (codigo, nombre, nombre_normalizado)
+        SELECT DISTINCT ON (codigo_cotizacion) codigo_cotizacion, nombre_cotizacion, nombre_normalizado
+        FROM {origen}
+        WHERE codigo_cotizacion IS NOT NULL
+        ORDER BY codigo_cotizacion, nombre_cotizacion NULLS LAST
+        ON CONFLICT (codigo) DO UPDATE
+        SET nombre = EXCLUDED.nombre, nombre_normalizado = EXCLUDED.nombre_normalizado
+        WHERE hist_cotizaciones.nombre IS NULL
+    """)
+
+
+def insertar_hechos(cursor, origen, destino, conservar_ids=False):
+    """
+    Inserta en destino las filas crudas de origen, traduciendo textos a claves.
+
+    Args:
+        conservar_ids: Copiar también la columna id (migración de datos existentes)
+
+    Returns:
+        Cantidad de filas insertadas
+    """
+    columnas = list(_COLUMNAS_DIRECTAS)
+    if conservar_ids:
+        columnas = ['id', 'fecha_importacion'] + columnas
+
+    cursor.execute(f"""
+        INSERT INTO {destino} (cotizacion_id, region_id, proveedor_id, {', '.join(columnas)})
+        SELECT c.id, r.id, p.id, {', '.join(f's.{col}' for col in columnas)}
+        FROM {origen} s
+        LEFT JOIN hist_cotizaciones c ON c.codigo = s.codigo_cotizacion
+        LEFT JOIN hist_regiones r ON r.nombre = s.region
+        LEFT JOIN hist_proveedores p ON p.rut = s.rut_proveedor
+    """)
+    return cursor.rowcount
+
+
+def cargar_hechos(conn, origen, destino=TABLA_HECHOS, eliminar_origen=False):
+    """Actualiza dimensiones e inserta las filas de origen en destino (una transacción)."""
+    cursor = conn.cursor()
+    try:
+        actualizar_dimensiones(cursor, origen)
+        filas = insertar_hechos(cursor, origen, destino)
+        if eliminar_origen:
+            cursor.execute(f"DROP TABLE {origen}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info(f"{filas:,} filas normalizadas de {origen} a {destino}")
+    return filas
+
+
+def crear_tabla_carga(conn, nombre=TABLA_CARGA):
+    """
+    Crea (o recrea) una tabla cruda con las columnas de la vista, para que los
+    importadores escriban textos como siempre. UNLOGGED: es temporal y se
+    descarta tras cargar_hechos().
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {nombre}")
+    cursor.execute(f"CREATE UNLOGGED TABLE {nombre} (LIKE {VISTA_HISTORICO})")
+    conn.commit()
+    return nombre
+
+
+def convertir_carga(conn, carga, destino_nuevo):
+    """
+    Reemplaza la tabla cruda carga por una tabla con el esquema de hechos.
+
+    Usado por las cargas particionadas: el staging crudo se traduce a claves
+    y toma su nombre, de modo que el resto del flujo (índices, ATTACH) no cambia.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {destino_nuevo}")
+        cursor.execute(f"""
+            CREATE TABLE {destino_nuevo}
+            (LIKE {TABLA_HECHOS} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        """)
+        actualizar_dimensiones(cursor, carga)
+        filas = insertar_hechos(cursor, carga, destino_nuevo)
+        cursor.execute(f"DROP TABLE {carga}")
+        cursor.execute(f"ALTER TABLE {destino_nuevo} RENAME TO {carga}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info(f"{filas:,} filas de staging traducidas a claves de dimensión")
+    return filas
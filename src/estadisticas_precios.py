@@ -0,0 +1,385 @@
+"""
+Estadísticas de precio precalculadas por término de producto.
+
+calcular_precio_optimo() recalculaba percentiles, promedio y filtro de outliers
+sobre cientos de filas en cada consulta. Esta tabla guarda esos valores por
+término normalizado (canonizacion.normalizar_termino) y región, de modo que una
+recomendación se responde con una sola lectura por clave primaria:
+
+    estadisticas_precios (termino, region) -> n_ofertas, n_ganadores, n_registros,
+                                             tasa_ganadores, p25, p42, p50, p75, p90,
+                                             promedio, desviacion, precio_min, precio_max
+
+region = '' agrupa todas las regiones. Se usan las mismas reglas que el cálculo
+en vivo: ventana de 2 años, monto y cantidad > 0, percentiles sobre ofertas
+ganadoras tras descartar outliers con filtro_outliers() (mediana ± 3 MAD).
+
+Tras cada importación mensual se recalculan solo los términos presentes en el
+mes importado. La reconstrucción completa (--completo) además descarta términos
+que salieron de la ventana de 2 años.
+
+Uso:
+    python src/estadisticas_precios.py --completo
+    python src/estadisticas_precios.py --mes 2025-06
+"""
+import os
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+import pandas as pd
+import database_extended as db
+from canonizacion import normalizar_termino
+
+logger = logging.getLogger(__name__)
+
+TABLA = 'estadisticas_precios'
+
+# Mínimo de precios ganadores (tras outliers) para guardar un término
+MIN_REGISTROS = int(os.getenv('ESTADISTICAS_MIN_REGISTROS', '5'))
+
+# Filas leídas de la BD por lote
+FILAS_POR_LOTE = int(os.getenv('ESTADISTICAS_LOTE', '100000'))
+
+VENTANA_DIAS = 730
+
+PERCENTILES = {'p25': 0.25, 'p42': 0.42, 'p50': 0.50, 'p75': 0.75, 'p90': 0.90}
+
+# Outliers: más de LIMITE_OUTLIER desviaciones robustas (MAD * FACTOR_MAD) de la mediana
+LIMITE_OUTLIER = 3
+FACTOR_MAD = 1.4826
+
+COLUMNAS = (
+    'termino', 'region', 'n_ofertas', 'n_ganadores', 'n_registros', 'tasa_ganadores',
+    'p25', 'p42', 'p50', 'p75', 'p90', 'promedio', 'desviacion', 'precio_min', 'precio_max'
+)
+
+
+def normalizar_region(region):
+    return (region or '').strip().upper()
+
+
+def filtro_outliers(precios: pd.Series, por=None) -> pd.Series:
+    """
+    Máscara de precios que no son outliers, por grupo si se indica por.
+
+    Descarta los que se alejan de la mediana más de 3 MAD escaladas (σ
+    robusta: un precio extremo no ensancha el rango como con media ± 3σ).
+    Si la MAD es 0 (más de la mitad de precios iguales) se usa media ± 3σ.
+    resumen_precios aplica la misma regla con numpy y sketches_precios sobre
+    los digests.
+    """
+    if por is None:
+        por = np.zeros(len(precios), dtype=np.int8)
+    grupos = precios.groupby(por, observed=True)
+    desvio = (precios - grupos.transform('median')).abs()
+    mad = desvio.groupby(por, observed=True).transform('median')
+    sigma = grupos.transform('std')
+
+    robusto = desvio <= LIMITE_OUTLIER * FACTOR_MAD * mad
+    clasico = sigma.isna() | ((precios - grupos.transform('mean')).abs() <= LIMITE_OUTLIER * sigma)
+    return robusto.where(mad > 0, clasico)
+
+
+
+def resumen_precios(precios: np.ndarray) -> Dict:
+    """
+    Percentiles (PERCENTILES), promedio y n_registros de un conjunto de
+    precios, descartando outliers con la regla de filtro_outliers.
+
+    Versión numpy para un solo grupo (cálculo en vivo de
+    ml_precio_optimo); precios no debe estar vacío.
+    """
+    precios = np.asarray(precios, dtype=float)
+    mediana = np.median(precios)
+    desvio = np.abs(precios - mediana)
+    mad = np.median(desvio)
+    if mad > 0:
+        mascara = desvio <= LIMITE_OUTLIER * FACTOR_MAD * mad
+    elif len(precios) > 1:
+        mascara = np.abs(precios - precios.mean()) <= LIMITE_OUTLIER * precios.std(ddof=1)
+    else:
+        mascara = np.ones(len(precios), dtype=bool)
+
+    filtrados = precios[mascara]
+    stats = dict(zip(PERCENTILES, np.quantile(filtrados, list(PERCENTILES.values()))))
+    stats.update(promedio=filtrados.mean(), n_registros=len(filtrados))
+    return stats
+
+def _lotes_ofertas(conn, desde, hasta=None):
+    """Itera lotes (producto, termino, region, monto, cantidad, es_ganador) de [desde, hasta)."""
+    p = db.get_placeholder()
+    query = f"""
+        SELECT producto_cotizado, producto_normalizado, region, monto_total, cantidad, es_ganador
+        FROM historico_licitaciones
+        WHERE monto_total > 0
+        AND cantidad > 0
+        AND fecha_cierre >= {p}
+    """
+    params = (desde.isoformat(),)
+    if hasta is not None:
+        query += f" AND fecha_cierre < {p}"
+        params += (hasta.isoformat(),)
+    if db.USE_POSTGRES:
+        # Cursor del lado del servidor: la ventana completa no cabe cómoda en memoria
+        cursor = conn.cursor(name='estadisticas_precios')
+        cursor.itersize = FILAS_POR_LOTE
+    else:
+        cursor = conn.cursor()
+    cursor.execute(query, params)
+    try:
+        while True:
+            filas = cursor.fetchmany(FILAS_POR_LOTE)
+            if not filas:
+                break
+            yield filas
+    finally:
+        cursor.close()
+
+
+def leer_ofertas(conn, desde, terminos=None, hasta=None):
+    """
+    Lee la ventana de ofertas como DataFrame compacto (termino, region, precio, es_ganador).
+
+    Args:
+        terminos: Si se indica, conserva solo filas de esos términos (modo incremental)
+        hasta: Fin exclusivo de la ventana (None = sin límite)
+    """
+    cache = {}
+    partes = []
+    for filas in _lotes_ofertas(conn, desde, hasta):
+        productos, normalizados, regiones, montos, cantidades, ganadores = zip(*filas)
+        claves = []
+        for producto, termino in zip(productos, normalizados):
+            # Filas sin columna canónica (anteriores a la migración): se calcula aquí
+            if termino is None:
+                termino = cache.get(producto)
+                if termino is None:
+                    termino = cache[producto] = normalizar_termino(producto)
+            claves.append(termino)
+
+        lote = pd.DataFrame({
+            'termino': claves,
+            'region': [normalizar_region(r) for r in regiones],
+            'precio_unitario': np.asarray(montos, dtype='float64') / np.asarray(cantidades, dtype='float64'),
+            'es_ganador': np.asarray([bool(g) for g in ganadores]),
+        })
+        lote = lote[lote['termino'] != '']
+        if terminos is not None:
+            lote = lote[lote['termino'].isin(terminos)]
+        if not lote.empty:
+            lote['termino'] = lote['termino'].astype('category')
+            lote['region'] = lote['region'].astype('category')
+            partes.append(lote)
+
+    if not partes:
+        return pd.DataFrame(columns=['termino', 'region', 'precio_unitario', 'es_ganador'])
+    # Las categorías difieren entre lotes: concat las vuelve a texto
+    df = pd.concat(partes, ignore_index=True)
+    df['termino'] = df['termino'].astype(str)
+    df['region'] = df['region'].astype(str)
+    return df
+
+
+def _agregar(df, claves):
+    """Estadísticas por grupo con las reglas de calcular_precio_optimo()."""
+    conteos = df.groupby(claves, observed=True).agg(
+        n_ofertas=('es_ganador', 'size'),
+        n_ganadores=('es_ganador', 'sum'),
+    )
+
+    ganadores = df[df['es_ganador']]
+    if ganadores.empty:
+        return pd.DataFrame(columns=list(COLUMNAS))
+
+    ganadores = ganadores[filtro_outliers(
+        ganadores['precio_unitario'], [ganadores[clave] for clave in claves]
+    )]
+
+    grupos = ganadores.groupby(claves, observed=True)['precio_unitario']
+    resumen = grupos.agg(
+        n_registros='size', promedio='mean', desviacion='std',
+        precio_min='min', precio_max='max'
+    )
+    cuantiles = grupos.quantile(list(PERCENTILES.values())).unstack()
+    cuantiles.columns = list(PERCENTILES.keys())
+
+    resultado = conteos.join(resumen, how='inner').join(cuantiles)
+    resultado = resultado[resultado['n_registros'] >= MIN_REGISTROS]
+    resultado['tasa_ganadores'] = resultado['n_ganadores'] / resultado['n_ofertas'] * 100
+    return resultado.reset_index()
+
+
+def calcular_estadisticas(df):
+    """
+    Estadísticas por término y región, más el agregado de todas las regiones (region = '').
+
+    Args:
+        df: DataFrame con termino, region, precio_unitario, es_ganador
+
+    Returns:
+        DataFrame con las columnas de la tabla estadisticas_precios
+    """
+    if df.empty:
+        return pd.DataFrame(columns=list(COLUMNAS))
+
+    por_region = _agregar(df[df['region'] != ''], ['termino', 'region'])
+    todas = _agregar(df, ['termino'])
+    todas['region'] = ''
+    resultado = pd.concat([todas, por_region], ignore_index=True)
+    return resultado[list(COLUMNAS)]
+
+
+def _valor(v):
+    if v is None or (isinstance(v, float) and np.isnan(v)):
+        return None
+    return v.item() if hasattr(v, 'item') else v
+
+
+def guardar_estadisticas(conn, estadisticas, terminos=None):
+    """
+    Reemplaza las filas de la tabla en una transacción.
+
+    Args:
+        terminos: Términos a reemplazar; None reemplaza la tabla completa
+    """
+    filas = [tuple(_valor(v) for v in fila) for fila in estadisticas.itertuples(index=False)]
+    p = db.get_placeholder()
+    cursor = conn.cursor()
+    try:
+        if terminos is None:
+            cursor.execute(f"DELETE FROM {TABLA}")
+        elif db.USE_POSTGRES:
+            cursor.execute(f"DELETE FROM {TABLA} WHERE termino = ANY(%s)", (list(terminos),))
+        else:
+            cursor.executemany(f"DELETE FROM {TABLA} WHERE termino = ?", [(t,) for t in terminos])
+
+        insert = f"INSERT INTO {TABLA} ({', '.join(COLUMNAS)}) VALUES "
+        if db.USE_POSTGRES:
+            from psycopg2.extras import execute_values
+            execute_values(cursor, insert + "%s", filas, page_size=5000)
+        else:
+            cursor.executemany(insert + f"({', '.join([p] * len(COLUMNAS))})", filas)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(filas)
+
+
+def terminos_de_meses(conn, meses: Iterable[str]) -> Set[str]:
+    """Términos normalizados de los productos ofertados en los meses indicados."""
+    from particiones_historico import rango_mes
+
+    p = db.get_placeholder()
+    cursor = conn.cursor()
+    terminos: Set[str] = set()
+    for mes in meses:
+        inicio, fin = rango_mes(mes)
+        cursor.execute(f"""
+            SELECT DISTINCT producto_cotizado, producto_normalizado
+            FROM historico_licitaciones
+            WHERE fecha_cierre >= {p} AND fecha_cierre < {p}
+        """, (inicio.isoformat(), fin.isoformat()))
+        terminos.update(
+            row[1] if row[1] is not None else normalizar_termino(row[0])
+            for row in cursor.fetchall()
+        )
+    terminos.discard('')
+    return terminos
+
+
+def reconstruir(meses: Optional[Iterable[str]] = None, hoy: Optional[date] = None) -> int:
+    """
+    Recalcula la tabla de estadísticas.
+
+    Args:
+        meses: Meses recién importados ('YYYY-MM'); solo se recalculan sus
+            términos. None reconstruye la tabla completa.
+        hoy: Fecha de referencia para la ventana (tests)
+
+    Returns:
+        Cantidad de filas (término, región) escritas
+    """
+    desde = (hoy or date.today()) - timedelta(days=VENTANA_DIAS)
+    conn = db.get_connection()
+    try:
+        terminos = None
+        if meses is not None:
+            terminos = terminos_de_meses(conn, meses)
+            if not terminos:
+                logger.info("Sin términos nuevos; estadísticas sin cambios")
+                return 0
+
+        df = leer_ofertas(conn, desde, terminos)
+        estadisticas = calcular_estadisticas(df)
+        filas = guardar_estadisticas(conn, estadisticas, terminos)
+    finally:
+        conn.close()
+
+    alcance = 'completa' if terminos is None else f"{len(terminos):,} términos"
+    logger.info(f"Estadísticas de precio actualizadas ({alcance}): {filas:,} filas")
+    return filas
+
+
+def buscar_estadisticas(producto: str, region: Optional[str] = None) -> Optional[Dict]:
+    """
+    Estadísticas precalculadas del producto (y región), o None si el término no existe.
+    """
+    return buscar_estadisticas_lote([(producto, region)])[0]
+
+
+def buscar_estadisticas_lote(consultas: Sequence[Tuple[str, Optional[str]]]) -> List[Optional[Dict]]:
+    """
+    Estadísticas de varios (producto, región) en una sola consulta.
+
+    Returns:
+        Lista alineada con consultas (None donde el término no existe)
+    """
+    claves = [(normalizar_termino(producto), normalizar_region(region)) for producto, region in consultas]
+    terminos = sorted({termino for termino, _ in claves if termino})
+    if not terminos:
+        return [None] * len(claves)
+
+    p = db.get_placeholder()
+    try:
+        conn = db.get_connection()
+        try:
+            cursor = conn.cursor()
+            if db.USE_POSTGRES:
+                cursor.execute(f"SELECT {', '.join(COLUMNAS)} FROM {TABLA} WHERE termino = ANY(%s)", (terminos,))
+            else:
+                cursor.execute(
+                    f"SELECT {', '.join(COLUMNAS)} FROM {TABLA} WHERE termino IN ({', '.join([p] * len(terminos))})",
+                    tuple(terminos)
+                )
+            filas = cursor.fetchall()
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"No se pudo leer {TABLA}: {e}")
+        return [None] * len(claves)
+
+    por_clave = {(fila[0], fila[1]): dict(zip(COLUMNAS, fila)) for fila in filas}
+    return [por_clave.get(clave) for clave in claves]
+
+
+def main():
+    import argparse
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Estadísticas de precio precalculadas")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--completo", action="store_true", help="Reconstruir la tabla completa")
+    grupo.add_argument("--mes", action="append", help="Recalcular términos del mes (YYYY-MM); repetible")
+    args = parser.parse_args()
+
+    db.iniciar_db_extendida()
+    reconstruir(None if args.completo else args.mes)
+
+
+if __name__ == "__main__":
+    main()
@@ -189,14 +189,11 @@ def buscar_compatibles_con_perfil(perfil, limite=10):
     return licitaciones[:limite]
 
 
-import unicodedata
+from canonizacion import quitar_tildes
 
 def normalizar_texto(texto):
     """Elimina acentos y convierte a minúsculas."""
-    if not texto:
-        return ""
-    return ''.join(c for c in unicodedata.normalize('NFD', str(texto))
-                  if unicodedata.category(c) != 'Mn').lower()
+    return quitar_tildes(texto)
 
 def calcular_score_compatibilidad_simple(licitacion, perfil):
     """
@@ -3,8 +3,12 @@ Módulo de integración con AI para análisis de licitaciones.
 NUEVO: Soporta múltiples proveedores (Gemini, Groq, Cerebras) via ai_providers.py
 Mantiene backward compatibility con código existente.
 """
+import asyncio
 import logging
 import json
+import os
+import time
+from typing import Any, List, Tuple
 
 # Importar abstracción de proveedores AI
 try:
@@ -32,6 +36,18 @@ except ImportError:
 # Logger para este módulo
 logger = logging.getLogger('compra_agil.gemini_ai')
 
+# Segundos que el análisis espera cada rama del enriquecimiento (RAG y precios);
+# una rama que no responde a tiempo se omite del prompt
+ANALISIS_TIMEOUT_RAG = float(os.getenv('ANALISIS_TIMEOUT_RAG', '8'))
+ANALISIS_TIMEOUT_PRECIO = float(os.getenv('ANALISIS_TIMEOUT_PRECIO', '8'))
+
+# Productos por lote de precios (cada lote es una tarea de pool_ml)
+ANALISIS_PRODUCTOS_POR_LOTE = int(os.getenv('ANALISIS_PRODUCTOS_POR_LOTE', '10'))
+
+# Versión del prompt de análisis: subirla al cambiar _preparar_analisis
+# invalida los análisis en caché (cache_analisis.py)
+VERSION_PROMPT_ANALISIS = 'v2'
+
 # Configurar proveedor de AI
 _ai_provider = None
 
@@ -51,6 +67,19 @@ def _get_provider():
             _ai_provider = _setup_legacy_gemini()
     return _ai_provider
 
+def modelo_activo() -> str:
+    """Proveedor y modelo que responden los análisis ('groq:llama-3.3-70b-versatile')."""
+    provider = _get_provider()
+    if provider is None:
+        return 'ninguno'
+    if isinstance(provider, dict):
+        return f"gemini:{provider['model']}"
+    return f"{provider.name}:{provider.model}"
+
+def _estimar_tokens(*textos: str) -> int:
+    """Estimación gruesa de tokens (~4 caracteres por token)."""
+    return sum(len(texto or '') for texto in textos) // 4
+
 def _setup_legacy_gemini():
     """Configuración legacy de Gemini (fallback)."""
     try:
@@ -87,6 +116,67 @@ def _generate_text(prompt: str, **kwargs) -> str:
     
     raise RuntimeError("Proveedor de AI no válido")
 
+async def _agenerate_text(prompt: str, **kwargs) -> str:
+    """
+    Versión async de _generate_text: espera al proveedor sin bloquear el
+    event loop del bot, que sigue atendiendo a otros usuarios.
+    """
+    provider = _get_provider()
+    
+    if provider is None:
+        raise RuntimeError("No hay proveedor de AI configurado")
+    
+    if AI_PROVIDERS_AVAILABLE and hasattr(provider, 'agenerate'):
+        response = await provider.agenerate(prompt, **kwargs)
+        return response.text
+    
+    # Fallback: modo legacy Gemini
+    if isinstance(provider, dict) and provider.get('type') == 'legacy_gemini':
+        genai = provider['genai']
+        model = genai.GenerativeModel(provider['model'])
+        response = await model.generate_content_async(prompt)
+        return response.text
+    
+    raise RuntimeError("Proveedor de AI no válido")
+
+async def _astream_text(prompt: str, **kwargs):
+    """Genera texto en streaming: entrega los fragmentos a medida que llegan."""
+    provider = _get_provider()
+    
+    if provider is None:
+        raise RuntimeError("No hay proveedor de AI configurado")
+    
+    if AI_PROVIDERS_AVAILABLE and hasattr(provider, 'astream'):
+        async for fragmento in provider.astream(prompt, **kwargs):
+            yield fragmento
+        return
+    
+    # Fallback: modo legacy Gemini
+    if isinstance(provider, dict) and provider.get('type') == 'legacy_gemini':
+        genai = provider['genai']
+        model = genai.GenerativeModel(provider['model'])
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+        return
+    
+    raise RuntimeError("Proveedor de AI no válido")
+
+async def _agenerar_con_avance(prompt: str, al_avanzar=None) -> str:
+    """
+    Genera el texto completo; con `al_avanzar` lo pide en streaming y llama
+    `await al_avanzar(texto_acumulado)` con cada fragmento recibido.
+    """
+    if al_avanzar is None:
+        return await _agenerate_text(prompt)
+    
+    fragmentos = []
+    async for fragmento in _astream_text(prompt):
+        fragmentos.append(fragmento)
+        await al_avanzar("".join(fragmentos))
+    return "".join(fragmentos)
+
 def _parse_json_response(text: str) -> dict:
     """Parsea respuesta de AI como JSON, limpiando markdown si existe."""
     texto_respuesta = text.strip()
@@ -104,47 +194,130 @@ def _parse_json_response(text: str) -> dict:
 
 # Backward compatibility: exponer MODEL_NAME para código legacy
 MODEL_NAME = GEMINI_MODEL
-
-
-def analizar_licitacion_completo(licitacion, perfil_empresa, productos_detalle=None, usar_historicos=True):
-    """
-    Realiza un análisis completo de una licitación usando Gemini AI.
-    MEJORADO: Ahora incluye datos históricos reales (RAG) y recomendaciones ML.
-    
-    Args:
-        licitacion: Dict con datos de la licitación
-        perfil_empresa: Dict con perfil de la empresa
-        productos_detalle: Lista de productos solicitados (opcional)
-        usar_historicos: Si True, enriquece con datos históricos (RAG)
-    
-    Returns:
-        dict con el análisis completo + datos históricos
-    """
-    
-    # Construir lista de productos si existe
-    productos_texto = ""
-    if productos_detalle:
-        productos_lineas = [f"- {p.get('nombre')}: {p.get('cantidad')} {p.get('unidad_medida')}" for p in productos_detalle]
-        productos_texto = "PRODUCTOS SOLICITADOS:\n" + "\n".join(productos_lineas)
-    
+
+
+def _lanzar_rama(fn, *args, tipo: str, **kwargs):
+    """
+    Envía una rama al pool ML (pool_ml.enviar), o devuelve None si está
+    saturado.
+
+    Una rama abandonada por timeout sigue ocupando su lugar en la cola hasta
+    terminar; con la cola llena las ramas nuevas se omiten de inmediato en
+    vez de esperar detrás de ellas.
+    """
+    import pool_ml
+    try:
+        return pool_ml.enviar(fn, *args, tipo=tipo, **kwargs)
+    except pool_ml.PoolSaturado:
+        return None
+
+
+def _esperar_rama(tarea, limite: float, rama: str, omitidas: List[str]):
+    """
+    Espera el resultado de una rama hasta el instante `limite` (time.monotonic).
+
+    Si la rama falla, no termina a tiempo o no se lanzó por el pool saturado
+    (tarea None) se registra en `omitidas` y se devuelve None; una rama ya
+    iniciada termina en su worker y su resultado se descarta.
+    """
+    import pool_ml
+    if tarea is None:
+        logger.warning(f"Rama '{rama}' omitida: pool ML saturado")
+        if rama not in omitidas:
+            omitidas.append(rama)
+        return None
+    try:
+        return pool_ml.esperar(tarea, timeout=max(limite - time.monotonic(), 0))
+    except TimeoutError:
+        logger.warning(f"Rama '{rama}' sin respuesta a tiempo, se omite del análisis")
+    except Exception as e:
+        logger.warning(f"Error en rama '{rama}' del análisis: {e}")
+    if rama not in omitidas:
+        omitidas.append(rama)
+    return None
+
+
+def _enriquecer_en_paralelo(licitacion: dict, productos_texto: str, items: list):
+    """
+    Lanza en paralelo el RAG histórico y el precio óptimo de los productos.
+
+    Los productos se reparten en lotes de ANALISIS_PRODUCTOS_POR_LOTE, cada
+    uno con su llamada a calcular_precios_lote. Cada rama tiene su propio
+    plazo (ANALISIS_TIMEOUT_RAG / ANALISIS_TIMEOUT_PRECIO) contado desde el
+    lanzamiento, así que el total queda acotado por el mayor de ellos. Las
+    ramas corren en pool_ml; con el pool saturado se omiten sin esperar.
+
+    Returns:
+        (datos_rag, precios_productos, ramas_omitidas). Los productos de un
+        lote omitido quedan con {'success': False, 'omitido': True}.
+    """
+    from rag_historico import enriquecer_analisis_licitacion
+    from ml_precio_optimo import calcular_precios_lote
+
+    inicio = time.monotonic()
+
+    logger.info("Buscando casos históricos similares...")
+    tarea_rag = _lanzar_rama(
+        enriquecer_analisis_licitacion,
+        tipo='rag',
+        nombre_licitacion=licitacion.get('nombre', ''),
+        monto_estimado=licitacion.get('monto_disponible'),
+        descripcion=productos_texto
+    )
+
+    por_lote = max(ANALISIS_PRODUCTOS_POR_LOTE, 1)
+    lotes = [items[i:i + por_lote] for i in range(0, len(items), por_lote)]
+    if items:
+        logger.info(f"Calculando precio óptimo para {len(items)} productos en {len(lotes)} lotes...")
+    tareas_precio = [
+        _lanzar_rama(calcular_precios_lote, lote, tipo='precio_lote', solo_ganadores=True)
+        for lote in lotes
+    ]
+
+    omitidas: List[str] = []
+    datos_rag = _esperar_rama(tarea_rag, inicio + ANALISIS_TIMEOUT_RAG, 'rag', omitidas) or {}
+
+    precios_productos: List[Tuple[dict, Any]] = []
+    for lote, tarea in zip(lotes, tareas_precio):
+        resultados = _esperar_rama(tarea, inicio + ANALISIS_TIMEOUT_PRECIO, 'precio', omitidas)
+        if resultados is None:
+            resultados = [{'success': False, 'omitido': True, 'confianza': 0}] * len(lote)
+        precios_productos.extend(zip(lote, resultados))
+
+    return datos_rag, precios_productos, omitidas
+
+
+def _preparar_analisis(licitacion, perfil_empresa, productos_detalle=None, usar_historicos=True):
+    """
+    Enriquece la licitación con datos históricos y arma el prompt del análisis.
+    
+    Returns:
+        (prompt, metadata) donde metadata describe los datos históricos usados
+    """
+    
+    # Construir lista de productos si existe
+    productos_texto = ""
+    if productos_detalle:
+        productos_lineas = [f"- {p.get('nombre')}: {p.get('cantidad')} {p.get('unidad_medida')}" for p in productos_detalle]
+        productos_texto = "PRODUCTOS SOLICITADOS:\n" + "\n".join(productos_lineas)
+    
     # ========== NUEVO: INTEGRACIÓN CON SISTEMA RAG ==========
     contexto_historico = ""
     insights_historicos = ""
     recomendacion_precio_ml = None
+    precios_productos = []  # [(item, resultado)] de cada producto solicitado
     datos_rag = {}  # Inicializar vacío para evitar 'unbound'
+    ramas_omitidas = []  # Ramas del enriquecimiento que no respondieron a tiempo
     
     if usar_historicos:
         try:
-            # Importar módulos ML (lazy import para evitar errores si no están disponibles)
-            from rag_historico import enriquecer_analisis_licitacion
-            from ml_precio_optimo import calcular_precio_optimo
-            
-            # Buscar casos históricos similares
-            logger.info("Buscando casos históricos similares...")
-            datos_rag = enriquecer_analisis_licitacion(
-                nombre_licitacion=licitacion.get('nombre', ''),
-                monto_estimado=licitacion.get('monto_disponible'),
-                descripcion=productos_texto
+            items = [
+                {'producto': p.get('nombre') or '', 'cantidad': p.get('cantidad') or 1}
+                for p in productos_detalle or []
+            ]
+            # RAG y precios en paralelo, cada rama con su plazo
+            datos_rag, precios_productos, ramas_omitidas = _enriquecer_en_paralelo(
+                licitacion, productos_texto, items
             )
             
             if datos_rag.get('tiene_datos'):
@@ -152,248 +325,328 @@ def analizar_licitacion_completo(licitacion, perfil_empresa, productos_detalle=N
                 insights_historicos = datos_rag['insights']
                 logger.info(f"Encontrados {datos_rag['n_casos_encontrados']} casos históricos")
             
-            # Calcular precio óptimo si hay productos
-            if productos_detalle and len(productos_detalle) > 0:
-                producto_principal = productos_detalle[0].get('nombre', '')
-                cantidad = productos_detalle[0].get('cantidad', 1)
-                
-                if producto_principal:
-                    logger.info(f"Calculando precio óptimo para '{producto_principal}'...")
-                    recomendacion_precio_ml = calcular_precio_optimo(
-                        producto=producto_principal,
-                        cantidad=cantidad,
-                        solo_ganadores=True
-                    )
-                    
-                    if recomendacion_precio_ml.get('success'):
-                        logger.info(f"Precio recomendado: ${recomendacion_precio_ml['precio_total']['recomendado']:,}")
+            # El primer producto sigue siendo la recomendación principal
+            if precios_productos and not precios_productos[0][1].get('omitido'):
+                recomendacion_precio_ml = precios_productos[0][1]
+                if recomendacion_precio_ml.get('success'):
+                    logger.info(f"Precio recomendado: ${recomendacion_precio_ml['precio_total']['recomendado']:,}")
         
         except ImportError as e:
             logger.warning(f"Módulos ML no disponibles: {e}")
         except Exception as e:
             logger.warning(f"Error al obtener datos históricos: {e}")
-    
-    # ========== FIN INTEGRACIÓN RAG ==========
-    
-    # Construir prompt enriquecido
-    prompt = f"""Eres un experto en licitaciones públicas de Chile, especializado en Compra Ágil. 
-Analiza la siguiente licitación para ayudar a una PYME a decidir si participar y cómo ganar.
-
-PERFIL DE LA EMPRESA:
-- Nombre: {perfil_empresa.get('nombre_empresa', 'No especificado')}
-- Tipo de negocio: {perfil_empresa.get('tipo_negocio', 'No especificado')}
-- Productos/Servicios: {perfil_empresa.get('productos_servicios', 'No especificado')}
-- Palabras clave: {perfil_empresa.get('palabras_clave', 'No especificado')}
-- Capacidad de entrega: {perfil_empresa.get('capacidad_entrega_dias', 'No especificado')} días
-- Ubicación: {perfil_empresa.get('ubicacion', 'No especificado')}
-- Experiencia: {perfil_empresa.get('experiencia_anos', 'No especificado')} años
-- Certificaciones: {perfil_empresa.get('certificaciones', 'Ninguna')}
-
-LICITACIÓN:
-- Código: {licitacion.get('codigo')}
-- Nombre: {licitacion.get('nombre')}
-- Organismo: {licitacion.get('organismo')}
-- Unidad: {licitacion.get('unidad', 'No especificado')}
-- Presupuesto estimado: ${licitacion.get('monto_disponible', 0):,} CLP
-- Moneda: {licitacion.get('moneda', 'CLP')}
-- Fecha de cierre: {licitacion.get('fecha_cierre')}
-- Fecha de publicación: {licitacion.get('fecha_publicacion')}
-- Proveedores cotizando: {licitacion.get('cantidad_proveedores_cotizando', 0)}
-- Estado: {licitacion.get('estado')}
-
-{productos_texto}
-
-{"=" * 60}
-ANÁLISIS BASADO EN DATOS HISTÓRICOS REALES:
-{"=" * 60}
-
-{insights_historicos if insights_historicos else "No hay datos históricos disponibles para esta licitación."}
-
-{contexto_historico}
-
-{"=" * 60}
-RECOMENDACIÓN DE PRECIO (ML):
-{"=" * 60}
-"""
-
-    # Añadir recomendación de precio ML si existe
-    if recomendacion_precio_ml and recomendacion_precio_ml.get('success'):
-        prompt += f"""
-{recomendacion_precio_ml['recomendacion']}
-
-Estadísticas detalladas:
-- {recomendacion_precio_ml['estadisticas']['n_registros']} licitaciones similares analizadas
-- {recomendacion_precio_ml['estadisticas']['n_ganadores']} ofertas ganadoras
-- Tasa de conversión histórica: {recomendacion_precio_ml['estadisticas']['tasa_conversion']:.1f}%
-
-IMPORTANTE: Usa esta información REAL para fundamentar tu recomendación de precio.
-"""
-    else:
-        prompt += "\nNo hay datos suficientes para calcular precio óptimo con ML.\n"
-
-    prompt +=f"""
-{"=" * 60}
-
-Proporciona un análisis estructurado en formato JSON con los siguientes campos:
-
-{{
-  "compatibilidad": {{
-    "score": <número 0-100>,
-    "explicacion": "<por qué este score>",
-    "fortalezas": ["<fortaleza 1>", "<fortaleza 2>", ...],
-    "debilidades": ["<debilidad 1>", "<debilidad 2>", ...]
-  }},
-  "recomendacion_precio": {{
-    "rango_minimo": <número>,
-    "rango_maximo": <número>,
-    "precio_sugerido": <número>,
-    "estrategia": "<explicación de la estrategia de precio>",
-    "justificacion": "<por qué este rango - cita los datos históricos si los usaste>"
-  }},
-  "analisis_competencia": {{
-    "nivel_competencia": "<bajo/medio/alto>",
-    "ventajas_competitivas": ["<ventaja 1>", "<ventaja 2>", ...],
-    "riesgos": ["<riesgo 1>", "<riesgo 2>", ...]
-  }},
-  "recomendaciones": {{
-    "debe_participar": <true/false>,
-    "probabilidad_exito": "<baja/media/alta>",
-    "acciones_clave": ["<acción 1>", "<acción 2>", ...],
-    "que_destacar": ["<punto 1>", "<punto 2>", ...],
-    "consejos_cotizacion": ["<consejo 1>", "<consejo 2>", ...]
-  }},
-  "resumen_ejecutivo": "<resumen en 2-3 oraciones sobre si conviene participar y por qué>"
-}}
-
+    
+    # ========== FIN INTEGRACIÓN RAG ==========
+    
+    # Construir prompt enriquecido
+    prompt = f"""Eres un experto en licitaciones públicas de Chile, especializado en Compra Ágil. 
+Analiza la siguiente licitación para ayudar a una PYME a decidir si participar y cómo ganar.
+
+PERFIL DE LA EMPRESA:
+- Nombre: {perfil_empresa.get('nombre_empresa', 'No especificado')}
+- Tipo de negocio: {perfil_empresa.get('tipo_negocio', 'No especificado')}
+- Productos/Servicios: {perfil_empresa.get('productos_servicios', 'No especificado')}
+- Palabras clave: {perfil_empresa.get('palabras_clave', 'No especificado')}
+- Capacidad de entrega: {perfil_empresa.get('capacidad_entrega_dias', 'No especificado')} días
+- Ubicación: {perfil_empresa.get('ubicacion', 'No especificado')}
+- Experiencia: {perfil_empresa.get('experiencia_anos', 'No especificado')} años
+- Certificaciones: {perfil_empresa.get('certificaciones', 'Ninguna')}
+
+LICITACIÓN:
+- Código: {licitacion.get('codigo')}
+- Nombre: {licitacion.get('nombre')}
+- Organismo: {licitacion.get('organismo')}
+- Unidad: {licitacion.get('unidad', 'No especificado')}
+- Presupuesto estimado: ${licitacion.get('monto_disponible', 0):,} CLP
+- Moneda: {licitacion.get('moneda', 'CLP')}
+- Fecha de cierre: {licitacion.get('fecha_cierre')}
+- Fecha de publicación: {licitacion.get('fecha_publicacion')}
+- Proveedores cotizando: {licitacion.get('cantidad_proveedores_cotizando', 0)}
+- Estado: {licitacion.get('estado')}
+
+{productos_texto}
+
+{"=" * 60}
+ANÁLISIS BASADO EN DATOS HISTÓRICOS REALES:
+{"=" * 60}
+
+{insights_historicos if insights_historicos else "No hay datos históricos disponibles para esta licitación."}
+
+{contexto_historico}
+
+{"=" * 60}
+RECOMENDACIÓN DE PRECIO (ML):
+{"=" * 60}
+"""
+
+    # Añadir recomendación de precio ML si existe
+    if recomendacion_precio_ml and recomendacion_precio_ml.get('success'):
+        prompt += f"""
+{recomendacion_precio_ml['recomendacion']}
+
+Estadísticas detalladas:
+- {recomendacion_precio_ml['estadisticas']['n_registros']} licitaciones similares analizadas
+- {recomendacion_precio_ml['estadisticas']['n_ganadores']} ofertas ganadoras
+- Tasa de conversión histórica: {recomendacion_precio_ml['estadisticas']['tasa_conversion']:.1f}%
+
+IMPORTANTE: Usa esta información REAL para fundamentar tu recomendación de precio.
+"""
+    elif 'precio' in ramas_omitidas:
+        prompt += "\nEl cálculo de precio óptimo con ML no estuvo disponible para este análisis.\n"
+    else:
+        prompt += "\nNo hay datos suficientes para calcular precio óptimo con ML.\n"
+
+    # Precios de cada producto solicitado
+    if len(precios_productos) > 1:
+        lineas_precios = []
+        total_sugerido = 0
+        for item, precio in precios_productos:
+            if precio.get('success'):
+                total_sugerido += precio['precio_total']['recomendado']
+                lineas_precios.append(
+                    f"- {item['producto']} (x{item['cantidad']}): "
+                    f"${precio['precio_unitario']['recomendado']:,.0f} c/u, "
+                    f"total ${precio['precio_total']['recomendado']:,.0f} "
+                    f"(confianza {precio['confianza']:.0%})"
+                )
+            elif precio.get('omitido'):
+                lineas_precios.append(f"- {item['producto']} (x{item['cantidad']}): precio no disponible (cálculo no terminó a tiempo)")
+            else:
+                lineas_precios.append(f"- {item['producto']} (x{item['cantidad']}): sin datos históricos suficientes")
+        prompt += "\nPRECIOS POR PRODUCTO (ML):\n" + "\n".join(lineas_precios) + "\n"
+        if total_sugerido:
+            prompt += f"Total sugerido para los productos con datos: ${total_sugerido:,.0f}\n"
+
+    prompt +=f"""
+{"=" * 60}
+
+Proporciona un análisis estructurado en formato JSON con los siguientes campos:
+
+{{
+  "compatibilidad": {{
+    "score": <número 0-100>,
+    "explicacion": "<por qué este score>",
+    "fortalezas": ["<fortaleza 1>", "<fortaleza 2>", ...],
+    "debilidades": ["<debilidad 1>", "<debilidad 2>", ...]
+  }},
+  "recomendacion_precio": {{
+    "rango_minimo": <número>,
+    "rango_maximo": <número>,
+    "precio_sugerido": <número>,
+    "estrategia": "<explicación de la estrategia de precio>",
+    "justificacion": "<por qué este rango - cita los datos históricos si los usaste>"
+  }},
+  "analisis_competencia": {{
+    "nivel_competencia": "<bajo/medio/alto>",
+    "ventajas_competitivas": ["<ventaja 1>", "<ventaja 2>", ...],
+    "riesgos": ["<riesgo 1>", "<riesgo 2>", ...]
+  }},
+  "recomendaciones": {{
+    "debe_participar": <true/false>,
+    "probabilidad_exito": "<baja/media/alta>",
+    "acciones_clave": ["<acción 1>", "<acción 2>", ...],
+    "que_destacar": ["<punto 1>", "<punto 2>", ...],
+    "consejos_cotizacion": ["<consejo 1>", "<consejo 2>", ...]
+  }},
+  "resumen_ejecutivo": "<resumen en 2-3 oraciones sobre si conviene participar y por qué>"
+}}
+
 IMPORTANTE: 
 - Responde SOLO con el JSON, sin texto adicional antes o después.
 - Fundamenta tus recomendaciones en los DATOS HISTÓRICOS REALES proporcionados arriba.
 - Menciona específicamente insights de casos históricos en tu análisis."""
     
+    # Metadatos sobre datos históricos usados
+    metadata = {
+        'uso_datos_historicos': usar_historicos,
+        'casos_historicos_encontrados': datos_rag.get('n_casos_encontrados', 0) if usar_historicos and datos_rag.get('tiene_datos') else 0,
+        'precio_ml_calculado': recomendacion_precio_ml is not None and recomendacion_precio_ml.get('success', False),
+        'confianza_precio_ml': recomendacion_precio_ml.get('confianza', 0) if recomendacion_precio_ml else 0,
+        'productos_con_precio_ml': sum(1 for _, precio in precios_productos if precio.get('success')),
+        # Análisis hecho sin alguna rama (RAG o precios) por tiempo o error
+        'parcial': bool(ramas_omitidas),
+        'ramas_omitidas': ramas_omitidas
+    }
+    
+    return prompt, metadata
+
+
+def _analisis_con_error(e: Exception) -> dict:
+    logger.error(f"Error en análisis de IA: {e}")
+    return {
+        "error": str(e),
+        "compatibilidad": {"score": 0, "explicacion": "Error al analizar"},
+        "recomendacion_precio": {"precio_sugerido": 0, "estrategia": "No disponible"},
+        "analisis_competencia": {"nivel_competencia": "desconocido"},
+        "recomendaciones": {"debe_participar": False, "probabilidad_exito": "desconocida"},
+        "resumen_ejecutivo": "No se pudo completar el análisis"
+    }
+
+
+def analizar_licitacion_completo(licitacion, perfil_empresa, productos_detalle=None, usar_historicos=True):
+    """
+    Realiza un análisis completo de una licitación usando Gemini AI.
+    MEJORADO: Ahora incluye datos históricos reales (RAG) y recomendaciones ML.
+    
+    Args:
+        licitacion: Dict con datos de la licitación
+        perfil_empresa: Dict con perfil de la empresa
+        productos_detalle: Lista de productos solicitados (opcional)
+        usar_historicos: Si True, enriquece con datos históricos (RAG)
+    
+    Returns:
+        dict con el análisis completo + datos históricos
+    """
+    prompt, metadata = _preparar_analisis(licitacion, perfil_empresa, productos_detalle, usar_historicos)
+    
     try:
         texto_respuesta = _generate_text(prompt)
         analisis = _parse_json_response(texto_respuesta)
-        
-        # Añadir metadatos sobre datos históricos usados
-        analisis['_metadata'] = {
-            'uso_datos_historicos': usar_historicos,
-            'casos_historicos_encontrados': datos_rag.get('n_casos_encontrados', 0) if usar_historicos and datos_rag.get('tiene_datos') else 0,
-            'precio_ml_calculado': recomendacion_precio_ml is not None and recomendacion_precio_ml.get('success', False),
-            'confianza_precio_ml': recomendacion_precio_ml.get('confianza', 0) if recomendacion_precio_ml else 0
-        }
-        
-        return analisis
-        
+        analisis['_metadata'] = dict(metadata, tokens_estimados=_estimar_tokens(prompt, texto_respuesta))
+        return analisis
+        
+    except Exception as e:
+        return _analisis_con_error(e)
+
+
+async def analizar_licitacion_completo_async(licitacion, perfil_empresa, productos_detalle=None, usar_historicos=True, al_avanzar=None):
+    """
+    Versión async de analizar_licitacion_completo para los handlers del bot.
+    
+    El enriquecimiento (BD + ML) corre en un hilo y la llamada al proveedor
+    es async, así que varios análisis avanzan a la vez en el mismo proceso.
+    Con `al_avanzar` la respuesta llega en streaming (ver _agenerar_con_avance)
+    y el JSON se parsea al terminar.
+    """
+    prompt, metadata = await asyncio.to_thread(
+        _preparar_analisis, licitacion, perfil_empresa, productos_detalle, usar_historicos
+    )
+    
+    try:
+        texto_respuesta = await _agenerar_con_avance(prompt, al_avanzar)
+        analisis = _parse_json_response(texto_respuesta)
+        analisis['_metadata'] = dict(metadata, tokens_estimados=_estimar_tokens(prompt, texto_respuesta))
+        return analisis
+        
     except Exception as e:
-        logger.error(f"Error en análisis de IA: {e}")
-        return {
-            "error": str(e),
-            "compatibilidad": {"score": 0, "explicacion": "Error al analizar"},
-            "recomendacion_precio": {"precio_sugerido": 0, "estrategia": "No disponible"},
-            "analisis_competencia": {"nivel_competencia": "desconocido"},
-            "recomendaciones": {"debe_participar": False, "probabilidad_exito": "desconocida"},
-            "resumen_ejecutivo": "No se pudo completar el análisis"
-        }
-
-
-
-def generar_ayuda_cotizacion(licitacion, perfil_empresa, analisis):
-    """
-    Genera una guía personalizada para preparar la cotización.
-    
-    Returns:
-        dict con checklist, plantilla y consejos
-    """
-    
-    prompt = f"""Basándote en el siguiente análisis de licitación, genera una guía práctica para preparar la cotización.
-
-LICITACIÓN:
-- Código: {licitacion.get('codigo')}
-- Nombre: {licitacion.get('nombre')}
-- Presupuesto: ${licitacion.get('monto_disponible', 0):,} CLP
-
-PERFIL EMPRESA:
-- {perfil_empresa.get('nombre_empresa')}
-- {perfil_empresa.get('productos_servicios')}
-
-ANÁLISIS PREVIO:
-- Score compatibilidad: {analisis.get('compatibilidad', {}).get('score', 0)}
-- Precio sugerido: ${analisis.get('recomendacion_precio', {}).get('precio_sugerido', 0):,} CLP
-
-Genera en formato JSON:
-
-{{
-  "checklist_documentos": [
-    {{"item": "<documento>", "obligatorio": true/false, "descripcion": "<breve descripción>"}}
-  ],
-  "estructura_cotizacion": {{
-    "seccion_1": "<qué incluir>",
-    "seccion_2": "<qué incluir>",
-    ...
-  }},
-  "consejos_presentacion": ["<consejo 1>", "<consejo 2>", ...],
-  "errores_evitar": ["<error 1>", "<error 2>", ...],
-  "timeline_sugerido": {{
-    "dias_antes_cierre": [
-      {{"dias": 7, "tarea": "<qué hacer>"}},
-      {{"dias": 3, "tarea": "<qué hacer>"}},
-      {{"dias": 1, "tarea": "<qué hacer>"}}
-    ]
-  }}
-}}
-
+        return _analisis_con_error(e)
+
+
+def _prompt_ayuda_cotizacion(licitacion, perfil_empresa, analisis) -> str:
+    return f"""Basándote en el siguiente análisis de licitación, genera una guía práctica para preparar la cotización.
+
+LICITACIÓN:
+- Código: {licitacion.get('codigo')}
+- Nombre: {licitacion.get('nombre')}
+- Presupuesto: ${licitacion.get('monto_disponible', 0):,} CLP
+
+PERFIL EMPRESA:
+- {perfil_empresa.get('nombre_empresa')}
+- {perfil_empresa.get('productos_servicios')}
+
+ANÁLISIS PREVIO:
+- Score compatibilidad: {analisis.get('compatibilidad', {}).get('score', 0)}
+- Precio sugerido: ${analisis.get('recomendacion_precio', {}).get('precio_sugerido', 0):,} CLP
+
+Genera en formato JSON:
+
+{{
+  "checklist_documentos": [
+    {{"item": "<documento>", "obligatorio": true/false, "descripcion": "<breve descripción>"}}
+  ],
+  "estructura_cotizacion": {{
+    "seccion_1": "<qué incluir>",
+    "seccion_2": "<qué incluir>",
+    ...
+  }},
+  "consejos_presentacion": ["<consejo 1>", "<consejo 2>", ...],
+  "errores_evitar": ["<error 1>", "<error 2>", ...],
+  "timeline_sugerido": {{
+    "dias_antes_cierre": [
+      {{"dias": 7, "tarea": "<qué hacer>"}},
+      {{"dias": 3, "tarea": "<qué hacer>"}},
+      {{"dias": 1, "tarea": "<qué hacer>"}}
+    ]
+  }}
+}}
+
 Responde SOLO con el JSON."""
 
+
+def _guia_con_error(e: Exception) -> dict:
+    logger.error(f"Error al generar guía: {e}")
+    return {
+        "error": str(e),
+        "checklist_documentos": [],
+        "consejos_presentacion": ["No disponible"]
+    }
+
+
+def generar_ayuda_cotizacion(licitacion, perfil_empresa, analisis):
+    """
+    Genera una guía personalizada para preparar la cotización.
+    
+    Returns:
+        dict con checklist, plantilla y consejos
+    """
+    prompt = _prompt_ayuda_cotizacion(licitacion, perfil_empresa, analisis)
+
     try:
         texto_respuesta = _generate_text(prompt)
         guia = _parse_json_response(texto_respuesta)
         return guia
         
     except Exception as e:
-        logger.error(f"Error al generar guía: {e}")
-        return {
-            "error": str(e),
-            "checklist_documentos": [],
-            "consejos_presentacion": ["No disponible"]
-        }
-
-
-def comparar_licitaciones(licitacion1, licitacion2, perfil_empresa):
-    """
-    Compara dos licitaciones y recomienda cuál es mejor para la empresa.
-    """
-    
-    prompt = f"""Compara estas dos licitaciones para la empresa y recomienda cuál es mejor opción.
-
-PERFIL EMPRESA:
-- {perfil_empresa.get('nombre_empresa')}
-- {perfil_empresa.get('productos_servicios')}
-
-LICITACIÓN A:
-- Código: {licitacion1.get('codigo')}
-- Nombre: {licitacion1.get('nombre')}
-- Presupuesto: ${licitacion1.get('monto_disponible', 0):,} CLP
-- Cierre: {licitacion1.get('fecha_cierre')}
-- Competidores: {licitacion1.get('cantidad_proveedores_cotizando', 0)}
-
-LICITACIÓN B:
-- Código: {licitacion2.get('codigo')}
-- Nombre: {licitacion2.get('nombre')}
-- Presupuesto: ${licitacion2.get('monto_disponible', 0):,} CLP
-- Cierre: {licitacion2.get('fecha_cierre')}
-- Competidores: {licitacion2.get('cantidad_proveedores_cotizando', 0)}
-
-Responde en formato JSON:
-
-{{
-  "recomendacion": "A" o "B",
-  "razon_principal": "<por qué>",
-  "ventajas_opcion_recomendada": ["<ventaja 1>", ...],
-  "desventajas_otra_opcion": ["<desventaja 1>", ...],
-  "consideraciones": ["<consideración 1>", ...],
-  "resumen": "<resumen ejecutivo>"
-}}
-
+        return _guia_con_error(e)
+
+
+async def generar_ayuda_cotizacion_async(licitacion, perfil_empresa, analisis, al_avanzar=None):
+    """Versión async de generar_ayuda_cotizacion (en streaming con `al_avanzar`)."""
+    prompt = _prompt_ayuda_cotizacion(licitacion, perfil_empresa, analisis)
+
+    try:
+        return _parse_json_response(await _agenerar_con_avance(prompt, al_avanzar))
+        
+    except Exception as e:
+        return _guia_con_error(e)
+
+
+def comparar_licitaciones(licitacion1, licitacion2, perfil_empresa):
+    """
+    Compara dos licitaciones y recomienda cuál es mejor para la empresa.
+    """
+    
+    prompt = f"""Compara estas dos licitaciones para la empresa y recomienda cuál es mejor opción.
+
+PERFIL EMPRESA:
+- {perfil_empresa.get('nombre_empresa')}
+- {perfil_empresa.get('productos_servicios')}
+
+LICITACIÓN A:
+- Código: {licitacion1.get('codigo')}
+- Nombre: {licitacion1.get('nombre')}
+- Presupuesto: ${licitacion1.get('monto_disponible', 0):,} CLP
+- Cierre: {licitacion1.get('fecha_cierre')}
+- Competidores: {licitacion1.get('cantidad_proveedores_cotizando', 0)}
+
+LICITACIÓN B:
+- Código: {licitacion2.get('codigo')}
+- Nombre: {licitacion2.get('nombre')}
+- Presupuesto: ${licitacion2.get('monto_disponible', 0):,} CLP
+- Cierre: {licitacion2.get('fecha_cierre')}
+- Competidores: {licitacion2.get('cantidad_proveedores_cotizando', 0)}
+
+Responde en formato JSON:
+
+{{
+  "recomendacion": "A" o "B",
+  "razon_principal": "<por qué>",
+  "ventajas_opcion_recomendada": ["<ventaja 1>", ...],
+  "desventajas_otra_opcion": ["<desventaja 1>", ...],
+  "consideraciones": ["<consideración 1>", ...],
+  "resumen": "<resumen ejecutivo>"
+}}
+
 Responde SOLO con el JSON."""
 
     try:
@@ -404,59 +657,62 @@ Responde SOLO con el JSON."""
     except Exception as e:
         logger.error(f"Error al comparar: {e}")
         return {"error": str(e)}
-
-
-def generar_borrador_oferta(licitacion, perfil_empresa, formato="texto", instrucciones_extra=""):
-    """
-    Genera un borrador de oferta para una licitación.
-    
-    Args:
-        licitacion: Dict con datos de la licitación
-        perfil_empresa: Dict con perfil de la empresa
-        formato: "texto", "pdf" (estructura formal), "correo"
-        instrucciones_extra: Instrucciones adicionales del usuario
-        
-    Returns:
-        str: El contenido generado
-    """
-    
-    tipo_formato = {
-        "texto": "un mensaje de texto para Telegram, conciso y directo, resaltando los puntos clave.",
-        "pdf": "una propuesta formal estructurada (Introducción, Propuesta Técnica, Propuesta Económica, Plazos, Experiencia). Usa formato Markdown.",
-        "correo": "un correo electrónico profesional, con asunto sugerido, saludo formal y cuerpo persuasivo."
-    }
-    
-    desc_formato = tipo_formato.get(formato, tipo_formato["texto"])
-    
-    prompt = f"""Actúa como un experto en ventas B2B y licitaciones públicas.
-Redacta {desc_formato} para postular a la siguiente licitación de Compra Ágil.
-
-PERFIL DE MI EMPRESA:
-- Nombre: {perfil_empresa.get('nombre_empresa', 'No especificado')}
-- Giro: {perfil_empresa.get('tipo_negocio', 'No especificado')}
-- Productos/Servicios: {perfil_empresa.get('productos_servicios', 'No especificado')}
-- Fortalezas: {perfil_empresa.get('palabras_clave', '')}
-- Experiencia: {perfil_empresa.get('experiencia_anos', 0)} años
-- Ubicación: {perfil_empresa.get('ubicacion', 'No especificado')}
-
-DATOS DE LA LICITACIÓN:
-- Código: {licitacion.get('codigo')}
-- Nombre: {licitacion.get('nombre')}
-- Organismo: {licitacion.get('organismo')}
-- Descripción: {licitacion.get('descripcion', 'Ver detalles en ficha')}
-- Presupuesto: ${licitacion.get('monto_disponible', 0):,} (Referencial)
-- Fecha Cierre: {licitacion.get('fecha_cierre')}
-
-INSTRUCCIONES ADICIONALES:
-{instrucciones_extra}
-
-OBJETIVO:
-Persuadir al comprador de que somos la mejor opción por calidad, confianza y cumplimiento.
-Si es formato PDF, estructura el contenido con títulos claros.
-Si es correo, incluye el Asunto.
-
+
+
+def _prompt_borrador_oferta(licitacion, perfil_empresa, formato="texto", instrucciones_extra="") -> str:
+    tipo_formato = {
+        "texto": "un mensaje de texto para Telegram, conciso y directo, resaltando los puntos clave.",
+        "pdf": "una propuesta formal estructurada (Introducción, Propuesta Técnica, Propuesta Económica, Plazos, Experiencia). Usa formato Markdown.",
+        "correo": "un correo electrónico profesional, con asunto sugerido, saludo formal y cuerpo persuasivo."
+    }
+    
+    desc_formato = tipo_formato.get(formato, tipo_formato["texto"])
+    
+    return f"""Actúa como un experto en ventas B2B y licitaciones públicas.
+Redacta {desc_formato} para postular a la siguiente licitación de Compra Ágil.
+
+PERFIL DE MI EMPRESA:
+- Nombre: {perfil_empresa.get('nombre_empresa', 'No especificado')}
+- Giro: {perfil_empresa.get('tipo_negocio', 'No especificado')}
+- Productos/Servicios: {perfil_empresa.get('productos_servicios', 'No especificado')}
+- Fortalezas: {perfil_empresa.get('palabras_clave', '')}
+- Experiencia: {perfil_empresa.get('experiencia_anos', 0)} años
+- Ubicación: {perfil_empresa.get('ubicacion', 'No especificado')}
+
+DATOS DE LA LICITACIÓN:
+- Código: {licitacion.get('codigo')}
+- Nombre: {licitacion.get('nombre')}
+- Organismo: {licitacion.get('organismo')}
+- Descripción: {licitacion.get('descripcion', 'Ver detalles en ficha')}
+- Presupuesto: ${licitacion.get('monto_disponible', 0):,} (Referencial)
+- Fecha Cierre: {licitacion.get('fecha_cierre')}
+
+INSTRUCCIONES ADICIONALES:
+{instrucciones_extra}
+
+OBJETIVO:
+Persuadir al comprador de que somos la mejor opción por calidad, confianza y cumplimiento.
+Si es formato PDF, estructura el contenido con títulos claros.
+Si es correo, incluye el Asunto.
+
 Genera SOLO el contenido del borrador."""
 
+
+def generar_borrador_oferta(licitacion, perfil_empresa, formato="texto", instrucciones_extra=""):
+    """
+    Genera un borrador de oferta para una licitación.
+    
+    Args:
+        licitacion: Dict con datos de la licitación
+        perfil_empresa: Dict con perfil de la empresa
+        formato: "texto", "pdf" (estructura formal), "correo"
+        instrucciones_extra: Instrucciones adicionales del usuario
+        
+    Returns:
+        str: El contenido generado
+    """
+    prompt = _prompt_borrador_oferta(licitacion, perfil_empresa, formato, instrucciones_extra)
+
     try:
         texto_respuesta = _generate_text(prompt)
         return texto_respuesta.strip()
@@ -464,8 +720,21 @@ Genera SOLO el contenido del borrador."""
     except Exception as e:
         logger.error(f"Error al generar borrador: {e}")
         return f"Lo siento, hubo un error al generar el borrador: {str(e)}"
-
-
+
+
+async def generar_borrador_oferta_async(licitacion, perfil_empresa, formato="texto", instrucciones_extra="", al_avanzar=None):
+    """Versión async de generar_borrador_oferta (en streaming con `al_avanzar`)."""
+    prompt = _prompt_borrador_oferta(licitacion, perfil_empresa, formato, instrucciones_extra)
+
+    try:
+        texto_respuesta = await _agenerar_con_avance(prompt, al_avanzar)
+        return texto_respuesta.strip()
+        
+    except Exception as e:
+        logger.error(f"Error al generar borrador: {e}")
+        return f"Lo siento, hubo un error al generar el borrador: {str(e)}"
+
+
 if __name__ == "__main__":
     # Prueba básica - configurar logging para ver output
     logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
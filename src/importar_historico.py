@@ -7,13 +7,23 @@ import psycopg2
 from psycopg2.extras import execute_values
 from datetime import datetime
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from tqdm import tqdm
 import database_extended as db
+import descarga_historico as dh
+import dimensiones_historico as dim
+from canonizacion import columnas_fila
 
 # Configuración
 CHUNK_SIZE = 1024 * 1024 * 10  # 10 MB
 BATCH_SIZE = 5000
 
+# Modo paralelo: procesos que parsean/transforman bloques del CSV y los cargan
+# cada uno con su propia conexión (COPY en PostgreSQL)
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', '1'))
+PARALLEL_CHUNK_BYTES = int(os.getenv('IMPORT_CHUNK_BYTES', str(8 * 1024 * 1024)))  # 8 MB
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -22,66 +32,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def descargar_y_procesar(url):
+def descargar_y_procesar(url, usar_cache=True, streaming=True, workers=None,
+                         tabla='historico_licitaciones'):
+    """
+    Descarga el ZIP del histórico y lo importa.
+
+    Si el archivo ya está en la caché local (verificado por sha256) no se
+    descarga. En caso contrario la descarga es reanudable y, con streaming=True,
+    los CSV se procesan a medida que llegan los bytes. Las entradas que no se
+    puedan leer en streaming se procesan desde el archivo completo al terminar.
+
+    Con workers > 1 cada CSV se parsea y carga en paralelo (ver procesar_stream_paralelo).
+    `tabla` permite cargar en una tabla de staging con el mismo esquema. Si el
+    histórico está normalizado (dimensiones_historico), las filas se cargan en
+    una tabla cruda y se traducen a claves de dimensión al final.
+
+    Returns:
+        Total de registros importados
+    """
+    workers = workers or IMPORT_WORKERS
     logger.info(f"Iniciando importación desde: {url}")
-    
-    # Descargar archivo temporalmente
-    local_filename = "temp_historico.zip"
     start_time = datetime.now()
-    
+
+    cache = dh.CacheHistorico()
+    procesados = set()
+    total_records = 0
+    conn = db.get_connection()
+
     try:
-        # Obtener tamaño del archivo
-        logger.info("Obteniendo información del archivo...")
-        response = requests.head(url, allow_redirects=True)
-        total_size = int(response.headers.get('content-length', 0))
-        
-        if total_size > 0:
-            logger.info(f"Tamaño del archivo: {total_size / (1024*1024):.2f} MB")
-        
-        # Descargar con barra de progreso
-        logger.info("Iniciando descarga...")
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            
-            with open(local_filename, 'wb') as f:
-                with tqdm(total=total_size, unit='B', unit_scale=True, 
-                         desc="Descargando", ncols=100) as pbar:
-                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
-                        f.write(chunk)
-                        pbar.update(len(chunk))
-        
-        download_duration = (datetime.now() - start_time).total_seconds()
-        logger.info(f"Descarga completada en {download_duration:.1f}s")
-        
-        # Obtener tamaño del archivo descargado
-        file_size = os.path.getsize(local_filename)
-        logger.info(f"Archivo descargado: {file_size / (1024*1024):.2f} MB")
-        
-        # Procesar ZIP
-        logger.info("Extrayendo archivos ZIP...")
-        with zipfile.ZipFile(local_filename, 'r') as z:
+        # La vista de compatibilidad no admite INSERT/COPY
+        carga = None
+        if tabla == dim.VISTA_HISTORICO and dim.esta_normalizada(conn):
+            carga = tabla = dim.crear_tabla_carga(conn)
+
+        ruta_zip = cache.buscar(url) if usar_cache else None
+
+        if ruta_zip:
+            logger.info(f"Archivo encontrado en caché: {ruta_zip}")
+        else:
+            descarga = cache.abrir_descarga(url)
+            try:
+                if streaming:
+                    total_records += _procesar_en_streaming(descarga, conn, procesados, workers, tabla)
+                ruta_zip = cache.registrar(url, descarga)
+            finally:
+                descarga.close()
+
+            download_duration = (datetime.now() - start_time).total_seconds()
+            logger.info(f"Descarga completada en {download_duration:.1f}s")
+            logger.info(f"Archivo descargado: {os.path.getsize(ruta_zip) / (1024*1024):.2f} MB")
+
+        # Procesar (o verificar) desde el ZIP completo las entradas pendientes
+        with zipfile.ZipFile(ruta_zip, 'r') as z:
             csv_files = [f for f in z.namelist() if f.endswith('.csv')]
             logger.info(f"Encontrados {len(csv_files)} archivo(s) CSV: {csv_files}")
-            
-            conn = db.get_connection()
-            total_records = 0
-            
+
             for csv_file in csv_files:
-                records = procesar_csv(z, csv_file, conn)
-                total_records += records
-                
-            conn.close()
-            
-            total_duration = (datetime.now() - start_time).total_seconds()
-            logger.info("=" * 60)
-            logger.info("RESUMEN DE IMPORTACIÓN")
-            logger.info("=" * 60)
-            logger.info(f"Total registros procesados: {total_records:,}")
-            logger.info(f"Tiempo total: {total_duration:.1f}s ({total_duration/60:.1f} min)")
-            if total_records > 0:
-                logger.info(f"Velocidad promedio: {total_records/total_duration:.1f} registros/s")
-            logger.info("=" * 60)
-            
+                if csv_file not in procesados:
+                    total_records += procesar_csv(z, csv_file, conn, workers, tabla)
+
+        if carga:
+            dim.cargar_hechos(conn, carga, eliminar_origen=True)
+
+        total_duration = (datetime.now() - start_time).total_seconds()
+        logger.info("=" * 60)
+        logger.info("RESUMEN DE IMPORTACIÓN")
+        logger.info("=" * 60)
+        logger.info(f"Total registros procesados: {total_records:,}")
+        logger.info(f"Tiempo total: {total_duration:.1f}s ({total_duration/60:.1f} min)")
+        if total_records > 0:
+            logger.info(f"Velocidad promedio: {total_records/total_duration:.1f} registros/s")
+        logger.info("=" * 60)
+        return total_records
+
     except requests.exceptions.RequestException as e:
         logger.error(f"Error de red al descargar archivo: {e}")
         raise
@@ -92,105 +115,377 @@ def descargar_y_procesar(url):
         logger.error(f"Error inesperado: {e}", exc_info=True)
         raise
     finally:
-        if os.path.exists(local_filename):
-            os.remove(local_filename)
-            logger.info("Archivo temporal eliminado.")
+        conn.close()
+
+
+def _procesar_en_streaming(descarga, conn, procesados, workers=1, tabla='historico_licitaciones'):
+    """
+    Importa los CSV del ZIP directamente desde la descarga en curso.
+
+    Agrega a `procesados` los nombres importados. Si el ZIP no admite lectura
+    en streaming se detiene y deja el resto para el procesamiento desde archivo.
+    """
+    total = 0
+    stream = io.BufferedReader(descarga, buffer_size=CHUNK_SIZE)
+    try:
+        for nombre, tamano, lector in dh.iterar_entradas_zip(stream):
+            if not nombre.endswith('.csv'):
+                continue
+            total += procesar_stream(lector, nombre, tamano, conn, workers, tabla)
+            procesados.add(nombre)
+    except dh.ZipNoStreamable as e:
+        logger.warning(f"ZIP no procesable en streaming ({e}); se completará la descarga primero")
+    finally:
+        # Soltar el buffer sin cerrar la descarga (aún debe completarse y registrarse)
+        stream.detach()
+    return total
+
+
+# Columnas del CSV en el mismo orden que la tupla insertada en historico_licitaciones
+COLUMNAS_CSV = (
+    'CodigoCotizacion',
+    'NombreCotizacion',
+    'Region',
+    'RUTProveedor',
+    'RazonSocialProveedor',
+    'ProductoCotizado',
+    'CantidadSolicitada',
+    'MontoTotal',
+    'DetalleCotizacion',
+    'ProveedorSeleccionado',
+    'FechaCierreParaCotizar',
+)
+
+
+class _ContadorBytes(io.RawIOBase):
+    """Envuelve un stream binario y acumula los bytes (descomprimidos) leídos."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.leidos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._stream.readinto(buffer)
+        self.leidos += n
+        return n
+
+
+def construir_transformador(encabezado):
+    """
+    Construye la función que mapea una fila del CSV (lista) a la tupla de inserción.
+
+    Los índices de columna se resuelven una sola vez a partir del encabezado,
+    de modo que por fila solo se hace indexación directa y dos int(). Las
+    columnas canónicas (canonizacion.columnas_fila) se calculan aquí, con
+    caché por texto: producto y nombre se repiten mucho dentro de un mes.
+
+    Raises:
+        ValueError: si faltan columnas requeridas en el encabezado
+    """
+    faltantes = [c for c in COLUMNAS_CSV if c not in encabezado]
+    if faltantes:
+        raise ValueError(f"Columnas faltantes en el CSV: {', '.join(faltantes)}")
+
+    (i_codigo, i_nombre, i_region, i_rut, i_razon, i_producto,
+     i_cantidad, i_monto, i_detalle, i_seleccionado, i_fecha) = (
+        encabezado.index(c) for c in COLUMNAS_CSV
+    )
+
+    def transformar(row):
+        return (
+            row[i_codigo],
+            row[i_nombre],
+            row[i_region],
+            row[i_rut],
+            row[i_razon],
+            row[i_producto],
+            int(row[i_cantidad] or 0),
+            int(row[i_monto] or 0),
+            row[i_detalle],
+            row[i_seleccionado].lower() == 'si',
+            row[i_fecha] or None,
+        ) + columnas_fila(row[i_producto], row[i_nombre])
+
+    return transformar
+
+
+def procesar_csv(zip_ref, filename, conn, workers=1, tabla='historico_licitaciones'):
+    """Importa un CSV de un ZipFile abierto (ver procesar_stream)."""
+    with zip_ref.open(filename) as f:
+        return procesar_stream(f, filename, zip_ref.getinfo(filename).file_size, conn, workers, tabla)
+
+
+def procesar_stream(f, filename, total_bytes, conn, workers=1, tabla='historico_licitaciones'):
+    """
+    Importa un CSV desde un stream binario en una sola pasada.
+
+    El progreso se mide en bytes descomprimidos consumidos contra el
+    file_size de la entrada del ZIP (total_bytes; None si no se conoce),
+    sin una pasada previa para contar filas.
+    """
+    if workers > 1:
+        return procesar_stream_paralelo(f, filename, total_bytes, conn, workers, tabla)
 
-def procesar_csv(zip_ref, filename, conn):
     logger.info(f"Procesando archivo: {filename}")
     start_time = datetime.now()
-    
-    with zip_ref.open(filename) as f:
-        text_file = io.TextIOWrapper(f, encoding='utf-8-sig', errors='replace')
-        reader = csv.DictReader(text_file, delimiter=';')
-        
-        batch = []
-        count = 0
-        errors = 0
-        
-        cursor = conn.cursor()
-        
-        # Primera pasada para contar filas (opcional, para mejor barra de progreso)
-        logger.info("Contando registros en el archivo...")
-        text_file.seek(0)
-        total_rows = sum(1 for _ in csv.DictReader(text_file, delimiter=';'))
-        text_file.seek(0)
-        reader = csv.DictReader(text_file, delimiter=';')
-        
-        logger.info(f"Total de filas a procesar: {total_rows:,}")
-        
-        with tqdm(total=total_rows, desc=f"Procesando {filename}", 
-                 unit=" registros", ncols=100) as pbar:
-            for row in reader:
-                # Mapeo de columnas
-                try:
-                    item = (
-                        row.get('CodigoCotizacion'),
-                        row.get('NombreCotizacion'),
-                        row.get('Region'),
-                        row.get('RUTProveedor'),
-                        row.get('RazonSocialProveedor'),
-                        row.get('ProductoCotizado'),
-                        int(row.get('CantidadSolicitada', 0) or 0),
-                        int(row.get('MontoTotal', 0) or 0),
-                        row.get('DetalleCotizacion'),
-                        True if row.get('ProveedorSeleccionado', '').lower() == 'si' else False,
-                        row.get('FechaCierreParaCotizar')
-                    )
-                    batch.append(item)
-                    
-                    if len(batch) >= BATCH_SIZE:
-                        insertar_batch(cursor, batch)
-                        count += len(batch)
-                        batch = []
-                        pbar.update(BATCH_SIZE)
-                        
-                except ValueError as e:
-                    errors += 1
-                    continue # Saltar filas con errores de formato
-                    
+
+    if total_bytes:
+        logger.info(f"Tamaño descomprimido: {total_bytes / (1024*1024):.2f} MB")
+
+    contador = _ContadorBytes(f)
+    buffered = io.BufferedReader(contador, buffer_size=CHUNK_SIZE)
+    text_file = io.TextIOWrapper(buffered, encoding='utf-8-sig', errors='replace', newline='')
+    reader = csv.reader(text_file, delimiter=';')
+
+    try:
+        encabezado = next(reader)
+    except StopIteration:
+        logger.warning(f"Archivo {filename} vacío, se omite")
+        return 0
+    transformar = construir_transformador(encabezado)
+
+    batch = []
+    append = batch.append
+    count = 0
+    errors = 0
+
+    cursor = conn.cursor()
+
+    with tqdm(total=total_bytes, desc=f"Procesando {filename}",
+             unit='B', unit_scale=True, ncols=100) as pbar:
+        for row in reader:
+            try:
+                append(transformar(row))
+            except (ValueError, IndexError):
+                errors += 1
+                continue  # Saltar filas con errores de formato
+
+            if len(batch) >= BATCH_SIZE:
+                insertar_batch(cursor, batch, tabla)
+                count += len(batch)
+                batch.clear()
+                pbar.update(contador.leidos - pbar.n)
+
         # Insertar batch final
         if batch:
-            insertar_batch(cursor, batch)
+            insertar_batch(cursor, batch, tabla)
             count += len(batch)
-            pbar.update(len(batch))
-            
-        conn.commit()
-        
-        duration = (datetime.now() - start_time).total_seconds()
-        logger.info(f"Archivo {filename} procesado:")
-        logger.info(f"  - Registros insertados: {count:,}")
-        if errors > 0:
-            logger.warning(f"  - Filas con errores omitidas: {errors:,}")
-        logger.info(f"  - Tiempo: {duration:.1f}s")
+        pbar.update(contador.leidos - pbar.n)
+
+    conn.commit()
+
+    duration = (datetime.now() - start_time).total_seconds()
+    logger.info(f"Archivo {filename} procesado:")
+    logger.info(f"  - Registros insertados: {count:,}")
+    if errors > 0:
+        logger.warning(f"  - Filas con errores omitidas: {errors:,}")
+    logger.info(f"  - Tiempo: {duration:.1f}s")
+    if duration > 0:
         logger.info(f"  - Velocidad: {count/duration:.1f} registros/s")
-        
-        return count
 
-def insertar_batch(cursor, batch):
+    return count
+
+
+def insertar_batch(cursor, batch, tabla='historico_licitaciones'):
+    placeholders = '%s' if db.USE_POSTGRES else f"({', '.join(['?'] * len(COLUMNAS_DESTINO))})"
+    query = f"""
+        INSERT INTO {tabla} ({', '.join(COLUMNAS_DESTINO)})
+        VALUES {placeholders}
+    """
     if db.USE_POSTGRES:
-        query = """
-            INSERT INTO historico_licitaciones (
-                codigo_cotizacion, nombre_cotizacion, region, rut_proveedor, 
-                nombre_proveedor, producto_cotizado, cantidad, monto_total, 
-                detalle_oferta, es_ganador, fecha_cierre
-            ) VALUES %s
-        """
         execute_values(cursor, query, batch)
     else:
-        query = """
-            INSERT INTO historico_licitaciones (
-                codigo_cotizacion, nombre_cotizacion, region, rut_proveedor, 
-                nombre_proveedor, producto_cotizado, cantidad, monto_total, 
-                detalle_oferta, es_ganador, fecha_cierre
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
         cursor.executemany(query, batch)
 
+
+# ==================== IMPORTACIÓN PARALELA ====================
+
+COLUMNAS_DESTINO = (
+    'codigo_cotizacion', 'nombre_cotizacion', 'region', 'rut_proveedor',
+    'nombre_proveedor', 'producto_cotizado', 'cantidad', 'monto_total',
+    'detalle_oferta', 'es_ganador', 'fecha_cierre', 'producto_normalizado',
+    'nombre_normalizado', 'cantidad_medida', 'unidad_medida'
+)
+
+_ESCAPE_COPY = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\x00': ''})
+
+
+def _valor_copy(valor):
+    if valor is None:
+        return '\\N'
+    if valor is True:
+        return 't'
+    if valor is False:
+        return 'f'
+    return str(valor).translate(_ESCAPE_COPY)
+
+
+def copiar_filas(cursor, filas, tabla='historico_licitaciones'):
+    """Carga filas transformadas con COPY (formato texto) en PostgreSQL."""
+    buffer = io.StringIO()
+    write = buffer.write
+    for fila in filas:
+        write('\t'.join(map(_valor_copy, fila)))
+        write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {tabla} ({', '.join(COLUMNAS_DESTINO)}) FROM STDIN",
+        buffer,
+        size=CHUNK_SIZE
+    )
+
+
+def bloques_alineados(stream, tamano=None):
+    """
+    Divide un stream CSV binario en bloques que terminan en fin de registro.
+
+    Un salto de línea solo es fin de registro si la cantidad de comillas
+    anteriores en el bloque es par (no está dentro de un campo entre comillas).
+    Cada bloque empieza en inicio de registro, así que la paridad parte en cero.
+    """
+    tamano = tamano or PARALLEL_CHUNK_BYTES
+    resto = b''
+    while True:
+        datos = stream.read(tamano)
+        if not datos:
+            if resto:
+                yield resto
+            return
+
+        buf = resto + datos
+        pos = buf.rfind(b'\n')
+        comillas = buf.count(b'"', 0, pos) if pos >= 0 else 0
+        while pos >= 0 and comillas % 2:
+            anterior = pos
+            pos = buf.rfind(b'\n', 0, anterior)
+            comillas -= buf.count(b'"', max(pos, 0), anterior)
+
+        if pos < 0:
+            resto = buf
+            continue
+        yield buf[:pos + 1]
+        resto = buf[pos + 1:]
+
+
+_conexion_worker = None
+
+
+def _inicializar_worker():
+    """Cada proceso del pool mantiene su propia conexión de carga (solo PostgreSQL)."""
+    global _conexion_worker
+    if db.USE_POSTGRES:
+        _conexion_worker = db.get_connection()
+
+
+def _procesar_bloque(bloque, encabezado, tabla):
+    """
+    Parsea y transforma un bloque de registros en un proceso del pool.
+
+    En PostgreSQL lo carga con COPY desde el propio worker y retorna
+    (insertados, errores). En SQLite retorna (filas, errores) para que el
+    proceso principal las inserte (SQLite no admite escritores concurrentes).
+    """
+    transformar = construir_transformador(encabezado)
+    filas = []
+    append = filas.append
+    errores = 0
+    texto = io.StringIO(bloque.decode('utf-8', errors='replace'), newline='')
+    for row in csv.reader(texto, delimiter=';'):
+        try:
+            append(transformar(row))
+        except (ValueError, IndexError):
+            errores += 1
+
+    if _conexion_worker is None:
+        return filas, errores
+
+    cursor = _conexion_worker.cursor()
+    copiar_filas(cursor, filas, tabla)
+    _conexion_worker.commit()
+    return len(filas), errores
+
+
+def procesar_stream_paralelo(f, filename, total_bytes, conn, workers, tabla='historico_licitaciones'):
+    """
+    Importa un CSV repartiendo bloques alineados a registro en un pool de procesos.
+
+    El proceso principal solo descomprime y corta bloques; el parseo, la
+    transformación y la carga (COPY por conexión de worker) ocurren en paralelo.
+    La cantidad de bloques en vuelo se limita a 2 por worker para acotar memoria.
+
+    Nota: cada bloque se confirma por separado, así que un error a mitad de
+    archivo deja cargados los bloques previos.
+    """
+    logger.info(f"Procesando archivo: {filename} ({workers} workers)")
+    start_time = datetime.now()
+
+    contador = _ContadorBytes(f)
+    buffered = io.BufferedReader(contador, buffer_size=CHUNK_SIZE)
+    primera = buffered.readline()
+    if not primera:
+        logger.warning(f"Archivo {filename} vacío, se omite")
+        return 0
+    encabezado = next(csv.reader([primera.decode('utf-8-sig', errors='replace')], delimiter=';'))
+    construir_transformador(encabezado)  # Validar columnas antes de lanzar el pool
+
+    count = 0
+    errors = 0
+    cursor = conn.cursor()
+
+    def acumular(futuro):
+        nonlocal count, errors
+        resultado, errores = futuro.result()
+        if isinstance(resultado, list):
+            if resultado:
+                insertar_batch(cursor, resultado, tabla)
+            resultado = len(resultado)
+        count += resultado
+        errors += errores
+
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto,
+                             initializer=_inicializar_worker) as pool, \
+         tqdm(total=total_bytes, desc=f"Procesando {filename}",
+              unit='B', unit_scale=True, ncols=100) as pbar:
+        en_vuelo = set()
+        for bloque in bloques_alineados(buffered):
+            en_vuelo.add(pool.submit(_procesar_bloque, bloque, encabezado, tabla))
+            if len(en_vuelo) >= workers * 2:
+                listos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    acumular(futuro)
+            pbar.update(contador.leidos - pbar.n)
+
+        for futuro in en_vuelo:
+            acumular(futuro)
+        pbar.update(contador.leidos - pbar.n)
+
+    conn.commit()
+
+    duration = (datetime.now() - start_time).total_seconds()
+    logger.info(f"Archivo {filename} procesado:")
+    logger.info(f"  - Registros insertados: {count:,}")
+    if errors > 0:
+        logger.warning(f"  - Filas con errores omitidas: {errors:,}")
+    logger.info(f"  - Tiempo: {duration:.1f}s")
+    if duration > 0:
+        logger.info(f"  - Velocidad: {count/duration:.1f} registros/s")
+
+    return count
+
 def verificar_existencia(url, conn):
-    """Verifica si ya existen datos para el mes del archivo"""
+    """
+    Verifica si ya existen datos para el mes del archivo.
+
+    Con la tabla particionada se consulta solo el catálogo de particiones;
+    en otro caso se usa un rango sobre fecha_cierre (aprovecha idx_hist_fecha_cierre).
+    """
     import re
-    
+    import particiones_historico as ph
+
     # Extraer fecha del nombre del archivo (COT_YYYY-MM.zip)
     match = re.search(r'COT_(\d{4}-\d{2})', url)
     if not match:
@@ -199,17 +494,20 @@ def verificar_existencia(url, conn):
         
     mes = match.group(1)
     print(f"📅 Mes detectado: {mes}")
-    
+
+    if ph.esta_particionada(conn):
+        existe = ph.particion_tiene_datos(conn, mes)
+        if existe:
+            print(f"⚠️ La partición {ph.nombre_particion(mes)} ya contiene datos.")
+        return existe
+
+    inicio, fin = ph.rango_mes(mes)
     cursor = conn.cursor()
-    
-    # Consultar si hay registros de ese mes
-    # Asumimos que fecha_cierre está en formato YYYY-MM-DD
-    if db.USE_POSTGRES:
-        query = "SELECT COUNT(*) FROM historico_licitaciones WHERE TO_CHAR(fecha_cierre, 'YYYY-MM') = %s"
-    else:
-        query = "SELECT COUNT(*) FROM historico_licitaciones WHERE strftime('%Y-%m', fecha_cierre) = ?"
-        
-    cursor.execute(query, (mes,))
+    p = db.get_placeholder()
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM historico_licitaciones
+        WHERE fecha_cierre >= {p} AND fecha_cierre < {p}
+    """, (inicio.isoformat(), fin.isoformat()))
     count = cursor.fetchone()[0]
     
     if count > 0:
@@ -225,6 +523,9 @@ if __name__ == "__main__":
     parser.add_argument('--url', default="https://transparenciachc.blob.core.windows.net/trnspchc/COT_2025-01.zip", help='URL del archivo ZIP')
     parser.add_argument('--db-url', help='URL de conexión a la base de datos (sobrescribe .env)')
     parser.add_argument('--force', action='store_true', help='Forzar importación aunque existan datos')
+    parser.add_argument('--no-cache', action='store_true', help='Ignorar la caché local y volver a descargar')
+    parser.add_argument('--no-streaming', action='store_true', help='Descargar completo antes de procesar')
+    parser.add_argument('--workers', type=int, default=IMPORT_WORKERS, help='Procesos para parseo y carga en paralelo')
     
     args = parser.parse_args()
     
@@ -247,6 +548,7 @@ if __name__ == "__main__":
         print("Usa --force para importar de todas formas.")
     else:
         start_time = datetime.now()
-        descargar_y_procesar(args.url)
+        descargar_y_procesar(args.url, usar_cache=not args.no_cache, streaming=not args.no_streaming,
+                             workers=args.workers)
         duration = datetime.now() - start_time
         print(f"Tiempo total: {duration}")
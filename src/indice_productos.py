@@ -0,0 +1,459 @@
+"""
+Índice invertido en memoria sobre nombres de productos y cotizaciones del histórico.
+
+La recuperación de candidatos dependía de escaneos pg_trgm (umbral fijo de
+similitud) en PostgreSQL y de "las últimas N filas" en SQLite. Este índice
+resuelve en milisegundos, antes de tocar la BD, qué filas del histórico son
+candidatas para un texto:
+
+    token -> textos normalizados que lo contienen   (postings, CSR)
+    texto -> filas del histórico que lo usan          (CSR, más recientes primero)
+    fila  -> id, fecha, es_ganador, región            (arreglos paralelos)
+
+Hay un índice por campo (producto_cotizado y nombre_cotizacion). Los textos son
+sus columnas canónicas (canonizacion.py; se calculan al vuelo en filas sin
+ellas) y se rankean por coseno TF-IDF
+binario contra la consulta; luego se filtran filas por ganador, fecha y región
+sin ir a la BD. La consulta final solo lee las filas candidatas por id.
+
+El índice se construye desde la BD, se guarda como snapshot (.npz) y se carga
+al iniciar el proceso. Tras cada importación se reconstruye; los procesos en
+ejecución detectan el snapshot nuevo y lo recargan.
+
+Uso (mantenimiento):
+    python src/indice_productos.py     # reconstruye el snapshot
+"""
+import os
+import math
+import time
+import logging
+import threading
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Sequence
+import numpy as np
+import pandas as pd
+import database_extended as db
+from canonizacion import normalizar_termino
+
+logger = logging.getLogger(__name__)
+
+INDICE_RUTA = os.getenv('INDICE_PRODUCTOS_RUTA', 'data/indice_productos.npz')
+
+# Ventana indexada (la del RAG, 3 años; el precio óptimo filtra 2 años en memoria)
+VENTANA_DIAS = int(os.getenv('INDICE_PRODUCTOS_VENTANA_DIAS', '1095'))
+
+# Cada cuánto se revisa si hay un snapshot más nuevo en disco
+RECARGA_SEGUNDOS = int(os.getenv('INDICE_PRODUCTOS_RECARGA_SEGUNDOS', '60'))
+
+# Textos distintos considerados por consulta (antes de expandir a filas)
+MAX_TEXTOS = int(os.getenv('INDICE_PRODUCTOS_MAX_TEXTOS', '300'))
+
+FILAS_POR_LOTE = int(os.getenv('INDICE_PRODUCTOS_LOTE', '100000'))
+
+CAMPOS = {'producto': 'producto_cotizado', 'nombre': 'nombre_cotizacion'}
+NORMALIZADOS = {'producto': 'producto_normalizado', 'nombre': 'nombre_normalizado'}
+
+_EPOCA = date(1970, 1, 1).toordinal()
+
+
+def _dias(fecha):
+    """Fecha (date o 'YYYY-MM-DD') a días desde 1970-01-01."""
+    if fecha is None:
+        return -1
+    if not isinstance(fecha, date):
+        fecha = date.fromisoformat(str(fecha)[:10])
+    return fecha.toordinal() - _EPOCA
+
+
+def _csr(claves, valores, n):
+    """Agrupa valores por clave: (offsets[n+1], valores ordenados por clave)."""
+    orden = np.argsort(claves, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(claves, minlength=n), out=offsets[1:])
+    return offsets, valores[orden]
+
+
+def _texto_a_arreglo(textos):
+    return np.frombuffer('\n'.join(textos).encode('utf-8'), dtype=np.uint8)
+
+
+def _arreglo_a_texto(arreglo):
+    contenido = arreglo.tobytes().decode('utf-8')
+    return contenido.split('\n') if contenido else []
+
+
+class _Campo:
+    """Postings de un campo de texto."""
+
+    def __init__(self, tokens, tok_offsets, tok_textos, idf, normas, txt_offsets, txt_filas):
+        self.tokens = tokens
+        self.token_ids = {token: i for i, token in enumerate(tokens)}
+        self.tok_offsets = tok_offsets
+        self.tok_textos = tok_textos
+        self.idf = idf
+        self.normas = normas
+        self.txt_offsets = txt_offsets
+        self.txt_filas = txt_filas
+
+    @classmethod
+    def desde_textos(cls, textos, fila_texto, orden_filas):
+        """
+        Args:
+            textos: Textos normalizados (posición = id de texto)
+            fila_texto: Id de texto de cada fila (-1 = sin texto)
+            orden_filas: Clave de orden de las filas dentro de un texto (menor primero)
+        """
+        vocabulario = {}
+        tok_claves = array('i')
+        tok_textos = array('i')
+        for tid, texto in enumerate(textos):
+            for token in texto.split():
+                tok_claves.append(vocabulario.setdefault(token, len(vocabulario)))
+                tok_textos.append(tid)
+
+        n_textos = len(textos)
+        tok_claves = np.frombuffer(tok_claves, dtype=np.int32)
+        tok_offsets, tok_postings = _csr(tok_claves, np.frombuffer(tok_textos, dtype=np.int32), len(vocabulario))
+
+        frecuencia = np.diff(tok_offsets)
+        idf = np.log1p(n_textos / np.maximum(frecuencia, 1)).astype(np.float32)
+        normas = np.sqrt(np.bincount(
+            np.frombuffer(tok_textos, dtype=np.int32),
+            weights=idf[tok_claves] ** 2,
+            minlength=n_textos
+        )).astype(np.float32)
+
+        validas = np.flatnonzero(fila_texto >= 0)
+        validas = validas[np.lexsort((orden_filas[validas], fila_texto[validas]))]
+        txt_offsets = np.zeros(n_textos + 1, dtype=np.int64)
+        np.cumsum(np.bincount(fila_texto[validas], minlength=n_textos), out=txt_offsets[1:])
+
+        return cls(list(vocabulario), tok_offsets, tok_postings, idf, normas,
+                   txt_offsets, validas.astype(np.int32))
+
+    def rankear(self, consulta, limite):
+        """Ids de texto ordenados por coseno TF-IDF con la consulta."""
+        tokens = [self.token_ids[t] for t in normalizar_termino(consulta).split() if t in self.token_ids]
+        if not tokens:
+            return np.zeros(0, dtype=np.int32)
+
+        postings = [self.tok_textos[self.tok_offsets[t]:self.tok_offsets[t + 1]] for t in tokens]
+        pesos = [np.full(len(p), self.idf[t] ** 2, dtype=np.float32) for t, p in zip(tokens, postings)]
+        textos, inverso = np.unique(np.concatenate(postings), return_inverse=True)
+        puntaje = np.bincount(inverso, weights=np.concatenate(pesos))
+        norma_consulta = math.sqrt(float(np.sum(self.idf[tokens] ** 2)))
+        puntaje = puntaje / (self.normas[textos] * norma_consulta)
+
+        if len(textos) > limite:
+            mejores = np.argpartition(-puntaje, limite - 1)[:limite]
+        else:
+            mejores = np.arange(len(textos))
+        mejores = mejores[np.argsort(-puntaje[mejores], kind='stable')]
+        return textos[mejores]
+
+    def filas(self, textos):
+        """Posiciones de fila de los textos, en el orden dado."""
+        if len(textos) == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.concatenate([self.txt_filas[self.txt_offsets[t]:self.txt_offsets[t + 1]] for t in textos])
+
+    def a_arreglos(self, prefijo):
+        return {
+            f'{prefijo}_tokens': _texto_a_arreglo(self.tokens),
+            f'{prefijo}_tok_offsets': self.tok_offsets,
+            f'{prefijo}_tok_textos': self.tok_textos,
+            f'{prefijo}_idf': self.idf,
+            f'{prefijo}_normas': self.normas,
+            f'{prefijo}_txt_offsets': self.txt_offsets,
+            f'{prefijo}_txt_filas': self.txt_filas,
+        }
+
+    @classmethod
+    def desde_arreglos(cls, datos, prefijo):
+        return cls(
+            _arreglo_a_texto(datos[f'{prefijo}_tokens']),
+            datos[f'{prefijo}_tok_offsets'],
+            datos[f'{prefijo}_tok_textos'],
+            datos[f'{prefijo}_idf'],
+            datos[f'{prefijo}_normas'],
+            datos[f'{prefijo}_txt_offsets'],
+            datos[f'{prefijo}_txt_filas'],
+        )
+
+
+class IndiceProductos:
+    """Índice invertido de filas del histórico por producto y nombre de cotización."""
+
+    def __init__(self, ids, fechas, ganadores, region_codigos, regiones, campos, creado=None):
+        self.ids = ids
+        self.fechas = fechas
+        self.ganadores = ganadores
+        self.region_codigos = region_codigos
+        self.regiones = regiones
+        self.region_ids = {region: i for i, region in enumerate(regiones)}
+        self.campos = campos
+        self.creado = creado or datetime.now().isoformat(timespec='seconds')
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def construir(cls, conn, desde):
+        """Construye el índice leyendo la ventana del histórico desde la BD."""
+        ids = array('i')
+        fechas = array('i')
+        ganadores = array('b')
+        region_codigos = array('h')
+        regiones = {}
+        textos = {campo: {} for campo in CAMPOS}
+        crudos = {campo: {} for campo in CAMPOS}
+        fila_texto = {campo: array('i') for campo in CAMPOS}
+
+        for filas in _lotes_historico(conn, desde):
+            for fila in filas:
+                ids.append(fila[0])
+                fechas.append(_dias(fila[1]))
+                ganadores.append(1 if fila[2] else 0)
+                region = (fila[3] or '').strip().upper()
+                region_codigos.append(regiones.setdefault(region, len(regiones)))
+                for i, campo in enumerate(CAMPOS):
+                    normalizado = fila[4 + len(CAMPOS) + i]
+                    if normalizado is None:
+                        crudo = fila[4 + i]
+                        normalizado = crudos[campo].get(crudo)
+                        if normalizado is None:
+                            normalizado = crudos[campo][crudo] = normalizar_termino(crudo)
+                    tid = textos[campo].setdefault(normalizado, len(textos[campo])) if normalizado else -1
+                    fila_texto[campo].append(tid)
+
+        fechas = np.frombuffer(fechas, dtype=np.int32)
+        # Dentro de cada texto, filas más recientes primero
+        orden = -fechas
+        campos = {
+            campo: _Campo.desde_textos(
+                list(textos[campo]), np.frombuffer(fila_texto[campo], dtype=np.int32), orden
+            )
+            for campo in CAMPOS
+        }
+        return cls(
+            np.frombuffer(ids, dtype=np.int32),
+            fechas,
+            np.frombuffer(ganadores, dtype=np.int8).astype(bool),
+            np.frombuffer(region_codigos, dtype=np.int16),
+            list(regiones),
+            campos,
+        )
+
+    def candidatos(
+        self,
+        texto: str,
+        campos: Sequence[str] = ('producto',),
+        limite: int = 1500,
+        solo_ganadores: bool = False,
+        desde: Optional[date] = None,
+        region: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        Ids de filas candidatas, de la más a la menos relevante.
+
+        Con varios campos el límite se reparte entre ellos y se eliminan duplicados.
+        """
+        mascara = None
+        if solo_ganadores:
+            mascara = self.ganadores
+        if desde is not None:
+            reciente = self.fechas >= _dias(desde)
+            mascara = reciente if mascara is None else mascara & reciente
+        if region:
+            codigo = self.region_ids.get(region.strip().upper())
+            if codigo is None:
+                return np.zeros(0, dtype=np.int64)
+            en_region = self.region_codigos == codigo
+            mascara = en_region if mascara is None else mascara & en_region
+
+        cupo = max(1, limite // len(campos))
+        resultado = []
+        for campo in campos:
+            indice = self.campos[campo]
+            posiciones = indice.filas(indice.rankear(texto, MAX_TEXTOS))
+            if mascara is not None:
+                posiciones = posiciones[mascara[posiciones]]
+            resultado.append(self.ids[posiciones[:cupo]])
+
+        ids = pd.unique(np.concatenate(resultado)) if len(resultado) > 1 else resultado[0]
+        return ids[:limite].astype(np.int64)
+
+    def guardar(self, ruta):
+        """Escribe el snapshot de forma atómica (archivo temporal + rename)."""
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        arreglos = {
+            'ids': self.ids,
+            'fechas': self.fechas,
+            'ganadores': self.ganadores,
+            'region_codigos': self.region_codigos,
+            'regiones': _texto_a_arreglo(self.regiones),
+            'creado': _texto_a_arreglo([self.creado]),
+        }
+        for campo, indice in self.campos.items():
+            arreglos.update(indice.a_arreglos(campo))
+
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'wb') as archivo:
+            np.savez(archivo, **arreglos)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta) as datos:
+            return cls(
+                datos['ids'],
+                datos['fechas'],
+                datos['ganadores'],
+                datos['region_codigos'],
+                _arreglo_a_texto(datos['regiones']),
+                {campo: _Campo.desde_arreglos(datos, campo) for campo in CAMPOS},
+                creado=_arreglo_a_texto(datos['creado'])[0],
+            )
+
+
+def _lotes_historico(conn, desde):
+    """Itera lotes (id, fecha, es_ganador, region, textos, normalizados) de la ventana."""
+    p = db.get_placeholder()
+    query = f"""
+        SELECT id, fecha_cierre, es_ganador, region,
+               {', '.join(CAMPOS.values())}, {', '.join(NORMALIZADOS.values())}
+        FROM historico_licitaciones
+        WHERE monto_total > 0
+        AND fecha_cierre >= {p}
+    """
+    if db.USE_POSTGRES:
+        cursor = conn.cursor(name='indice_productos')
+        cursor.itersize = FILAS_POR_LOTE
+    else:
+        cursor = conn.cursor()
+    cursor.execute(query, (desde.isoformat(),))
+    try:
+        while True:
+            filas = cursor.fetchmany(FILAS_POR_LOTE)
+            if not filas:
+                break
+            yield filas
+    finally:
+        cursor.close()
+
+
+# ==================== INSTANCIA DEL PROCESO ====================
+
+_indice = None
+_indice_mtime = None
+_ultima_revision = 0.0
+_lock = threading.Lock()
+
+
+def obtener(ruta=None) -> Optional[IndiceProductos]:
+    """
+    Índice del proceso, cargado desde el snapshot (None si no existe).
+
+    Revisa como máximo cada RECARGA_SEGUNDOS si el snapshot cambió en disco.
+    """
+    global _indice, _indice_mtime, _ultima_revision
+    ruta = ruta or INDICE_RUTA
+    ahora = time.monotonic()
+    if _indice is not None and ahora - _ultima_revision < RECARGA_SEGUNDOS:
+        return _indice
+
+    with _lock:
+        _ultima_revision = ahora
+        try:
+            mtime = os.path.getmtime(ruta)
+        except OSError:
+            return _indice
+        if _indice is None or mtime != _indice_mtime:
+            inicio = time.time()
+            try:
+                _indice = IndiceProductos.cargar(ruta)
+                _indice_mtime = mtime
+                logger.info(
+                    f"Índice de productos cargado: {len(_indice):,} filas "
+                    f"(creado {_indice.creado}) en {time.time() - inicio:.2f}s"
+                )
+            except Exception as e:
+                logger.error(f"No se pudo cargar el índice de productos {ruta}: {e}")
+    return _indice
+
+
+def candidatos(texto: str, **kwargs) -> Optional[np.ndarray]:
+    """Ids candidatos según el índice, o None si no hay índice disponible."""
+    indice = obtener()
+    if indice is None:
+        return None
+    return indice.candidatos(texto, **kwargs)
+
+
+def refrescar(ruta=None, hoy: Optional[date] = None) -> IndiceProductos:
+    """Reconstruye el índice desde la BD, guarda el snapshot y lo publica en el proceso."""
+    global _indice, _indice_mtime
+    ruta = ruta or INDICE_RUTA
+    desde = (hoy or date.today()) - timedelta(days=VENTANA_DIAS)
+
+    inicio = time.time()
+    conn = db.get_connection()
+    try:
+        indice = IndiceProductos.construir(conn, desde)
+    finally:
+        conn.close()
+    indice.guardar(ruta)
+
+    with _lock:
+        _indice = indice
+        _indice_mtime = os.path.getmtime(ruta)
+
+    logger.info(
+        f"Índice de productos reconstruido: {len(indice):,} filas, "
+        + ", ".join(f"{len(c.normas):,} textos de {campo}" for campo, c in indice.campos.items())
+        + f" en {time.time() - inicio:.1f}s"
+    )
+    return indice
+
+
+def leer_filas(conn, ids, columnas: Iterable[str], dtype: Optional[Dict] = None) -> pd.DataFrame:
+    """
+    Lee las filas del histórico con esos ids (lecturas por clave primaria).
+
+    Args:
+        dtype: Tipos por columna para pd.read_sql (p. ej. categóricos)
+    """
+    columnas = ', '.join(columnas)
+    ids = [int(i) for i in ids]
+    if not ids:
+        return pd.DataFrame()
+    if db.USE_POSTGRES:
+        return pd.read_sql(
+            f"SELECT {columnas} FROM historico_licitaciones WHERE id = ANY(%s)",
+            conn, params=(ids,), dtype=dtype
+        )
+    # SQLite: límite de variables por sentencia
+    partes = []
+    for i in range(0, len(ids), 900):
+        lote = ids[i:i + 900]
+        partes.append(pd.read_sql(
+            f"SELECT {columnas} FROM historico_licitaciones WHERE id IN ({','.join(['?'] * len(lote))})",
+            conn, params=tuple(lote), dtype=dtype
+        ))
+    df = pd.concat(partes, ignore_index=True)
+    # Categóricos de lotes distintos se combinan como object
+    return df.astype(dtype) if dtype and len(partes) > 1 else df
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    refrescar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Índice TF-IDF disperso de n-gramas de caracteres sobre los nombres del histórico.
+
+pg_trgm compara el texto completo y el índice por tokens (indice_productos)
+exige palabras idénticas: "resmas" no encuentra "resma" y un "tonner" mal
+escrito no encuentra nada. Este índice representa cada documento como un
+vector TF-IDF de trigramas de caracteres de sus palabras (sublineal y
+normalizado L2). Un documento es un nombre de cotización más su producto
+canónicos (canonizacion.py), así que el orden de las palabras da lo mismo, una
+variante comparte casi todos sus trigramas y los trigramas frecuentes pesan
+poco. La búsqueda devuelve los k documentos de mayor coseno, en CPU y dentro
+del proceso:
+
+    trigrama  -> documentos y pesos       (CSC; HashingVectorizer, sin vocabulario)
+    documento -> filas del histórico      (CSR, más recientes primero)
+    fila      -> id, fecha                (arreglos paralelos)
+
+Se construye offline desde la BD. Cada arreglo se guarda como .npy en un
+directorio por versión y se abre con mmap: la carga es instantánea y los
+workers de un mismo servidor comparten las páginas. El archivo ACTUAL apunta a
+la versión vigente; los procesos detectan el cambio y reabren.
+
+Es un recuperador alternativo para rag_historico (RAG_RECUPERADOR=tfidf).
+
+Uso (mantenimiento):
+    python src/indice_tfidf.py     # construye una versión nueva
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from array import array
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+import scipy.sparse as sp
+import database_extended as db
+from canonizacion import normalizar_termino
+
+logger = logging.getLogger(__name__)
+
+INDICE_DIR = os.getenv('INDICE_TFIDF_DIR', 'data/indice_tfidf')
+
+# Ventana indexada (la del RAG)
+VENTANA_DIAS = int(os.getenv('INDICE_TFIDF_VENTANA_DIAS', '1095'))
+
+# Dimensión del espacio de hashing (colisiones despreciables con 2^20)
+N_FEATURES = int(os.getenv('INDICE_TFIDF_FEATURES', str(2 ** 20)))
+
+# Documentos considerados por consulta (antes de expandir a filas)
+MAX_DOCUMENTOS = int(os.getenv('INDICE_TFIDF_MAX_DOCUMENTOS', '300'))
+
+RECARGA_SEGUNDOS = int(os.getenv('INDICE_TFIDF_RECARGA_SEGUNDOS', '60'))
+
+FILAS_POR_LOTE = int(os.getenv('INDICE_TFIDF_LOTE', '100000'))
+
+ARREGLOS = ('indptr', 'indices', 'datos', 'idf', 'doc_offsets', 'doc_filas', 'ids', 'fechas')
+
+_EPOCA = date(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=4)
+def _vectorizador(n_features: int) -> HashingVectorizer:
+    return HashingVectorizer(
+        analyzer='char_wb', ngram_range=(3, 3), n_features=n_features,
+        alternate_sign=False, norm=None, lowercase=False, dtype=np.float32
+    )
+
+
+def _conteos(textos, n_features):
+    """Matriz CSR de conteos de trigramas, vectorizando por lotes."""
+    vectorizador = _vectorizador(n_features)
+    partes = [
+        vectorizador.transform(textos[i:i + FILAS_POR_LOTE])
+        for i in range(0, len(textos), FILAS_POR_LOTE)
+    ]
+    if not partes:
+        return sp.csr_matrix((0, n_features), dtype=np.float32)
+    return sp.vstack(partes, format='csr')
+
+
+def _ponderar(conteos, idf):
+    """TF sublineal (1 + log tf) por IDF, filas normalizadas L2."""
+    conteos = conteos.copy()
+    conteos.data = (1 + np.log(conteos.data)) * idf[conteos.indices]
+    return normalize(conteos, copy=False)
+
+
+def _documento(nombre, producto):
+    """Términos canónicos de nombre y producto en un solo documento."""
+    return ' '.join(sorted(set(nombre.split()) | set(producto.split())))
+
+
+def _dias(fecha):
+    if fecha is None:
+        return -1
+    if not isinstance(fecha, date):
+        fecha = date.fromisoformat(str(fecha)[:10])
+    return fecha.toordinal() - _EPOCA
+
+
+class IndiceTfidf:
+    """Vectores TF-IDF de los documentos del histórico y su mapeo a filas."""
+
+    def __init__(self, indptr, indices, datos, idf, doc_offsets, doc_filas, ids, fechas,
+                 n_features=N_FEATURES, creado=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.datos = datos
+        self.idf = idf
+        self.doc_offsets = doc_offsets
+        self.doc_filas = doc_filas
+        self.ids = ids
+        self.fechas = fechas
+        self.n_features = n_features
+        self.creado = creado or datetime.now().isoformat(timespec='seconds')
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def n_documentos(self) -> int:
+        return len(self.doc_offsets) - 1
+
+    @classmethod
+    def construir(cls, conn, desde, n_features=N_FEATURES):
+        """Construye el índice leyendo la ventana del histórico desde la BD."""
+        ids = array('q')
+        fechas = array('i')
+        fila_doc = array('i')
+        documentos = {}
+        canonicos = {}
+
+        def canonico(normalizado, crudo):
+            if normalizado is not None:
+                return normalizado
+            if crudo not in canonicos:
+                canonicos[crudo] = normalizar_termino(crudo)
+            return canonicos[crudo]
+
+        for filas in _lotes_historico(conn, desde):
+            for id_, fecha, nombre, producto, nombre_norm, producto_norm in filas:
+                documento = _documento(canonico(nombre_norm, nombre), canonico(producto_norm, producto))
+                if not documento:
+                    continue
+                ids.append(id_)
+                fechas.append(_dias(fecha))
+                fila_doc.append(documentos.setdefault(documento, len(documentos)))
+
+        conteos = _conteos(list(documentos), n_features)
+        frecuencia = np.bincount(conteos.indices, minlength=n_features)
+        idf = (np.log((1 + len(documentos)) / (1 + frecuencia)) + 1).astype(np.float32)
+        matriz = _ponderar(conteos, idf).tocsc()
+        matriz.sort_indices()
+
+        fechas = np.frombuffer(fechas, dtype=np.int32)
+        fila_doc = np.frombuffer(fila_doc, dtype=np.int32)
+        # Filas agrupadas por documento, más recientes primero
+        orden = np.lexsort((-fechas, fila_doc)).astype(np.int32)
+        doc_offsets = np.zeros(len(documentos) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(fila_doc, minlength=len(documentos)), out=doc_offsets[1:])
+
+        return cls(
+            matriz.indptr.astype(np.int64), matriz.indices.astype(np.int32),
+            matriz.data.astype(np.float32), idf, doc_offsets, orden,
+            np.frombuffer(ids, dtype=np.int64), fechas, n_features=n_features
+        )
+
+    def buscar(self, texto: str, k: int = MAX_DOCUMENTOS) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k documentos por coseno con el texto.
+
+        Solo recorre las columnas (trigramas) de la consulta: el costo depende
+        de cuántos documentos comparten sus trigramas, no del tamaño del índice.
+
+        Returns:
+            (ids de documento, puntajes) ordenados de mayor a menor coseno
+        """
+        termino = normalizar_termino(texto)
+        consulta = _ponderar(_conteos([termino], self.n_features), self.idf) if termino else None
+        if consulta is None or consulta.nnz == 0 or self.n_documentos == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        puntajes = np.zeros(self.n_documentos, dtype=np.float32)
+        for columna, peso in zip(consulta.indices, consulta.data):
+            inicio, fin = self.indptr[columna], self.indptr[columna + 1]
+            # Dentro de una columna cada documento aparece una vez
+            puntajes[self.indices[inicio:fin]] += self.datos[inicio:fin] * peso
+
+        documentos = np.flatnonzero(puntajes)
+        if len(documentos) > k:
+            documentos = documentos[np.argpartition(-puntajes[documentos], k - 1)[:k]]
+        documentos = documentos[np.argsort(-puntajes[documentos], kind='stable')]
+        return documentos, puntajes[documentos]
+
+    def candidatos(
+        self,
+        texto: str,
+        limite: int = 1500,
+        desde: Optional[date] = None,
+        documentos: int = MAX_DOCUMENTOS
+    ) -> np.ndarray:
+        """Ids de filas candidatas, de la más a la menos similar."""
+        encontrados, _ = self.buscar(texto, documentos)
+        if len(encontrados) == 0:
+            return np.zeros(0, dtype=np.int64)
+        posiciones = np.concatenate([
+            self.doc_filas[self.doc_offsets[d]:self.doc_offsets[d + 1]] for d in encontrados
+        ])
+        if desde is not None:
+            posiciones = posiciones[self.fechas[posiciones] >= _dias(desde)]
+        return np.asarray(self.ids[posiciones[:limite]], dtype=np.int64)
+
+    def guardar(self, directorio) -> str:
+        """
+        Escribe una versión nueva y la publica en ACTUAL (rename atómico).
+
+        Las versiones anteriores se borran: los procesos que aún las tienen
+        mapeadas las siguen leyendo hasta reabrir.
+        """
+        version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        destino = os.path.join(directorio, version)
+        os.makedirs(destino)
+        for nombre in ARREGLOS:
+            np.save(os.path.join(destino, f'{nombre}.npy'), getattr(self, nombre))
+        with open(os.path.join(destino, 'meta.json'), 'w') as archivo:
+            json.dump({'creado': self.creado, 'n_features': self.n_features}, archivo)
+
+        temporal = os.path.join(directorio, 'ACTUAL.tmp')
+        with open(temporal, 'w') as archivo:
+            archivo.write(version)
+        os.replace(temporal, os.path.join(directorio, 'ACTUAL'))
+
+        for otra in os.listdir(directorio):
+            ruta = os.path.join(directorio, otra)
+            if otra != version and os.path.isdir(ruta):
+                shutil.rmtree(ruta, ignore_errors=True)
+        return destino
+
+    @classmethod
+    def cargar(cls, directorio):
+        """Abre la versión vigente con mmap (no lee los arreglos a memoria)."""
+        with open(os.path.join(directorio, 'ACTUAL')) as archivo:
+            ruta = os.path.join(directorio, archivo.read().strip())
+        with open(os.path.join(ruta, 'meta.json')) as archivo:
+            meta = json.load(archivo)
+        arreglos = {
+            nombre: np.load(os.path.join(ruta, f'{nombre}.npy'), mmap_mode='r')
+            for nombre in ARREGLOS
+        }
+        return cls(**arreglos, n_features=meta['n_features'], creado=meta['creado'])
+
+
+def _lotes_historico(conn, desde):
+    """Itera lotes (id, fecha, nombre, producto, nombre_norm, producto_norm) de la ventana."""
+    p = db.get_placeholder()
+    query = f"""
+        SELECT id, fecha_cierre, nombre_cotizacion, producto_cotizado,
+               nombre_normalizado, producto_normalizado
+        FROM historico_licitaciones
+        WHERE nombre_cotizacion IS NOT NULL
+        AND monto_total > 0
+        AND fecha_cierre >= {p}
+    """
+    if db.USE_POSTGRES:
+        cursor = conn.cursor(name='indice_tfidf')
+        cursor.itersize = FILAS_POR_LOTE
+    else:
+        cursor = conn.cursor()
+    cursor.execute(query, (desde.isoformat(),))
+    try:
+        while True:
+            filas = cursor.fetchmany(FILAS_POR_LOTE)
+            if not filas:
+                break
+            yield filas
+    finally:
+        cursor.close()
+
+
+# ==================== INSTANCIA DEL PROCESO ====================
+
+_indice = None
+_indice_mtime = None
+_ultima_revision = 0.0
+_lock = threading.Lock()
+
+
+def obtener(directorio=None) -> Optional[IndiceTfidf]:
+    """
+    Índice del proceso (None si no se ha construido).
+
+    Revisa como máximo cada RECARGA_SEGUNDOS si ACTUAL apunta a otra versión.
+    """
+    global _indice, _indice_mtime, _ultima_revision
+    directorio = directorio or INDICE_DIR
+    ahora = time.monotonic()
+    if _indice is not None and ahora - _ultima_revision < RECARGA_SEGUNDOS:
+        return _indice
+
+    with _lock:
+        _ultima_revision = ahora
+        try:
+            mtime = os.path.getmtime(os.path.join(directorio, 'ACTUAL'))
+        except OSError:
+            return _indice
+        if _indice is None or mtime != _indice_mtime:
+            try:
+                _indice = IndiceTfidf.cargar(directorio)
+                _indice_mtime = mtime
+                logger.info(
+                    f"Índice TF-IDF abierto: {len(_indice):,} filas, "
+                    f"{_indice.n_documentos:,} documentos (creado {_indice.creado})"
+                )
+            except Exception as e:
+                logger.error(f"No se pudo abrir el índice TF-IDF {directorio}: {e}")
+    return _indice
+
+
+def candidatos(texto: str, **kwargs) -> Optional[np.ndarray]:
+    """Ids candidatos según el índice, o None si no hay índice disponible."""
+    indice = obtener()
+    if indice is None:
+        return None
+    return indice.candidatos(texto, **kwargs)
+
+
+def refrescar(directorio=None, hoy: Optional[date] = None) -> IndiceTfidf:
+    """Construye una versión nueva desde la BD, la publica y la abre en el proceso."""
+    global _indice, _indice_mtime
+    directorio = directorio or INDICE_DIR
+    desde = (hoy or date.today()) - timedelta(days=VENTANA_DIAS)
+
+    inicio = time.time()
+    conn = db.get_connection()
+    try:
+        indice = IndiceTfidf.construir(conn, desde)
+    finally:
+        conn.close()
+    indice.guardar(directorio)
+
+    with _lock:
+        _indice = IndiceTfidf.cargar(directorio)
+        _indice_mtime = os.path.getmtime(os.path.join(directorio, 'ACTUAL'))
+
+    logger.info(
+        f"Índice TF-IDF reconstruido: {len(indice):,} filas, {indice.n_documentos:,} documentos, "
+        f"{len(indice.datos):,} pesos en {time.time() - inicio:.1f}s"
+    )
+    return _indice
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    refrescar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Mensaje de Telegram que se va editando mientras llega la respuesta de la IA.
+
+En vez de dejar al usuario mirando "Analizando..." hasta que termina la
+completion, el texto del proveedor se muestra a medida que llega (streaming)
+editando un único mensaje:
+
+- Las ediciones se espacian al menos TELEGRAM_EDICION_INTERVALO segundos
+  (Telegram limita las ediciones por chat) y se omiten si el texto no cambió.
+- Si Telegram responde RetryAfter se respeta la espera indicada.
+- Los avances se muestran como texto plano; el formato final (HTML, botones)
+  se aplica una sola vez en finalizar().
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Segundos mínimos entre dos ediciones del mismo mensaje
+TELEGRAM_EDICION_INTERVALO = float(os.getenv('TELEGRAM_EDICION_INTERVALO', '1.5'))
+
+# Largo máximo de un mensaje de Telegram
+LARGO_MAXIMO = 4096
+
+# Cadenas JSON: "clave": o "valor" (el último puede venir incompleto)
+_CADENA_JSON = re.compile(r'"((?:[^"\\]|\\.)*)("?)(\s*:)?')
+
+
+def texto_legible_json(parcial: str) -> str:
+    """
+    Vista previa legible de un JSON a medio llegar.
+
+    Muestra los valores de texto (no las claves ni la sintaxis), uno por
+    línea, incluido el que todavía se está escribiendo.
+    """
+    lineas = []
+    for valor, _, dos_puntos in _CADENA_JSON.findall(parcial):
+        if dos_puntos or not valor.strip():
+            continue
+        lineas.append("• " + valor.replace('\\n', ' ').replace('\\"', '"'))
+    return "\n".join(lineas)
+
+
+class MensajeProgresivo:
+    """
+    Un mensaje de Telegram que se actualiza con el texto parcial de la IA.
+
+    Uso:
+        progreso = await MensajeProgresivo.enviar(update.effective_message, "🤖 Analizando...")
+        texto = await gemini_ai.generar_borrador_oferta_async(..., al_avanzar=progreso.actualizar)
+        await progreso.finalizar(texto)
+    """
+
+    def __init__(self, mensaje, encabezado: str = "", vista_previa=None):
+        """
+        Args:
+            mensaje: telegram.Message ya enviado que se irá editando
+            encabezado: Texto fijo sobre el avance (p. ej. "🤖 Analizando...")
+            vista_previa: Función texto_acumulado -> texto a mostrar
+                (por defecto el texto tal cual)
+        """
+        self.mensaje = mensaje
+        self.encabezado = encabezado
+        self.vista_previa = vista_previa
+        self._mostrado: Optional[str] = None
+        self._proxima_edicion = 0.0
+        # Hasta cuándo Telegram pidió no editar (RetryAfter)
+        self._bloqueado_hasta = 0.0
+
+    @classmethod
+    async def enviar(cls, mensaje_origen, encabezado: str, vista_previa=None, parse_mode='HTML'):
+        """Responde a mensaje_origen con el encabezado y devuelve el mensaje progresivo."""
+        mensaje = await mensaje_origen.reply_text(encabezado, parse_mode=parse_mode)
+        # El encabezado se muestra como texto plano en los avances
+        return cls(mensaje, re.sub(r'<[^>]+>', '', encabezado), vista_previa)
+
+    def _componer(self, acumulado: str) -> str:
+        cuerpo = self.vista_previa(acumulado) if self.vista_previa else acumulado
+        texto = f"{self.encabezado}\n\n{cuerpo}" if self.encabezado else cuerpo
+        if len(texto) > LARGO_MAXIMO:
+            texto = texto[:LARGO_MAXIMO - 1] + "…"
+        return texto
+
+    async def _editar(self, texto: str, **kwargs) -> bool:
+        try:
+            await self.mensaje.edit_text(texto, **kwargs)
+            self._mostrado = texto
+            return True
+        except RetryAfter as e:
+            espera = e.retry_after
+            segundos = espera.total_seconds() if hasattr(espera, 'total_seconds') else float(espera)
+            self._bloqueado_hasta = time.monotonic() + segundos
+            self._proxima_edicion = max(self._proxima_edicion, self._bloqueado_hasta)
+            logger.debug(f"Telegram pide esperar {segundos}s antes de editar")
+        except BadRequest as e:
+            if 'not modified' in str(e).lower():
+                self._mostrado = texto
+                return True
+            logger.warning(f"No se pudo editar el mensaje: {e}")
+        except TelegramError as e:
+            logger.warning(f"No se pudo editar el mensaje: {e}")
+        return False
+
+    async def actualizar(self, acumulado: str):
+        """
+        Muestra el texto acumulado si ya pasó el intervalo entre ediciones.
+
+        Pensado como callback por cada fragmento del stream: las llamadas
+        dentro del intervalo no hacen nada.
+        """
+        ahora = time.monotonic()
+        if ahora < self._proxima_edicion:
+            return
+        texto = self._componer(acumulado)
+        if not texto.strip() or texto == self._mostrado:
+            return
+        self._proxima_edicion = ahora + TELEGRAM_EDICION_INTERVALO
+        await self._editar(texto)
+
+    async def finalizar(self, texto: str, reply_markup=None, parse_mode=None) -> bool:
+        """
+        Reemplaza el avance por el mensaje final (con formato y botones).
+
+        Si Telegram pidió esperar, se espera; si la edición falla (p. ej. el
+        usuario borró el mensaje) el texto se envía como mensaje nuevo.
+        """
+        espera = self._bloqueado_hasta - time.monotonic()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        if await self._editar(texto, reply_markup=reply_markup, parse_mode=parse_mode):
+            return True
+        try:
+            await self.mensaje.reply_text(texto, reply_markup=reply_markup, parse_mode=parse_mode)
+            return True
+        except TelegramError as e:
+            logger.error(f"No se pudo enviar el mensaje final: {e}")
+            return False
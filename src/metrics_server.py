@@ -195,6 +195,37 @@ redis_memoria_uso = Gauge(
     'Uso de memoria de Redis en bytes'
 )
 
+# Pool de procesos ML (pool_ml.py)
+ml_pool_profundidad = Gauge(
+    'compra_agil_ml_pool_queue_depth',
+    'Tareas ML encoladas o en ejecución en el pool'
+)
+
+ml_pool_espera = Histogram(
+    'compra_agil_ml_pool_wait_seconds',
+    'Tiempo de una tarea ML en cola antes de empezar',
+    ['task_type'],
+    buckets=[0.005, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0]
+)
+
+ml_pool_tareas = Counter(
+    'compra_agil_ml_pool_tasks_total',
+    'Tareas ML enviadas al pool por resultado',
+    ['task_type', 'status']  # 'ok', 'error', 'timeout', 'rejected'
+)
+
+# Caché de análisis IA (cache_analisis.py)
+analisis_cache_consultas = Counter(
+    'compra_agil_analysis_cache_requests_total',
+    'Consultas a la caché de análisis IA por resultado',
+    ['result']  # 'hit_memoria', 'hit_bd', 'miss'
+)
+
+analisis_cache_tokens_ahorrados = Counter(
+    'compra_agil_analysis_cache_saved_tokens_total',
+    'Tokens de LLM (estimados) que se evitaron gracias a la caché de análisis'
+)
+
 # ==================== SERVIDOR DE MÉTRICAS ====================
 
 async def metrics_handler(request):
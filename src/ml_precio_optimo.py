@@ -2,22 +2,40 @@
 Sistema de Recomendación de Precio Óptimo
 Analiza datos históricos para sugerir precios competitivos
 """
+import os
+import hashlib
+import threading
+import time
+from io import StringIO
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple
-from datetime import datetime
+from datetime import datetime, timedelta
 import database_extended as db
-from fuzzywuzzy import fuzz
+import estadisticas_precios
+import indice_productos
+import similitud
+import sketches_precios
+import umbral_trgm
 import logging
+from canonizacion import columna_normalizada, normalizar_termino
 
 logger = logging.getLogger(__name__)
 
 
+COLUMNAS_CANDIDATOS = [
+    'producto_cotizado', 'producto_normalizado', 'monto_total', 'cantidad',
+    'region', 'es_ganador', 'fecha_cierre', 'nombre_proveedor'
+]
+
+
 def buscar_productos_similares(
     producto: str,
     region: Optional[str] = None,
     limite: int = 500,
-    umbral_similitud: int = 60
+    umbral_similitud: int = 60,
+    offline: bool = False
 ) -> pd.DataFrame:
     """
     Busca productos similares en el histórico usando fuzzy matching optimizado.
@@ -27,143 +45,448 @@ def buscar_productos_similares(
         region: Filtrar por región específica (opcional)
         limite: Máximo de registros a retornar
         umbral_similitud: Umbral mínimo de similitud (0-100)
+        offline: Leer del espejo Parquet en vez de la BD (análisis batch)
 
     Returns:
         DataFrame con productos similares y sus datos
     """
     try:
+        if offline:
+            df = _leer_candidatos_parquet(producto, region)
+            return _rankear_similares(df, producto, limite, umbral_similitud)
+
+        desde = datetime.now().date() - timedelta(days=730)
+        ids = indice_productos.candidatos(
+            producto, campos=('producto',), limite=limite * 3,
+            solo_ganadores=True, desde=desde, region=region
+        )
+
         conn = db.get_connection()
 
-        if db.USE_POSTGRES:
-            # ✅ QUERY OPTIMIZADA con pg_trgm y índices
-            # Usa el índice idx_hist_producto_trgm para fuzzy matching
-            # Filtra por fecha reciente (últimos 2 años) usando idx_hist_fecha_producto
-            # Filtra solo ganadores con monto > 0 usando idx_hist_precio_optimo
+        if ids is not None and len(ids):
+            # Índice en memoria: solo se leen por id las filas candidatas
+            df = indice_productos.leer_filas(conn, ids, COLUMNAS_CANDIDATOS)
+            df = df[(df['monto_total'] > 0) & (df['cantidad'] > 0)].reset_index(drop=True)
+
+        elif db.USE_POSTGRES:
+            # ✅ QUERY OPTIMIZADA con pg_trgm: KNN sobre idx_hist_producto_norm_gist
+            # ORDER BY <-> recorre el índice GiST de más a menos similar y se
+            # detiene al juntar `limite` filas, sin ordenar todas las coincidencias
+            # (el costo no crece con lo común que sea el término)
+            # Filtra por fecha reciente (últimos 2 años) y solo ganadores con monto > 0
+            # El umbral de % se ajusta por consulta (umbral_trgm)
             query = """
                 SELECT
                     producto_cotizado,
+                    producto_normalizado,
                     monto_total,
                     cantidad,
                     region,
                     es_ganador,
                     fecha_cierre,
                     nombre_proveedor,
-                    similarity(producto_cotizado, %s) as similitud
+                    similarity(producto_normalizado, %s) as similitud
                 FROM historico_licitaciones
-                WHERE producto_cotizado %% %s  -- Operador de similitud (usa idx_hist_producto_trgm)
+                WHERE producto_normalizado %% %s  -- Umbral de similitud (pg_trgm.similarity_threshold)
                 AND monto_total > 0
                 AND cantidad > 0
                 AND fecha_cierre >= CURRENT_DATE - INTERVAL '2 years'  -- Solo últimos 2 años
                 AND es_ganador = true  -- Solo ofertas ganadoras
             """
 
-            params = [producto, producto]
+            termino = normalizar_termino(producto)
+            limite_knn = umbral_trgm.acotar(limite)
+            params: List[object] = [termino, termino]
 
             # Filtro por región si se especifica
             if region:
                 query += " AND UPPER(region) = UPPER(%s)"
                 params.append(region)
 
-            # Ordenar por similitud y fecha (usa índices)
+            # Orden por distancia trigram (1 - similitud): scan KNN del índice
             query += """
-                ORDER BY similitud DESC, fecha_cierre DESC
+                ORDER BY producto_normalizado <-> %s
                 LIMIT %s
             """
-            params.append(limite)
+            params.extend([termino, limite_knn])
 
             # Ejecutar query
-            df = pd.read_sql(query, conn, params=tuple(params))
+            df = umbral_trgm.consultar(
+                conn, lambda: pd.read_sql(query, conn, params=tuple(params)),
+                limite=limite_knn
+            )
 
         else:
             # SQLite fallback (sin pg_trgm)
-            query = """
-                SELECT
-                    producto_cotizado,
-                    monto_total,
-                    cantidad,
-                    region,
-                    es_ganador,
-                    fecha_cierre,
-                    nombre_proveedor
-                FROM historico_licitaciones
-                WHERE monto_total > 0
-                AND cantidad > 0
-                AND fecha_cierre >= date('now', '-2 years')
-                AND es_ganador = 1
-            """
+            df = _leer_recientes_sqlite(conn, region, limite * 3)
 
-            params = []
+        conn.close()
 
-            # Filtro por región si se especifica
-            if region:
-                query += " AND UPPER(region) = UPPER(?)"
-                params.append(region)
+        return _rankear_similares(df, producto, limite, umbral_similitud)
+
+    except Exception as e:
+        logger.error(f"Error buscando productos similares: {e}")
+        return pd.DataFrame()
 
-            # Ordenar por fecha reciente y limitar
-            query += f" ORDER BY fecha_cierre DESC LIMIT {limite * 3}"
 
-            # Ejecutar query
-            if params:
-                df = pd.read_sql(query, conn, params=tuple(params))
-            else:
-                df = pd.read_sql(query, conn)
+def _leer_recientes_sqlite(conn, region: Optional[str], limite: int, columnas=COLUMNAS_CANDIDATOS) -> pd.DataFrame:
+    """SQLite (sin pg_trgm): ganadores más recientes de la ventana de 2 años."""
+    query = f"""
+        SELECT {', '.join(columnas)}
+        FROM historico_licitaciones
+        WHERE monto_total > 0
+        AND cantidad > 0
+        AND fecha_cierre >= date('now', '-2 years')
+        AND es_ganador = 1
+    """
 
-        conn.close()
-        
-        if df.empty:
-            logger.warning(f"No se encontraron datos históricos")
-            return pd.DataFrame()
-        
-        # Calcular similitud con fuzzy matching
-        producto_lower = producto.lower()
-        df['similitud'] = df['producto_cotizado'].apply(
-            lambda x: fuzz.token_set_ratio(producto_lower, str(x).lower()) 
-            if pd.notna(x) else 0
-        )
-        
-        # Filtrar por umbral de similitud
-        df_filtrado = df[df['similitud'] >= umbral_similitud].copy()
-        
-        # Ordenar por similitud y tomar los mejores
-        df_filtrado = df_filtrado.nlargest(limite, 'similitud')
-        
-        # Calcular precio unitario
-        df_filtrado['precio_unitario'] = (
-            df_filtrado['monto_total'] / df_filtrado['cantidad']
+    params = []
+
+    # Filtro por región si se especifica
+    if region:
+        query += " AND UPPER(region) = UPPER(?)"
+        params.append(region)
+
+    # Ordenar por fecha reciente y limitar
+    query += f" ORDER BY fecha_cierre DESC LIMIT {int(limite)}"
+
+    return pd.read_sql(query, conn, params=tuple(params))
+
+
+def _leer_candidatos_parquet(producto: str, region: Optional[str] = None) -> pd.DataFrame:
+    """Candidatos desde el espejo Parquet, con los mismos filtros que la query SQL."""
+    import parquet_historico as ph_parquet
+    import pyarrow.dataset as ds
+
+    filtro = (ds.field('monto_total') > 0) & (ds.field('cantidad') > 0)
+    filtro_texto = ph_parquet.filtro_texto(producto)
+    if filtro_texto is not None:
+        filtro = filtro & filtro_texto
+
+    # El espejo no guarda las columnas canónicas: se calculan al puntuar
+    return ph_parquet.leer_historico(
+        columnas=[columna for columna in COLUMNAS_CANDIDATOS if columna in ph_parquet.COLUMNAS],
+        region=region,
+        desde=datetime.now().date() - timedelta(days=730),
+        es_ganador=True,
+        filtro=filtro,
+        categorias=False
+    )
+
+
+def _rankear_similares(
+    df: pd.DataFrame,
+    producto: str,
+    limite: int,
+    umbral_similitud: int,
+    similitudes: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """
+    Calcula similitud fuzzy, filtra por umbral y agrega precio unitario.
+
+    Args:
+        similitudes: Puntajes ya calculados para las filas de df (lotes)
+    """
+    if df.empty:
+        logger.warning(f"No se encontraron datos históricos")
+        return pd.DataFrame()
+    
+    # Calcular similitud con fuzzy matching (vectorizado) sobre términos canónicos
+    if similitudes is None:
+        similitudes = similitud.puntajes(
+            normalizar_termino(producto),
+            columna_normalizada(df, 'producto_cotizado'),
+            processor=None
         )
-        
-        logger.info(
-            f"Encontrados {len(df_filtrado)} productos similares "
-            f"(similitud >= {umbral_similitud}%)"
+    df['similitud'] = similitudes
+    
+    # Filtrar por umbral de similitud
+    df_filtrado = df[df['similitud'] >= umbral_similitud].copy()
+    
+    # Ordenar por similitud y tomar los mejores
+    df_filtrado = df_filtrado.nlargest(limite, 'similitud')
+    
+    # Calcular precio unitario
+    df_filtrado['precio_unitario'] = (
+        df_filtrado['monto_total'] / df_filtrado['cantidad']
+    )
+    
+    logger.info(
+        f"Encontrados {len(df_filtrado)} productos similares "
+        f"(similitud >= {umbral_similitud}%)"
+    )
+    
+    return df_filtrado
+
+
+# ==================== ANÁLISIS DE MERCADO COMPARTIDO ====================
+
+# Segundos que se reutilizan los candidatos de un producto (0 = sin caché)
+MERCADO_TTL_SEGUNDOS = int(os.getenv('MERCADO_TTL_SEGUNDOS', '300'))
+MERCADO_MAX_ENTRADAS = int(os.getenv('MERCADO_MAX_ENTRADAS', '128'))
+
+# Candidatos por análisis; el precio usa los LIMITE_PRECIO más similares
+LIMITE_MERCADO = 1000
+LIMITE_PRECIO = 500
+
+
+class AnalisisMercado:
+    """
+    Productos similares a un producto (y región), buscados y puntuados una vez.
+
+    calcular_precio_optimo() y analizar_competencia_precios() derivan sus
+    estadísticas de este mismo conjunto. similares se comparte mientras el
+    análisis esté en caché: no modificarlo.
+    """
+
+    def __init__(self, producto: str, region: Optional[str], similares: pd.DataFrame, offline: bool = False):
+        self.producto = producto
+        self.region = region
+        self.similares = similares
+        self.offline = offline
+
+    @property
+    def vacio(self) -> bool:
+        return self.similares.empty
+
+    def precio(self, cantidad: int, solo_ganadores: bool = True) -> Dict:
+        """
+        Recomendación de precio (formato de calcular_precio_optimo).
+
+        Los percentiles se calculan en memoria sobre los candidatos ya
+        cargados: no hay otro viaje a la BD.
+        """
+        # similares viene ordenado por similitud descendente
+        return _precio_desde_similares(
+            self.similares.head(LIMITE_PRECIO), cantidad, self.region, solo_ganadores
         )
-        
-        return df_filtrado
-        
+
+    def competencia(self) -> Dict:
+        """Análisis de competencia (formato de analizar_competencia_precios)."""
+        df = self.similares
+        if df.empty:
+            return {'success': False, 'error': 'No hay datos suficientes'}
+
+        # Agrupar por proveedor
+        competidores = df.groupby('nombre_proveedor').agg({
+            'monto_total': ['count', 'mean'],
+            'es_ganador': 'sum',
+            'precio_unitario': ['mean', 'min', 'max']
+        }).round(2)
+
+        competidores.columns = ['_'.join(col).strip() for col in competidores.columns]
+        competidores['tasa_exito'] = (
+            competidores['es_ganador_sum'] / competidores['monto_total_count'] * 100
+        ).round(2)
+
+        # Top 10 competidores por participación
+        top_competidores = competidores.nlargest(10, 'monto_total_count')
+
+        # Top 5 ganadores frecuentes
+        ganadores_frecuentes = competidores[
+            competidores['monto_total_count'] >= 3
+        ].nlargest(5, 'tasa_exito')
+
+        return {
+            'success': True,
+            'top_competidores': top_competidores.to_dict('index'),
+            'ganadores_frecuentes': ganadores_frecuentes.to_dict('index'),
+            'total_competidores': len(competidores),
+            'estadisticas_generales': self._estadisticas_generales()
+        }
+
+    def _estadisticas_generales(self) -> Dict:
+        """Distribución de precios: sketches de 24 meses o, sin ellos, los candidatos."""
+        distribucion = None
+        if not self.offline:
+            distribucion = sketches_precios.consultar(self.producto, self.region, recortar=False)
+        if distribucion:
+            return {
+                'precio_min': distribucion['precio_min'],
+                'precio_max': distribucion['precio_max'],
+                'precio_promedio': distribucion['promedio'],
+                'desviacion_std': distribucion['desviacion'],
+                'p25': distribucion['p25'],
+                'p50': distribucion['p50'],
+                'p75': distribucion['p75'],
+                'n_registros': distribucion['n_registros'],
+                'fuente': 'sketch',
+            }
+
+        precios = self.similares['precio_unitario']
+        return {
+            'precio_min': precios.min(),
+            'precio_max': precios.max(),
+            'precio_promedio': precios.mean(),
+            'desviacion_std': precios.std(),
+            'p25': precios.quantile(0.25),
+            'p50': precios.quantile(0.50),
+            'p75': precios.quantile(0.75),
+            'n_registros': len(precios),
+            'fuente': 'en_vivo',
+        }
+
+
+# (término, REGIÓN, offline) -> (creado, AnalisisMercado), en orden LRU
+_mercado: "OrderedDict[Tuple[str, str, bool], Tuple[float, AnalisisMercado]]" = OrderedDict()
+_mercado_lock = threading.Lock()
+
+PREFIJO_REDIS_MERCADO = 'mercado:'
+
+
+def _redis():
+    """Cliente Redis compartido, o None si no está disponible."""
+    try:
+        import redis_cache
+    except Exception:
+        return None
+    return redis_cache.redis_client if redis_cache.REDIS_AVAILABLE else None
+
+
+def _clave_redis_mercado(termino: str, region: str) -> str:
+    digest = hashlib.sha1(termino.encode('utf-8')).hexdigest()[:20]
+    return f"{PREFIJO_REDIS_MERCADO}{region or '-'}:{digest}"
+
+
+def _leer_mercado_redis(cliente, clave: str) -> Optional[pd.DataFrame]:
+    try:
+        valor = cliente.get(clave)
+        if valor:
+            return pd.read_json(StringIO(valor), orient='split', dtype=False, convert_dates=False)
     except Exception as e:
-        logger.error(f"Error buscando productos similares: {e}")
-        return pd.DataFrame()
+        logger.warning(f"Error leyendo análisis de mercado en Redis: {e}")
+    return None
+
+
+def _guardar_mercado_redis(cliente, clave: str, df: pd.DataFrame):
+    try:
+        cliente.setex(clave, MERCADO_TTL_SEGUNDOS, df.to_json(orient='split', index=False, date_format='iso'))
+    except Exception as e:
+        logger.warning(f"Error guardando análisis de mercado en Redis: {e}")
+
+
+def analisis_mercado(producto: str, region: Optional[str] = None, offline: bool = False) -> AnalisisMercado:
+    """
+    Análisis de mercado de un producto, reutilizado durante MERCADO_TTL_SEGUNDOS.
+
+    La clave es el término canónico y la región: /precio_optimo seguido de
+    /competidores (o las redacciones "Resma carta" y "carta, resma") buscan
+    en el histórico una sola vez. Los resultados vacíos no se guardan.
+
+    Con Redis los candidatos se comparten entre procesos (workers de
+    pool_ml, API y bot); el LRU del proceso evita releerlos en cada llamada.
+    """
+    termino = normalizar_termino(producto)
+    region_clave = (region or '').strip().upper()
+    clave = (termino, region_clave, offline)
+    ahora = time.monotonic()
+
+    analisis = _mercado_en_cache(clave, ahora)
+    if analisis is not None:
+        return analisis
+
+    usar_redis = bool(termino) and not offline and MERCADO_TTL_SEGUNDOS > 0
+    cliente = _redis() if usar_redis else None
+    clave_redis = _clave_redis_mercado(termino, region_clave) if cliente is not None else None
+
+    df = _leer_mercado_redis(cliente, clave_redis) if clave_redis is not None else None
+    desde_redis = df is not None
+    if df is None:
+        df = buscar_productos_similares(producto, region, limite=LIMITE_MERCADO, offline=offline)
+    analisis = AnalisisMercado(producto, region, df, offline)
+
+    if termino and not df.empty and MERCADO_TTL_SEGUNDOS > 0:
+        if clave_redis is not None and not desde_redis:
+            _guardar_mercado_redis(cliente, clave_redis, df)
+        with _mercado_lock:
+            _mercado[clave] = (ahora, analisis)
+            _mercado.move_to_end(clave)
+            while len(_mercado) > MERCADO_MAX_ENTRADAS:
+                _mercado.popitem(last=False)
+    return analisis
+
+
+def _mercado_en_cache(clave, ahora: float) -> Optional[AnalisisMercado]:
+    with _mercado_lock:
+        entrada = _mercado.get(clave)
+        if entrada and ahora - entrada[0] < MERCADO_TTL_SEGUNDOS:
+            _mercado.move_to_end(clave)
+            return entrada[1]
+    return None
+
+
+def limpiar_cache_mercado():
+    """Descarta los análisis de mercado en caché de este proceso."""
+    with _mercado_lock:
+        _mercado.clear()
+
+
+# Columnas de similares que usa el resumen de /stats
+COLUMNAS_RESUMEN_MERCADO = ['es_ganador', 'precio_unitario', 'nombre_proveedor']
+
+
+def resumen_mercado(producto: str, region: Optional[str] = None) -> pd.DataFrame:
+    """
+    Candidatos del análisis de mercado con solo COLUMNAS_RESUMEN_MERCADO.
+
+    Pensada para pool_ml: devuelve un DataFrame chico en vez de serializar el
+    AnalisisMercado completo de vuelta al proceso que la llama.
+    """
+    df = analisis_mercado(producto, region).similares
+    if df.empty:
+        return pd.DataFrame(columns=COLUMNAS_RESUMEN_MERCADO)
+    return df[COLUMNAS_RESUMEN_MERCADO].copy()
 
 
 def calcular_precio_optimo(
     producto: str,
     cantidad: int,
     region: Optional[str] = None,
-    solo_ganadores: bool = True
+    solo_ganadores: bool = True,
+    offline: bool = False,
+    usar_precalculado: bool = True
 ) -> Dict:
     """
     Calcula el precio óptimo basado en análisis estadístico de históricos.
     
+    Primero busca el término normalizado en estadisticas_precios (una lectura
+    por clave); solo si no existe calcula en vivo sobre el análisis de mercado
+    compartido con analizar_competencia_precios() (mismos candidatos, re-ranking
+    fuzzy y umbral de similitud, así que ambos dan las mismas cifras).
+    
     Args:
         producto: Nombre del producto
         cantidad: Cantidad solicitada
         region: Región (opcional)
         solo_ganadores: Si True, solo considera ofertas ganadoras
+        offline: Usar el espejo Parquet (análisis batch, sin cargar la BD)
+        usar_precalculado: Consultar la tabla de estadísticas precalculadas
     
     Returns:
         Dict con recomendación de precio y estadísticas
     """
-    df = buscar_productos_similares(producto, region, limite=500)
-    
+    if usar_precalculado and solo_ganadores and not offline:
+        stats = estadisticas_precios.buscar_estadisticas(producto, region)
+        if stats:
+            return _respuesta_precio(
+                stats, cantidad,
+                n_ganadores=stats['n_ganadores'],
+                tasa_conversion=stats['tasa_ganadores'],
+                solo_ganadores=True,
+                region=region,
+                fuente='precalculado'
+            )
+
+    return analisis_mercado(producto, region, offline).precio(cantidad, solo_ganadores)
+
+
+def _precio_desde_similares(
+    df: pd.DataFrame,
+    cantidad: int,
+    region: Optional[str],
+    solo_ganadores: bool
+) -> Dict:
+    """Estadísticas de precio sobre productos similares ya rankeados."""
     if df.empty:
         return {
             'success': False,
@@ -181,40 +504,51 @@ def calcular_precio_optimo(
     else:
         df_analisis = df.copy()
     
-    # Remover outliers (fuera de 3 desviaciones estándar)
-    precio_mean = df_analisis['precio_unitario'].mean()
-    precio_std = df_analisis['precio_unitario'].std()
-    df_analisis = df_analisis[
-        (df_analisis['precio_unitario'] >= precio_mean - 3*precio_std) &
-        (df_analisis['precio_unitario'] <= precio_mean + 3*precio_std)
-    ]
-    
-    # Calcular percentiles
-    p25 = df_analisis['precio_unitario'].quantile(0.25)
-    p50 = df_analisis['precio_unitario'].quantile(0.50)
-    p75 = df_analisis['precio_unitario'].quantile(0.75)
-    p90 = df_analisis['precio_unitario'].quantile(0.90)
+    # Percentiles sin outliers (misma regla que las estadísticas precalculadas)
+    stats = estadisticas_precios.resumen_precios(df_analisis['precio_unitario'].to_numpy())
     
-    # Precio recomendado: percentil 40-45 (sweet spot)
-    precio_unitario_recomendado = df_analisis['precio_unitario'].quantile(0.42)
-    precio_total_recomendado = precio_unitario_recomendado * cantidad
+    # Análisis de ganadores vs perdedores
+    n_ganadores = len(df[df['es_ganador'] == True])
+    tasa_conversion = (n_ganadores / len(df) * 100) if len(df) > 0 else 0
     
-    # Calcular confianza (basado en cantidad de datos)
-    n_registros = len(df_analisis)
+    return _respuesta_precio(
+        stats, cantidad,
+        n_ganadores=n_ganadores,
+        tasa_conversion=tasa_conversion,
+        solo_ganadores=solo_ganadores,
+        region=region,
+        fuente='en_vivo'
+    )
+
+
+def _calcular_confianza(n_registros: int) -> float:
+    """Confianza de la recomendación según cantidad de precios analizados."""
     if n_registros >= 100:
-        confianza = 0.95
+        return 0.95
     elif n_registros >= 50:
-        confianza = 0.85
+        return 0.85
     elif n_registros >= 20:
-        confianza = 0.70
+        return 0.70
     elif n_registros >= 10:
-        confianza = 0.60
-    else:
-        confianza = 0.40
-    
-    # Análisis de ganadores vs perdedores
-    n_ganadores = len(df[df['es_ganador'] == True])
-    tasa_conversion = (n_ganadores / len(df) * 100) if len(df) > 0 else 0
+        return 0.60
+    return 0.40
+
+
+def _respuesta_precio(
+    stats: Dict,
+    cantidad: int,
+    n_ganadores: int,
+    tasa_conversion: float,
+    solo_ganadores: bool,
+    region: Optional[str],
+    fuente: str
+) -> Dict:
+    """Arma la respuesta de calcular_precio_optimo a partir de percentiles ya calculados."""
+    # Precio recomendado: percentil 40-45 (sweet spot)
+    precio_unitario_recomendado = stats['p42']
+    p25, p50, p75 = stats['p25'], stats['p50'], stats['p75']
+    n_registros = int(stats['n_registros'])
+    confianza = _calcular_confianza(n_registros)
     
     return {
         'success': True,
@@ -223,20 +557,21 @@ def calcular_precio_optimo(
             'p25': round(p25, 2),
             'p50': round(p50, 2),
             'p75': round(p75, 2),
-            'p90': round(p90, 2),
-            'promedio': round(df_analisis['precio_unitario'].mean(), 2),
+            'p90': round(stats['p90'], 2),
+            'promedio': round(stats['promedio'], 2),
         },
         'precio_total': {
-            'recomendado': round(precio_total_recomendado, 2),
+            'recomendado': round(precio_unitario_recomendado * cantidad, 2),
             'minimo_competitivo': round(p25 * cantidad, 2),
             'maximo_aceptable': round(p75 * cantidad, 2),
         },
         'estadisticas': {
             'n_registros': n_registros,
-            'n_ganadores': n_ganadores,
+            'n_ganadores': int(n_ganadores),
             'tasa_conversion': round(tasa_conversion, 2),
             'solo_ganadores': solo_ganadores,
             'region': region or 'Todas',
+            'fuente': fuente,
         },
         'confianza': confianza,
         'recomendacion': generar_recomendacion(
@@ -245,6 +580,215 @@ def calcular_precio_optimo(
     }
 
 
+def _leer_lote_postgres(
+    conn,
+    consultas: List[Tuple[str, Optional[str]]],
+    limite: int,
+    columnas: List[str]
+) -> pd.DataFrame:
+    """
+    KNN pg_trgm de varias consultas en una sentencia LATERAL.
+
+    El umbral de % es uno por sentencia: se baja escalonadamente (umbral_trgm)
+    y en cada paso solo se repiten las consultas con menos de
+    TRGM_MIN_CANDIDATOS filas.
+
+    Returns:
+        Filas con la columna 'consulta' (posición en consultas, desde 0)
+    """
+    query = f"""
+        SELECT q.n AS consulta, h.*
+        FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS q(producto, region, n)
+        CROSS JOIN LATERAL (
+            SELECT {', '.join(columnas)}
+            FROM historico_licitaciones
+            WHERE producto_normalizado %% q.producto
+            AND monto_total > 0
+            AND cantidad > 0
+            AND fecha_cierre >= CURRENT_DATE - INTERVAL '2 years'
+            AND es_ganador = true
+            AND (q.region IS NULL OR UPPER(region) = UPPER(q.region))
+            ORDER BY producto_normalizado <-> q.producto
+            LIMIT %s
+        ) h
+    """
+    pendientes = [(normalizar_termino(producto), region) for producto, region in consultas]
+    posiciones = list(range(len(consultas)))
+    limite = umbral_trgm.acotar(limite)
+    minimo = min(umbral_trgm.TRGM_MIN_CANDIDATOS, limite)
+    cursor = conn.cursor()
+    partes = []
+    for paso, umbral in enumerate(umbral_trgm.TRGM_UMBRALES):
+        umbral_trgm.fijar_umbral(cursor, umbral)
+        df = pd.read_sql(query, conn, params=(
+            [termino for termino, _ in pendientes],
+            [region for _, region in pendientes],
+            limite
+        ))
+        conteos = df['consulta'].value_counts()
+        suficientes = {
+            n for n in range(1, len(pendientes) + 1)
+            if conteos.get(n, 0) >= minimo
+        }
+        # En el último umbral se acepta lo que haya
+        if paso == len(umbral_trgm.TRGM_UMBRALES) - 1:
+            suficientes = set(range(1, len(pendientes) + 1))
+        df = df[df['consulta'].isin(suficientes)].copy()
+        # q.n numera las consultas de este paso: se traduce a la posición original
+        df['consulta'] = [posiciones[n - 1] for n in df['consulta']]
+        partes.append(df)
+        pendientes, posiciones = [
+            consulta for n, consulta in enumerate(pendientes, 1) if n not in suficientes
+        ], [
+            posicion for n, posicion in enumerate(posiciones, 1) if n not in suficientes
+        ]
+        if not pendientes:
+            break
+    return pd.concat(partes, ignore_index=True)
+
+
+def _candidatos_lote(
+    consultas: List[Tuple[str, Optional[str]]],
+    limite: int
+) -> Tuple[pd.DataFrame, List[np.ndarray]]:
+    """
+    Pool compartido de candidatos para varios (producto, región), sin un
+    viaje a la BD por producto: lectura por ids del índice en memoria o, sin
+    índice, una consulta LATERAL con KNN pg_trgm por umbral probado
+    (SQLite: ganadores recientes por región).
+
+    Cada consulta recibe los mismos candidatos que buscar_productos_similares
+    con ese limite.
+
+    Returns:
+        (pool sin ids repetidos, ids de los candidatos de cada consulta)
+    """
+    desde = datetime.now().date() - timedelta(days=730)
+    por_indice = [
+        indice_productos.candidatos(
+            producto, campos=('producto',), limite=limite * 3,
+            solo_ganadores=True, desde=desde, region=region
+        )
+        for producto, region in consultas
+    ]
+    con_ids = [ids for ids in por_indice if ids is not None and len(ids)]
+    sin_indice = [k for k, ids in enumerate(por_indice) if ids is None or not len(ids)]
+    columnas = ['id'] + COLUMNAS_CANDIDATOS
+    miembros = [
+        np.asarray(ids, dtype=np.int64) if ids is not None and len(ids) else np.empty(0, dtype=np.int64)
+        for ids in por_indice
+    ]
+
+    partes = []
+    conn = db.get_connection()
+    try:
+        if con_ids:
+            partes.append(indice_productos.leer_filas(conn, np.unique(np.concatenate(con_ids)), columnas))
+
+        if sin_indice and db.USE_POSTGRES:
+            df = _leer_lote_postgres(conn, [consultas[k] for k in sin_indice], limite, columnas)
+            for posicion, ids in df.groupby('consulta')['id']:
+                miembros[sin_indice[posicion]] = ids.to_numpy(dtype=np.int64)
+            partes.append(df.drop(columns='consulta'))
+        elif sin_indice:
+            for region in {consultas[k][1] for k in sin_indice}:
+                df = _leer_recientes_sqlite(conn, region, limite * 3, columnas)
+                for k in sin_indice:
+                    if consultas[k][1] == region:
+                        miembros[k] = df['id'].to_numpy(dtype=np.int64)
+                partes.append(df)
+    finally:
+        conn.close()
+
+    partes = [parte for parte in partes if not parte.empty]
+    if not partes:
+        return pd.DataFrame(columns=columnas), miembros
+    pool = pd.concat(partes, ignore_index=True).drop_duplicates(subset='id')
+    pool = pool[(pool['monto_total'] > 0) & (pool['cantidad'] > 0)]
+    return pool.reset_index(drop=True), miembros
+
+
+def calcular_precios_lote(
+    items: List[Dict],
+    solo_ganadores: bool = True,
+    usar_precalculado: bool = True,
+    limite: int = LIMITE_MERCADO,
+    umbral_similitud: int = 60
+) -> List[Optional[Dict]]:
+    """
+    Calcula el precio óptimo de varios productos a la vez.
+
+    Las estadísticas precalculadas se leen en una consulta; los productos sin
+    ellas comparten un pool de candidatos (un viaje a la BD) y se puntúan con
+    una sola matriz de similitud. Cada producto usa sus propios candidatos y
+    el mismo cálculo que calcular_precio_optimo (AnalisisMercado.precio), así
+    que ambos recomiendan lo mismo.
+
+    Args:
+        items: Dicts con 'producto', 'cantidad' y 'region' (opcional)
+
+    Returns:
+        Lista en el mismo orden que items. Cada resultado tiene el formato de
+        calcular_precio_optimo(); los errores de un ítem no afectan al resto.
+    """
+    resultados: List[Optional[Dict]] = [None] * len(items)
+
+    for i, item in enumerate(items):
+        if not str(item.get('producto') or '').strip():
+            resultados[i] = {'success': False, 'error': 'Producto vacío', 'confianza': 0}
+
+    pendientes = [i for i, r in enumerate(resultados) if r is None]
+
+    if usar_precalculado and solo_ganadores and pendientes:
+        stats = estadisticas_precios.buscar_estadisticas_lote(
+            [(items[i]['producto'], items[i].get('region')) for i in pendientes]
+        )
+        for i, stat in zip(pendientes, stats):
+            if stat:
+                resultados[i] = _respuesta_precio(
+                    stat, items[i].get('cantidad') or 1,
+                    n_ganadores=stat['n_ganadores'],
+                    tasa_conversion=stat['tasa_ganadores'],
+                    solo_ganadores=True,
+                    region=items[i].get('region'),
+                    fuente='precalculado'
+                )
+        pendientes = [i for i in pendientes if resultados[i] is None]
+
+    if pendientes:
+        try:
+            consultas = [(items[i]['producto'], items[i].get('region')) for i in pendientes]
+            pool, miembros = _candidatos_lote(consultas, limite)
+            matriz = similitud.matriz_puntajes(
+                [normalizar_termino(producto) for producto, _ in consultas],
+                columna_normalizada(pool, 'producto_cotizado'),
+                processor=None
+            )
+            ids_pool = pool['id']
+        except Exception as e:
+            logger.error(f"Error buscando candidatos del lote: {e}")
+            for i in pendientes:
+                resultados[i] = {'success': False, 'error': 'Error al buscar datos históricos', 'confianza': 0}
+            pendientes = []
+
+        for k, i in enumerate(pendientes):
+            producto, region = consultas[k]
+            try:
+                mascara = ids_pool.isin(miembros[k]).to_numpy()
+                df = _rankear_similares(
+                    pool[mascara].copy(), producto, limite, umbral_similitud,
+                    similitudes=matriz[k][mascara]
+                )
+                resultados[i] = AnalisisMercado(producto, region, df).precio(
+                    items[i].get('cantidad') or 1, solo_ganadores
+                )
+            except Exception as e:
+                logger.error(f"Error calculando precio de '{producto}': {e}")
+                resultados[i] = {'success': False, 'error': 'Error al calcular el precio', 'confianza': 0}
+
+    return resultados
+
+
 def generar_recomendacion(
     precio_rec: float, 
     mediana: float, 
@@ -286,51 +830,21 @@ def generar_recomendacion(
 
 def analizar_competencia_precios(
     producto: str, 
-    region: Optional[str] = None
+    region: Optional[str] = None,
+    offline: bool = False
 ) -> Dict:
     """
     Analiza la distribución de precios de la competencia.
+
+    Con offline=True lee del espejo Parquet (reportes y estudios batch).
+    Las estadísticas generales salen de los sketches mensuales de los
+    últimos 24 meses cuando existen; si no, de las ofertas encontradas.
+    Los candidatos se comparten con calcular_precio_optimo() (ver analisis_mercado).
     
     Returns:
         Dict con análisis de competencia y distribución
     """
-    df = buscar_productos_similares(producto, region, limite=1000)
-    
-    if df.empty:
-        return {'success': False, 'error': 'No hay datos suficientes'}
-    
-    # Agrupar por proveedor
-    competidores = df.groupby('nombre_proveedor').agg({
-        'monto_total': ['count', 'mean'],
-        'es_ganador': 'sum',
-        'precio_unitario': ['mean', 'min', 'max']
-    }).round(2)
-    
-    competidores.columns = ['_'.join(col).strip() for col in competidores.columns]
-    competidores['tasa_exito'] = (
-        competidores['es_ganador_sum'] / competidores['monto_total_count'] * 100
-    ).round(2)
-    
-    # Top 10 competidores por participación
-    top_competidores = competidores.nlargest(10, 'monto_total_count')
-    
-    # Top 5 ganadores frecuentes
-    ganadores_frecuentes = competidores[
-        competidores['monto_total_count'] >= 3
-    ].nlargest(5, 'tasa_exito')
-    
-    return {
-        'success': True,
-        'top_competidores': top_competidores.to_dict('index'),
-        'ganadores_frecuentes': ganadores_frecuentes.to_dict('index'),
-        'total_competidores': len(competidores),
-        'estadisticas_generales': {
-            'precio_min': df['precio_unitario'].min(),
-            'precio_max': df['precio_unitario'].max(),
-            'precio_promedio': df['precio_unitario'].mean(),
-            'desviacion_std': df['precio_unitario'].std(),
-        }
-    }
+    return analisis_mercado(producto, region, offline).competencia()
 
 
 # Función de conveniencia para uso directo
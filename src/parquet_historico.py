@@ -0,0 +1,436 @@
+"""
+Espejo columnar (Parquet) de historico_licitaciones para analítica fuera de la BD.
+
+Cada mes se exporta a un archivo Parquet independiente (layout hive):
+
+    <HISTORICO_PARQUET_DIR>/mes=YYYY-MM/datos.parquet
+    <HISTORICO_PARQUET_DIR>/_manifiesto.json
+
+Los textos repetitivos (región, proveedor, nombre de cotización, producto) se
+guardan con dictionary encoding y los números con tipos fijos. Las filas se
+ordenan por región y fecha para que las estadísticas de cada row group
+permitan descartar bloques completos al filtrar.
+
+El lector (leer_historico) aplica predicate pushdown sobre región, rango de
+fechas y es_ganador: se podan meses completos por la partición y row groups
+por estadísticas, sin tocar Postgres.
+
+Uso (mantenimiento):
+    python src/parquet_historico.py                 # exporta meses nuevos o reimportados
+    python src/parquet_historico.py --mes 2025-06   # fuerza un mes
+    python src/parquet_historico.py --force         # reexporta todo
+"""
+import os
+import re
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import database_extended as db
+from canonizacion import quitar_tildes
+
+logger = logging.getLogger(__name__)
+
+PARQUET_DIR = os.getenv('HISTORICO_PARQUET_DIR', 'data/historico_parquet')
+
+# Filas leídas de la BD por lote (y tamaño de row group en el archivo)
+FILAS_POR_LOTE = int(os.getenv('HISTORICO_PARQUET_LOTE', '100000'))
+
+_TEXTO_DICT = pa.dictionary(pa.int32(), pa.string())
+
+ESQUEMA = pa.schema([
+    ('codigo_cotizacion', _TEXTO_DICT),
+    ('nombre_cotizacion', _TEXTO_DICT),
+    ('region', _TEXTO_DICT),
+    ('rut_proveedor', _TEXTO_DICT),
+    ('nombre_proveedor', _TEXTO_DICT),
+    ('producto_cotizado', _TEXTO_DICT),
+    ('cantidad', pa.int64()),
+    ('monto_total', pa.int64()),
+    ('detalle_oferta', pa.string()),
+    ('es_ganador', pa.bool_()),
+    ('fecha_cierre', pa.date32()),
+])
+
+COLUMNAS = tuple(ESQUEMA.names)
+
+_PARTICIONADO = ds.partitioning(pa.schema([('mes', pa.string())]), flavor='hive')
+
+_MANIFIESTO = '_manifiesto.json'
+_ARCHIVO = 'datos.parquet'
+
+# Palabras que no aportan al prefiltro de texto
+_PALABRAS_VACIAS = {
+    'de', 'la', 'el', 'en', 'y', 'los', 'del', 'las', 'por', 'un', 'para',
+    'con', 'una', 'al', 'sin', 'que',
+}
+_VOCALES = {'a': '[aá]', 'e': '[eé]', 'i': '[ií]', 'o': '[oó]', 'u': '[uúü]', 'n': '[nñ]'}
+
+
+# ==================== UTILIDADES ====================
+
+def _rango_mes(mes):
+    import particiones_historico as ph
+    return ph.rango_mes(mes)
+
+
+def _mes_de(fecha):
+    return f"{fecha.year}-{fecha.month:02d}"
+
+
+def _meses_entre(inicio, fin):
+    """Meses 'YYYY-MM' desde la fecha inicio hasta la fecha fin (inclusive)."""
+    meses = []
+    anio, mes = inicio.year, inicio.month
+    while (anio, mes) <= (fin.year, fin.month):
+        meses.append(f"{anio}-{mes:02d}")
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return meses
+
+
+def _como_fecha(valor):
+    if valor is None or isinstance(valor, date) and not isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, datetime):
+        return valor.date()
+    return date.fromisoformat(str(valor)[:10])
+
+
+def _ruta_mes(directorio, mes):
+    return os.path.join(directorio, f"mes={mes}", _ARCHIVO)
+
+
+def leer_manifiesto(directorio=None):
+    """Retorna {mes: {filas, regiones, exportado, origen}} de los meses exportados."""
+    ruta = os.path.join(directorio or PARQUET_DIR, _MANIFIESTO)
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _guardar_manifiesto(directorio, manifiesto):
+    ruta = os.path.join(directorio, _MANIFIESTO)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=1, sort_keys=True)
+    os.replace(temporal, ruta)
+
+
+# ==================== EXPORTACIÓN ====================
+
+def _lotes_mes(conn, mes):
+    """Itera lotes de filas del mes, ordenadas por región y fecha."""
+    inicio, fin = _rango_mes(mes)
+    p = db.get_placeholder()
+    query = f"""
+        SELECT {', '.join(COLUMNAS)}
+        FROM historico_licitaciones
+        WHERE fecha_cierre >= {p} AND fecha_cierre < {p}
+        ORDER BY region, fecha_cierre
+    """
+    if db.USE_POSTGRES:
+        # Cursor del lado del servidor: no materializa el mes completo en memoria
+        cursor = conn.cursor(name=f"parquet_{mes.replace('-', '_')}")
+        cursor.itersize = FILAS_POR_LOTE
+    else:
+        cursor = conn.cursor()
+    cursor.execute(query, (inicio.isoformat(), fin.isoformat()))
+    try:
+        while True:
+            filas = cursor.fetchmany(FILAS_POR_LOTE)
+            if not filas:
+                break
+            yield filas
+    finally:
+        cursor.close()
+
+
+def _tabla_desde_filas(filas):
+    columnas = list(zip(*filas))
+    arreglos = []
+    for i, campo in enumerate(ESQUEMA):
+        valores = columnas[i]
+        if campo.name == 'es_ganador':
+            valores = [None if v is None else bool(v) for v in valores]
+        elif campo.name == 'fecha_cierre':
+            valores = [_como_fecha(v) for v in valores]
+        tipo = campo.type.value_type if pa.types.is_dictionary(campo.type) else campo.type
+        arreglo = pa.array(valores, type=tipo)
+        if pa.types.is_dictionary(campo.type):
+            arreglo = arreglo.dictionary_encode()
+        arreglos.append(arreglo)
+    return pa.Table.from_arrays(arreglos, schema=ESQUEMA)
+
+
+def exportar_mes(conn, mes, directorio=None):
+    """
+    Exporta un mes a Parquet (escritura atómica vía archivo temporal).
+
+    Returns:
+        Dict con filas exportadas y regiones presentes en el mes
+    """
+    directorio = directorio or PARQUET_DIR
+    ruta = _ruta_mes(directorio, mes)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    # Prefijo '.' para que el dataset ignore el archivo mientras se escribe
+    temporal = os.path.join(os.path.dirname(ruta), f".{_ARCHIVO}.tmp")
+
+    filas = 0
+    regiones = set()
+    writer = None
+    try:
+        for lote in _lotes_mes(conn, mes):
+            tabla = _tabla_desde_filas(lote)
+            if writer is None:
+                writer = pq.ParquetWriter(temporal, ESQUEMA, compression='zstd')
+            writer.write_table(tabla, row_group_size=FILAS_POR_LOTE)
+            filas += tabla.num_rows
+            regiones.update(r for r in tabla.column('region').chunk(0).dictionary.to_pylist() if r)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if filas:
+        os.replace(temporal, ruta)
+    else:
+        # Mes vacío en la BD: no dejar datos obsoletos en el espejo
+        for archivo in (ruta, temporal):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+
+    logger.info(f"[{mes}] {filas:,} filas exportadas a Parquet")
+    return {'filas': filas, 'regiones': sorted(regiones)}
+
+
+def _meses_en_bd(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(fecha_cierre), MAX(fecha_cierre) FROM historico_licitaciones")
+    minimo, maximo = cursor.fetchone()
+    if minimo is None:
+        return []
+    return _meses_entre(_como_fecha(minimo), _como_fecha(maximo))
+
+
+def _versiones_importacion(conn):
+    """{mes: marca} de historico_importaciones; cambia cada vez que un mes se reimporta."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT mes, actualizado FROM historico_importaciones WHERE estado = 'completado'")
+    return {mes: str(actualizado) for mes, actualizado in cursor.fetchall()}
+
+
+def meses_a_exportar(meses, manifiesto, versiones, force=False):
+    """
+    Decide qué meses exportar.
+
+    Un mes se exporta si no está en el espejo, o si fue reimportado después de
+    la última exportación (su marca en historico_importaciones cambió).
+    """
+    if force:
+        return list(meses)
+    pendientes = []
+    for mes in meses:
+        entrada = manifiesto.get(mes)
+        if entrada is None or (mes in versiones and entrada.get('origen') != versiones[mes]):
+            pendientes.append(mes)
+    return pendientes
+
+
+def sincronizar(meses: Optional[Iterable[str]] = None, force: bool = False,
+                directorio: Optional[str] = None) -> Dict[str, int]:
+    """
+    Pone al día el espejo Parquet.
+
+    Args:
+        meses: Meses a considerar (por defecto, todos los presentes en la BD)
+        force: Reexportar aunque el espejo esté al día
+        directorio: Directorio del espejo (por defecto HISTORICO_PARQUET_DIR)
+
+    Returns:
+        {mes: filas} de los meses exportados
+    """
+    directorio = directorio or PARQUET_DIR
+    os.makedirs(directorio, exist_ok=True)
+    manifiesto = leer_manifiesto(directorio)
+
+    conn = db.get_connection()
+    try:
+        meses = list(meses) if meses is not None else _meses_en_bd(conn)
+        versiones = _versiones_importacion(conn)
+        pendientes = meses_a_exportar(meses, manifiesto, versiones, force=force)
+        logger.info(f"Espejo Parquet: {len(pendientes)} de {len(meses)} meses por exportar")
+
+        exportados = {}
+        for mes in pendientes:
+            resultado = exportar_mes(conn, mes, directorio)
+            if resultado['filas']:
+                manifiesto[mes] = {
+                    'filas': resultado['filas'],
+                    'regiones': resultado['regiones'],
+                    'exportado': datetime.now().isoformat(timespec='seconds'),
+                    'origen': versiones.get(mes),
+                }
+            else:
+                manifiesto.pop(mes, None)
+            exportados[mes] = resultado['filas']
+            # Guardar tras cada mes: una interrupción no pierde lo ya exportado
+            _guardar_manifiesto(directorio, manifiesto)
+    finally:
+        conn.close()
+
+    return exportados
+
+
+# ==================== LECTURA ====================
+
+def dataset(directorio: Optional[str] = None) -> ds.Dataset:
+    """Dataset Arrow del espejo, con la partición 'mes' como columna."""
+    return ds.dataset(directorio or PARQUET_DIR, format='parquet', partitioning=_PARTICIONADO)
+
+
+def disponible(directorio: Optional[str] = None) -> bool:
+    """True si el espejo tiene al menos un mes exportado."""
+    return bool(leer_manifiesto(directorio))
+
+
+def _regiones_exactas(region, manifiesto):
+    """
+    Resuelve la región (sin distinguir mayúsculas, como UPPER(region) = UPPER(%s))
+    a los valores exactos guardados, para filtrar por igualdad y aprovechar estadísticas.
+    """
+    buscadas = {r.upper() for r in ([region] if isinstance(region, str) else region)}
+    conocidas = {r for entrada in manifiesto.values() for r in entrada.get('regiones', [])}
+    return sorted(r for r in conocidas if r.upper() in buscadas)
+
+
+def filtro_historico(
+    region: Optional[Union[str, List[str]]] = None,
+    desde: Optional[Union[date, str]] = None,
+    hasta: Optional[Union[date, str]] = None,
+    es_ganador: Optional[bool] = None,
+    directorio: Optional[str] = None
+) -> Optional[ds.Expression]:
+    """
+    Construye la expresión de filtro con pushdown.
+
+    Args:
+        region: Región o lista de regiones
+        desde: Fecha de cierre mínima (inclusive)
+        hasta: Fecha de cierre máxima (exclusiva)
+        es_ganador: Filtrar solo ganadoras (True) o perdedoras (False)
+    """
+    condiciones = []
+
+    if region:
+        exactas = _regiones_exactas(region, leer_manifiesto(directorio))
+        condiciones.append(ds.field('region').isin(pa.array(exactas, type=pa.string())))
+
+    if desde is not None:
+        inicio: date = _como_fecha(desde)
+        condiciones.append(ds.field('mes') >= _mes_de(inicio))
+        condiciones.append(ds.field('fecha_cierre') >= pa.scalar(inicio, pa.date32()))
+
+    if hasta is not None:
+        fin: date = _como_fecha(hasta)
+        condiciones.append(ds.field('mes') <= _mes_de(fin - timedelta(days=1)))
+        condiciones.append(ds.field('fecha_cierre') < pa.scalar(fin, pa.date32()))
+
+    if es_ganador is not None:
+        condiciones.append(ds.field('es_ganador') == es_ganador)
+
+    if not condiciones:
+        return None
+    filtro = condiciones[0]
+    for condicion in condiciones[1:]:
+        filtro = filtro & condicion
+    return filtro
+
+
+def filtro_texto(texto: str, columnas: Iterable[str] = ('producto_cotizado',)) -> Optional[ds.Expression]:
+    """
+    Prefiltro barato por palabras: la fila debe contener alguna palabra del texto
+    (sin distinguir mayúsculas ni tildes) en alguna de las columnas.
+
+    Sirve para acotar candidatos antes del fuzzy matching en memoria.
+    """
+    texto = quitar_tildes(texto)
+    palabras = [
+        p for p in re.findall(r'[a-z0-9]+', texto)
+        if len(p) >= 3 and p not in _PALABRAS_VACIAS
+    ]
+    if not palabras:
+        return None
+
+    patron = '|'.join(''.join(_VOCALES.get(c, c) for c in p) for p in palabras)
+    filtro = None
+    for columna in columnas:
+        # Las columnas dictionary se comparan sobre sus valores de texto
+        valores = ds.field(columna).cast(pa.string())
+        condicion = pc.match_substring_regex(valores, patron, ignore_case=True)
+        filtro = condicion if filtro is None else filtro | condicion
+    return filtro
+
+
+def leer_historico(
+    columnas: Optional[List[str]] = None,
+    region: Optional[Union[str, List[str]]] = None,
+    desde: Optional[Union[date, str]] = None,
+    hasta: Optional[Union[date, str]] = None,
+    es_ganador: Optional[bool] = None,
+    filtro: Optional[ds.Expression] = None,
+    categorias: bool = True,
+    directorio: Optional[str] = None
+):
+    """
+    Lee el histórico desde el espejo Parquet con predicate pushdown.
+
+    Args:
+        columnas: Columnas a leer (por defecto todas); solo se leen esas del disco
+        region, desde, hasta, es_ganador: Ver filtro_historico
+        filtro: Expresión adicional (p. ej. filtro_texto o umbrales de monto)
+        categorias: Si False, los textos se entregan como str en vez de category
+                    (mismo formato que pd.read_sql)
+
+    Returns:
+        DataFrame de pandas
+    """
+    base = filtro_historico(region, desde, hasta, es_ganador, directorio)
+    if filtro is not None:
+        base = filtro if base is None else base & filtro
+
+    tabla = dataset(directorio).to_table(columns=columnas, filter=base)
+
+    if not categorias:
+        esquema = pa.schema([
+            campo.with_type(campo.type.value_type) if pa.types.is_dictionary(campo.type) else campo
+            for campo in tabla.schema
+        ])
+        tabla = tabla.cast(esquema)
+
+    return tabla.to_pandas()
+
+
+def main():
+    import argparse
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Espejo Parquet del histórico")
+    parser.add_argument("--mes", action="append", help="Mes a exportar (YYYY-MM); repetible")
+    parser.add_argument("--directorio", help="Directorio del espejo")
+    parser.add_argument("--force", action="store_true", help="Reexportar aunque esté al día")
+    args = parser.parse_args()
+
+    exportados = sincronizar(args.mes, force=args.force or bool(args.mes), directorio=args.directorio)
+    logger.info(f"Meses exportados: {len(exportados)} | Filas: {sum(exportados.values()):,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Cargas mensuales atómicas sobre historico_licitaciones particionada.
+
+Requiere el layout creado por scripts/partition_historico.py (particiones
+RANGE mensuales historico_licitaciones_YYYY_MM). Cada mes se carga en una
+tabla de staging independiente, se indexa y analiza fuera de línea, y luego
+se intercambia por la partición del mes en una sola transacción:
+
+    DETACH + DROP partición anterior -> RENAME staging -> ATTACH
+
+Los lectores nunca ven meses a medio cargar ni particiones sin índices, y
+re-importar un mes reemplaza sus datos en vez de duplicarlos.
+
+Con el esquema normalizado (dimensiones_historico) las particiones cuelgan de
+historico_ofertas: el staging se carga con filas crudas y se traduce a claves
+de dimensión antes de indexarlo.
+"""
+import os
+import re
+import logging
+from datetime import date
+import database_extended as db
+import dimensiones_historico as dim
+
+logger = logging.getLogger(__name__)
+
+TABLA_HISTORICO = 'historico_licitaciones'
+
+# Espera máxima por el lock del intercambio (evita encolar lectores detrás)
+SWAP_LOCK_TIMEOUT = os.getenv('HISTORICO_SWAP_LOCK_TIMEOUT', '30s')
+
+_MES_RE = re.compile(r'^(\d{4})-(\d{2})$')
+_INDEXDEF_RE = re.compile(r'^CREATE (UNIQUE )?INDEX \S+ ON (?:ONLY )?\S+ ')
+
+
+def rango_mes(mes):
+    """
+    Retorna (inicio, fin) del mes 'YYYY-MM' como fechas [inicio, fin).
+
+    Raises:
+        ValueError: si el formato del mes no es válido
+    """
+    match = _MES_RE.match(mes or '')
+    if not match:
+        raise ValueError(f"Mes inválido (se espera YYYY-MM): {mes}")
+    anio, numero = int(match.group(1)), int(match.group(2))
+    inicio = date(anio, numero, 1)
+    fin = date(anio + 1, 1, 1) if numero == 12 else date(anio, numero + 1, 1)
+    return inicio, fin
+
+
+def nombre_particion(mes, padre=TABLA_HISTORICO):
+    """Nombre de la partición del mes, igual al de scripts/partition_historico.py."""
+    inicio, _ = rango_mes(mes)
+    return f"{padre}_{inicio.year}_{inicio.month:02d}"
+
+
+def nombre_staging(mes, padre=TABLA_HISTORICO):
+    return f"{nombre_particion(mes, padre)}_staging"
+
+
+def tabla_padre(conn):
+    """Tabla particionada que recibe las particiones mensuales."""
+    return dim.tabla_fisica(conn) if db.USE_POSTGRES else TABLA_HISTORICO
+
+
+def esta_particionada(conn):
+    """True si la tabla del histórico está particionada (solo PostgreSQL)."""
+    if not db.USE_POSTGRES:
+        return False
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table
+            WHERE partrelid = to_regclass(%s)
+        )
+    """, (tabla_padre(conn),))
+    return cursor.fetchone()[0]
+
+
+def particion_existe(conn, mes):
+    """Consulta el catálogo: ¿existe la partición del mes adjunta al padre?"""
+    padre = tabla_padre(conn)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1
+            FROM pg_inherits
+            WHERE inhparent = to_regclass(%s)
+            AND inhrelid = to_regclass(%s)
+        )
+    """, (padre, nombre_particion(mes, padre)))
+    return cursor.fetchone()[0]
+
+
+def particion_tiene_datos(conn, mes):
+    """
+    Verifica si el mes ya fue cargado usando solo metadatos de particiones.
+
+    Reemplaza el COUNT(*) con TO_CHAR(fecha_cierre, ...) sobre toda la tabla:
+    se consulta el catálogo y, si la partición existe, se lee a lo sumo una fila.
+    """
+    if not particion_existe(conn, mes):
+        return False
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {nombre_particion(mes, tabla_padre(conn))})")
+    return cursor.fetchone()[0]
+
+
+def mes_tiene_datos(conn, mes):
+    """¿Hay datos cargados para el mes? Usa el catálogo si la tabla está particionada."""
+    if esta_particionada(conn):
+        return particion_tiene_datos(conn, mes)
+    inicio, fin = rango_mes(mes)
+    p = db.get_placeholder()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT EXISTS (
+            SELECT 1 FROM {TABLA_HISTORICO}
+            WHERE fecha_cierre >= {p} AND fecha_cierre < {p}
+        )
+    """, (inicio.isoformat(), fin.isoformat()))
+    return bool(cursor.fetchone()[0])
+
+
+def crear_staging(conn, mes):
+    """
+    Crea (o recrea) la tabla de staging del mes con las columnas de historico_licitaciones.
+
+    Con el esquema normalizado historico_licitaciones es la vista: el staging
+    recibe filas crudas y preparar_staging() lo traduce a claves.
+    """
+    staging = nombre_staging(mes, tabla_padre(conn))
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    cursor.execute(f"""
+        CREATE TABLE {staging}
+        (LIKE {TABLA_HISTORICO} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    """)
+    conn.commit()
+    logger.info(f"Tabla de staging creada: {staging}")
+    return staging
+
+
+def reescribir_indexdef(indexdef, nombre, tabla):
+    """Adapta la definición de un índice del padre para crearlo en otra tabla."""
+    return _INDEXDEF_RE.sub(lambda m: f"CREATE {m.group(1) or ''}INDEX {nombre} ON {tabla} ", indexdef, count=1)
+
+
+def preparar_staging(conn, mes):
+    """
+    Deja la tabla de staging lista para adjuntarse como partición del mes.
+
+    - Con el esquema normalizado, traduce las filas crudas a claves de dimensión
+    - Descarta filas fuera del rango del mes (o sin fecha), que no caben en la partición
+    - Agrega un CHECK con los límites de la partición para que el ATTACH no escanee
+    - Crea los mismos índices que tiene el padre (el ATTACH los reutiliza)
+    - Ejecuta ANALYZE
+
+    Returns:
+        Cantidad de filas descartadas por estar fuera del mes
+    """
+    padre = tabla_padre(conn)
+    staging = nombre_staging(mes, padre)
+    inicio, fin = rango_mes(mes)
+    cursor = conn.cursor()
+
+    if padre != TABLA_HISTORICO:
+        dim.convertir_carga(conn, staging, f"{staging}_k")
+
+    cursor.execute(f"""
+        DELETE FROM {staging}
+        WHERE fecha_cierre IS NULL OR fecha_cierre < %s OR fecha_cierre >= %s
+    """, (inicio, fin))
+    descartadas = cursor.rowcount
+    if descartadas:
+        logger.warning(f"{descartadas:,} filas con fecha_cierre fuera de {mes} descartadas")
+
+    cursor.execute(f"""
+        ALTER TABLE {staging} ADD CONSTRAINT {staging}_rango
+        CHECK (fecha_cierre IS NOT NULL AND fecha_cierre >= %s AND fecha_cierre < %s)
+    """, (inicio, fin))
+    conn.commit()
+
+    cursor.execute("""
+        SELECT pg_get_indexdef(indexrelid)
+        FROM pg_index
+        WHERE indrelid = to_regclass(%s)
+        ORDER BY indexrelid
+    """, (padre,))
+    definiciones = [row[0] for row in cursor.fetchall()]
+
+    for i, indexdef in enumerate(definiciones, 1):
+        sql = reescribir_indexdef(indexdef, f"{staging}_idx{i}", staging)
+        logger.info(f"Creando índice {i}/{len(definiciones)} en staging...")
+        cursor.execute(sql)
+        conn.commit()
+
+    cursor.execute(f"ANALYZE {staging}")
+    conn.commit()
+    return descartadas
+
+
+def intercambiar_particion(conn, mes):
+    """
+    Reemplaza atómicamente la partición del mes por la tabla de staging.
+
+    Todo ocurre en una transacción: si algo falla, la partición anterior
+    queda intacta y el staging se conserva para inspección.
+    """
+    padre = tabla_padre(conn)
+    staging = nombre_staging(mes, padre)
+    particion = nombre_particion(mes, padre)
+    inicio, fin = rango_mes(mes)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+
+        if particion_existe(conn, mes):
+            cursor.execute(f"ALTER TABLE {padre} DETACH PARTITION {particion}")
+            cursor.execute(f"DROP TABLE {particion}")
+        else:
+            cursor.execute(f"DROP TABLE IF EXISTS {particion}")
+
+        cursor.execute(f"ALTER TABLE {staging} RENAME TO {particion}")
+        cursor.execute(f"""
+            ALTER TABLE {padre} ATTACH PARTITION {particion}
+            FOR VALUES FROM (%s) TO (%s)
+        """, (inicio, fin))
+        # El CHECK ya cumplió su función (evitar el escaneo del ATTACH)
+        cursor.execute(f"ALTER TABLE {particion} DROP CONSTRAINT {staging}_rango")
+
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = to_regclass(%s) AND c.relname LIKE %s
+        """, (particion, f"{staging}_idx%"))
+        for (indice,) in cursor.fetchall():
+            cursor.execute(f"ALTER INDEX {indice} RENAME TO {indice.replace(staging, particion)}")
+
+        conn.commit()
+        logger.info(f"Partición {particion} reemplazada atómicamente")
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def importar_mes_atomico(mes, url, workers=None, usar_cache=True):
+    """
+    Importa un mes completo vía staging + intercambio atómico de partición.
+
+    Returns:
+        Dict con registros cargados, descartados y si se reemplazó un mes previo
+    """
+    import importar_historico as ih
+
+    conn = db.get_connection()
+    try:
+        if not esta_particionada(conn):
+            raise RuntimeError(
+                f"{TABLA_HISTORICO} no está particionada; ejecuta scripts/partition_historico.py"
+            )
+        reemplaza = particion_tiene_datos(conn, mes)
+        staging = crear_staging(conn, mes)
+    finally:
+        conn.close()
+
+    registros = ih.descargar_y_procesar(
+        url, usar_cache=usar_cache, workers=workers, tabla=staging
+    )
+
+    conn = db.get_connection()
+    try:
+        descartadas = preparar_staging(conn, mes)
+        intercambiar_particion(conn, mes)
+    finally:
+        conn.close()
+
+    return {
+        'mes': mes,
+        'registros': registros - descartadas,
+        'descartados': descartadas,
+        'reemplazo': reemplaza,
+    }
@@ -0,0 +1,255 @@
+"""
+Pool de workers para el cómputo ML (pandas + similitud fuzzy) fuera del
+event loop.
+
+calcular_precio_optimo, buscar_casos_similares y compañía son CPU-bound:
+llamados directo desde un handler async bloquean uvicorn (o el bot) durante
+todo el request. Aquí se ejecutan en un pool de procesos compartido por la
+API, los comandos ML del bot y las ramas del análisis completo (enviar/esperar
+desde código síncrono):
+
+- Cola acotada: sobre POOL_ML_WORKERS + POOL_ML_MAX_COLA tareas en curso se
+  rechaza con PoolSaturado (la API responde 503) en vez de acumular espera.
+- Timeout por tarea: pasado POOL_ML_TIMEOUT el cliente recibe TimeoutError;
+  la tarea ya iniciada termina en su worker y sigue contando en la cola.
+- Métricas: profundidad de la cola, tiempo de espera y tareas por resultado
+  (metrics_server).
+
+Los workers se crean con 'spawn' (sin heredar conexiones del pool de BD ni
+hilos del proceso padre) y cada uno mantiene sus propios índices (el de
+productos se precarga al crear el proceso) y cachés locales; los análisis de mercado y los enriquecimientos RAG se comparten
+entre workers a través de Redis cuando está disponible.
+Con POOL_ML_WORKERS=0 se usan hilos del mismo proceso (tests, desarrollo).
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Procesos del pool (0 = hilos en el mismo proceso)
+POOL_ML_WORKERS = int(os.getenv('POOL_ML_WORKERS', '2'))
+
+# Tareas que pueden esperar worker libre antes de rechazar
+POOL_ML_MAX_COLA = int(os.getenv('POOL_ML_MAX_COLA', '16'))
+
+# Segundos que un cliente espera el resultado de una tarea
+POOL_ML_TIMEOUT = float(os.getenv('POOL_ML_TIMEOUT', '30'))
+
+# Tareas por proceso antes de reemplazarlo (acota fugas de memoria; 0 = sin límite)
+POOL_ML_TAREAS_POR_WORKER = int(os.getenv('POOL_ML_TAREAS_POR_WORKER', '500'))
+
+_executor = None
+_lock = threading.Lock()
+_en_curso = 0
+
+
+class PoolSaturado(Exception):
+    """La cola del pool ML está llena."""
+
+
+def _metricas():
+    """Métricas del pool (None si metrics_server no está disponible)."""
+    try:
+        from metrics_server import ml_pool_espera, ml_pool_profundidad, ml_pool_tareas
+        return ml_pool_profundidad, ml_pool_espera, ml_pool_tareas
+    except Exception:
+        return None
+
+
+def _contar_tarea(tipo: str, estado: str):
+    metricas = _metricas()
+    if metricas:
+        metricas[2].labels(task_type=tipo, status=estado).inc()
+
+
+def _ajustar_cola(delta: int, maximo: Optional[int] = None) -> bool:
+    """
+    Suma delta a las tareas en curso y actualiza la métrica de profundidad.
+
+    Con `maximo` no suma (y devuelve False) si la cola ya está llena.
+    """
+    global _en_curso
+    with _lock:
+        if maximo is not None and _en_curso >= maximo:
+            return False
+        _en_curso += delta
+        profundidad = _en_curso
+    metricas = _metricas()
+    if metricas:
+        metricas[0].set(profundidad)
+    return True
+
+
+def _iniciar_worker():
+    """
+    Corre al crear cada proceso: carga el snapshot del índice de productos
+    para que la primera tarea del worker no pague esa lectura.
+    """
+    try:
+        import indice_productos
+        indice_productos.obtener()
+    except Exception as e:
+        logger.warning(f"No se pudo precargar el índice de productos en el worker: {e}")
+
+
+def _ejecutar_en_worker(funcion: Callable, args: tuple, kwargs: dict):
+    """Corre en el worker: devuelve cuándo empezó (para medir la espera) y el resultado."""
+    return time.time(), funcion(*args, **kwargs)
+
+
+def _obtener_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            if POOL_ML_WORKERS > 0:
+                _executor = ProcessPoolExecutor(
+                    max_workers=POOL_ML_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_iniciar_worker,
+                    max_tasks_per_child=POOL_ML_TAREAS_POR_WORKER or None
+                )
+                logger.info(f"Pool ML iniciado con {POOL_ML_WORKERS} procesos")
+            else:
+                _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pool_ml')
+        return _executor
+
+
+def capacidad() -> int:
+    """Máximo de tareas en curso (en ejecución + en cola)."""
+    return max(POOL_ML_WORKERS, 1) + POOL_ML_MAX_COLA
+
+
+def en_curso() -> int:
+    """Tareas encoladas o en ejecución."""
+    return _en_curso
+
+
+class Tarea(NamedTuple):
+    """Tarea enviada al pool con enviar()."""
+    futuro: Future
+    tipo: str
+    encolado: float
+
+
+def enviar(funcion: Callable, *args, tipo: str = 'ml', **kwargs) -> Tarea:
+    """
+    Encola funcion(*args, **kwargs) en el pool sin esperar su resultado.
+
+    Para código síncrono (hilos del análisis del bot); el resultado se
+    obtiene con esperar(). Misma cola acotada y métricas que ejecutar().
+
+    Raises:
+        PoolSaturado: Si la cola está llena
+    """
+    global _executor
+    if not _ajustar_cola(1, maximo=capacidad()):
+        _contar_tarea(tipo, 'rejected')
+        raise PoolSaturado(f"Pool ML saturado ({_en_curso} tareas en curso)")
+
+    encolado = time.time()
+    executor = _obtener_executor()
+    try:
+        try:
+            futuro = executor.submit(_ejecutar_en_worker, funcion, args, kwargs)
+        except (BrokenProcessPool, RuntimeError) as e:
+            # Un worker murió (OOM, señal): se descarta el pool y se recrea
+            logger.error(f"Pool ML inutilizable, se recrea: {e}")
+            with _lock:
+                if _executor is executor:
+                    _executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            futuro = _obtener_executor().submit(_ejecutar_en_worker, funcion, args, kwargs)
+    except Exception:
+        _ajustar_cola(-1)
+        raise
+
+    # La tarea sale de la cola cuando termina, aunque el cliente ya no espere
+    futuro.add_done_callback(lambda _: _ajustar_cola(-1))
+    return Tarea(futuro, tipo, encolado)
+
+
+def _registrar_resultado(tarea: Tarea, inicio: float):
+    _contar_tarea(tarea.tipo, 'ok')
+    metricas = _metricas()
+    if metricas:
+        metricas[1].labels(task_type=tarea.tipo).observe(max(inicio - tarea.encolado, 0.0))
+
+
+def esperar(tarea: Tarea, timeout: Optional[float] = None) -> Any:
+    """
+    Espera (bloqueando el hilo) el resultado de una tarea de enviar().
+
+    Pasado el plazo se cancela si aún no empezó; si ya corre termina en su
+    worker y sigue contando en la cola.
+
+    Raises:
+        TimeoutError: Si el resultado no llega a tiempo
+    """
+    espera = POOL_ML_TIMEOUT if timeout is None else timeout
+    try:
+        inicio, resultado = tarea.futuro.result(timeout=espera)
+    except FuturesTimeout:
+        tarea.futuro.cancel()
+        _contar_tarea(tarea.tipo, 'timeout')
+        logger.warning(f"Tarea ML '{tarea.tipo}' sin respuesta tras {espera:.1f}s")
+        raise
+    except Exception:
+        _contar_tarea(tarea.tipo, 'error')
+        raise
+    _registrar_resultado(tarea, inicio)
+    return resultado
+
+
+async def ejecutar(
+    funcion: Callable,
+    *args,
+    tipo: str = 'ml',
+    timeout: Optional[float] = None,
+    **kwargs
+) -> Any:
+    """
+    Ejecuta funcion(*args, **kwargs) en el pool y espera su resultado.
+
+    La función y sus argumentos deben poder serializarse con pickle
+    (funciones de módulo, no lambdas).
+
+    Args:
+        funcion: Función CPU-bound a ejecutar
+        tipo: Etiqueta para las métricas ('precio', 'rag', 'competencia', ...)
+        timeout: Segundos de espera máximos (por defecto POOL_ML_TIMEOUT)
+
+    Raises:
+        PoolSaturado: Si la cola está llena
+        TimeoutError: Si el resultado no llega a tiempo
+    """
+    espera = POOL_ML_TIMEOUT if timeout is None else timeout
+    tarea = enviar(funcion, *args, tipo=tipo, **kwargs)
+
+    try:
+        inicio, resultado = await asyncio.wait_for(asyncio.wrap_future(tarea.futuro), espera)
+    except asyncio.TimeoutError:
+        _contar_tarea(tipo, 'timeout')
+        logger.warning(f"Tarea ML '{tipo}' sin respuesta tras {espera}s")
+        raise
+    except Exception:
+        _contar_tarea(tipo, 'error')
+        raise
+
+    _registrar_resultado(tarea, inicio)
+    return resultado
+
+
+def cerrar():
+    """Detiene el pool (al apagar la API o el bot)."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
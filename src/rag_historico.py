@@ -2,52 +2,100 @@
 Sistema RAG (Retrieval Augmented Generation)
 Busca casos históricos similares para enriquecer análisis con IA
 """
+import os
+import copy
+import hashlib
+import json
+import math
+import threading
+import time
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import database_extended as db
-from fuzzywuzzy import fuzz
+import indice_productos
+import indice_tfidf
+import similitud
+import umbral_trgm
 import logging
+from canonizacion import columna_normalizada, normalizar_termino
 
 logger = logging.getLogger(__name__)
 
+# Recuperador de candidatos: 'indice' (tokens, indice_productos) o 'tfidf'
+# (trigramas de caracteres, indice_tfidf). Sin índice se usa pg_trgm.
+RAG_RECUPERADOR = os.getenv('RAG_RECUPERADOR', 'indice')
 
-def buscar_casos_similares(
-    nombre_licitacion: str,
-    monto_estimado: Optional[int] = None,
-    limite: int = 10,
-    umbral_similitud: int = 50
-) -> List[Dict]:
+
+COLUMNAS_CASOS = [
+    'codigo_cotizacion', 'nombre_cotizacion', 'producto_cotizado', 'region',
+    'rut_proveedor', 'nombre_proveedor', 'monto_total', 'cantidad',
+    'detalle_oferta', 'es_ganador', 'fecha_cierre',
+    'nombre_normalizado', 'producto_normalizado'
+]
+
+# Largo del detalle de oferta en los casos (se corta en SQL, no en Python)
+LARGO_DETALLE = 200
+
+# Columnas de la consulta: el detalle llega truncado desde la BD
+SELECT_CASOS = [
+    f"SUBSTR(detalle_oferta, 1, {LARGO_DETALLE}) AS detalle_oferta" if columna == 'detalle_oferta' else columna
+    for columna in COLUMNAS_CASOS
+]
+
+# Textos muy repetidos entre candidatos: categóricos al leer (menos memoria)
+DTYPES_CASOS = {
+    'region': 'category',
+    'nombre_proveedor': 'category',
+    'rut_proveedor': 'category',
+}
+
+# Caché de enriquecer_analisis_licitacion: Redis o, sin Redis, en el proceso.
+# El histórico cambia una vez al mes; la importación invalida la caché.
+ENRIQUECIMIENTO_TTL_SEGUNDOS = int(os.getenv('ENRIQUECIMIENTO_TTL_SEGUNDOS', '86400'))
+ENRIQUECIMIENTO_MAX_ENTRADAS = int(os.getenv('ENRIQUECIMIENTO_MAX_ENTRADAS', '256'))
+
+# Tramos logarítmicos de monto por década (4 = tramos de ~1.8x)
+TRAMOS_POR_DECADA = 4
+
+CLAVE_GENERACION = 'rag_enriquecido:generacion'
+
+
+def _candidatos_indice(nombre_licitacion: str, limite: int, recuperador: str):
+    """Ids candidatos del índice en memoria elegido (None si no está construido)."""
+    desde = datetime.now().date() - timedelta(days=3 * 365)
+    if recuperador == 'tfidf':
+        ids = indice_tfidf.candidatos(nombre_licitacion, limite=limite * 10, desde=desde)
+        if ids is not None:
+            return ids
+    return indice_productos.candidatos(
+        nombre_licitacion,
+        campos=('nombre', 'producto'),
+        limite=limite * 10,
+        desde=desde
+    )
+
+
+def _leer_casos_bd(nombre_licitacion: str, limite: int, recuperador: str = RAG_RECUPERADOR) -> pd.DataFrame:
     """
-    Busca licitaciones históricas similares para enriquecer el contexto.
-    
-    Args:
-        nombre_licitacion: Nombre/descripción de la licitación actual
-        monto_estimado: Monto estimado de la licitación (opcional)
-        limite: Número máximo de casos a retornar
-        umbral_similitud: Umbral mínimo de similitud textual (0-100)
-    
-    Returns:
-        Lista de diccionarios con casos similares rankeados
+    Candidatos desde la BD.
+
+    Con un índice en memoria solo se leen por id las filas que este propone;
+    sin índice (o sin coincidencias) se usa pg_trgm en PostgreSQL y los
+    últimos registros en SQLite.
     """
+    ids = _candidatos_indice(nombre_licitacion, limite, recuperador)
+
+    conn = db.get_connection()
     try:
-        conn = db.get_connection()
-        
-        # Query para obtener datos históricos
-        query = """
-            SELECT 
-                codigo_cotizacion,
-                nombre_cotizacion,
-                producto_cotizado,
-                region,
-                rut_proveedor,
-                nombre_proveedor,
-                monto_total,
-                cantidad,
-                detalle_oferta,
-                es_ganador,
-                fecha_cierre
+        if ids is not None and len(ids):
+            df = indice_productos.leer_filas(conn, ids, SELECT_CASOS, dtype=DTYPES_CASOS)
+            return df[df['nombre_cotizacion'].notna()].reset_index(drop=True)
+
+        query = f"""
+            SELECT {', '.join(SELECT_CASOS)}
             FROM historico_licitaciones
             WHERE nombre_cotizacion IS NOT NULL
             AND monto_total > 0
@@ -57,59 +105,151 @@ def buscar_casos_similares(
 
         # Optimización PostgreSQL con pg_trgm
         if db.USE_POSTGRES:
-            # Query optimizada usando índices GIN trigram:
-            # - idx_hist_nombre_trgm para nombre_cotizacion
-            # - idx_hist_producto_trgm para producto_cotizado
-            # - idx_hist_rag_composite para filtros es_ganador, fecha, monto
-            query = """
-                SELECT
-                    codigo_cotizacion,
-                    nombre_cotizacion,
-                    producto_cotizado,
-                    region,
-                    rut_proveedor,
-                    nombre_proveedor,
-                    monto_total,
-                    cantidad,
-                    detalle_oferta,
-                    es_ganador,
-                    fecha_cierre,
+            # Dos búsquedas KNN (ORDER BY <-> LIMIT) sobre los índices GiST de
+            # términos canónicos, una por columna:
+            # - idx_hist_nombre_norm_gist para nombre_normalizado
+            # - idx_hist_producto_norm_gist para producto_normalizado
+            # Cada rama se detiene al juntar `limite` filas; un OR entre ambas
+            # columnas obligaría a leer y ordenar todas las coincidencias
+            columnas = ', '.join(SELECT_CASOS)
+            rama = f"""
+                (SELECT {columnas},
                     GREATEST(
-                        similarity(nombre_cotizacion, %s),
-                        similarity(COALESCE(producto_cotizado, ''), %s)
+                        similarity(nombre_normalizado, %(termino)s),
+                        similarity(COALESCE(producto_normalizado, ''), %(termino)s)
                     ) as score_similitud
                 FROM historico_licitaciones
-                WHERE (nombre_cotizacion %% %s OR producto_cotizado %% %s)
+                WHERE {{columna}} %% %(termino)s
                 AND nombre_cotizacion IS NOT NULL
                 AND monto_total > 0
                 AND fecha_cierre >= CURRENT_DATE - INTERVAL '3 years'
+                ORDER BY {{columna}} <-> %(termino)s
+                LIMIT %(limite)s)
+            """
+            query = f"""
+                {rama.format(columna='nombre_normalizado')}
+                UNION
+                {rama.format(columna='producto_normalizado')}
                 ORDER BY score_similitud DESC, fecha_cierre DESC
-                LIMIT %s
+                LIMIT %(limite)s
             """
-            params = (nombre_licitacion, nombre_licitacion, nombre_licitacion,
-                     nombre_licitacion, limite * 3)
-            df = pd.read_sql(query, conn, params=params)
+            limite_knn = umbral_trgm.acotar(limite * 3)
+            params = {
+                'termino': normalizar_termino(nombre_licitacion),
+                'limite': limite_knn
+            }
+            # Umbral de % ajustado por consulta hasta juntar suficientes casos
+            df = umbral_trgm.consultar(
+                conn, lambda: pd.read_sql(query, conn, params=params, dtype=DTYPES_CASOS),
+                limite=limite_knn
+            )
         else:
-            df = pd.read_sql(query, conn)
-
+            df = pd.read_sql(query, conn, dtype=DTYPES_CASOS)
+    finally:
         conn.close()
+    return df
+
+
+def _leer_casos_parquet(nombre_licitacion: str) -> pd.DataFrame:
+    """Candidatos desde el espejo Parquet: mismos filtros que la query SQL, con pushdown."""
+    import parquet_historico as ph_parquet
+    import pyarrow.dataset as ds
+
+    filtro = ds.field('nombre_cotizacion').is_valid() & (ds.field('monto_total') > 0)
+    filtro_texto = ph_parquet.filtro_texto(
+        nombre_licitacion, columnas=('nombre_cotizacion', 'producto_cotizado')
+    )
+    if filtro_texto is not None:
+        filtro = filtro & filtro_texto
+
+    # El espejo no guarda las columnas canónicas: se calculan al puntuar
+    return ph_parquet.leer_historico(
+        columnas=[columna for columna in COLUMNAS_CASOS if columna in ph_parquet.COLUMNAS],
+        desde=datetime.now().date() - timedelta(days=3 * 365),
+        filtro=filtro,
+        categorias=False
+    )
+
+
+def _nulos_a_none(serie: pd.Series) -> pd.Series:
+    """Serie de objetos con None en vez de NaN/NaT/NA (serializable a JSON)."""
+    return serie.astype(object).where(serie.notna(), None)
+
+
+def _materializar_casos(df: pd.DataFrame) -> List[Dict]:
+    """
+    Casos rankeados como lista de diccionarios.
+
+    Las columnas se convierten completas (operaciones vectorizadas) y los
+    registros salen de un solo to_dict('records'), sin recorrer filas.
+    """
+    monto = pd.to_numeric(df['monto_total'], errors='coerce').fillna(0)
+    cantidad = pd.to_numeric(df['cantidad'], errors='coerce').fillna(0)
+    precio_unitario = (monto / cantidad.where(cantidad > 0)).fillna(0)
+    detalle = df['detalle_oferta'] if 'detalle_oferta' in df else pd.Series('', index=df.index)
+
+    salida = pd.DataFrame({
+        'codigo': _nulos_a_none(df['codigo_cotizacion']),
+        'nombre': _nulos_a_none(df['nombre_cotizacion']),
+        'producto': _nulos_a_none(df['producto_cotizado']),
+        'proveedor': _nulos_a_none(df['nombre_proveedor']),
+        'rut_proveedor': _nulos_a_none(df['rut_proveedor']),
+        'monto': monto.astype('int64'),
+        'cantidad': cantidad.astype('int64'),
+        'precio_unitario': precio_unitario.astype('int64'),
+        'es_ganador': df['es_ganador'].astype('boolean').fillna(False).astype(bool),
+        'fecha_cierre': _nulos_a_none(df['fecha_cierre'].dt.strftime('%Y-%m-%d')),
+        'region': _nulos_a_none(df['region']),
+        'detalle': detalle.fillna('').astype(str).str.slice(0, LARGO_DETALLE),
+        'similitud': df['score_similitud'].astype(float).round(1),
+        'antiguedad_dias': _nulos_a_none(df['antiguedad_dias'].astype('Int64')),
+    })
+    return salida.to_dict('records')
+
+
+def buscar_casos_similares(
+    nombre_licitacion: str,
+    monto_estimado: Optional[int] = None,
+    limite: int = 10,
+    umbral_similitud: int = 50,
+    offline: bool = False,
+    recuperador: Optional[str] = None
+) -> List[Dict]:
+    """
+    Busca licitaciones históricas similares para enriquecer el contexto.
+    
+    Args:
+        nombre_licitacion: Nombre/descripción de la licitación actual
+        monto_estimado: Monto estimado de la licitación (opcional)
+        limite: Número máximo de casos a retornar
+        umbral_similitud: Umbral mínimo de similitud textual (0-100)
+        offline: Leer del espejo Parquet en vez de la BD (procesos batch)
+        recuperador: 'indice' o 'tfidf' (por defecto RAG_RECUPERADOR)
+    
+    Returns:
+        Lista de diccionarios con casos similares rankeados
+    """
+    try:
+        if offline:
+            df = _leer_casos_parquet(nombre_licitacion)
+        else:
+            df = _leer_casos_bd(nombre_licitacion, limite, recuperador or RAG_RECUPERADOR)
 
         if df.empty:
             logger.warning("No se encontraron datos históricos")
             return []
-        
-        # Calcular similitud con fuzzy matching
-        nombre_lower = nombre_licitacion.lower()
-        df['similitud_nombre'] = df['nombre_cotizacion'].apply(
-            lambda x: fuzz.token_set_ratio(nombre_lower, str(x).lower()) 
-            if pd.notna(x) else 0
-        )
-        
-        # También buscar similitud en producto
-        df['similitud_producto'] = df['producto_cotizado'].apply(
-            lambda x: fuzz.token_set_ratio(nombre_lower, str(x).lower())
-            if pd.notna(x) else 0
+
+        # Calcular similitud con fuzzy matching (nombre y producto en una sola
+        # pasada) sobre los términos canónicos
+        df['nombre_normalizado'] = columna_normalizada(df, 'nombre_cotizacion')
+        df['producto_normalizado'] = columna_normalizada(df, 'producto_cotizado')
+        puntajes = similitud.puntajes_columnas(
+            normalizar_termino(nombre_licitacion), df,
+            ['nombre_normalizado', 'producto_normalizado'],
+            processor=None
         )
+        df['similitud_nombre'] = puntajes['nombre_normalizado']
+        df['similitud_producto'] = puntajes['producto_normalizado']
         
         # Score combinado (70% nombre, 30% producto)
         df['score_similitud'] = (
@@ -146,25 +286,7 @@ def buscar_casos_similares(
             )
             df_filtrado = df_filtrado.nlargest(limite, 'score_ajustado')
         
-        # Convertir a lista de diccionarios
-        casos = []
-        for _, row in df_filtrado.iterrows():
-            casos.append({
-                'codigo': row['codigo_cotizacion'],
-                'nombre': row['nombre_cotizacion'],
-                'producto': row['producto_cotizado'],
-                'proveedor': row['nombre_proveedor'],
-                'rut_proveedor': row['rut_proveedor'],
-                'monto': int(row['monto_total']) if pd.notna(row['monto_total']) else 0,
-                'cantidad': int(row['cantidad']) if pd.notna(row['cantidad']) else 0,
-                'precio_unitario': int(row['monto_total'] / row['cantidad']) if row['cantidad'] > 0 else 0,
-                'es_ganador': bool(row['es_ganador']),
-                'fecha_cierre': row['fecha_cierre'].strftime('%Y-%m-%d') if pd.notna(row['fecha_cierre']) else None,
-                'region': row['region'],
-                'detalle': row['detalle_oferta'][:200] if pd.notna(row['detalle_oferta']) else '',
-                'similitud': round(row['score_similitud'], 1),
-                'antiguedad_dias': int(row['antiguedad_dias']) if pd.notna(row['antiguedad_dias']) else None
-            })
+        casos = _materializar_casos(df_filtrado)
         
         logger.info(f"Encontrados {len(casos)} casos similares para '{nombre_licitacion}'")
         return casos
@@ -322,6 +444,110 @@ def generar_insights_para_ia(casos: List[Dict]) -> str:
     return insights.strip()
 
 
+# ==================== CACHÉ DE ENRIQUECIMIENTO ====================
+
+# clave -> (creado, resultado), en orden LRU (solo sin Redis)
+_enriquecimientos: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+_enriquecimientos_lock = threading.Lock()
+
+
+def _redis():
+    """Cliente Redis compartido, o None si no está disponible."""
+    try:
+        import redis_cache
+    except Exception:
+        return None
+    return redis_cache.redis_client if redis_cache.REDIS_AVAILABLE else None
+
+
+def _tramo_monto(monto: Optional[int]) -> Optional[int]:
+    """Tramo logarítmico del monto (montos parecidos comparten caché)."""
+    if not monto or monto <= 0:
+        return None
+    return int(round(math.log10(monto) * TRAMOS_POR_DECADA))
+
+
+def _monto_del_tramo(tramo: Optional[int]) -> Optional[int]:
+    """Monto representativo de un tramo: el resultado no depende de quién llegó primero."""
+    return None if tramo is None else int(round(10 ** (tramo / TRAMOS_POR_DECADA)))
+
+
+def _version_historico(cliente) -> str:
+    """
+    Versión de los datos detrás de un enriquecimiento: generación de la
+    caché (invalidar_enriquecimiento) y snapshot del índice de productos,
+    que se reconstruye tras cada importación.
+    """
+    generacion = 0
+    if cliente is not None:
+        try:
+            generacion = int(cliente.get(CLAVE_GENERACION) or 0)
+        except Exception as e:
+            logger.warning(f"No se pudo leer la generación de la caché RAG: {e}")
+    indice = indice_productos.obtener()
+    return f"{generacion}:{indice.creado if indice is not None else '-'}"
+
+
+def _clave_enriquecimiento(termino: str, tramo: Optional[int], cliente) -> str:
+    digest = hashlib.sha1(termino.encode('utf-8')).hexdigest()[:20]
+    return (
+        f"rag_enriquecido:{_version_historico(cliente)}:{RAG_RECUPERADOR}:"
+        f"{'-' if tramo is None else tramo}:{digest}"
+    )
+
+
+def _leer_enriquecimiento(cliente, clave: str) -> Optional[Dict]:
+    if cliente is not None:
+        try:
+            valor = cliente.get(clave)
+            return json.loads(valor) if valor else None
+        except Exception as e:
+            logger.warning(f"Error leyendo caché RAG: {e}")
+            return None
+    with _enriquecimientos_lock:
+        entrada = _enriquecimientos.get(clave)
+        if entrada and time.monotonic() - entrada[0] < ENRIQUECIMIENTO_TTL_SEGUNDOS:
+            _enriquecimientos.move_to_end(clave)
+            return copy.deepcopy(entrada[1])
+    return None
+
+
+def _guardar_enriquecimiento(cliente, clave: str, resultado: Dict):
+    if cliente is not None:
+        try:
+            cliente.setex(clave, ENRIQUECIMIENTO_TTL_SEGUNDOS, json.dumps(resultado, default=str))
+        except Exception as e:
+            logger.warning(f"Error guardando caché RAG: {e}")
+        return
+    with _enriquecimientos_lock:
+        _enriquecimientos[clave] = (time.monotonic(), resultado)
+        _enriquecimientos.move_to_end(clave)
+        while len(_enriquecimientos) > ENRIQUECIMIENTO_MAX_ENTRADAS:
+            _enriquecimientos.popitem(last=False)
+
+
+def invalidar_enriquecimiento():
+    """
+    Invalida los enriquecimientos en caché (tras importar un mes).
+
+    En Redis sube la generación (las claves viejas expiran solas); en el
+    proceso se vacía la caché local.
+    """
+    cliente = _redis()
+    if cliente is not None:
+        try:
+            cliente.incr(CLAVE_GENERACION)
+        except Exception as e:
+            logger.warning(f"No se pudo invalidar la caché RAG: {e}")
+    limpiar_cache_enriquecimiento()
+
+
+def limpiar_cache_enriquecimiento():
+    """Descarta los enriquecimientos en caché de este proceso."""
+    with _enriquecimientos_lock:
+        _enriquecimientos.clear()
+
+
 # Función principal para integración con bot
 def enriquecer_analisis_licitacion(
     nombre_licitacion: str,
@@ -331,6 +557,10 @@ def enriquecer_analisis_licitacion(
     """
     Función principal que combina búsqueda + análisis + contexto.
     Lista para integrar con el análisis IA del bot.
+
+    El resultado se guarda en caché por texto canónico, tramo de monto y
+    versión del histórico: la misma licitación analizada por muchos
+    usuarios (o desde varios botones) se calcula una vez por importación.
     
     Returns:
         Dict con todo el contexto enriquecido
@@ -339,7 +569,27 @@ def enriquecer_analisis_licitacion(
     texto_busqueda = nombre_licitacion
     if descripcion:
         texto_busqueda += " " + descripcion[:200]
-    
+
+    termino = normalizar_termino(texto_busqueda)
+    if not termino or ENRIQUECIMIENTO_TTL_SEGUNDOS <= 0:
+        return _enriquecer(texto_busqueda, monto_estimado)
+
+    tramo = _tramo_monto(monto_estimado)
+    cliente = _redis()
+    clave = _clave_enriquecimiento(termino, tramo, cliente)
+    resultado = _leer_enriquecimiento(cliente, clave)
+    if resultado is not None:
+        logger.debug(f"Enriquecimiento RAG desde caché: {clave}")
+        return resultado
+
+    resultado = _enriquecer(texto_busqueda, _monto_del_tramo(tramo))
+    if resultado['tiene_datos']:
+        _guardar_enriquecimiento(cliente, clave, resultado)
+    return resultado
+
+
+def _enriquecer(texto_busqueda: str, monto_estimado: Optional[int]) -> Dict:
+    """Búsqueda + análisis + contexto, sin caché."""
     # Buscar casos similares
     casos = buscar_casos_similares(
         texto_busqueda, 
@@ -210,6 +210,46 @@ def cache_response_sync(
         return wrapper
     return decorator
 
+def cache_get_many(keys: list) -> list:
+    """
+    Lee varias claves en un solo viaje (MGET).
+
+    Returns:
+        Lista alineada con keys: valor deserializado o None si no está en cache
+    """
+    if not REDIS_AVAILABLE or not keys:
+        return [None] * len(keys)
+
+    try:
+        valores = redis_client.mget(keys)
+    except Exception as e:
+        logger.warning(f"Error leyendo cache: {e}")
+        return [None] * len(keys)
+
+    resultado = []
+    for valor in valores:
+        if valor:
+            _track_cache_hit()
+            resultado.append(json.loads(valor))
+        else:
+            _track_cache_miss()
+            resultado.append(None)
+    return resultado
+
+
+def cache_set_many(items: dict, ttl: Optional[timedelta] = None):
+    """Guarda varias claves con el mismo TTL en un solo viaje (pipeline)."""
+    if not REDIS_AVAILABLE or not items:
+        return
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.setex(key, ttl or CACHE_TTL.get('default', timedelta(minutes=15)), json.dumps(value, default=str))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Error guardando cache: {e}")
+
 def invalidate_cache(pattern: str):
     """
     Invalida cache por patrón
@@ -2,6 +2,7 @@ import os
 from datetime import datetime, timedelta
 import logging
 import importar_historico as ih
+import particiones_historico as ph
 
 # Configurar logging
 logging.basicConfig(
@@ -21,12 +22,57 @@ def build_month_str(target_month=None):
 def build_url(month_str):
     return f"https://transparenciachc.blob.core.windows.net/trnspchc/COT_{month_str}.zip"
 
+def actualizar_derivados(meses):
+    """
+    Actualiza las estructuras derivadas del histórico tras importar meses:
+    columnas canónicas de las filas anteriores a ellas, estadísticas de precio
+    de los términos importados, sketches de precio de los meses importados,
+    índice de productos, índice TF-IDF (si el RAG lo usa) y caché de
+    enriquecimiento RAG. Los errores se registran sin
+    abortar la importación.
+    """
+    try:
+        import canonizacion
+        canonizacion.rellenar()
+    except Exception as e:
+        logger.error(f"No se pudieron canonizar las filas pendientes del histórico: {e}")
+    try:
+        import estadisticas_precios
+        estadisticas_precios.reconstruir(meses)
+    except Exception as e:
+        logger.error(f"No se pudieron actualizar las estadísticas de precio: {e}")
+    try:
+        import sketches_precios
+        sketches_precios.reconstruir(meses)
+    except Exception as e:
+        logger.error(f"No se pudieron construir los sketches de precio: {e}")
+    try:
+        import indice_productos
+        indice_productos.refrescar()
+    except Exception as e:
+        logger.error(f"No se pudo reconstruir el índice de productos: {e}")
+    if os.getenv('RAG_RECUPERADOR', 'indice') == 'tfidf':
+        try:
+            import indice_tfidf
+            indice_tfidf.refrescar()
+        except Exception as e:
+            logger.error(f"No se pudo reconstruir el índice TF-IDF: {e}")
+    try:
+        import rag_historico
+        rag_historico.invalidar_enriquecimiento()
+    except Exception as e:
+        logger.error(f"No se pudo invalidar la caché de enriquecimiento RAG: {e}")
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="Importación mensual de histórico")
     parser.add_argument("--month", help="Mes a importar en formato YYYY-MM")
     parser.add_argument("--db-url", help="URL de conexión a la base de datos")
     parser.add_argument("--force", action="store_true", help="Forzar importación")
+    parser.add_argument("--workers", type=int, default=ih.IMPORT_WORKERS,
+                        help="Procesos para parseo y carga en paralelo")
+    parser.add_argument("--parquet", action="store_true",
+                        help="Actualizar el espejo Parquet del mes al terminar")
     args = parser.parse_args()
 
     logger.info("=" * 60)
@@ -60,6 +106,7 @@ def main():
     logger.info("Verificando si ya existen datos para este mes...")
     try:
         conn = ih.db.get_connection()
+        particionada = ph.esta_particionada(conn)
         exists = ih.verificar_existencia(url, conn)
         conn.close()
     except Exception as e:
@@ -75,7 +122,11 @@ def main():
         return
     
     if exists and args.force:
-        logger.warning("Ya existen datos para este mes, pero se continuará (--force activo)")
+        if particionada:
+            logger.warning("Ya existen datos para este mes; se reemplazará la partición (--force activo)")
+        else:
+            logger.warning("Ya existen datos para este mes, pero se continuará (--force activo)")
+            logger.warning("La tabla no está particionada: los registros se agregarán a los existentes")
 
     # Ejecutar importación
     logger.info("=" * 60)
@@ -83,7 +134,16 @@ def main():
     logger.info("=" * 60)
     
     try:
-        ih.descargar_y_procesar(url)
+        if particionada:
+            logger.info("Modo atómico: staging + intercambio de partición")
+            resultado = ph.importar_mes_atomico(month_str, url, workers=args.workers)
+            logger.info(f"Registros cargados en la partición: {resultado['registros']:,}")
+        else:
+            ih.descargar_y_procesar(url, workers=args.workers)
+        if args.parquet:
+            import parquet_historico
+            parquet_historico.sincronizar([month_str], force=True)
+        actualizar_derivados([month_str])
         logger.info("=" * 60)
         logger.info("✓ IMPORTACIÓN COMPLETADA EXITOSAMENTE")
         logger.info("=" * 60)
@@ -40,6 +40,15 @@ def run_scraper_detalles():
     except Exception as e:
         logger.error(f"❌ Excepción en Scraper de Detalles: {e}")
 
+def run_purga_cache_analisis():
+    """Elimina de la BD los análisis de IA vencidos"""
+    try:
+        import database_bot as db_bot
+        borrados = db_bot.purgar_analisis_cache()
+        logger.info(f"🧹 Caché de análisis: {borrados} entradas vencidas eliminadas")
+    except Exception as e:
+        logger.error(f"❌ Error purgando caché de análisis: {e}")
+
 def run_threaded(job_func):
     """Ejecuta una tarea en un hilo separado para no bloquear el scheduler"""
     job_thread = threading.Thread(target=job_func)
@@ -52,11 +61,15 @@ schedule.every(60).minutes.do(run_threaded, run_scraper_lista)
 # Scraper de detalles: Cada 30 minutos
 schedule.every(120).minutes.do(run_threaded, run_scraper_detalles)
 
+# Purga de análisis IA vencidos: Diario
+schedule.every().day.at("04:00").do(run_threaded, run_purga_cache_analisis)
+
 if __name__ == "__main__":
     logger.info("⏰ Scheduler iniciado")
     logger.info("📅 Tareas programadas:")
     logger.info("   - Scraper Lista: Cada 60 min")
     logger.info("   - Scraper Detalles: Cada 120 min")
+    logger.info("   - Purga caché de análisis: Diario 04:00")
 
     # Iniciar servidor de métricas en background
     try:
@@ -0,0 +1,109 @@
+"""
+Similitud textual vectorizada con rapidfuzz.
+
+Reemplaza el df[col].apply(lambda x: fuzz.token_set_ratio(...)) fila por fila:
+todos los candidatos se puntúan en una sola llamada a process.cdist (en C++,
+con varios hilos para lotes grandes) y el resultado es un arreglo NumPy
+alineado con la columna del DataFrame.
+
+Los textos repetidos (el mismo nombre de cotización en todas sus ofertas) se
+puntúan una sola vez.
+"""
+import os
+from typing import Dict, Sequence
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process, utils
+
+# Hilos para process.cdist (-1 = todos los núcleos)
+SIMILITUD_WORKERS = int(os.getenv('SIMILITUD_WORKERS', '-1'))
+
+# Bajo este número de comparaciones no compensa repartir entre hilos
+SIMILITUD_MIN_PARALELO = int(os.getenv('SIMILITUD_MIN_PARALELO', '1000'))
+
+
+def puntajes(
+    consulta: str,
+    candidatos,
+    scorer=fuzz.token_set_ratio,
+    processor=utils.default_process
+) -> np.ndarray:
+    """
+    Similitud (0-100) de la consulta contra cada candidato.
+
+    Aplica el mismo preprocesamiento que fuzzywuzzy (minúsculas, sin
+    puntuación); candidatos nulos puntúan 0.
+
+    Args:
+        consulta: Texto buscado
+        candidatos: Serie, arreglo o lista de textos
+        scorer: Función de rapidfuzz.fuzz
+        processor: Preprocesamiento de los textos; None para textos ya
+            canonizados (canonizacion.columna_normalizada)
+
+    Returns:
+        np.ndarray float64 del mismo largo que candidatos (serializable como float)
+    """
+    return matriz_puntajes([consulta], candidatos, scorer=scorer, processor=processor)[0]
+
+
+def matriz_puntajes(
+    consultas: Sequence[str],
+    candidatos,
+    scorer=fuzz.token_set_ratio,
+    processor=utils.default_process
+) -> np.ndarray:
+    """
+    Similitud de varias consultas contra los mismos candidatos en una sola llamada.
+
+    Returns:
+        np.ndarray (len(consultas), len(candidatos))
+    """
+    serie = pd.Series(candidatos, copy=False)
+    resultado = np.zeros((len(consultas), len(serie)))
+    if serie.empty or not len(consultas):
+        return resultado
+
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    if len(unicos) == 0:
+        return resultado
+
+    celdas = len(unicos) * len(consultas)
+    workers = SIMILITUD_WORKERS if celdas >= SIMILITUD_MIN_PARALELO else 1
+    matriz = process.cdist(
+        list(consultas),
+        [str(texto) for texto in unicos],
+        scorer=scorer,
+        processor=processor,
+        dtype=np.float32,
+        workers=workers,
+    )
+    validos = codigos >= 0
+    resultado[:, validos] = matriz[:, codigos[validos]]
+    return resultado
+
+
+def puntajes_columnas(
+    consulta: str,
+    df: pd.DataFrame,
+    columnas: Sequence[str],
+    scorer=fuzz.token_set_ratio,
+    processor=utils.default_process
+) -> Dict[str, np.ndarray]:
+    """
+    Puntúa varias columnas de texto en una sola pasada.
+
+    Returns:
+        Dict columna -> np.ndarray con la similitud de cada fila
+    """
+    if df.empty:
+        return {columna: np.zeros(0) for columna in columnas}
+
+    todos = puntajes(
+        consulta,
+        pd.concat([df[columna] for columna in columnas], ignore_index=True),
+        scorer=scorer,
+        processor=processor
+    )
+    n = len(df)
+    return {columna: todos[i * n:(i + 1) * n] for i, columna in enumerate(columnas)}
@@ -0,0 +1,425 @@
+"""
+Sketches de cuantiles fusionables por producto, región y mes.
+
+Los percentiles de calcular_precio_optimo() y las estadísticas generales de
+analizar_competencia_precios() exigen leer cada precio unitario del rango
+consultado. Esta tabla guarda, por término normalizado
+(canonizacion.normalizar_termino), región y mes, un t-digest de los precios
+unitarios ganadores:
+
+    sketches_precios (termino, region, mes) -> n_ofertas, n_ganadores, n, suma,
+                                               suma_cuadrados, precio_min,
+                                               precio_max, centroides
+
+Un t-digest resume la distribución en a lo más ~COMPRESION/2 centroides
+(media, peso), más finos en las colas, y dos digests se fusionan sin volver a
+los datos. "Rango de precios de los últimos 24 meses en la región X" se
+responde fusionando 24 filas, sin importar cuántas ofertas hubo. Grupos con
+pocos precios guardan los valores tal cual (cuantiles exactos).
+
+Los sketches de cada mes se construyen tras su importación (run_monthly_import).
+
+Uso:
+    python src/sketches_precios.py --completo
+    python src/sketches_precios.py --mes 2025-06
+"""
+import os
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+import numpy as np
+import pandas as pd
+import database_extended as db
+from estadisticas_precios import FACTOR_MAD, LIMITE_OUTLIER, PERCENTILES, leer_ofertas, normalizar_region
+from canonizacion import normalizar_termino
+
+logger = logging.getLogger(__name__)
+
+TABLA = 'sketches_precios'
+
+# Parámetro δ del t-digest: más alto = más centroides y menor error en los cuantiles
+COMPRESION = int(os.getenv('SKETCH_COMPRESION', '100'))
+
+# Meses fusionados por defecto en consultar()
+VENTANA_MESES = 24
+
+COLUMNAS = (
+    'termino', 'region', 'mes', 'n_ofertas', 'n_ganadores', 'n', 'suma',
+    'suma_cuadrados', 'precio_min', 'precio_max', 'centroides'
+)
+
+
+class TDigest:
+    """
+    t-digest (variante "merging") sobre arreglos NumPy.
+
+    medias/pesos son los centroides ordenados por media; n, suma y
+    suma_cuadrados son exactos, de modo que promedio y desviación no
+    dependen de la compresión.
+    """
+
+    __slots__ = ('medias', 'pesos', 'n', 'suma', 'suma_cuadrados', 'minimo', 'maximo')
+
+    def __init__(self, medias, pesos, n, suma, suma_cuadrados, minimo, maximo):
+        self.medias = np.asarray(medias, dtype='float64')
+        self.pesos = np.asarray(pesos, dtype='float64')
+        self.n = n
+        self.suma = suma
+        self.suma_cuadrados = suma_cuadrados
+        self.minimo = minimo
+        self.maximo = maximo
+
+    def __len__(self):
+        return len(self.medias)
+
+    @classmethod
+    def desde_valores(cls, valores, compresion: int = COMPRESION) -> 'TDigest':
+        valores = np.sort(np.asarray(valores, dtype='float64'))
+        if len(valores) == 0:
+            raise ValueError("No se puede crear un digest sin valores")
+        medias, pesos = _comprimir(valores, np.ones(len(valores)), compresion)
+        return cls(
+            medias, pesos, len(valores), float(valores.sum()),
+            float(np.square(valores).sum()), float(valores[0]), float(valores[-1])
+        )
+
+    @classmethod
+    def fusionar(cls, digests: Sequence['TDigest'], compresion: int = COMPRESION) -> Optional['TDigest']:
+        """Fusiona varios digests en uno (None si la lista está vacía)."""
+        digests = [d for d in digests if d is not None and d.n]
+        if not digests:
+            return None
+        medias = np.concatenate([d.medias for d in digests])
+        pesos = np.concatenate([d.pesos for d in digests])
+        orden = np.argsort(medias, kind='stable')
+        medias, pesos = _comprimir(medias[orden], pesos[orden], compresion)
+        return cls(
+            medias, pesos,
+            sum(d.n for d in digests),
+            sum(d.suma for d in digests),
+            sum(d.suma_cuadrados for d in digests),
+            min(d.minimo for d in digests),
+            max(d.maximo for d in digests),
+        )
+
+    def _ejes(self):
+        """Posición (0..n-1) de cada centroide en la muestra ordenada, con los extremos."""
+        acumulado = np.cumsum(self.pesos) - self.pesos
+        centros = acumulado + (self.pesos - 1) / 2
+        posiciones = np.concatenate([[0.0], centros, [self.n - 1.0]])
+        valores = np.concatenate([[self.minimo], self.medias, [self.maximo]])
+        return posiciones, valores
+
+    def cuantiles(self, qs) -> np.ndarray:
+        """Cuantiles con interpolación lineal; con pesos unitarios coincide con pandas."""
+        posiciones, valores = self._ejes()
+        return np.interp(np.asarray(qs, dtype='float64') * (self.n - 1), posiciones, valores)
+
+    def recortar(self, minimo: float, maximo: float) -> 'TDigest':
+        """
+        Digest sin los centroides fuera de [minimo, maximo] (filtro de outliers).
+
+        Exacto mientras los valores se guarden sin comprimir; con centroides
+        agrupados el recorte y los momentos son aproximados.
+        """
+        dentro = (self.medias >= minimo) & (self.medias <= maximo)
+        if dentro.all() or not dentro.any():
+            return self
+        medias, pesos = self.medias[dentro], self.pesos[dentro]
+        return TDigest(
+            medias, pesos, float(pesos.sum()),
+            float((medias * pesos).sum()), float((np.square(medias) * pesos).sum()),
+            self.minimo if self.minimo >= minimo else float(medias[0]),
+            self.maximo if self.maximo <= maximo else float(medias[-1]),
+        )
+
+    def mad(self) -> float:
+        """
+        Desviación absoluta mediana (mediana de |x - mediana|).
+
+        Se calcula sobre los centroides con sus pesos: exacta con valores sin
+        comprimir, aproximada con centroides agrupados.
+        """
+        mediana = float(self.cuantiles([0.5])[0])
+        desvios = np.abs(self.medias - mediana)
+        orden = np.argsort(desvios, kind='stable')
+        desvios, pesos = desvios[orden], self.pesos[orden]
+        extremo = max(abs(self.minimo - mediana), abs(self.maximo - mediana))
+        return float(TDigest(desvios, pesos, self.n, 0.0, 0.0, float(desvios[0]), extremo).cuantiles([0.5])[0])
+
+    def sin_outliers(self) -> 'TDigest':
+        """
+        Recorte de estadisticas_precios.filtro_outliers: mediana ± 3 MAD
+        escaladas, o media ± 3σ si la MAD es 0.
+        """
+        mad = self.mad()
+        if mad > 0:
+            centro, limite = float(self.cuantiles([0.5])[0]), LIMITE_OUTLIER * FACTOR_MAD * mad
+        elif self.desviacion:
+            centro, limite = self.promedio, LIMITE_OUTLIER * self.desviacion
+        else:
+            return self
+        return self.recortar(centro - limite, centro + limite)
+
+    @property
+    def promedio(self) -> float:
+        return self.suma / self.n
+
+    @property
+    def desviacion(self) -> Optional[float]:
+        if self.n < 2:
+            return None
+        varianza = (self.suma_cuadrados - self.suma ** 2 / self.n) / (self.n - 1)
+        return float(np.sqrt(max(varianza, 0.0)))
+
+    def a_bytes(self) -> bytes:
+        """Centroides como float32 little-endian: medias seguidas de pesos."""
+        return np.concatenate([self.medias, self.pesos]).astype('<f4').tobytes()
+
+    @classmethod
+    def desde_fila(cls, n, suma, suma_cuadrados, minimo, maximo, centroides) -> 'TDigest':
+        datos = np.frombuffer(bytes(centroides), dtype='<f4').astype('float64')
+        mitad = len(datos) // 2
+        return cls(datos[:mitad], datos[mitad:], n, suma, suma_cuadrados, minimo, maximo)
+
+
+def _comprimir(medias, pesos, compresion):
+    """
+    Agrupa centroides ordenados según la función de escala k1 del t-digest:
+    cada grupo abarca a lo más una unidad de k(q) = δ/2π · asin(2q - 1),
+    lo que deja centroides pequeños en las colas y grandes en el centro.
+    """
+    if len(medias) <= compresion:
+        return medias, pesos
+    total = pesos.sum()
+    izquierda = (np.cumsum(pesos) - pesos) / total
+    k = compresion / (2 * np.pi) * np.arcsin(2 * izquierda - 1)
+    grupos = np.floor(k - k[0]).astype(np.int64)
+    _, grupos = np.unique(grupos, return_inverse=True)
+    peso_grupo = np.bincount(grupos, weights=pesos)
+    media_grupo = np.bincount(grupos, weights=medias * pesos) / peso_grupo
+    return media_grupo, peso_grupo
+
+
+def calcular_sketches(df: pd.DataFrame, mes: str, compresion: int = COMPRESION) -> pd.DataFrame:
+    """
+    Un sketch por (término, región) de las ofertas de un mes.
+
+    Args:
+        df: DataFrame con termino, region, precio_unitario, es_ganador (leer_ofertas)
+        mes: Mes 'YYYY-MM' de las ofertas
+
+    Returns:
+        DataFrame con las columnas de la tabla sketches_precios
+    """
+    if df.empty:
+        return pd.DataFrame(columns=list(COLUMNAS))
+
+    conteos = df.groupby(['termino', 'region'], observed=True).agg(
+        n_ofertas=('es_ganador', 'size'),
+        n_ganadores=('es_ganador', 'sum'),
+    )
+
+    ganadores = df[df['es_ganador']].sort_values(['termino', 'region', 'precio_unitario'])
+    precios = ganadores['precio_unitario'].to_numpy()
+    inicios = np.flatnonzero(
+        (ganadores['termino'].to_numpy()[1:] != ganadores['termino'].to_numpy()[:-1])
+        | (ganadores['region'].to_numpy()[1:] != ganadores['region'].to_numpy()[:-1])
+    ) + 1
+    limites = np.concatenate([[0], inicios, [len(ganadores)]]) if len(ganadores) else np.array([0])
+
+    filas = {}
+    claves = ganadores[['termino', 'region']].to_numpy()
+    for inicio, fin in zip(limites[:-1], limites[1:]):
+        digest = TDigest.desde_valores(precios[inicio:fin], compresion)
+        filas[tuple(claves[inicio])] = (
+            digest.n, digest.suma, digest.suma_cuadrados,
+            digest.minimo, digest.maximo, digest.a_bytes()
+        )
+
+    # Grupos sin ganadores conservan sus conteos de ofertas (tasa de ganadores)
+    vacio = (0, 0.0, 0.0, None, None, b'')
+    resultado = conteos.reset_index()
+    valores = [filas.get((t, r), vacio) for t, r in zip(resultado['termino'], resultado['region'])]
+    for i, columna in enumerate(('n', 'suma', 'suma_cuadrados', 'precio_min', 'precio_max', 'centroides')):
+        resultado[columna] = [v[i] for v in valores]
+    resultado['mes'] = mes
+    return resultado[list(COLUMNAS)]
+
+
+def _valor(v):
+    return v.item() if hasattr(v, 'item') else v
+
+
+def guardar_sketches(conn, sketches: pd.DataFrame, mes: str) -> int:
+    """Reemplaza los sketches del mes en una transacción."""
+    filas = [tuple(_valor(v) for v in fila) for fila in sketches.itertuples(index=False)]
+    p = db.get_placeholder()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DELETE FROM {TABLA} WHERE mes = {p}", (mes,))
+        insert = f"INSERT INTO {TABLA} ({', '.join(COLUMNAS)}) VALUES "
+        if db.USE_POSTGRES:
+            from psycopg2.extras import execute_values
+            execute_values(cursor, insert + "%s", filas, page_size=5000)
+        else:
+            cursor.executemany(insert + f"({', '.join([p] * len(COLUMNAS))})", filas)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(filas)
+
+
+def meses_del_historico(conn) -> List[str]:
+    """Meses 'YYYY-MM' entre la primera y la última fecha de cierre del histórico."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(fecha_cierre), MAX(fecha_cierre) FROM historico_licitaciones")
+    minimo, maximo = cursor.fetchone()
+    if minimo is None:
+        return []
+    inicio = pd.Period(str(minimo)[:7], freq='M')
+    fin = pd.Period(str(maximo)[:7], freq='M')
+    return [str(periodo) for periodo in pd.period_range(inicio, fin, freq='M')]
+
+
+def reconstruir(meses: Optional[Iterable[str]] = None) -> int:
+    """
+    Construye los sketches de los meses indicados.
+
+    Args:
+        meses: Meses 'YYYY-MM'; None reconstruye todo el histórico
+
+    Returns:
+        Cantidad de filas (término, región, mes) escritas
+    """
+    from particiones_historico import rango_mes
+
+    conn = db.get_connection()
+    try:
+        meses = meses_del_historico(conn) if meses is None else list(meses)
+        total = 0
+        for mes in meses:
+            inicio, fin = rango_mes(mes)
+            df = leer_ofertas(conn, inicio, hasta=fin)
+            total += guardar_sketches(conn, calcular_sketches(df, mes), mes)
+    finally:
+        conn.close()
+
+    logger.info(f"Sketches de precio actualizados ({len(meses)} meses): {total:,} filas")
+    return total
+
+
+def ultimos_meses(n: int = VENTANA_MESES, hoy: Optional[date] = None) -> List[str]:
+    """Los n meses 'YYYY-MM' que terminan en el mes de hoy."""
+    fin = pd.Period(hoy or date.today(), freq='M')
+    return [str(periodo) for periodo in pd.period_range(end=fin, periods=n, freq='M')]
+
+
+def _leer_sketches(termino, regiones, meses):
+    p = db.get_placeholder()
+    query = f"""
+        SELECT n_ofertas, n_ganadores, n, suma, suma_cuadrados, precio_min, precio_max, centroides
+        FROM {TABLA}
+        WHERE termino = {p}
+    """
+    params = [termino]
+    for columna, valores in (('mes', meses), ('region', regiones)):
+        if valores is None:
+            continue
+        if db.USE_POSTGRES:
+            query += f" AND {columna} = ANY(%s)"
+            params.append(list(valores))
+        else:
+            query += f" AND {columna} IN ({', '.join([p] * len(valores))})"
+            params.extend(valores)
+
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, tuple(params))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def consultar(
+    producto: str,
+    regiones: Union[str, Sequence[str], None] = None,
+    meses: Optional[Sequence[str]] = None,
+    recortar: bool = True
+) -> Optional[Dict]:
+    """
+    Distribución de precios fusionando los sketches de los meses y regiones pedidos.
+
+    Args:
+        producto: Texto del producto (se normaliza a término)
+        regiones: Región o lista de regiones; None = todas
+        meses: Meses 'YYYY-MM'; None = últimos VENTANA_MESES
+        recortar: Calcula percentiles descartando outliers (mediana ± 3 MAD,
+            ver TDigest.sin_outliers), como el cálculo en vivo
+
+    Returns:
+        Dict con las columnas de estadisticas_precios (aproximadas) más 'meses',
+        o None si no hay datos
+    """
+    termino = normalizar_termino(producto)
+    if not termino:
+        return None
+    if isinstance(regiones, str):
+        regiones = [regiones]
+    if regiones is not None:
+        regiones = sorted({normalizar_region(r) for r in regiones})
+    meses = list(meses) if meses is not None else ultimos_meses()
+
+    try:
+        filas = _leer_sketches(termino, regiones, meses)
+    except Exception as e:
+        logger.warning(f"No se pudo leer {TABLA}: {e}")
+        return None
+
+    digest = TDigest.fusionar([TDigest.desde_fila(*fila[2:]) for fila in filas])
+    if digest is None:
+        return None
+
+    n_ofertas = sum(fila[0] for fila in filas)
+    n_ganadores = sum(fila[1] for fila in filas)
+    if recortar:
+        digest = digest.sin_outliers()
+
+    cuantiles = digest.cuantiles(list(PERCENTILES.values()))
+    return {
+        'termino': termino,
+        'region': ','.join(regiones) if regiones is not None else '',
+        'meses': meses,
+        'n_ofertas': int(n_ofertas),
+        'n_ganadores': int(n_ganadores),
+        'n_registros': int(round(digest.n)),
+        'tasa_ganadores': n_ganadores / n_ofertas * 100 if n_ofertas else 0.0,
+        **{nombre: float(valor) for nombre, valor in zip(PERCENTILES, cuantiles)},
+        'promedio': digest.promedio,
+        'desviacion': digest.desviacion,
+        'precio_min': digest.minimo,
+        'precio_max': digest.maximo,
+    }
+
+
+def main():
+    import argparse
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Sketches de cuantiles de precio por mes")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--completo", action="store_true", help="Reconstruir todos los meses del histórico")
+    grupo.add_argument("--mes", action="append", help="Reconstruir el mes (YYYY-MM); repetible")
+    args = parser.parse_args()
+
+    db.iniciar_db_extendida()
+    reconstruir(None if args.completo else args.mes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Umbral adaptativo de pg_trgm para las búsquedas por similitud.
+
+El operador % usa pg_trgm.similarity_threshold (0.3 por defecto en el
+servidor): con un término raro no devuelve nada y con uno común devuelve
+cientos de miles de filas. Aquí cada consulta prueba umbrales de mayor a
+menor (reintento escalonado) hasta juntar TRGM_MIN_CANDIDATOS filas:
+
+- Un umbral alto poda casi todo el índice GiST, así que los primeros
+  intentos de un término raro son baratos.
+- El máximo lo acota el LIMIT de la búsqueda KNN (ORDER BY <-> LIMIT),
+  recortado a TRGM_MAX_CANDIDATOS.
+
+El umbral se fija con set_config(..., true): vale solo para la transacción
+en curso y no se filtra a otras consultas de la conexión del pool.
+"""
+import os
+import logging
+from typing import Any, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Umbrales a probar, de mayor a menor
+TRGM_UMBRALES = [
+    float(umbral) for umbral in os.getenv('TRGM_UMBRALES', '0.5,0.4,0.3,0.2').split(',')
+]
+
+# Tamaño buscado del conjunto de candidatos
+TRGM_MIN_CANDIDATOS = int(os.getenv('TRGM_MIN_CANDIDATOS', '20'))
+TRGM_MAX_CANDIDATOS = int(os.getenv('TRGM_MAX_CANDIDATOS', '1000'))
+
+
+def acotar(limite: int) -> int:
+    """LIMIT de la búsqueda KNN, recortado al máximo configurado."""
+    return max(1, min(int(limite), TRGM_MAX_CANDIDATOS))
+
+
+def fijar_umbral(cursor, umbral: float):
+    """Fija pg_trgm.similarity_threshold para la transacción en curso."""
+    cursor.execute(
+        "SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+        (str(umbral),)
+    )
+
+
+def consultar(
+    conn,
+    leer: Callable[[], T],
+    contar: Callable[[Any], int] = len,
+    limite: Optional[int] = None
+) -> T:
+    """
+    Ejecuta leer() con umbrales decrecientes hasta juntar suficientes candidatos.
+
+    Args:
+        conn: Conexión PostgreSQL sobre la que corre leer()
+        leer: Ejecuta la consulta con el operador % y devuelve su resultado
+        contar: Cantidad de candidatos de un resultado
+        limite: LIMIT de la consulta; con uno menor que TRGM_MIN_CANDIDATOS
+            basta con llenarlo
+
+    Returns:
+        El primer resultado con suficientes candidatos o, si ninguno llega,
+        el del umbral más bajo
+    """
+    minimo = TRGM_MIN_CANDIDATOS if limite is None else min(TRGM_MIN_CANDIDATOS, limite)
+    cursor = conn.cursor()
+    for paso, umbral in enumerate(TRGM_UMBRALES, 1):
+        fijar_umbral(cursor, umbral)
+        resultado = leer()
+        n = contar(resultado)
+        if n >= minimo or paso == len(TRGM_UMBRALES):
+            logger.debug(f"pg_trgm: {n} candidatos con umbral {umbral}")
+            return resultado
+    # Sin umbrales configurados: el de la sesión
+    return leer()
@@ -8,6 +8,9 @@ import pytest
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+# ML pool in threads: monkeypatched functions must run in the test process
+os.environ.setdefault('POOL_ML_WORKERS', '0')
+
 # Load environment variables for tests
 from dotenv import load_dotenv
 load_dotenv()
@@ -77,6 +80,12 @@ def mock_redis(monkeypatch):
             self._store[key] = value
             return True
         
+        def mget(self, keys):
+            return [self._store.get(key) for key in keys]
+        
+        def pipeline(self, transaction=True):
+            return MockPipeline(self)
+        
         def delete(self, *keys):
             count = 0
             for key in keys:
@@ -115,6 +124,20 @@ def mock_redis(monkeypatch):
             self._store.clear()
             return True
     
+    class MockPipeline:
+        def __init__(self, redis):
+            self._redis = redis
+            self._ops = []
+        
+        def setex(self, key, time, value):
+            self._ops.append((key, value))
+            return self
+        
+        def execute(self):
+            for key, value in self._ops:
+                self._redis.setex(key, None, value)
+            return [True] * len(self._ops)
+    
     mock = MockRedis()
     
     # Patch redis_cache module
@@ -142,6 +165,24 @@ def api_client():
     return TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def limpiar_cache_mercado():
+    """
+    Avoids leaking cached market analyses (ml_precio_optimo), RAG
+    enrichments (rag_historico) and AI analyses (cache_analisis) between tests.
+    """
+    yield
+    modulo = sys.modules.get('ml_precio_optimo')
+    if modulo is not None:
+        modulo.limpiar_cache_mercado()
+    modulo = sys.modules.get('rag_historico')
+    if modulo is not None:
+        modulo.limpiar_cache_enriquecimiento()
+    modulo = sys.modules.get('cache_analisis')
+    if modulo is not None:
+        modulo.limpiar_cache_local()
+
+
 # ==================== MARKERS ====================
 
 def pytest_configure(config):
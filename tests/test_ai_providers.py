@@ -345,6 +345,41 @@ class TestFallbackChain:
         # Should succeed if at least one provider is configured
         # (returns True if any provider in the chain is available)
         assert isinstance(result, bool)
+    
+    def test_fallback_chain_astream(self):
+        """astream skips providers that fail before their first chunk."""
+        import asyncio
+        from ai_providers import AIProvider, AIResponse, FallbackChain
+        
+        class StreamProvider(AIProvider):
+            def __init__(self, name, chunks, fail_after=None):
+                super().__init__(api_key="k", model="m")
+                self.name = name
+                self.chunks = chunks
+                self.fail_after = fail_after
+            
+            def configure(self):
+                return True
+            
+            def generate(self, prompt, **kwargs):
+                return AIResponse(text="".join(self.chunks), provider=self.name, model="m")
+            
+            async def astream(self, prompt, **kwargs):
+                for i, chunk in enumerate(self.chunks):
+                    if i == self.fail_after:
+                        raise ConnectionError(self.name)
+                    yield chunk
+        
+        async def collect(chain):
+            return [chunk async for chunk in chain.astream("prompt")]
+        
+        chain = FallbackChain(["a", "b"])
+        chain._providers = [StreamProvider("a", ["x"], fail_after=0), StreamProvider("b", ["Hola", " mundo"])]
+        assert asyncio.run(collect(chain)) == ["Hola", " mundo"]
+        
+        chain._providers = [StreamProvider("a", ["Hola", " mundo"], fail_after=1), StreamProvider("b", ["otro"])]
+        with pytest.raises(ConnectionError):
+            asyncio.run(collect(chain))
 
 
 # ==================== Helper Function Tests ====================
@@ -383,6 +418,127 @@ class TestHelperFunctions:
         assert 'provider' in sig.parameters
 
 
+# ==================== Async Interface Tests ====================
+
+def _fake_async_client(calls, delay=0.0):
+    """Async client double with the chat.completions.create() surface."""
+    import asyncio
+    from types import SimpleNamespace
+
+    async def create(stream=False, **params):
+        calls.append(params)
+        await asyncio.sleep(delay)
+        if stream:
+            async def chunks():
+                for content in ["Hola", None, " mundo"]:
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+                # Usage-only chunk without choices
+                yield SimpleNamespace(choices=[])
+            return chunks()
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="respuesta"))],
+            usage=SimpleNamespace(prompt_tokens=3, completion_tokens=2, total_tokens=5)
+        )
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)), closed=False)
+
+    async def close():
+        client.closed = True
+
+    client.close = close
+    return client
+
+
+class TestAsyncInterface:
+    """Tests for agenerate/astream."""
+    
+    def test_agenerate_reuses_client_concurrently(self):
+        """Concurrent agenerate calls share one async client and overlap."""
+        import asyncio
+        import time
+        from ai_providers import GroqProvider
+        
+        provider = GroqProvider(api_key="test-key")
+        provider._configured = True
+        calls = []
+        created = []
+        provider._create_async_client = lambda: created.append(1) or _fake_async_client(calls, delay=0.2)
+        
+        async def scenario():
+            return await asyncio.gather(*(provider.agenerate(f"prompt {i}") for i in range(5)))
+        
+        start = time.monotonic()
+        responses = asyncio.run(scenario())
+        
+        assert time.monotonic() - start < 0.8
+        assert len(created) == 1
+        assert [r.text for r in responses] == ["respuesta"] * 5
+        assert responses[0].usage["total_tokens"] == 5
+        assert calls[0]["messages"][0]["content"] == "prompt 0"
+    
+    def test_astream_yields_chunks(self):
+        """astream yields text deltas in order, skipping empty ones."""
+        import asyncio
+        from ai_providers import OpenAIProvider
+        
+        provider = OpenAIProvider(api_key="test-key", model="o1-mini")
+        provider._configured = True
+        calls = []
+        provider._create_async_client = lambda: _fake_async_client(calls)
+        
+        async def scenario():
+            return [chunk async for chunk in provider.astream("prompt")]
+        
+        assert asyncio.run(scenario()) == ["Hola", " mundo"]
+        # o1 models don't accept temperature
+        assert "temperature" not in calls[0]
+    
+    def test_new_loop_closes_previous_client(self):
+        """A client opened on a finished loop is closed before being replaced."""
+        import asyncio
+        from ai_providers import GroqProvider
+        
+        provider = GroqProvider(api_key="test-key")
+        provider._configured = True
+        created = []
+        provider._create_async_client = lambda: created.append(_fake_async_client([])) or created[-1]
+        
+        asyncio.run(provider.agenerate("prompt"))
+        asyncio.run(provider.agenerate("prompt"))
+        
+        assert len(created) == 2
+        assert created[0].closed and not created[1].closed
+        
+        asyncio.run(provider.aclose())
+        assert created[1].closed
+    
+    def test_default_async_runs_generate(self):
+        """Providers without a native async client fall back to generate() in a thread."""
+        import asyncio
+        import threading
+        from ai_providers import AIProvider, AIResponse
+        
+        class SyncProvider(AIProvider):
+            name = "sync"
+            
+            def configure(self):
+                return True
+            
+            def generate(self, prompt, **kwargs):
+                return AIResponse(text=threading.current_thread().name, provider=self.name, model="m")
+        
+        provider = SyncProvider(api_key="k", model="m")
+        
+        async def scenario():
+            response = await provider.agenerate("prompt")
+            chunks = [chunk async for chunk in provider.astream("prompt")]
+            return response, chunks
+        
+        response, chunks = asyncio.run(scenario())
+        assert response.text != threading.current_thread().name
+        assert len(chunks) == 1
+
+
 # ==================== Integration Tests ====================
 
 @pytest.mark.integration
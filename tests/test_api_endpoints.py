@@ -179,3 +179,45 @@ class TestMLEndpoints:
         
         # Should return 200 or 404 if not implemented
         assert response.status_code in [200, 404, 422]
+
+
+class TestMLBatchEndpoint:
+    """Tests for the batch price endpoint (ML layer mocked)."""
+    
+    def test_batch_preserves_order_and_reports_errors(self, api_client, monkeypatch):
+        """Results come back in request order with per-item errors."""
+        import api_backend_v3
+        
+        def fake_lote(items, solo_ganadores=True):
+            return [
+                {'success': True, 'precio_unitario': {'recomendado': 100.0}}
+                if item['producto'] != 'desconocido'
+                else {'success': False, 'error': 'No hay suficientes datos históricos'}
+                for item in items
+            ]
+        
+        monkeypatch.setattr(api_backend_v3, 'REDIS_AVAILABLE', False)
+        monkeypatch.setattr(api_backend_v3.ml_precio_optimo, 'calcular_precios_lote', fake_lote)
+        
+        response = api_client.post("/api/v3/ml/precio/batch", json={
+            "items": [
+                {"producto": "resma papel", "cantidad": 10},
+                {"producto": "desconocido"},
+                {"producto": "toner hp", "cantidad": 2, "region": "Metropolitana"},
+            ]
+        })
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data['total'] == 3
+        assert data['exitosos'] == 2
+        assert data['errores'] == 1
+        assert [r['producto'] for r in data['resultados']] == ['resma papel', 'desconocido', 'toner hp']
+        assert data['resultados'][1]['cantidad'] == 1
+        assert not data['resultados'][1]['success']
+    
+    def test_batch_rejects_empty_list(self, api_client):
+        """An empty batch is a validation error."""
+        response = api_client.post("/api/v3/ml/precio/batch", json={"items": []})
+        
+        assert response.status_code == 422
@@ -0,0 +1,78 @@
+"""
+Tests para la planificación del backfill de histórico.
+"""
+import pytest
+
+
+class TestMesesEnRango:
+    """Tests de meses_en_rango"""
+
+    def test_rango_cruza_anio(self):
+        """Incluye ambos extremos y cruza el cambio de año"""
+        from backfill_historico import meses_en_rango
+
+        assert meses_en_rango('2024-11', '2025-02') == ['2024-11', '2024-12', '2025-01', '2025-02']
+
+    def test_mismo_mes(self):
+        """Un rango de un solo mes"""
+        from backfill_historico import meses_en_rango
+
+        assert meses_en_rango('2025-03', '2025-03') == ['2025-03']
+
+    def test_rango_invertido(self):
+        """Rango con desde > hasta es inválido"""
+        from backfill_historico import meses_en_rango
+
+        with pytest.raises(ValueError):
+            meses_en_rango('2025-03', '2025-01')
+
+
+class TestClasificarMeses:
+    """Tests de clasificar_meses"""
+
+    def _checkpoint(self, estado='completado', etag='"a"'):
+        return {'estado': estado, 'etag': etag}
+
+    def test_faltantes_e_incompletos(self):
+        """Importa meses sin datos ni checkpoint, e incompletos; omite los completados"""
+        from backfill_historico import clasificar_meses
+
+        meses = ['2025-01', '2025-02', '2025-03', '2025-04']
+        checkpoints = {
+            '2025-02': self._checkpoint('cargando'),
+            '2025-03': self._checkpoint(),
+        }
+        con_datos = {'2025-03', '2025-04'}
+
+        plan = clasificar_meses(meses, checkpoints, con_datos)
+
+        assert set(plan) == {'2025-01', '2025-02'}
+        assert plan['2025-01'] == 'faltante'
+        assert 'cargando' in plan['2025-02']
+
+    def test_completado_sin_datos(self):
+        """Un mes marcado completado pero sin datos se vuelve a importar"""
+        from backfill_historico import clasificar_meses
+
+        plan = clasificar_meses(['2025-01'], {'2025-01': self._checkpoint()}, set())
+
+        assert '2025-01' in plan
+
+    def test_etag_remoto_distinto(self):
+        """Detecta archivos remotos actualizados por ETag"""
+        from backfill_historico import clasificar_meses
+
+        checkpoints = {'2025-01': self._checkpoint(), '2025-02': self._checkpoint()}
+        etags = {'2025-01': '"a"', '2025-02': '"b"'}
+
+        plan = clasificar_meses(['2025-01', '2025-02'], checkpoints, {'2025-01', '2025-02'}, etags)
+
+        assert list(plan) == ['2025-02']
+
+    def test_force(self):
+        """force reimporta todo el rango"""
+        from backfill_historico import clasificar_meses
+
+        plan = clasificar_meses(['2025-01'], {'2025-01': self._checkpoint()}, {'2025-01'}, force=True)
+
+        assert plan == {'2025-01': 'forzado'}
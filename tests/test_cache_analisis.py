@@ -0,0 +1,142 @@
+"""
+Tests para cache_analisis.py - Caché de análisis IA por licitación y perfil.
+"""
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+import pytest
+
+
+ANALISIS = {'resumen_ejecutivo': 'Conviene participar', '_metadata': {'tokens_estimados': 1200}}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """cache_analisis sobre una BD SQLite temporal, sin Redis."""
+    import cache_analisis
+    import database_bot as db_bot
+    import gemini_ai
+
+    ruta = str(tmp_path / 'bot.db')
+    monkeypatch.setattr(db_bot, 'USE_POSTGRES', False)
+    monkeypatch.setattr(db_bot, 'get_connection', lambda: sqlite3.connect(ruta))
+    db_bot.iniciar_db_bot()
+
+    monkeypatch.setattr(gemini_ai, 'modelo_activo', lambda: 'groq:llama-test')
+    monkeypatch.setattr(cache_analisis, '_redis', lambda: None)
+    return cache_analisis
+
+
+def _cierre_en(horas):
+    return (datetime.now() + timedelta(hours=horas)).isoformat()
+
+
+class TestHuellaPerfil:
+    """Tests de la huella del perfil"""
+
+    def test_perfiles_equivalentes(self, sample_perfil_empresa):
+        """Mayúsculas, espacios y orden de palabras clave no cambian la huella"""
+        from cache_analisis import huella_perfil
+
+        equivalente = dict(
+            sample_perfil_empresa,
+            nombre_empresa='  EMPRESA test  SpA',
+            palabras_clave='servidores,computadores ,  notebooks',
+            telegram_user_id=999,
+        )
+        distinto = dict(sample_perfil_empresa, ubicacion='Valparaíso')
+
+        assert huella_perfil(equivalente) == huella_perfil(sample_perfil_empresa)
+        assert huella_perfil(distinto) != huella_perfil(sample_perfil_empresa)
+
+
+class TestExpiracion:
+    """Tests del vencimiento según el cierre de la licitación"""
+
+    def test_vence_al_cierre_acotado(self, monkeypatch):
+        """Vence al cierre, como máximo ANALISIS_CACHE_MAX_HORAS; None si ya cerró"""
+        import cache_analisis
+
+        monkeypatch.setattr(cache_analisis, 'ANALISIS_CACHE_MAX_HORAS', 72)
+        ahora = time.time()
+        cierre = datetime.fromtimestamp(ahora) + timedelta(hours=5)
+
+        assert cache_analisis.expiracion(cierre.isoformat(), ahora) == pytest.approx(cierre.timestamp())
+        assert cache_analisis.expiracion(date.today() + timedelta(days=30), ahora) == ahora + 72 * 3600
+        assert cache_analisis.expiracion('no es fecha', ahora) == ahora + 72 * 3600
+        assert cache_analisis.expiracion(datetime.fromtimestamp(ahora) - timedelta(hours=1), ahora) is None
+
+
+class TestObtenerGuardar:
+    """Tests de los niveles memoria + BD"""
+
+    def test_por_perfil_y_modelo(self, cache, sample_perfil_empresa, monkeypatch):
+        """El análisis se comparte solo con perfiles equivalentes y el mismo modelo"""
+        import gemini_ai
+
+        assert cache.guardar('123-1-COT25', sample_perfil_empresa, ANALISIS, _cierre_en(10))
+
+        assert cache.obtener('123-1-COT25', dict(sample_perfil_empresa, telegram_user_id=2)) == ANALISIS
+        assert cache.obtener('123-1-COT25', dict(sample_perfil_empresa, tipo_negocio='Aseo')) is None
+
+        monkeypatch.setattr(gemini_ai, 'modelo_activo', lambda: 'gemini:otro')
+        assert cache.obtener('123-1-COT25', sample_perfil_empresa) is None
+
+    def test_bd_promueve_a_memoria(self, cache, sample_perfil_empresa):
+        """Tras vaciar la memoria el análisis sale de la BD y vuelve a memoria"""
+        cache.guardar('123-1-COT25', sample_perfil_empresa, ANALISIS, _cierre_en(10))
+        cache.limpiar_cache_local()
+
+        assert cache.obtener('123-1-COT25', sample_perfil_empresa) == ANALISIS
+        assert len(cache._locales) == 1
+
+    def test_no_guarda_errores_ni_cerradas(self, cache, sample_perfil_empresa):
+        """Análisis con error o de licitaciones cerradas no se guardan; los vencidos no se leen"""
+        import database_bot as db_bot
+
+        assert not cache.guardar('A', sample_perfil_empresa, {'error': 'timeout'}, _cierre_en(10))
+        assert not cache.guardar('B', sample_perfil_empresa, ANALISIS, _cierre_en(-1))
+
+        clave = cache.clave_analisis('C', cache.huella_perfil(sample_perfil_empresa), 'v2', 'groq:llama-test')
+        db_bot.guardar_analisis_cache(clave, 'C', '-', 'v2', 'groq:llama-test', ANALISIS, time.time() - 1)
+        assert cache.obtener('C', sample_perfil_empresa) is None
+        assert db_bot.purgar_analisis_cache() == 1
+
+    def test_elimina_tabla_antigua(self, cache):
+        """iniciar_db_bot borra la caché anterior (solo por código), que ya nadie lee"""
+        import database_bot as db_bot
+
+        conn = db_bot.get_connection()
+        conn.execute('CREATE TABLE analisis_cache (codigo_licitacion TEXT PRIMARY KEY, analisis_json TEXT)')
+        conn.commit()
+        conn.close()
+
+        db_bot.iniciar_db_bot()
+
+        conn = db_bot.get_connection()
+        tablas = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        conn.close()
+        assert 'analisis_cache' not in tablas
+        assert 'analisis_cache_perfil' in tablas
+
+    def test_nivel_redis(self, cache, sample_perfil_empresa, mock_redis, monkeypatch):
+        """Con Redis el nivel en memoria se comparte entre procesos con TTL hasta el vencimiento"""
+        monkeypatch.setattr(cache, '_redis', lambda: mock_redis)
+
+        cache.guardar('123-1-COT25', sample_perfil_empresa, ANALISIS, _cierre_en(1))
+
+        claves = [k for k in mock_redis._store if k.startswith(cache.PREFIJO_REDIS)]
+        assert len(claves) == 1
+        assert cache.obtener('123-1-COT25', sample_perfil_empresa) == ANALISIS
+
+    def test_parcial_vigencia_corta(self, cache, sample_perfil_empresa, monkeypatch):
+        """Un análisis parcial vence a los minutos, no al cierre; con 0 no se guarda"""
+        parcial = dict(ANALISIS, _metadata={'parcial': True, 'ramas_omitidas': ['precio']})
+        monkeypatch.setattr(cache, 'ANALISIS_CACHE_PARCIAL_MINUTOS', 10)
+
+        assert cache.guardar('P', sample_perfil_empresa, parcial, _cierre_en(48))
+        expira_en = next(iter(cache._locales.values()))[0]
+        assert expira_en <= time.time() + 10 * 60
+
+        monkeypatch.setattr(cache, 'ANALISIS_CACHE_PARCIAL_MINUTOS', 0)
+        assert not cache.guardar('Q', sample_perfil_empresa, parcial, _cierre_en(48))
@@ -0,0 +1,124 @@
+"""
+Tests para canonizacion.py - Columnas canónicas de producto y cotización.
+"""
+import sqlite3
+import pytest
+
+
+@pytest.fixture
+def bd_antigua(tmp_path, monkeypatch):
+    """Histórico SQLite creado antes de las columnas canónicas."""
+    import database_extended as db
+
+    ruta = str(tmp_path / 'canonizacion.db')
+    conn = sqlite3.connect(ruta)
+    conn.executescript('''
+        CREATE TABLE historico_licitaciones (
+            id INTEGER PRIMARY KEY, nombre_cotizacion TEXT, producto_cotizado TEXT
+        );
+        INSERT INTO historico_licitaciones (nombre_cotizacion, producto_cotizado) VALUES
+            ('Compra de aceite', 'Aceite maravilla 1,5 lt'),
+            ('Útiles de oficina', 'Resma papel carta'),
+            (NULL, NULL);
+    ''')
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, 'USE_POSTGRES', False)
+    monkeypatch.setattr(db, 'get_connection', lambda: sqlite3.connect(ruta))
+    return ruta
+
+
+class TestCanonizar:
+    """Tests de canonizar"""
+
+    def test_unidades_y_cantidades(self):
+        """La medida sale del término y se devuelve en unidad canónica"""
+        from canonizacion import canonizar
+
+        assert canonizar('Resma papel carta 75 gr') == ('carta papel resma', 75.0, 'g')
+        assert canonizar('PAPEL, resma de carta 75g').termino == 'carta papel resma'
+        assert canonizar('Aceite maravilla 1,5 lt') == ('aceite maravilla', 1.5, 'l')
+        assert canonizar('Guantes nitrilo talla M') == ('guantes nitrilo talla', None, None)
+
+    def test_vacio(self):
+        """Nulos y textos sin tokens útiles"""
+        from canonizacion import canonizar
+
+        assert canonizar(None) == ('', None, None)
+        assert canonizar('500 ml') == ('', 500.0, 'ml')
+
+
+class TestColumnaNormalizada:
+    """Tests de columna_normalizada"""
+
+    def test_completa_solo_los_nulos(self):
+        """Respeta los valores precalculados y canoniza los que faltan"""
+        import pandas as pd
+        from canonizacion import columna_normalizada
+
+        df = pd.DataFrame({
+            'producto_cotizado': ['Tóner HP', 'Lápiz grafito', None],
+            'producto_normalizado': ['precalculado', None, None],
+        })
+
+        assert columna_normalizada(df, 'producto_cotizado').tolist() == ['precalculado', 'grafito lapiz', '']
+
+    def test_sin_columna(self):
+        """Sin la columna canónica (espejo Parquet) se calcula completa"""
+        import pandas as pd
+        from canonizacion import columna_normalizada
+
+        df = pd.DataFrame({'nombre_cotizacion': ['Compra de resmas', 'Compra de resmas']})
+
+        assert columna_normalizada(df, 'nombre_cotizacion').tolist() == ['resmas'] * 2
+
+
+class TestRellenar:
+    """Tests de rellenar sobre la tabla plana"""
+
+    def test_migra_y_rellena(self, bd_antigua):
+        """agregar_columnas_normalizadas + rellenar completan todas las filas una vez"""
+        import database_extended as db
+        import canonizacion
+
+        conn = sqlite3.connect(bd_antigua)
+        db.agregar_columnas_normalizadas(conn.cursor())
+        conn.commit()
+        conn.close()
+
+        assert canonizacion.rellenar(lote=2) == 3
+        assert canonizacion.rellenar() == 0
+
+        conn = sqlite3.connect(bd_antigua)
+        filas = conn.execute('''
+            SELECT producto_normalizado, nombre_normalizado, cantidad_medida, unidad_medida
+            FROM historico_licitaciones ORDER BY id
+        ''').fetchall()
+        conn.close()
+        assert filas == [
+            ('aceite maravilla', 'aceite', 1.5, 'l'),
+            ('carta papel resma', 'oficina utiles', None, None),
+            ('', '', None, None),
+        ]
+
+    def test_arranque_solo_advierte_pendientes(self, bd_antigua, monkeypatch, caplog):
+        """advertir_normalizadas_pendientes avisa una vez por proceso sin rellenar"""
+        import database_extended as db
+
+        conn = sqlite3.connect(bd_antigua)
+        db.agregar_columnas_normalizadas(conn.cursor())
+        conn.commit()
+        conn.close()
+        monkeypatch.setattr(db, '_normalizadas_verificadas', False)
+
+        assert db.advertir_normalizadas_pendientes() is True
+        assert db.advertir_normalizadas_pendientes() is False
+        assert 'canonizacion.py --rellenar' in caplog.text
+
+        conn = sqlite3.connect(bd_antigua)
+        nulos = conn.execute(
+            'SELECT COUNT(*) FROM historico_licitaciones WHERE producto_normalizado IS NULL'
+        ).fetchone()[0]
+        conn.close()
+        assert nulos == 3
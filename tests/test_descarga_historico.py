@@ -0,0 +1,171 @@
+"""
+Tests for descarga_historico.py - Descargas reanudables, caché y ZIP en streaming.
+"""
+import io
+import zipfile
+
+import pytest
+import requests
+
+
+def _zip_bytes(archivos, compresion=zipfile.ZIP_DEFLATED, seekable=True):
+    """Crea un ZIP en memoria. Sin seek, zipfile usa data descriptors."""
+    buffer = io.BytesIO()
+    destino = buffer
+    if not seekable:
+        class _NoSeek(io.RawIOBase):
+            def writable(self):
+                return True
+
+            def write(self, b):
+                return buffer.write(b)
+
+        destino = _NoSeek()
+    with zipfile.ZipFile(destino, 'w', compresion) as z:
+        for nombre, contenido in archivos.items():
+            z.writestr(nombre, contenido)
+    return buffer.getvalue()
+
+
+class _RespuestaFalsa:
+    def __init__(self, datos, status, headers, cortar_en=None):
+        self._datos = datos
+        self.status_code = status
+        self.headers = headers
+        self._cortar_en = cortar_en
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        enviados = 0
+        for i in range(0, len(self._datos), 7):
+            if self._cortar_en is not None and enviados >= self._cortar_en:
+                raise requests.exceptions.ChunkedEncodingError("conexión cortada")
+            bloque = self._datos[i:i + 7]
+            enviados += len(bloque)
+            yield bloque
+
+    def close(self):
+        pass
+
+
+class _SesionFalsa:
+    """Sirve `datos` con soporte de Range; la primera respuesta se corta en `cortar_en`."""
+
+    def __init__(self, datos, cortar_en=None):
+        self.datos = datos
+        self.cortar_en = cortar_en
+        self.rangos = []
+
+    def head(self, url, **kwargs):
+        return _RespuestaFalsa(b'', 200, {'ETag': '"v1"'})
+
+    def get(self, url, stream=True, headers=None, timeout=None):
+        headers = headers or {}
+        rango = headers.get('Range')
+        self.rangos.append(rango)
+        cortar_en, self.cortar_en = self.cortar_en, None
+        if rango:
+            inicio = int(rango.split('=')[1].rstrip('-'))
+            return _RespuestaFalsa(
+                self.datos[inicio:], 206,
+                {'ETag': '"v1"', 'Content-Range': f'bytes {inicio}-{len(self.datos) - 1}/{len(self.datos)}'},
+                cortar_en
+            )
+        return _RespuestaFalsa(
+            self.datos, 200, {'ETag': '"v1"', 'content-length': str(len(self.datos))}, cortar_en
+        )
+
+
+class TestIterarEntradasZip:
+    """Tests for the streaming ZIP reader."""
+
+    @pytest.mark.parametrize('compresion', [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+    def test_lee_entradas_en_orden(self, compresion):
+        import descarga_historico as dh
+
+        datos = _zip_bytes({'a.csv': b'x;y\n1;2\n' * 500, 'b.txt': b'ignorar', 'c.csv': b'z\n'}, compresion)
+        entradas = [(n, t, l.read()) for n, t, l in dh.iterar_entradas_zip(io.BytesIO(datos))]
+
+        assert [e[0] for e in entradas] == ['a.csv', 'b.txt', 'c.csv']
+        assert entradas[0][1] == len(b'x;y\n1;2\n' * 500)
+        assert entradas[0][2] == b'x;y\n1;2\n' * 500
+        assert entradas[2][2] == b'z\n'
+
+    def test_entradas_con_data_descriptor(self):
+        import descarga_historico as dh
+
+        datos = _zip_bytes({'a.csv': b'1;2\n' * 1000, 'b.csv': b'3;4\n'}, seekable=False)
+        entradas = list(dh.iterar_entradas_zip(io.BytesIO(datos)))
+
+        # Sin leer la primera entrada: debe descartarse al avanzar
+        assert [n for n, _, _ in entradas] == ['a.csv', 'b.csv']
+
+        entradas = [(n, t, l.read()) for n, t, l in dh.iterar_entradas_zip(io.BytesIO(datos))]
+        assert entradas[0][1] is None
+        assert entradas[0][2] == b'1;2\n' * 1000
+        assert entradas[1][2] == b'3;4\n'
+
+    def test_stored_con_descriptor_no_es_streamable(self):
+        import descarga_historico as dh
+
+        datos = _zip_bytes({'a.csv': b'1;2\n'}, zipfile.ZIP_STORED, seekable=False)
+        with pytest.raises(dh.ZipNoStreamable):
+            list(dh.iterar_entradas_zip(io.BytesIO(datos)))
+
+    def test_crc_invalido(self):
+        import descarga_historico as dh
+
+        datos = bytearray(_zip_bytes({'a.csv': b'hola'}, zipfile.ZIP_STORED))
+        datos[30 + len('a.csv')] ^= 0xFF  # Corromper el primer byte del contenido
+        with pytest.raises(zipfile.BadZipFile):
+            for _, _, lector in dh.iterar_entradas_zip(io.BytesIO(bytes(datos))):
+                lector.read()
+
+
+class TestDescargaReanudable:
+    """Tests for resumable downloads and the content-addressed cache."""
+
+    def test_reanuda_con_range_tras_corte(self, tmp_path, monkeypatch):
+        import descarga_historico as dh
+
+        monkeypatch.setattr(dh.time, 'sleep', lambda s: None)
+        datos = bytes(range(256)) * 40
+        sesion = _SesionFalsa(datos, cortar_en=3000)
+
+        descarga = dh.DescargaReanudable('http://x/COT_2025-01.zip', str(tmp_path / 'p.part'), session=sesion)
+        leido = descarga.read()
+        descarga.completar()
+
+        assert leido == datos
+        assert sesion.rangos[0] is None
+        assert sesion.rangos[1].startswith('bytes=') and sesion.rangos[1] != 'bytes=0-'
+
+    def test_cache_evita_redescarga(self, tmp_path):
+        import descarga_historico as dh
+
+        datos = _zip_bytes({'a.csv': b'1;2\n'})
+        url = 'http://x/COT_2025-01.zip'
+        cache = dh.CacheHistorico(str(tmp_path))
+
+        assert cache.buscar(url) is None
+
+        descarga = cache.abrir_descarga(url, session=_SesionFalsa(datos))
+        ruta = cache.registrar(url, descarga)
+
+        assert cache.buscar(url) == ruta
+        with open(ruta, 'rb') as f:
+            assert f.read() == datos
+
+    def test_cache_detecta_corrupcion(self, tmp_path):
+        import descarga_historico as dh
+
+        url = 'http://x/COT_2025-01.zip'
+        cache = dh.CacheHistorico(str(tmp_path))
+        ruta = cache.registrar(url, cache.abrir_descarga(url, session=_SesionFalsa(b'0123456789')))
+
+        with open(ruta, 'r+b') as f:
+            f.write(b'X')
+
+        assert cache.buscar(url) is None
@@ -0,0 +1,80 @@
+"""
+Tests for dimensiones_historico.py - Esquema normalizado del histórico.
+"""
+import sqlite3
+
+
+def _conexion_con_dimensiones():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE carga (
+            id INTEGER, codigo_cotizacion TEXT, nombre_cotizacion TEXT, region TEXT,
+            rut_proveedor TEXT, nombre_proveedor TEXT, producto_cotizado TEXT,
+            cantidad INTEGER, monto_total INTEGER, detalle_oferta TEXT,
+            es_ganador BOOLEAN, fecha_cierre DATE, fecha_importacion TIMESTAMP,
+            producto_normalizado TEXT, nombre_normalizado TEXT, cantidad_medida REAL, unidad_medida TEXT
+        );
+        CREATE TABLE hist_cotizaciones (
+            id INTEGER PRIMARY KEY, codigo TEXT UNIQUE, nombre TEXT, nombre_normalizado TEXT
+        );
+        CREATE TABLE hist_proveedores (id INTEGER PRIMARY KEY, rut TEXT UNIQUE, nombre TEXT);
+        CREATE TABLE hist_regiones (id INTEGER PRIMARY KEY, nombre TEXT UNIQUE);
+        CREATE TABLE historico_ofertas (
+            id INTEGER PRIMARY KEY, cotizacion_id INTEGER, region_id INTEGER, proveedor_id INTEGER,
+            producto_cotizado TEXT, cantidad INTEGER, monto_total INTEGER, detalle_oferta TEXT,
+            es_ganador BOOLEAN, fecha_cierre DATE, fecha_importacion TIMESTAMP,
+            producto_normalizado TEXT, cantidad_medida REAL, unidad_medida TEXT
+        );
+        INSERT INTO hist_cotizaciones (id, codigo, nombre) VALUES (7, 'C1', 'Compra lápices');
+        INSERT INTO hist_proveedores (id, rut, nombre) VALUES (3, '1-9', 'Prov A');
+        INSERT INTO hist_regiones (id, nombre) VALUES (2, 'RM');
+    ''')
+    conn.executemany('INSERT INTO carga VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)', [
+        (None, 'C1', 'Compra lápices', 'RM', '1-9', 'Prov A', 'Lápiz', 10, 5000, 'det', 1, '2025-01-15', None,
+         'lapiz', 'compra lapices', None, None),
+        (None, 'C1', 'Compra lápices', None, None, None, 'Goma 2 un', 2, 300, None, 0, '2025-01-15', None,
+         'goma', 'compra lapices', 2.0, 'un'),
+    ])
+    return conn
+
+
+class TestInsertarHechos:
+    """Tests for insertar_hechos."""
+
+    def test_traduce_textos_a_claves(self):
+        import dimensiones_historico as dim
+
+        conn = _conexion_con_dimensiones()
+        filas = dim.insertar_hechos(conn.cursor(), 'carga', 'historico_ofertas')
+
+        assert filas == 2
+        rows = conn.execute('''
+            SELECT cotizacion_id, region_id, proveedor_id, producto_cotizado, monto_total,
+                   producto_normalizado, cantidad_medida, unidad_medida
+            FROM historico_ofertas ORDER BY producto_cotizado
+        ''').fetchall()
+        assert rows == [
+            (7, None, None, 'Goma 2 un', 300, 'goma', 2.0, 'un'),
+            (7, 2, 3, 'Lápiz', 5000, 'lapiz', None, None),
+        ]
+
+
+class TestTablaFisica:
+    """Without PostgreSQL the historico table is never normalized."""
+
+    def test_sqlite(self, monkeypatch):
+        import database_extended as db
+        import dimensiones_historico as dim
+        import particiones_historico as ph
+
+        monkeypatch.setattr(db, 'USE_POSTGRES', False)
+        conn = sqlite3.connect(':memory:')
+
+        assert dim.tabla_fisica(conn) == 'historico_licitaciones'
+        assert ph.tabla_padre(conn) == 'historico_licitaciones'
+
+    def test_nombres_con_padre(self):
+        import particiones_historico as ph
+
+        assert ph.nombre_particion('2025-03', 'historico_ofertas') == 'historico_ofertas_2025_03'
+        assert ph.nombre_staging('2025-03', 'historico_ofertas') == 'historico_ofertas_2025_03_staging'
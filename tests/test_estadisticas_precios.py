@@ -0,0 +1,414 @@
+"""
+Tests para estadisticas_precios.py - Estadísticas de precio precalculadas.
+"""
+import sqlite3
+from datetime import date
+import pytest
+
+# producto_normalizado queda en NULL: se canoniza al leer
+INSERTAR = """
+    INSERT INTO historico_licitaciones
+    (producto_cotizado, region, cantidad, monto_total, es_ganador, fecha_cierre)
+    VALUES (?,?,?,?,?,?)
+"""
+
+
+@pytest.fixture
+def bd_estadisticas(tmp_path, monkeypatch):
+    """BD SQLite temporal con histórico y tabla de estadísticas."""
+    import database_extended as db
+
+    ruta = str(tmp_path / 'estadisticas.db')
+    conn = sqlite3.connect(ruta)
+    conn.executescript('''
+        CREATE TABLE historico_licitaciones (
+            producto_cotizado TEXT, region TEXT, cantidad INTEGER,
+            monto_total INTEGER, es_ganador BOOLEAN, fecha_cierre DATE,
+            producto_normalizado TEXT
+        );
+        CREATE TABLE estadisticas_precios (
+            termino TEXT NOT NULL, region TEXT NOT NULL DEFAULT '',
+            n_ofertas INTEGER, n_ganadores INTEGER, n_registros INTEGER, tasa_ganadores REAL,
+            p25 REAL, p42 REAL, p50 REAL, p75 REAL, p90 REAL, promedio REAL,
+            desviacion REAL, precio_min REAL, precio_max REAL,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (termino, region)
+        );
+    ''')
+    filas = []
+    for i in range(10):
+        filas.append(('Resma papel carta', 'Región Metropolitana', 10, 30000 + i * 1000, 1, '2025-05-10'))
+    filas.append(('papel, resma de carta', 'Valparaíso', 1, 3500, 1, '2025-06-02'))
+    filas.append(('Resma papel carta', 'Región Metropolitana', 10, 50000, 0, '2025-06-03'))
+    filas.append(('Tóner HP', 'Región Metropolitana', 1, 80000, 1, '2025-06-03'))
+    filas.append(('Resma papel carta', 'Región Metropolitana', 10, 1000, 1, '2020-01-01'))
+    conn.executemany(INSERTAR, filas)
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, 'USE_POSTGRES', False)
+    monkeypatch.setattr(db, 'get_connection', lambda: sqlite3.connect(ruta))
+    return ruta
+
+
+class TestNormalizarTermino:
+    """Tests de canonizacion.normalizar_termino"""
+
+    def test_orden_tildes_y_stop_words(self):
+        """Distintas redacciones del mismo producto comparten término"""
+        from canonizacion import normalizar_termino
+
+        assert normalizar_termino('Resma papel carta') == 'carta papel resma'
+        assert normalizar_termino('PAPEL, resma de Carta') == 'carta papel resma'
+        assert normalizar_termino('Tóner  HP') == 'hp toner'
+
+    def test_vacio(self):
+        """Textos sin tokens útiles producen término vacío"""
+        from canonizacion import normalizar_termino
+
+        assert normalizar_termino(None) == ''
+        assert normalizar_termino('de la') == ''
+
+
+class TestCalcularEstadisticas:
+    """Tests de calcular_estadisticas"""
+
+    def test_percentiles_y_outliers(self):
+        """Descarta outliers con la misma regla que el cálculo en vivo"""
+        import pandas as pd
+        from estadisticas_precios import calcular_estadisticas
+
+        precios = [100.0] * 30 + [10000.0]
+        df = pd.DataFrame({
+            'termino': 'lapiz',
+            'region': 'RM',
+            'precio_unitario': precios + [50.0],
+            'es_ganador': [True] * len(precios) + [False],
+        })
+
+        resultado = calcular_estadisticas(df).set_index('region')
+
+        todas = resultado.loc['']
+        assert todas['n_ofertas'] == 32
+        assert todas['n_ganadores'] == 31
+        assert todas['n_registros'] == 30
+        assert todas['p50'] == 100.0
+        assert todas['precio_max'] == 100.0
+        assert resultado.loc['RM', 'n_registros'] == 30
+
+    def test_outliers_con_mad(self):
+        """Un grupo de precios extremos no ensancha el rango (media ± 3σ los dejaría)"""
+        import pandas as pd
+        from estadisticas_precios import filtro_outliers
+
+        precios = pd.Series([100.0, 105.0, 110.0, 95.0, 90.0, 102.0, 98.0] * 3 + [1000.0] * 3)
+        por = pd.Series(['a'] * len(precios))
+
+        assert not ((precios - precios.mean()).abs() > 3 * precios.std()).any()
+        assert filtro_outliers(precios).sum() == 21
+        assert filtro_outliers(precios, [por]).tolist() == filtro_outliers(precios).tolist()
+
+    def test_resumen_precios_igual_a_pandas(self):
+        """resumen_precios (numpy) coincide con filtro_outliers + quantile de pandas"""
+        import numpy as np
+        import pandas as pd
+        from estadisticas_precios import PERCENTILES, filtro_outliers, resumen_precios
+
+        casos = [
+            [100.0, 105.0, 110.0, 95.0, 90.0, 102.0, 98.0] * 3 + [1000.0] * 3,
+            [100.0] * 30 + [10000.0],
+            [100.0, 100.0, 100.0, 130.0],
+            [42.0],
+        ]
+        for precios in casos:
+            serie = pd.Series(precios)
+            filtrados = serie[filtro_outliers(serie)]
+
+            stats = resumen_precios(np.array(precios))
+
+            assert stats['n_registros'] == len(filtrados)
+            assert stats['promedio'] == pytest.approx(filtrados.mean())
+            for clave, q in PERCENTILES.items():
+                assert stats[clave] == pytest.approx(filtrados.quantile(q))
+
+    def test_minimo_de_registros(self, monkeypatch):
+        """No guarda términos con pocos precios"""
+        import pandas as pd
+        import estadisticas_precios as ep
+
+        monkeypatch.setattr(ep, 'MIN_REGISTROS', 5)
+        df = pd.DataFrame({
+            'termino': ['a'] * 3,
+            'region': ['RM'] * 3,
+            'precio_unitario': [1.0, 2.0, 3.0],
+            'es_ganador': [True] * 3,
+        })
+
+        assert ep.calcular_estadisticas(df).empty
+
+
+class TestReconstruir:
+    """Tests de reconstruir y buscar_estadisticas"""
+
+    def test_completa_y_busqueda(self, bd_estadisticas):
+        """Agrupa redacciones equivalentes, ignora filas fuera de la ventana"""
+        import estadisticas_precios as ep
+
+        ep.reconstruir(hoy=date(2025, 7, 1))
+
+        stats = ep.buscar_estadisticas('papel carta resma')
+        assert stats['n_registros'] == 11
+        assert stats['n_ofertas'] == 12
+        assert stats['precio_min'] == 3000.0
+
+        regional = ep.buscar_estadisticas('Resma papel carta', 'región metropolitana')
+        assert regional['n_registros'] == 10
+
+        # Pocos registros: no se precalcula
+        assert ep.buscar_estadisticas('Tóner HP') is None
+
+    def test_incremental_solo_terminos_del_mes(self, bd_estadisticas):
+        """Recalcula solo los términos ofertados en los meses indicados"""
+        import estadisticas_precios as ep
+
+        ep.reconstruir(hoy=date(2025, 7, 1))
+        conn = sqlite3.connect(bd_estadisticas)
+        conn.execute("INSERT INTO estadisticas_precios (termino, region, n_registros) VALUES ('viejo', '', 9)")
+        conn.execute("UPDATE estadisticas_precios SET n_registros = 0 WHERE termino = 'carta papel resma'")
+        conn.commit()
+        conn.close()
+
+        ep.reconstruir(['2025-06'], hoy=date(2025, 7, 1))
+
+        assert ep.buscar_estadisticas('resma papel carta')['n_registros'] == 11
+        assert ep.buscar_estadisticas('viejo')['n_registros'] == 9
+
+
+class TestCalcularPrecioOptimo:
+    """Tests de la integración con calcular_precio_optimo"""
+
+    def test_responde_desde_tabla(self, bd_estadisticas, monkeypatch):
+        """Con el término precalculado no consulta el histórico"""
+        import estadisticas_precios as ep
+        import ml_precio_optimo
+
+        ep.reconstruir(hoy=date(2025, 7, 1))
+
+        def no_llamar(*args, **kwargs):
+            raise AssertionError("no debe calcular en vivo")
+
+        monkeypatch.setattr(ml_precio_optimo, 'buscar_productos_similares', no_llamar)
+
+        resultado = ml_precio_optimo.calcular_precio_optimo('Resma papel carta', 2)
+
+        assert resultado['success']
+        assert resultado['estadisticas']['fuente'] == 'precalculado'
+        assert resultado['estadisticas']['n_registros'] == 11
+        assert resultado['precio_total']['recomendado'] == round(resultado['precio_unitario']['recomendado'] * 2, 2)
+
+    def test_fallback_en_vivo(self, bd_estadisticas, monkeypatch):
+        """Términos sin estadísticas se calculan en vivo"""
+        import pandas as pd
+        import ml_precio_optimo
+
+        df = pd.DataFrame({
+            'producto_cotizado': ['Tóner HP'] * 3,
+            'es_ganador': [True] * 3,
+            'precio_unitario': [100.0, 110.0, 120.0],
+        })
+        monkeypatch.setattr(ml_precio_optimo, 'buscar_productos_similares', lambda *a, **k: df.copy())
+
+        resultado = ml_precio_optimo.calcular_precio_optimo('Tóner HP', 1)
+
+        assert resultado['estadisticas']['fuente'] == 'en_vivo'
+        assert resultado['precio_unitario']['p50'] == 110.0
+
+
+class TestCalcularPreciosLote:
+    """Tests de ml_precio_optimo.calcular_precios_lote"""
+
+    def test_orden_fuentes_y_errores(self, bd_estadisticas, monkeypatch):
+        """Resultados en el orden recibido, mezclando precalculado, en vivo y errores"""
+        import numpy as np
+        import pandas as pd
+        import estadisticas_precios as ep
+        import ml_precio_optimo
+
+        ep.reconstruir(hoy=date(2025, 7, 1))
+
+        pool = pd.DataFrame({
+            'id': [1, 2, 3, 4],
+            'producto_cotizado': ['Tóner HP 85A', 'Toner HP', 'Silla oficina', 'Tóner HP 85A'],
+            'monto_total': [80000, 90000, 50000, 70000],
+            'cantidad': [1, 1, 1, 1],
+            'region': ['Región Metropolitana', 'Región Metropolitana', 'Valparaíso', 'Valparaíso'],
+            'es_ganador': [True, True, True, True],
+            'fecha_cierre': ['2025-06-01'] * 4,
+            'nombre_proveedor': ['A', 'B', 'C', 'D'],
+        })
+        llamadas = []
+
+        def candidatos_lote(consultas, limite):
+            llamadas.append(consultas)
+            # Tóner en RM; Motoniveladora sin candidatos
+            return pool.copy(), [np.array([1, 2]), np.array([], dtype=np.int64)]
+
+        monkeypatch.setattr(ml_precio_optimo, '_candidatos_lote', candidatos_lote)
+
+        resultados = ml_precio_optimo.calcular_precios_lote([
+            {'producto': 'Tóner HP', 'cantidad': 2, 'region': 'región metropolitana'},
+            {'producto': 'Resma papel carta', 'cantidad': 3},
+            {'producto': '', 'cantidad': 1},
+            {'producto': 'Motoniveladora', 'cantidad': 1},
+        ])
+
+        assert len(resultados) == 4
+        assert resultados[0]['estadisticas']['fuente'] == 'en_vivo'
+        assert resultados[0]['estadisticas']['n_registros'] == 2
+        assert resultados[1]['estadisticas']['fuente'] == 'precalculado'
+        assert not resultados[2]['success']
+        assert not resultados[3]['success']
+        # Un solo pool de candidatos para los ítems sin estadísticas
+        assert llamadas == [[('Tóner HP', 'región metropolitana'), ('Motoniveladora', None)]]
+
+    def test_igual_que_calcular_precio_optimo(self, tmp_path, monkeypatch):
+        """El lote recomienda lo mismo que la llamada individual para cada ítem"""
+        from datetime import timedelta
+        import database_extended as db
+        import indice_productos
+        import ml_precio_optimo
+
+        ruta = str(tmp_path / 'lote.db')
+        conn = sqlite3.connect(ruta)
+        conn.execute('''
+            CREATE TABLE historico_licitaciones (
+                id INTEGER PRIMARY KEY, producto_cotizado TEXT, producto_normalizado TEXT,
+                monto_total INTEGER, cantidad INTEGER, region TEXT, es_ganador BOOLEAN,
+                fecha_cierre DATE, nombre_proveedor TEXT
+            )
+        ''')
+        reciente = (date.today() - timedelta(days=30)).isoformat()
+        filas = []
+        for i in range(12):
+            filas.append(('Tóner HP 85A', 70000 + i * 1500, 1, 'Región Metropolitana', 1, reciente, f'P{i % 4}'))
+            filas.append(('Resma papel carta', 3000 + i * 100, 1, 'Valparaíso', 1, reciente, f'P{i % 3}'))
+        filas.append(('Toner HP', 900000, 1, 'Región Metropolitana', 1, reciente, 'P9'))
+        conn.executemany('''
+            INSERT INTO historico_licitaciones
+            (producto_cotizado, monto_total, cantidad, region, es_ganador, fecha_cierre, nombre_proveedor)
+            VALUES (?,?,?,?,?,?,?)
+        ''', filas)
+        conn.commit()
+        conn.close()
+
+        monkeypatch.setattr(db, 'USE_POSTGRES', False)
+        monkeypatch.setattr(db, 'get_connection', lambda: sqlite3.connect(ruta))
+        monkeypatch.setattr(indice_productos, 'candidatos', lambda *a, **k: None)
+
+        items = [
+            {'producto': 'Tóner HP', 'cantidad': 2, 'region': 'Región Metropolitana'},
+            {'producto': 'Resma carta', 'cantidad': 10},
+        ]
+        lote = ml_precio_optimo.calcular_precios_lote(items, usar_precalculado=False)
+        individuales = [
+            ml_precio_optimo.calcular_precio_optimo(
+                item['producto'], item['cantidad'], item.get('region'), usar_precalculado=False
+            )
+            for item in items
+        ]
+
+        assert all(resultado['success'] for resultado in lote)
+        assert lote == individuales
+
+
+class TestAnalisisMercado:
+    """Tests del análisis de mercado compartido entre precio y competencia"""
+
+    @pytest.fixture
+    def similares(self, monkeypatch):
+        import pandas as pd
+        import ml_precio_optimo
+        import sketches_precios
+
+        df = pd.DataFrame({
+            'producto_cotizado': ['Tóner HP'] * 4,
+            'nombre_proveedor': ['A', 'A', 'B', 'C'],
+            'monto_total': [100, 110, 120, 130],
+            'es_ganador': [True, False, True, True],
+            'precio_unitario': [100.0, 110.0, 120.0, 130.0],
+            'similitud': [100.0, 95.0, 90.0, 85.0],
+        })
+        llamadas = []
+
+        def buscar(producto, region=None, limite=500, umbral_similitud=60, offline=False):
+            llamadas.append((producto, region, limite))
+            return df.copy()
+
+        monkeypatch.setattr(ml_precio_optimo, 'buscar_productos_similares', buscar)
+        monkeypatch.setattr(sketches_precios, 'consultar', lambda *a, **k: None)
+        return llamadas
+
+    def test_una_busqueda_para_precio_y_competencia(self, similares):
+        """Precio y competencia del mismo término y región comparten candidatos"""
+        import ml_precio_optimo
+
+        precio = ml_precio_optimo.calcular_precio_optimo('Tóner HP', 1, 'RM', usar_precalculado=False)
+        competencia = ml_precio_optimo.analizar_competencia_precios('toner  hp', region='rm ')
+
+        assert precio['precio_unitario']['p50'] == 120.0
+        assert competencia['total_competidores'] == 3
+        assert competencia['estadisticas_generales']['fuente'] == 'en_vivo'
+        assert similares == [('Tóner HP', 'RM', ml_precio_optimo.LIMITE_MERCADO)]
+
+        ml_precio_optimo.analizar_competencia_precios('Tóner HP', region='Valparaíso')
+        assert len(similares) == 2
+
+    def test_expira_y_sin_cache(self, similares, monkeypatch):
+        """Con TTL 0 cada llamada vuelve a buscar"""
+        import ml_precio_optimo
+
+        monkeypatch.setattr(ml_precio_optimo, 'MERCADO_TTL_SEGUNDOS', 0)
+
+        ml_precio_optimo.analizar_competencia_precios('Tóner HP')
+        ml_precio_optimo.analizar_competencia_precios('Tóner HP')
+
+        assert len(similares) == 2
+
+
+    def test_redis_compartido_entre_procesos(self, similares, mock_redis):
+        """Con Redis otro proceso (LRU local vacío) reutiliza los candidatos"""
+        import ml_precio_optimo
+
+        primero = ml_precio_optimo.analisis_mercado('Tóner HP', 'RM')
+        ml_precio_optimo.limpiar_cache_mercado()
+        segundo = ml_precio_optimo.analisis_mercado('toner hp', 'rm')
+
+        assert len(similares) == 1
+        assert any(k.startswith(ml_precio_optimo.PREFIJO_REDIS_MERCADO) for k in mock_redis._store)
+        assert segundo.precio(1)['precio_unitario'] == primero.precio(1)['precio_unitario']
+        assert segundo.competencia()['total_competidores'] == 3
+
+    def test_resumen_mercado(self, similares):
+        """resumen_mercado devuelve solo las columnas del resumen de /stats"""
+        import ml_precio_optimo
+
+        df = ml_precio_optimo.resumen_mercado('Tóner HP')
+
+        assert list(df.columns) == ml_precio_optimo.COLUMNAS_RESUMEN_MERCADO
+        assert len(df) == 4
+
+    def test_postgres_usa_el_analisis_compartido(self, similares, monkeypatch):
+        """En PostgreSQL el precio en vivo sale de los candidatos en memoria, sin otra consulta"""
+        import database_extended as db
+        import ml_precio_optimo
+
+        monkeypatch.setattr(db, 'USE_POSTGRES', True)
+        monkeypatch.setattr(db, 'get_connection', lambda: pytest.fail("no debe consultar la BD"))
+
+        precio = ml_precio_optimo.calcular_precio_optimo('Tóner HP', 1, usar_precalculado=False)
+        competencia = ml_precio_optimo.analizar_competencia_precios('Tóner HP')
+
+        assert len(similares) == 1
+        assert precio['precio_unitario']['p50'] == 120.0
+        assert competencia['total_competidores'] == 3
+
@@ -0,0 +1,202 @@
+"""
+Tests para gemini_ai.py - Enriquecimiento en paralelo del análisis completo.
+"""
+import asyncio
+import json
+import threading
+import time
+import pytest
+
+
+RESPUESTA_IA = json.dumps({'resumen_ejecutivo': 'ok'})
+
+LICITACION = {'codigo': '123-1-COT25', 'nombre': 'Compra de resmas', 'monto_disponible': 100000}
+
+
+def _precio(producto):
+    return {
+        'success': True, 'confianza': 0.8, 'recomendacion': f'Precio de {producto}',
+        'precio_unitario': {'recomendado': 1000},
+        'precio_total': {'recomendado': 10000},
+        'estadisticas': {'n_registros': 10, 'n_ganadores': 5, 'tasa_conversion': 50.0},
+    }
+
+
+@pytest.fixture
+def analisis(monkeypatch):
+    """gemini_ai con IA y ramas de enriquecimiento simuladas (pool ML en hilos)."""
+    import gemini_ai
+    import ml_precio_optimo
+    import pool_ml
+    import rag_historico
+
+    monkeypatch.setattr(pool_ml, 'POOL_ML_WORKERS', 0)
+    monkeypatch.setattr(pool_ml, 'POOL_ML_MAX_COLA', 1)
+    pool_ml.cerrar()
+
+    prompts = []
+    monkeypatch.setattr(gemini_ai, '_generate_text', lambda prompt, **kw: prompts.append(prompt) or RESPUESTA_IA)
+
+    async def agenerar(prompt, **kw):
+        prompts.append(prompt)
+        return RESPUESTA_IA
+
+    monkeypatch.setattr(gemini_ai, '_agenerate_text', agenerar)
+    monkeypatch.setattr(rag_historico, 'enriquecer_analisis_licitacion', lambda **kw: {
+        'tiene_datos': True, 'n_casos_encontrados': 3,
+        'contexto_para_prompt': 'CASOS HISTORICOS', 'insights': 'INSIGHTS',
+    })
+    monkeypatch.setattr(ml_precio_optimo, 'calcular_precios_lote',
+                        lambda items, **kw: [_precio(i['producto']) for i in items])
+    monkeypatch.setattr(gemini_ai, 'ANALISIS_TIMEOUT_RAG', 0.5)
+    monkeypatch.setattr(gemini_ai, 'ANALISIS_TIMEOUT_PRECIO', 0.5)
+    return gemini_ai, prompts
+
+
+class TestEnriquecimientoParalelo:
+    """Tests de analizar_licitacion_completo con ramas en paralelo"""
+
+    def test_ramas_concurrentes_y_todos_los_productos(self, analisis, monkeypatch):
+        """RAG y lotes de precios corren a la vez y se valoran todos los productos"""
+        import ml_precio_optimo
+        import rag_historico
+
+        gemini_ai, prompts = analisis
+        # Cada rama (RAG y el lote de precios) espera a la otra: en secuencia no terminaría a tiempo
+        barrera = threading.Barrier(2, timeout=2)
+        calcular = ml_precio_optimo.calcular_precios_lote
+        enriquecer = rag_historico.enriquecer_analisis_licitacion
+
+        def calcular_tras_barrera(items, **kw):
+            barrera.wait()
+            return calcular(items, **kw)
+
+        def enriquecer_tras_barrera(**kw):
+            barrera.wait()
+            return enriquecer(**kw)
+
+        monkeypatch.setattr(ml_precio_optimo, 'calcular_precios_lote', calcular_tras_barrera)
+        monkeypatch.setattr(rag_historico, 'enriquecer_analisis_licitacion', enriquecer_tras_barrera)
+
+        productos = [{'nombre': 'Resma carta', 'cantidad': 10}, {'nombre': 'Resma oficio', 'cantidad': 5}]
+        resultado = gemini_ai.analizar_licitacion_completo(LICITACION, {}, productos)
+
+        metadata = resultado['_metadata']
+        assert metadata['parcial'] is False and metadata['ramas_omitidas'] == []
+        assert metadata['productos_con_precio_ml'] == 2
+        assert metadata['casos_historicos_encontrados'] == 3
+        assert 'CASOS HISTORICOS' in prompts[0] and 'Resma oficio' in prompts[0]
+
+    def test_precio_lento_marca_parcial(self, analisis, monkeypatch):
+        """Si el precio no llega a tiempo el prompt sale sin él y el análisis es parcial"""
+        import ml_precio_optimo
+
+        gemini_ai, prompts = analisis
+        liberar = threading.Event()
+
+        def calcular_lento(items, **kw):
+            liberar.wait(5)
+            return []
+
+        monkeypatch.setattr(ml_precio_optimo, 'calcular_precios_lote', calcular_lento)
+
+        inicio = time.monotonic()
+        try:
+            resultado = gemini_ai.analizar_licitacion_completo(LICITACION, {}, [{'nombre': 'Resma', 'cantidad': 1}])
+        finally:
+            liberar.set()
+
+        assert time.monotonic() - inicio < 3
+        metadata = resultado['_metadata']
+        assert metadata['parcial'] is True and metadata['ramas_omitidas'] == ['precio']
+        assert metadata['precio_ml_calculado'] is False
+        assert metadata['casos_historicos_encontrados'] == 3
+        assert 'no estuvo disponible' in prompts[0]
+
+    def test_error_en_rag_degrada(self, analisis, monkeypatch):
+        """Un error del RAG no impide el análisis con precios"""
+        import rag_historico
+
+        gemini_ai, _ = analisis
+
+        def fallar(**kw):
+            raise RuntimeError("BD caída")
+
+        monkeypatch.setattr(rag_historico, 'enriquecer_analisis_licitacion', fallar)
+
+        resultado = gemini_ai.analizar_licitacion_completo(LICITACION, {}, [{'nombre': 'Resma', 'cantidad': 1}])
+
+        metadata = resultado['_metadata']
+        assert metadata['ramas_omitidas'] == ['rag']
+        assert metadata['precio_ml_calculado'] is True
+
+    def test_pool_saturado_omite_sin_esperar(self, analisis, monkeypatch):
+        """Con las ramas abandonadas ocupando el pool ML, las nuevas se omiten de inmediato"""
+        import ml_precio_optimo
+        import pool_ml
+
+        gemini_ai, _ = analisis
+        # capacidad = 1 worker + 1 en cola
+        liberar = threading.Event()
+        llamadas = []
+
+        def calcular_lento(items, **kw):
+            llamadas.append(items)
+            liberar.wait(5)
+            return []
+
+        monkeypatch.setattr(ml_precio_optimo, 'calcular_precios_lote', calcular_lento)
+        productos = [{'nombre': 'Resma', 'cantidad': 1}]
+
+        try:
+            # El primer análisis abandona su lote de precios, que sigue en curso
+            gemini_ai.analizar_licitacion_completo(LICITACION, {}, productos)
+            # El lote abandonado llena el pool: RAG y precio se omiten sin esperar el timeout
+            monkeypatch.setattr(pool_ml, 'POOL_ML_MAX_COLA', 0)
+            inicio = time.monotonic()
+            resultado = gemini_ai.analizar_licitacion_completo(LICITACION, {}, productos)
+            assert time.monotonic() - inicio < 0.4
+        finally:
+            liberar.set()
+
+        assert len(llamadas) == 1
+        assert resultado['_metadata']['ramas_omitidas'] == ['rag', 'precio']
+        for _ in range(50):
+            if pool_ml.en_curso() == 0:
+                break
+            time.sleep(0.02)
+        assert pool_ml.en_curso() == 0
+
+
+class TestAnalisisAsync:
+    """Tests de las variantes async usadas por el bot"""
+
+    def test_analisis_async_igual_al_sync(self, analisis):
+        """La variante async arma el mismo prompt y metadatos que la sync"""
+        gemini_ai, prompts = analisis
+        productos = [{'nombre': 'Resma carta', 'cantidad': 10}]
+
+        sync = gemini_ai.analizar_licitacion_completo(LICITACION, {}, productos)
+        asincrono = asyncio.run(gemini_ai.analizar_licitacion_completo_async(LICITACION, {}, productos))
+
+        assert asincrono == sync
+        assert prompts[0] == prompts[1]
+
+    def test_streaming_avanza_y_parsea_al_final(self, analisis, monkeypatch):
+        """Con al_avanzar se reciben los avances y el JSON se parsea al terminar"""
+        gemini_ai, _ = analisis
+
+        async def stream(prompt, **kw):
+            for fragmento in ['{"resumen_', 'ejecutivo": ', '"ok"}']:
+                yield fragmento
+
+        monkeypatch.setattr(gemini_ai, '_astream_text', stream)
+        avances = []
+
+        async def al_avanzar(acumulado):
+            avances.append(acumulado)
+
+        guia = asyncio.run(gemini_ai.generar_ayuda_cotizacion_async(LICITACION, {}, {}, al_avanzar=al_avanzar))
+
+        assert avances == ['{"resumen_', '{"resumen_ejecutivo": ', '{"resumen_ejecutivo": "ok"}']
+        assert guia == {'resumen_ejecutivo': 'ok'}
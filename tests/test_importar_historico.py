@@ -0,0 +1,173 @@
+"""
+Tests for importar_historico.py - Importación del histórico de cotizaciones.
+"""
+import io
+import sqlite3
+import zipfile
+
+import pytest
+
+
+ENCABEZADO = (
+    'CodigoCotizacion;NombreCotizacion;Region;RUTProveedor;RazonSocialProveedor;'
+    'ProductoCotizado;CantidadSolicitada;MontoTotal;DetalleCotizacion;'
+    'ProveedorSeleccionado;FechaCierreParaCotizar'
+)
+
+
+def _crear_zip(filas, nombre='COT_2025-01.csv'):
+    contenido = "\n".join([ENCABEZADO] + filas) + "\n"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr(nombre, contenido.encode('utf-8-sig'))
+    buffer.seek(0)
+    return zipfile.ZipFile(buffer)
+
+
+def _conexion_sqlite(ruta=':memory:'):
+    conn = sqlite3.connect(ruta)
+    conn.execute('''
+        CREATE TABLE historico_licitaciones (
+            codigo_cotizacion TEXT, nombre_cotizacion TEXT, region TEXT,
+            rut_proveedor TEXT, nombre_proveedor TEXT, producto_cotizado TEXT,
+            cantidad INTEGER, monto_total INTEGER, detalle_oferta TEXT,
+            es_ganador BOOLEAN, fecha_cierre DATE,
+            producto_normalizado TEXT, nombre_normalizado TEXT, cantidad_medida REAL, unidad_medida TEXT
+        )
+    ''')
+    return conn
+
+
+class TestTransformador:
+    """Tests for construir_transformador."""
+
+    def test_mapea_fila_completa(self):
+        import importar_historico as ih
+
+        transformar = ih.construir_transformador(ENCABEZADO.split(';'))
+        item = transformar(['C1', 'Nombre', 'RM', '1-9', 'Prov', 'Papel', '10', '5000', 'det', 'Si', '2025-01-15'])
+
+        assert item == (
+            'C1', 'Nombre', 'RM', '1-9', 'Prov', 'Papel', 10, 5000, 'det', True, '2025-01-15',
+            'papel', 'nombre', None, None
+        )
+
+    def test_valores_vacios(self):
+        import importar_historico as ih
+
+        transformar = ih.construir_transformador(ENCABEZADO.split(';'))
+        item = transformar(['C1', '', '', '', '', '', '', '', '', 'No', ''])
+
+        assert item[6] == 0
+        assert item[7] == 0
+        assert item[9] is False
+        assert item[10] is None
+
+    def test_columnas_faltantes(self):
+        import importar_historico as ih
+
+        with pytest.raises(ValueError):
+            ih.construir_transformador(['CodigoCotizacion', 'Region'])
+
+
+class TestProcesarCSV:
+    """Tests for procesar_csv with an in-memory SQLite connection."""
+
+    def test_importa_en_una_pasada(self, monkeypatch):
+        import importar_historico as ih
+
+        monkeypatch.setattr(ih.db, 'USE_POSTGRES', False)
+        monkeypatch.setattr(ih, 'BATCH_SIZE', 2)
+
+        z = _crear_zip([
+            'C1;Papel;RM;1-9;Prov A;Papel carta;10;5000;det;Si;2025-01-15',
+            'C2;Lapiz;RM;2-7;Prov B;Lapiz;x;100;det;No;2025-01-16',
+            'C3;Toner;V;3-5;Prov C;Toner;2;90000;det;SI;2025-01-17',
+            'C4;Corto;V',
+            'C5;Cinta;V;4-3;Prov D;Cinta;1;900;det;no;2025-01-18',
+        ])
+        conn = _conexion_sqlite()
+
+        count = ih.procesar_csv(z, 'COT_2025-01.csv', conn)
+
+        assert count == 3
+        filas = conn.execute(
+            'SELECT codigo_cotizacion, es_ganador FROM historico_licitaciones ORDER BY codigo_cotizacion'
+        ).fetchall()
+        assert filas == [('C1', 1), ('C3', 1), ('C5', 0)]
+
+
+class TestDescargarYProcesar:
+    """Tests for descargar_y_procesar using a fake HTTP session."""
+
+    def test_streaming_y_cache(self, tmp_path, monkeypatch):
+        import importar_historico as ih
+        import descarga_historico as dh
+        from test_descarga_historico import _SesionFalsa, _zip_bytes
+
+        contenido = "\n".join([
+            ENCABEZADO,
+            'C1;Papel;RM;1-9;Prov A;Papel carta;10;5000;det;Si;2025-01-15',
+            'C2;Toner;V;3-5;Prov C;Toner;2;90000;det;No;2025-01-17',
+        ]) + "\n"
+        datos = _zip_bytes({'COT_2025-01.csv': contenido.encode('utf-8')}, seekable=False)
+        sesion = _SesionFalsa(datos)
+
+        ruta_db = str(tmp_path / 'test.db')
+        conn = _conexion_sqlite(ruta_db)
+        conn.commit()
+        monkeypatch.setattr(ih.db, 'USE_POSTGRES', False)
+        monkeypatch.setattr(ih.db, 'get_connection', lambda: sqlite3.connect(ruta_db))
+        monkeypatch.setattr(dh, 'CACHE_DIR', str(tmp_path / 'cache'))
+        monkeypatch.setattr(dh.requests, 'Session', lambda: sesion)
+
+        url = 'http://x/COT_2025-01.zip'
+        ih.descargar_y_procesar(url)
+        assert conn.execute('SELECT COUNT(*) FROM historico_licitaciones').fetchone()[0] == 2
+
+        # Segunda importación: desde caché, sin nuevas descargas
+        ih.descargar_y_procesar(url)
+        assert len(sesion.rangos) == 1
+        assert conn.execute('SELECT COUNT(*) FROM historico_licitaciones').fetchone()[0] == 4
+
+
+class TestImportacionParalela:
+    """Tests for the parallel import mode."""
+
+    def test_bloques_respetan_campos_entre_comillas(self):
+        import importar_historico as ih
+
+        registros = [b'a;"linea 1\nlinea 2";x\n', b'b;simple;y\n', b'c;"con ""comillas""\n y salto";z\n'] * 50
+        datos = b''.join(registros)
+
+        bloques = list(ih.bloques_alineados(io.BytesIO(datos), tamano=37))
+
+        assert b''.join(bloques) == datos
+        for bloque in bloques:
+            assert bloque.endswith(b'\n')
+            assert bloque.count(b'"') % 2 == 0
+
+    def test_valores_copy(self):
+        import importar_historico as ih
+
+        assert ih._valor_copy(None) == '\\N'
+        assert ih._valor_copy(True) == 't'
+        assert ih._valor_copy(10) == '10'
+        assert ih._valor_copy('a\tb\\c\nd') == 'a\\tb\\\\c\\nd'
+
+    @pytest.mark.slow
+    def test_importa_con_workers(self, monkeypatch):
+        import importar_historico as ih
+
+        monkeypatch.setattr(ih.db, 'USE_POSTGRES', False)
+        monkeypatch.setattr(ih, 'PARALLEL_CHUNK_BYTES', 64)
+
+        filas = [f'C{i};Papel;RM;1-9;Prov;"Papel\ncarta";{i};{i * 10};det;Si;2025-01-15' for i in range(1, 41)]
+        filas.append('C99;Malo;RM;1-9;Prov;Papel;x;1;det;No;2025-01-15')
+        z = _crear_zip(filas)
+        conn = _conexion_sqlite()
+
+        count = ih.procesar_csv(z, 'COT_2025-01.csv', conn, workers=2)
+
+        assert count == 40
+        assert conn.execute('SELECT SUM(cantidad) FROM historico_licitaciones').fetchone()[0] == sum(range(1, 41))
@@ -0,0 +1,146 @@
+"""
+Tests para indice_productos.py - Índice invertido en memoria del histórico.
+"""
+import sqlite3
+from datetime import date
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def bd_historico(tmp_path, monkeypatch):
+    """BD SQLite temporal con un histórico pequeño."""
+    import database_extended as db
+
+    ruta = str(tmp_path / 'historico.db')
+    conn = sqlite3.connect(ruta)
+    conn.executescript('''
+        CREATE TABLE historico_licitaciones (
+            id INTEGER PRIMARY KEY, codigo_cotizacion TEXT, nombre_cotizacion TEXT,
+            region TEXT, rut_proveedor TEXT, nombre_proveedor TEXT, producto_cotizado TEXT,
+            cantidad INTEGER, monto_total INTEGER, detalle_oferta TEXT,
+            es_ganador BOOLEAN, fecha_cierre DATE,
+            producto_normalizado TEXT, nombre_normalizado TEXT, cantidad_medida REAL, unidad_medida TEXT
+        );
+    ''')
+    filas = [
+        (1, 'C1', 'Compra de resmas', 'Metropolitana', 'Resma papel carta', 10, 30000, 1, '2025-05-10'),
+        (2, 'C1', 'Compra de resmas', 'Metropolitana', 'Resma papel carta', 10, 32000, 0, '2025-05-10'),
+        (3, 'C2', 'Útiles de oficina', 'Valparaíso', 'papel carta', 5, 9000, 1, '2025-06-01'),
+        (4, 'C3', 'Insumos impresión', 'Metropolitana', 'Tóner HP 85A', 2, 90000, 1, '2025-06-02'),
+        (5, 'C4', 'Compra de resmas', 'Metropolitana', 'Resma papel carta', 10, 1000, 1, '2021-01-01'),
+        (6, 'C5', 'Resmas', 'Metropolitana', 'Resma papel carta', 10, 0, 1, '2025-06-03'),
+    ]
+    conn.executemany('''
+        INSERT INTO historico_licitaciones
+        (id, codigo_cotizacion, nombre_cotizacion, region, producto_cotizado,
+         cantidad, monto_total, es_ganador, fecha_cierre)
+        VALUES (?,?,?,?,?,?,?,?,?)
+    ''', filas)
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, 'USE_POSTGRES', False)
+    monkeypatch.setattr(db, 'get_connection', lambda: sqlite3.connect(ruta))
+    return ruta
+
+
+@pytest.fixture
+def indice(bd_historico):
+    import indice_productos as ip
+
+    conn = sqlite3.connect(bd_historico)
+    try:
+        return ip.IndiceProductos.construir(conn, date(2023, 1, 1))
+    finally:
+        conn.close()
+
+
+class TestCandidatos:
+    """Tests de IndiceProductos.candidatos"""
+
+    def test_ranking_por_relevancia(self, indice):
+        """Los textos más parecidos primero; excluye ventana y montos en cero"""
+        ids = indice.candidatos('resma de papel carta')
+
+        assert set(ids[:2]) == {1, 2}
+        assert ids[2] == 3
+        assert 4 not in ids
+        assert 5 not in ids and 6 not in ids
+
+    def test_filtros_en_memoria(self, indice):
+        """Filtra por ganador, fecha y región sin ir a la BD"""
+        assert list(indice.candidatos('papel carta', solo_ganadores=True, region='metropolitana')) == [1]
+        assert list(indice.candidatos('papel carta', desde=date(2025, 6, 1))) == [3]
+        assert len(indice.candidatos('papel carta', region='Atacama')) == 0
+
+    def test_varios_campos(self, indice):
+        """Combina nombre y producto sin duplicar filas"""
+        ids = indice.candidatos('útiles oficina', campos=('nombre', 'producto'))
+
+        assert list(ids) == [3]
+
+    def test_sin_coincidencias(self, indice):
+        """Consultas con tokens desconocidos no retornan filas"""
+        assert len(indice.candidatos('motoniveladora')) == 0
+
+
+class TestSnapshot:
+    """Tests de guardar/cargar y de la instancia del proceso"""
+
+    def test_roundtrip(self, indice, tmp_path):
+        """El snapshot cargado responde igual que el índice construido"""
+        import indice_productos as ip
+
+        ruta = str(tmp_path / 'indice.npz')
+        indice.guardar(ruta)
+        cargado = ip.IndiceProductos.cargar(ruta)
+
+        assert len(cargado) == len(indice)
+        assert cargado.regiones == indice.regiones
+        np.testing.assert_array_equal(
+            cargado.candidatos('resma papel', campos=('nombre', 'producto')),
+            indice.candidatos('resma papel', campos=('nombre', 'producto'))
+        )
+
+    def test_refrescar_y_obtener(self, bd_historico, tmp_path, monkeypatch):
+        """refrescar() publica el índice; sin snapshot no hay índice"""
+        import indice_productos as ip
+
+        monkeypatch.setattr(ip, '_indice', None)
+        monkeypatch.setattr(ip, '_indice_mtime', None)
+        ruta = str(tmp_path / 'indice.npz')
+        monkeypatch.setattr(ip, 'INDICE_RUTA', ruta)
+
+        assert ip.candidatos('resma') is None
+
+        ip.refrescar(hoy=date(2025, 7, 1))
+
+        assert ip.obtener() is not None
+        assert 1 in ip.candidatos('resma papel carta')
+
+
+class TestIntegracion:
+    """Tests de uso desde ml_precio_optimo"""
+
+    def test_buscar_productos_similares_usa_indice(self, indice, bd_historico, monkeypatch):
+        """Con índice disponible se leen solo las filas candidatas"""
+        import indice_productos as ip
+        import ml_precio_optimo
+
+        monkeypatch.setattr(ip, 'obtener', lambda: indice)
+        monkeypatch.setattr(ml_precio_optimo, 'datetime', _Fecha)
+
+        df = ml_precio_optimo.buscar_productos_similares('resma papel carta')
+
+        assert sorted(df['producto_cotizado']) == ['Resma papel carta', 'papel carta']
+        assert set(df['monto_total']) == {30000, 9000}
+
+
+class _Fecha:
+    """datetime con now() fijo (la ventana de 2 años depende de la fecha)."""
+
+    @staticmethod
+    def now():
+        from datetime import datetime
+        return datetime(2025, 7, 1)
@@ -0,0 +1,124 @@
+"""
+Tests para indice_tfidf.py - Índice TF-IDF de trigramas del histórico.
+"""
+import sqlite3
+from datetime import date
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def bd_historico(tmp_path, monkeypatch):
+    """BD SQLite temporal con un histórico pequeño."""
+    import database_extended as db
+
+    ruta = str(tmp_path / 'historico.db')
+    conn = sqlite3.connect(ruta)
+    conn.executescript('''
+        CREATE TABLE historico_licitaciones (
+            id INTEGER PRIMARY KEY, codigo_cotizacion TEXT, nombre_cotizacion TEXT,
+            region TEXT, rut_proveedor TEXT, nombre_proveedor TEXT, producto_cotizado TEXT,
+            cantidad INTEGER, monto_total INTEGER, detalle_oferta TEXT,
+            es_ganador BOOLEAN, fecha_cierre DATE,
+            producto_normalizado TEXT, nombre_normalizado TEXT, cantidad_medida REAL, unidad_medida TEXT
+        );
+    ''')
+    filas = [
+        (1, 'C1', 'Compra de resmas', 'Resma papel carta', 10, 30000, 1, '2025-05-10'),
+        (2, 'C1', 'Compra de resmas', 'Resma papel carta', 10, 32000, 0, '2025-05-12'),
+        (3, 'C2', 'Útiles de oficina', 'Carpeta oficio', 5, 9000, 1, '2025-06-01'),
+        (4, 'C3', 'Insumos impresión', 'Tóner HP 85A', 2, 90000, 1, '2025-06-02'),
+        (5, 'C4', 'Compra de resmas', 'Resma papel carta', 10, 1000, 1, '2021-01-01'),
+        (6, 'C5', 'Mobiliario', 'Silla ergonómica', 1, 50000, 1, '2025-06-03'),
+    ]
+    conn.executemany('''
+        INSERT INTO historico_licitaciones
+        (id, codigo_cotizacion, nombre_cotizacion, producto_cotizado,
+         cantidad, monto_total, es_ganador, fecha_cierre)
+        VALUES (?,?,?,?,?,?,?,?)
+    ''', filas)
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, 'USE_POSTGRES', False)
+    monkeypatch.setattr(db, 'get_connection', lambda: sqlite3.connect(ruta))
+    return ruta
+
+
+@pytest.fixture
+def indice(bd_historico):
+    import indice_tfidf as it
+
+    conn = sqlite3.connect(bd_historico)
+    try:
+        return it.IndiceTfidf.construir(conn, date(2023, 1, 1), n_features=2 ** 16)
+    finally:
+        conn.close()
+
+
+class TestBuscar:
+    """Tests de IndiceTfidf.buscar y candidatos"""
+
+    def test_variantes_y_orden(self, indice):
+        """Plurales, erratas y otro orden de palabras encuentran el documento"""
+        # Las filas de un documento salen de la más reciente a la más antigua
+        ids = indice.candidatos('papeles carta resma')
+        assert ids[:2].tolist() == [2, 1]
+
+        assert indice.candidatos('tonner hp')[0] == 4
+        assert indice.candidatos('silla ergonomica')[0] == 6
+
+    def test_coseno_ordenado(self, indice):
+        """Puntajes de coseno entre 0 y 1, de mayor a menor"""
+        documentos, puntajes = indice.buscar('resma papel carta oficio', k=5)
+
+        assert len(documentos) >= 2
+        assert np.all(np.diff(puntajes) <= 0)
+        assert 0 < puntajes[-1] <= puntajes[0] <= 1.0 + 1e-6
+
+    def test_filtros_y_vacio(self, indice):
+        """Filtro por fecha, límite y consultas sin trigramas"""
+        assert indice.candidatos('resma papel carta', limite=1).tolist() == [2]
+        recientes = indice.candidatos('resma papel carta', desde=date(2025, 5, 11)).tolist()
+        assert recientes[0] == 2 and 1 not in recientes
+        assert len(indice.candidatos('de la')) == 0
+        assert len(indice.candidatos('zzzz qqqq')) == 0
+
+
+class TestSnapshot:
+    """Tests de guardar/cargar con mmap"""
+
+    def test_roundtrip_mmap(self, indice, tmp_path):
+        """La versión guardada se abre con mmap y responde igual"""
+        import indice_tfidf as it
+
+        directorio = str(tmp_path / 'tfidf')
+        indice.guardar(directorio)
+        indice.guardar(directorio)
+        cargado = it.IndiceTfidf.cargar(directorio)
+
+        assert isinstance(cargado.datos, np.memmap)
+        assert len([d for d in (tmp_path / 'tfidf').iterdir() if d.is_dir()]) == 1
+        assert cargado.candidatos('tonner hp').tolist() == indice.candidatos('tonner hp').tolist()
+
+
+class TestIntegracion:
+    """Tests del recuperador alternativo en rag_historico"""
+
+    def test_buscar_casos_similares_con_tfidf(self, bd_historico, tmp_path, monkeypatch):
+        """Con recuperador='tfidf' los candidatos salen del índice de trigramas"""
+        import indice_productos
+        import indice_tfidf as it
+        import rag_historico
+
+        monkeypatch.setattr(it, 'INDICE_DIR', str(tmp_path / 'tfidf'))
+        monkeypatch.setattr(it, 'VENTANA_DIAS', 10000)
+        monkeypatch.setattr(it, '_indice', None)
+        monkeypatch.setattr(it, '_indice_mtime', None)
+        monkeypatch.setattr(indice_productos, 'candidatos', lambda *a, **k: pytest.fail("no debe usar el índice por tokens"))
+        it.refrescar()
+
+        casos = rag_historico.buscar_casos_similares('resmas papel carta', recuperador='tfidf')
+
+        assert casos
+        assert {caso['producto'] for caso in casos} == {'Resma papel carta'}
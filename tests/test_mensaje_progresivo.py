@@ -0,0 +1,83 @@
+"""
+Tests para mensaje_progresivo.py - Streaming de respuestas de IA en Telegram.
+"""
+import asyncio
+import pytest
+
+
+class MensajeFalso:
+    """Doble de telegram.Message que registra las ediciones."""
+
+    def __init__(self, errores=None):
+        self.ediciones = []
+        self.respuestas = []
+        self.errores = list(errores or [])
+
+    async def edit_text(self, texto, **kwargs):
+        if self.errores:
+            raise self.errores.pop(0)
+        self.ediciones.append((texto, kwargs))
+
+    async def reply_text(self, texto, **kwargs):
+        self.respuestas.append((texto, kwargs))
+        return self
+
+
+class TestTextoLegibleJson:
+    """Tests de la vista previa de JSON parcial"""
+
+    def test_valores_sin_claves(self):
+        """Se muestran los valores (incluido el incompleto), no las claves"""
+        from mensaje_progresivo import texto_legible_json
+
+        parcial = '{"compatibilidad": {"score": 80, "explicacion": "Buen calce", "fortalezas": ["Stock", "Prec'
+
+        assert texto_legible_json(parcial) == "• Buen calce\n• Stock\n• Prec"
+
+    def test_comillas_escapadas(self):
+        """Las comillas escapadas no cortan el valor"""
+        from mensaje_progresivo import texto_legible_json
+
+        assert texto_legible_json('{"resumen": "Dice \\"sí\\""}') == '• Dice "sí"'
+
+
+class TestMensajeProgresivo:
+    """Tests de las ediciones espaciadas"""
+
+    def test_ediciones_espaciadas(self, monkeypatch):
+        """Dentro del intervalo no se edita; finalizar siempre aplica el formato"""
+        import mensaje_progresivo as mp
+
+        monkeypatch.setattr(mp, 'TELEGRAM_EDICION_INTERVALO', 60)
+        mensaje = MensajeFalso()
+        progreso = mp.MensajeProgresivo(mensaje, "🤖 Analizando...")
+
+        async def escenario():
+            for acumulado in ["Ho", "Hola", "Hola mundo"]:
+                await progreso.actualizar(acumulado)
+            await progreso.finalizar("<b>Listo</b>", parse_mode='HTML')
+
+        asyncio.run(escenario())
+
+        assert [texto for texto, _ in mensaje.ediciones] == ["🤖 Analizando...\n\nHo", "<b>Listo</b>"]
+        assert mensaje.ediciones[-1][1]['parse_mode'] == 'HTML'
+
+    def test_retry_after_y_no_modificado(self, monkeypatch):
+        """RetryAfter posterga la siguiente edición y 'not modified' no duplica el mensaje"""
+        import mensaje_progresivo as mp
+        from telegram.error import BadRequest, RetryAfter
+
+        monkeypatch.setattr(mp, 'TELEGRAM_EDICION_INTERVALO', 0)
+        mensaje = MensajeFalso(errores=[RetryAfter(30)])
+        progreso = mp.MensajeProgresivo(mensaje)
+
+        async def escenario():
+            await progreso.actualizar("uno")
+            await progreso.actualizar("uno dos")
+            progreso._bloqueado_hasta = 0
+            mensaje.errores.append(BadRequest("Message is not modified"))
+            return await progreso.finalizar("uno dos")
+
+        assert asyncio.run(escenario()) is True
+        assert mensaje.ediciones == []
+        assert mensaje.respuestas == []
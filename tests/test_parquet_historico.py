@@ -0,0 +1,118 @@
+"""
+Tests for parquet_historico.py - Espejo Parquet del histórico y lector con pushdown.
+"""
+import sqlite3
+from datetime import date
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+FILAS = [
+    ('C1', 'Compra lápices', 'Región Metropolitana de Santiago', '1-9', 'Prov A', 'Lápiz grafito', 10, 5000, 'det', 1, '2025-01-15'),
+    ('C1', 'Compra lápices', 'Región Metropolitana de Santiago', '2-7', 'Prov B', 'Lapiz grafito HB', 10, 6000, 'det', 0, '2025-01-15'),
+    ('C2', 'Papel oficina', 'Región de Valparaíso', '1-9', 'Prov A', 'Resma papel carta', 5, 15000, None, 1, '2025-01-28'),
+    ('C3', 'Toner impresora', 'Región de Valparaíso', '3-5', 'Prov C', 'Toner HP', 2, 80000, 'det', 1, '2025-02-03'),
+]
+
+
+@pytest.fixture
+def espejo(tmp_path, monkeypatch):
+    """Base SQLite con dos meses de histórico y un directorio de espejo vacío."""
+    import database_extended as db
+
+    ruta_db = str(tmp_path / 'hist.db')
+    conn = sqlite3.connect(ruta_db)
+    conn.execute('''
+        CREATE TABLE historico_licitaciones (
+            codigo_cotizacion TEXT, nombre_cotizacion TEXT, region TEXT,
+            rut_proveedor TEXT, nombre_proveedor TEXT, producto_cotizado TEXT,
+            cantidad INTEGER, monto_total INTEGER, detalle_oferta TEXT,
+            es_ganador BOOLEAN, fecha_cierre DATE
+        )
+    ''')
+    conn.execute('CREATE TABLE historico_importaciones (mes TEXT PRIMARY KEY, estado TEXT, actualizado TIMESTAMP)')
+    conn.executemany(f"INSERT INTO historico_licitaciones VALUES ({', '.join('?' * 11)})", FILAS)
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, 'USE_POSTGRES', False)
+    monkeypatch.setattr(db, 'get_connection', lambda: sqlite3.connect(ruta_db))
+    return {'db': ruta_db, 'dir': str(tmp_path / 'parquet')}
+
+
+class TestSincronizar:
+    """Tests for the export job."""
+
+    def test_exporta_meses_y_manifiesto(self, espejo):
+        import parquet_historico as pqh
+
+        exportados = pqh.sincronizar(directorio=espejo['dir'])
+
+        assert exportados == {'2025-01': 3, '2025-02': 1}
+        manifiesto = pqh.leer_manifiesto(espejo['dir'])
+        assert manifiesto['2025-01']['regiones'] == [
+            'Región Metropolitana de Santiago', 'Región de Valparaíso'
+        ]
+
+    def test_incremental(self, espejo):
+        """Solo se reexportan meses nuevos o reimportados"""
+        import parquet_historico as pqh
+
+        pqh.sincronizar(directorio=espejo['dir'])
+        assert pqh.sincronizar(directorio=espejo['dir']) == {}
+
+        conn = sqlite3.connect(espejo['db'])
+        conn.execute("INSERT INTO historico_importaciones VALUES ('2025-02', 'completado', '2025-03-01 10:00:00')")
+        conn.commit()
+        conn.close()
+
+        assert pqh.sincronizar(directorio=espejo['dir']) == {'2025-02': 1}
+
+    def test_tipos(self, espejo):
+        """Textos con dictionary encoding y numéricos tipados"""
+        import pyarrow as pa
+        import parquet_historico as pqh
+
+        pqh.sincronizar(directorio=espejo['dir'])
+        esquema = pqh.dataset(espejo['dir']).schema
+
+        assert pa.types.is_dictionary(esquema.field('nombre_proveedor').type)
+        assert esquema.field('monto_total').type == pa.int64()
+        assert esquema.field('fecha_cierre').type == pa.date32()
+
+
+class TestLeerHistorico:
+    """Tests for the reader API."""
+
+    def test_filtros(self, espejo):
+        import parquet_historico as pqh
+
+        pqh.sincronizar(directorio=espejo['dir'])
+
+        df = pqh.leer_historico(
+            region='REGIÓN DE VALPARAÍSO', desde=date(2025, 1, 1), hasta='2025-02-01',
+            es_ganador=True, directorio=espejo['dir']
+        )
+
+        assert df['codigo_cotizacion'].astype(str).tolist() == ['C2']
+
+    def test_filtro_texto_sin_tildes(self, espejo):
+        import parquet_historico as pqh
+
+        pqh.sincronizar(directorio=espejo['dir'])
+
+        df = pqh.leer_historico(
+            columnas=['producto_cotizado'], filtro=pqh.filtro_texto('lapiz'),
+            categorias=False, directorio=espejo['dir']
+        )
+
+        assert sorted(df['producto_cotizado']) == ['Lapiz grafito HB', 'Lápiz grafito']
+        assert df['producto_cotizado'].dtype != 'category'
+
+    def test_region_desconocida(self, espejo):
+        import parquet_historico as pqh
+
+        pqh.sincronizar(directorio=espejo['dir'])
+
+        assert pqh.leer_historico(region='Atlantis', directorio=espejo['dir']).empty
@@ -0,0 +1,69 @@
+"""
+Tests for particiones_historico.py - Cargas mensuales con staging y ATTACH.
+"""
+from datetime import date
+
+import pytest
+
+
+class TestNombresYRangos:
+    """Tests for month helpers."""
+
+    def test_rango_mes(self):
+        import particiones_historico as ph
+
+        assert ph.rango_mes('2025-01') == (date(2025, 1, 1), date(2025, 2, 1))
+        assert ph.rango_mes('2024-12') == (date(2024, 12, 1), date(2025, 1, 1))
+
+    def test_rango_mes_invalido(self):
+        import particiones_historico as ph
+
+        with pytest.raises(ValueError):
+            ph.rango_mes('2025-1')
+        with pytest.raises(ValueError):
+            ph.rango_mes('2025-13')
+
+    def test_nombres(self):
+        import particiones_historico as ph
+
+        assert ph.nombre_particion('2025-03') == 'historico_licitaciones_2025_03'
+        assert ph.nombre_staging('2025-03') == 'historico_licitaciones_2025_03_staging'
+
+
+class TestReescribirIndexdef:
+    """Tests for reescribir_indexdef."""
+
+    def test_indice_particionado(self):
+        import particiones_historico as ph
+
+        sql = ph.reescribir_indexdef(
+            'CREATE INDEX idx_hist_p_fecha ON ONLY public.historico_licitaciones USING btree (fecha_cierre DESC)',
+            'stg_idx1', 'stg'
+        )
+        assert sql == 'CREATE INDEX stg_idx1 ON stg USING btree (fecha_cierre DESC)'
+
+    def test_indice_unico(self):
+        import particiones_historico as ph
+
+        sql = ph.reescribir_indexdef(
+            'CREATE UNIQUE INDEX historico_licitaciones_pkey ON ONLY public.historico_licitaciones '
+            'USING btree (id, fecha_cierre)',
+            'stg_idx2', 'stg'
+        )
+        assert sql == 'CREATE UNIQUE INDEX stg_idx2 ON stg USING btree (id, fecha_cierre)'
+
+
+class TestVerificarExistencia:
+    """verificar_existencia on a non-partitioned SQLite table uses a date range."""
+
+    def test_rango_sqlite(self, monkeypatch):
+        import sqlite3
+        import importar_historico as ih
+
+        monkeypatch.setattr(ih.db, 'USE_POSTGRES', False)
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE historico_licitaciones (fecha_cierre DATE)')
+        conn.execute("INSERT INTO historico_licitaciones VALUES ('2025-01-31'), ('2025-02-01')")
+
+        assert ih.verificar_existencia('http://x/COT_2025-01.zip', conn) is True
+        assert ih.verificar_existencia('http://x/COT_2025-03.zip', conn) is False
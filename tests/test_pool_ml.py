@@ -0,0 +1,74 @@
+"""
+Tests para pool_ml.py - Pool de workers para el cómputo ML.
+"""
+import asyncio
+import threading
+import time
+import pytest
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Pool en hilos con una cola de 1 tarea."""
+    import pool_ml
+
+    monkeypatch.setattr(pool_ml, 'POOL_ML_WORKERS', 0)
+    monkeypatch.setattr(pool_ml, 'POOL_ML_MAX_COLA', 1)
+    pool_ml.cerrar()
+    yield pool_ml
+    pool_ml.cerrar()
+
+
+def dormir(evento, segundos=5):
+    evento.wait(segundos)
+    return 'listo'
+
+
+class TestEjecutar:
+    """Tests de pool_ml.ejecutar"""
+
+    def test_resultado_y_argumentos(self, pool):
+        """Devuelve el resultado de la función con args y kwargs"""
+        resultado = asyncio.run(pool.ejecutar(sorted, [3, 1, 2], reverse=True, tipo='test'))
+
+        assert resultado == [3, 2, 1]
+        assert pool.en_curso() == 0
+
+    def test_cola_llena_rechaza(self, pool):
+        """Sobre la capacidad se rechaza sin encolar"""
+        evento = threading.Event()
+
+        async def escenario():
+            # capacidad = 1 worker + 1 en cola
+            tareas = [asyncio.ensure_future(pool.ejecutar(dormir, evento, tipo='test')) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(pool.PoolSaturado):
+                await pool.ejecutar(dormir, evento, tipo='test')
+            evento.set()
+            return await asyncio.gather(*tareas)
+
+        assert asyncio.run(escenario()) == ['listo', 'listo']
+
+    def test_timeout(self, pool):
+        """Pasado el timeout el cliente recibe TimeoutError; la tarea sigue contando hasta terminar"""
+        evento = threading.Event()
+
+        with pytest.raises(TimeoutError):
+            asyncio.run(pool.ejecutar(dormir, evento, tipo='test', timeout=0.05))
+        assert pool.en_curso() == 1
+
+        evento.set()
+        for _ in range(100):
+            if pool.en_curso() == 0:
+                break
+            time.sleep(0.01)
+        assert pool.en_curso() == 0
+
+    def test_procesos(self, pool, monkeypatch):
+        """Con POOL_ML_WORKERS > 0 la tarea corre en otro proceso"""
+        import os
+
+        monkeypatch.setattr(pool, 'POOL_ML_WORKERS', 1)
+        pid = asyncio.run(pool.ejecutar(os.getpid, tipo='test', timeout=60))
+
+        assert pid != os.getpid()
@@ -0,0 +1,127 @@
+"""
+Tests para rag_historico.py - Materialización y caché de casos similares.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestMaterializarCasos:
+    """Tests de _materializar_casos"""
+
+    def test_tipos_nativos_y_nulos(self):
+        """Columnas convertidas en bloque: tipos de Python y None en vez de NaN"""
+        from rag_historico import LARGO_DETALLE, _materializar_casos
+
+        df = pd.DataFrame({
+            'codigo_cotizacion': ['C1', 'C2'],
+            'nombre_cotizacion': ['Compra de resmas', 'Tóner'],
+            'producto_cotizado': ['Resma papel carta', 'Tóner HP'],
+            'nombre_proveedor': pd.Series(['Prov A', None], dtype='category'),
+            'rut_proveedor': ['1-9', None],
+            'monto_total': [30000, 9000],
+            'cantidad': [10, np.nan],
+            'es_ganador': [1, None],
+            'fecha_cierre': pd.to_datetime(['2025-06-01', None]),
+            'region': pd.Series(['Metropolitana', None], dtype='category'),
+            'detalle_oferta': ['x' * 500, None],
+            'score_similitud': [87.1234, 55.0],
+            'antiguedad_dias': [3.0, np.nan],
+        })
+
+        casos = _materializar_casos(df)
+
+        assert casos[0] == {
+            'codigo': 'C1', 'nombre': 'Compra de resmas', 'producto': 'Resma papel carta',
+            'proveedor': 'Prov A', 'rut_proveedor': '1-9', 'monto': 30000, 'cantidad': 10,
+            'precio_unitario': 3000, 'es_ganador': True, 'fecha_cierre': '2025-06-01',
+            'region': 'Metropolitana', 'detalle': 'x' * LARGO_DETALLE, 'similitud': 87.1,
+            'antiguedad_dias': 3,
+        }
+        assert type(casos[0]['monto']) is int and type(casos[0]['es_ganador']) is bool
+        assert casos[1]['proveedor'] is None and casos[1]['region'] is None
+        assert casos[1]['cantidad'] == 0 and casos[1]['precio_unitario'] == 0
+        assert casos[1]['es_ganador'] is False
+        assert casos[1]['fecha_cierre'] is None and casos[1]['antiguedad_dias'] is None
+        assert casos[1]['detalle'] == ''
+
+    def test_vacio(self):
+        """Sin filas no hay casos"""
+        from rag_historico import _materializar_casos
+
+        df = pd.DataFrame({
+            columna: pd.Series(dtype=object) for columna in (
+                'codigo_cotizacion', 'nombre_cotizacion', 'producto_cotizado',
+                'nombre_proveedor', 'rut_proveedor', 'monto_total', 'cantidad',
+                'es_ganador', 'region', 'detalle_oferta', 'score_similitud', 'antiguedad_dias'
+            )
+        })
+        df['fecha_cierre'] = pd.to_datetime(pd.Series(dtype=object))
+
+        assert _materializar_casos(df) == []
+
+
+@pytest.fixture
+def enriquecer_contado(monkeypatch):
+    """_enriquecer falso que registra sus llamadas, sin índice en memoria."""
+    import indice_productos
+    import rag_historico
+
+    llamadas = []
+
+    def enriquecer(texto, monto):
+        llamadas.append((texto, monto))
+        return {'tiene_datos': True, 'n_casos_encontrados': 1, 'monto': monto}
+
+    monkeypatch.setattr(rag_historico, '_enriquecer', enriquecer)
+    monkeypatch.setattr(indice_productos, 'obtener', lambda *a, **k: None)
+    return llamadas
+
+
+class TestCacheEnriquecimiento:
+    """Tests de la caché de enriquecer_analisis_licitacion"""
+
+    def test_en_proceso(self, enriquecer_contado, monkeypatch):
+        """Misma licitación canónica y tramo de monto: se calcula una vez"""
+        import rag_historico
+
+        monkeypatch.setattr(rag_historico, '_redis', lambda: None)
+
+        primero = rag_historico.enriquecer_analisis_licitacion('Resma papel carta', 1000)
+        segundo = rag_historico.enriquecer_analisis_licitacion('CARTA, resma de papel', 1100)
+
+        assert segundo == primero
+        assert len(enriquecer_contado) == 1
+        # Se calcula con el monto representativo del tramo, no el del primer usuario
+        assert enriquecer_contado[0][1] == 1000
+
+        rag_historico.enriquecer_analisis_licitacion('Resma papel carta', 50000)
+        assert len(enriquecer_contado) == 2
+
+    def test_redis_e_invalidacion(self, enriquecer_contado, mock_redis):
+        """En Redis la importación sube la generación y las claves viejas dejan de usarse"""
+        import rag_historico
+
+        rag_historico.enriquecer_analisis_licitacion('Tóner HP 85A')
+        rag_historico.enriquecer_analisis_licitacion('toner hp 85a')
+        assert len(enriquecer_contado) == 1
+        assert any(clave.startswith('rag_enriquecido:0:') for clave in mock_redis._store)
+
+        rag_historico.invalidar_enriquecimiento()
+        rag_historico.enriquecer_analisis_licitacion('Tóner HP 85A')
+        assert len(enriquecer_contado) == 2
+
+    def test_sin_datos_no_se_guarda(self, monkeypatch):
+        """Los resultados sin casos se recalculan"""
+        import rag_historico
+
+        llamadas = []
+        monkeypatch.setattr(rag_historico, '_redis', lambda: None)
+        monkeypatch.setattr(
+            rag_historico, '_enriquecer',
+            lambda texto, monto: llamadas.append(texto) or {'tiene_datos': False}
+        )
+
+        rag_historico.enriquecer_analisis_licitacion('Silla ergonómica')
+        rag_historico.enriquecer_analisis_licitacion('Silla ergonómica')
+        assert len(llamadas) == 2
@@ -148,6 +148,27 @@ class TestCacheWithMock:
         assert mock_redis.get('key2') is None
 
 
+class TestCacheMany:
+    """Tests for multi-key cache helpers."""
+    
+    def test_set_and_get_many(self, mock_redis):
+        """cache_get_many should return values aligned with keys."""
+        import redis_cache
+        
+        redis_cache.cache_set_many({'ml_precio:a': {'precio': 1}, 'ml_precio:b': [1, 2]})
+        
+        result = redis_cache.cache_get_many(['ml_precio:a', 'ml_precio:x', 'ml_precio:b'])
+        
+        assert result == [{'precio': 1}, None, [1, 2]]
+    
+    def test_get_many_without_redis(self, monkeypatch):
+        """Without Redis every key is a miss."""
+        import redis_cache
+        monkeypatch.setattr(redis_cache, 'REDIS_AVAILABLE', False)
+        
+        assert redis_cache.cache_get_many(['a', 'b']) == [None, None]
+
+
 class TestCacheDecorators:
     """Tests for cache decorator functions."""
     
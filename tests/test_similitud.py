@@ -0,0 +1,61 @@
+"""
+Tests para similitud.py - Similitud textual vectorizada.
+"""
+import numpy as np
+import pandas as pd
+
+
+class TestPuntajes:
+    """Tests de puntajes"""
+
+    def test_alineado_con_candidatos(self):
+        """Un puntaje por candidato, en el mismo orden; nulos puntúan 0"""
+        from similitud import puntajes
+
+        candidatos = pd.Series(['PAPEL carta, resma', None, 'Tóner HP', 'papel carta resma'])
+
+        resultado = puntajes('Resma de papel carta', candidatos)
+
+        assert isinstance(resultado, np.ndarray)
+        assert len(resultado) == 4
+        assert resultado[0] == 100
+        assert resultado[1] == 0
+        assert resultado[2] < 50
+        assert resultado[3] == resultado[0]
+
+    def test_vacio(self):
+        """Sin candidatos retorna un arreglo vacío"""
+        from similitud import puntajes
+
+        assert len(puntajes('papel', [])) == 0
+        assert list(puntajes('papel', [None, np.nan])) == [0, 0]
+
+    def test_paralelo_igual_a_secuencial(self, monkeypatch):
+        """Repartir entre hilos no cambia los puntajes"""
+        import similitud
+
+        candidatos = [f"producto {i % 37} tipo {i % 11}" for i in range(500)]
+        secuencial = similitud.puntajes('producto 5 tipo 3', candidatos)
+        monkeypatch.setattr(similitud, 'SIMILITUD_MIN_PARALELO', 1)
+        paralelo = similitud.puntajes('producto 5 tipo 3', candidatos)
+
+        np.testing.assert_array_equal(secuencial, paralelo)
+
+
+class TestPuntajesColumnas:
+    """Tests de puntajes_columnas"""
+
+    def test_varias_columnas(self):
+        """Cada columna recibe sus propios puntajes"""
+        from similitud import puntajes, puntajes_columnas
+
+        df = pd.DataFrame({
+            'nombre_cotizacion': ['Compra de resmas', 'Compra de tóner'],
+            'producto_cotizado': ['Tóner HP', 'Resma carta'],
+        })
+
+        resultado = puntajes_columnas('resma carta', df, ['nombre_cotizacion', 'producto_cotizado'])
+
+        np.testing.assert_array_equal(resultado['nombre_cotizacion'], puntajes('resma carta', df['nombre_cotizacion']))
+        np.testing.assert_array_equal(resultado['producto_cotizado'], puntajes('resma carta', df['producto_cotizado']))
+        assert resultado['producto_cotizado'][1] == 100
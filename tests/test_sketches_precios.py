@@ -0,0 +1,178 @@
+"""
+Tests para sketches_precios.py - Sketches de cuantiles por producto, región y mes.
+"""
+import sqlite3
+from datetime import date
+import numpy as np
+import pytest
+
+# producto_normalizado queda en NULL: se canoniza al leer
+INSERTAR = """
+    INSERT INTO historico_licitaciones
+    (producto_cotizado, region, cantidad, monto_total, es_ganador, fecha_cierre)
+    VALUES (?,?,?,?,?,?)
+"""
+
+
+@pytest.fixture
+def bd_sketches(tmp_path, monkeypatch):
+    """BD SQLite temporal con histórico de dos meses y tabla de sketches."""
+    import database_extended as db
+
+    ruta = str(tmp_path / 'sketches.db')
+    conn = sqlite3.connect(ruta)
+    conn.executescript('''
+        CREATE TABLE historico_licitaciones (
+            producto_cotizado TEXT, region TEXT, cantidad INTEGER,
+            monto_total INTEGER, es_ganador BOOLEAN, fecha_cierre DATE,
+            producto_normalizado TEXT
+        );
+        CREATE TABLE sketches_precios (
+            termino TEXT NOT NULL, region TEXT NOT NULL DEFAULT '', mes TEXT NOT NULL,
+            n_ofertas INTEGER, n_ganadores INTEGER, n INTEGER, suma REAL, suma_cuadrados REAL,
+            precio_min REAL, precio_max REAL, centroides BLOB,
+            PRIMARY KEY (termino, region, mes)
+        );
+    ''')
+    filas = []
+    for i in range(10):
+        filas.append(('Resma papel carta', 'Región Metropolitana', 10, 30000 + i * 1000, 1, '2025-05-10'))
+    for i in range(5):
+        filas.append(('papel, resma de carta', 'Valparaíso', 1, 3500 + i * 100, 1, '2025-06-02'))
+    filas.append(('Resma papel carta', 'Región Metropolitana', 10, 50000, 0, '2025-06-03'))
+    conn.executemany(INSERTAR, filas)
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, 'USE_POSTGRES', False)
+    monkeypatch.setattr(db, 'get_connection', lambda: sqlite3.connect(ruta))
+    return ruta
+
+
+class TestTDigest:
+    """Tests de la estructura TDigest"""
+
+    def test_exacto_con_pocos_valores(self):
+        """Sin compresión los cuantiles coinciden con pandas"""
+        import pandas as pd
+        from sketches_precios import TDigest
+
+        valores = np.random.default_rng(1).lognormal(8, 1, 60)
+        qs = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+        digest = TDigest.desde_valores(valores)
+
+        np.testing.assert_allclose(digest.cuantiles(qs), pd.Series(valores).quantile(qs).to_numpy())
+        assert digest.promedio == pytest.approx(valores.mean())
+        assert digest.desviacion == pytest.approx(valores.std(ddof=1))
+
+    def test_fusion_con_error_acotado(self):
+        """Fusionar digests mensuales aproxima los cuantiles del total"""
+        from sketches_precios import TDigest
+
+        valores = np.random.default_rng(2).lognormal(10, 1, 50000)
+        qs = [0.25, 0.5, 0.75, 0.9]
+
+        digest = TDigest.fusionar([TDigest.desde_valores(parte) for parte in np.array_split(valores, 24)])
+
+        assert len(digest) <= 100
+        assert digest.n == len(valores)
+        assert digest.minimo == valores.min() and digest.maximo == valores.max()
+        np.testing.assert_allclose(digest.cuantiles(qs), np.quantile(valores, qs), rtol=0.01)
+
+    def test_serializacion(self):
+        """a_bytes/desde_fila conservan los centroides (float32)"""
+        from sketches_precios import TDigest
+
+        digest = TDigest.desde_valores(np.arange(1000, dtype=float))
+        copia = TDigest.desde_fila(
+            digest.n, digest.suma, digest.suma_cuadrados,
+            digest.minimo, digest.maximo, memoryview(digest.a_bytes())
+        )
+
+        assert len(digest.a_bytes()) == len(digest) * 8
+        np.testing.assert_allclose(copia.cuantiles([0.1, 0.5, 0.9]), digest.cuantiles([0.1, 0.5, 0.9]))
+
+
+class TestConsultar:
+    """Tests de reconstruir y consultar"""
+
+    def test_fusiona_meses_y_regiones(self, bd_sketches):
+        """Combina términos equivalentes, meses y regiones sin leer el histórico"""
+        import sketches_precios as sp
+
+        assert sp.reconstruir(['2025-05', '2025-06']) == 3
+
+        todas = sp.consultar('papel carta resma', meses=['2025-05', '2025-06'])
+        assert todas['n_ofertas'] == 16
+        assert todas['n_ganadores'] == 15
+        assert todas['precio_min'] == 3000.0
+        assert todas['p50'] == 3600.0
+
+        regional = sp.consultar('Resma papel carta', 'región metropolitana', meses=['2025-05', '2025-06'])
+        assert regional['n_ofertas'] == 11
+        assert regional['n_registros'] == 10
+        assert regional['p50'] == 3450.0
+
+        assert sp.consultar('resma papel carta', meses=['2025-06'])['n_registros'] == 5
+        assert sp.consultar('resma papel carta', meses=['2024-01']) is None
+
+    def test_recorte_de_outliers(self, bd_sketches):
+        """Sin dispersión (MAD 0) el recorte usa media ± 3σ"""
+        import sketches_precios as sp
+
+        conn = sqlite3.connect(bd_sketches)
+        conn.executemany(
+            INSERTAR,
+            [('Lápiz grafito', 'Maule', 1, 100, 1, '2025-06-10')] * 30 + [('Lápiz grafito', 'Maule', 1, 10000, 1, '2025-06-11')]
+        )
+        conn.commit()
+        conn.close()
+        sp.reconstruir(['2025-06'])
+
+        recortado = sp.consultar('lapiz grafito', meses=['2025-06'])
+        completo = sp.consultar('lapiz grafito', meses=['2025-06'], recortar=False)
+
+        assert recortado['n_registros'] == 30
+        assert recortado['precio_max'] == 100.0
+        assert completo['precio_max'] == 10000.0
+
+    def test_recorte_mad_como_en_vivo(self, bd_sketches):
+        """El recorte descarta lo mismo que filtro_outliers aunque media ± 3σ lo conservaría"""
+        import pandas as pd
+        import sketches_precios as sp
+        from estadisticas_precios import filtro_outliers
+
+        precios = list(range(100, 120)) + [160] * 3
+        conn = sqlite3.connect(bd_sketches)
+        conn.executemany(INSERTAR, [('Lápiz grafito', 'Maule', 1, p, 1, '2025-06-10') for p in precios])
+        conn.commit()
+        conn.close()
+        sp.reconstruir(['2025-06'])
+
+        serie = pd.Series(precios, dtype='float64')
+        assert 160 <= serie.mean() + 3 * serie.std()
+        esperados = serie[filtro_outliers(serie)]
+
+        recortado = sp.consultar('lapiz grafito', meses=['2025-06'])
+        assert recortado['n_registros'] == len(esperados) == 20
+        assert recortado['precio_max'] == esperados.max()
+        assert recortado['p50'] == pytest.approx(esperados.median())
+
+    def test_rebuild_reemplaza_el_mes(self, bd_sketches):
+        """Reconstruir un mes no duplica sus filas"""
+        import sketches_precios as sp
+
+        sp.reconstruir(['2025-06'])
+        sp.reconstruir(['2025-06'])
+
+        conn = sqlite3.connect(bd_sketches)
+        total = conn.execute("SELECT COUNT(*) FROM sketches_precios WHERE mes = '2025-06'").fetchone()[0]
+        conn.close()
+        assert total == 2
+
+    def test_ultimos_meses(self):
+        """La ventana termina en el mes de referencia"""
+        from sketches_precios import ultimos_meses
+
+        assert ultimos_meses(3, hoy=date(2025, 1, 15)) == ['2024-11', '2024-12', '2025-01']
@@ -0,0 +1,77 @@
+"""
+Tests para umbral_trgm.py - Umbral adaptativo de pg_trgm.
+"""
+import pytest
+
+
+class CursorFalso:
+    """Registra los umbrales fijados con set_config."""
+
+    def __init__(self, umbrales):
+        self.umbrales = umbrales
+
+    def execute(self, sql, params=None):
+        assert 'pg_trgm.similarity_threshold' in sql
+        self.umbrales.append(float(params[0]))
+
+
+class ConexionFalsa:
+    """Conexión con un historial de umbrales compartido por sus cursores."""
+
+    def __init__(self):
+        self.umbrales = []
+
+    def cursor(self):
+        return CursorFalso(self.umbrales)
+
+
+@pytest.fixture
+def umbrales(monkeypatch):
+    import umbral_trgm
+
+    monkeypatch.setattr(umbral_trgm, 'TRGM_UMBRALES', [0.5, 0.4, 0.3, 0.2])
+    monkeypatch.setattr(umbral_trgm, 'TRGM_MIN_CANDIDATOS', 20)
+    monkeypatch.setattr(umbral_trgm, 'TRGM_MAX_CANDIDATOS', 1000)
+    return umbral_trgm
+
+
+def candidatos_por_umbral(conn, tamanos):
+    """leer() falso: la cantidad de filas depende del último umbral fijado."""
+    return lambda: list(range(tamanos[conn.umbrales[-1]]))
+
+
+class TestConsultar:
+    """Tests de consultar (reintento escalonado)"""
+
+    def test_termino_comun_un_intento(self, umbrales):
+        """Con suficientes candidatos al umbral más alto no se reintenta"""
+        conn = ConexionFalsa()
+        leer = candidatos_por_umbral(conn, {0.5: 1000, 0.4: 1000, 0.3: 1000, 0.2: 1000})
+
+        assert len(umbrales.consultar(conn, leer)) == 1000
+        assert conn.umbrales == [0.5]
+
+    def test_termino_raro_baja_el_umbral(self, umbrales):
+        """Se baja el umbral hasta juntar el mínimo; si no llega, queda el último"""
+        conn = ConexionFalsa()
+        leer = candidatos_por_umbral(conn, {0.5: 0, 0.4: 3, 0.3: 25, 0.2: 80})
+        assert len(umbrales.consultar(conn, leer)) == 25
+        assert conn.umbrales == [0.5, 0.4, 0.3]
+
+        conn = ConexionFalsa()
+        leer = candidatos_por_umbral(conn, {0.5: 0, 0.4: 0, 0.3: 1, 0.2: 2})
+        assert len(umbrales.consultar(conn, leer)) == 2
+        assert conn.umbrales == [0.5, 0.4, 0.3, 0.2]
+
+    def test_limite_menor_que_el_minimo(self, umbrales):
+        """Con un LIMIT menor que el mínimo basta con llenarlo"""
+        conn = ConexionFalsa()
+        leer = candidatos_por_umbral(conn, {0.5: 5, 0.4: 15, 0.3: 15, 0.2: 15})
+
+        assert len(umbrales.consultar(conn, leer, limite=15)) == 15
+        assert conn.umbrales == [0.5, 0.4]
+
+    def test_acotar(self, umbrales):
+        """El LIMIT KNN nunca supera TRGM_MAX_CANDIDATOS"""
+        assert umbrales.acotar(500) == 500
+        assert umbrales.acotar(5000) == 1000